@@ -1,21 +1,27 @@
 import os
-import stripe
 from flask import Blueprint, jsonify, g, current_app
 from auth import auth_required
 from models import get_session, User
+import resilience
 
 bp = Blueprint("ads_portal", __name__, url_prefix="/api/ads")
 
-# Set once at import
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+STRIPE_KEY = os.getenv("STRIPE_SECRET_KEY")
 FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:5173")
 
 
+def _stripe():
+    """Import the stripe SDK on first use instead of at worker boot."""
+    import stripe
+    stripe.api_key = STRIPE_KEY
+    return stripe
+
+
 @bp.post("/portal")
 @auth_required
 def create_portal():
     """Create a Stripe Billing Portal session for subscription management."""
-    if not stripe.api_key:
+    if not STRIPE_KEY:
         return jsonify(ok=False, error="stripe_api_key_missing"), 500
 
     # fetch only the field we need, then close the session
@@ -28,13 +34,17 @@ def create_portal():
         return jsonify(ok=False, error="no_customer"), 400
 
     return_url = f"{FRONTEND_ORIGIN}/settings"
+    stripe = _stripe()
 
     try:
-        sess = stripe.billing_portal.Session.create(
-            customer=u.stripe_customer_id,
-            return_url=return_url,
-        )
+        with resilience.upstream("stripe", "billing_portal.sessions.create"):
+            sess = stripe.billing_portal.Session.create(
+                customer=u.stripe_customer_id,
+                return_url=return_url,
+            )
         return jsonify(ok=True, url=sess.url), 200
+    except resilience.UpstreamUnavailable as e:
+        return resilience.unavailable_response(e)
     except stripe.error.StripeError as e:
         current_app.logger.exception("Stripe portal session error")
         # Keep the message generic for clients
@@ -1,22 +1,31 @@
+import startup  # first: with STARTUP_PROFILE=1 it times every import below
 import os
 import io
 import base64
 import time
+import importlib.util
 from datetime import datetime
-from typing import Optional
 
 from dotenv import load_dotenv
 
 # Load environment variables FIRST before any imports that need them
 load_dotenv()
 
-from flask import Flask, request, jsonify, send_from_directory, render_template, abort, make_response
+from flask import Flask, request, jsonify, send_from_directory, render_template, abort
 from flask_cors import CORS
 from flask_compress import Compress
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 
 # --- Database models ---
 from models import init_db, get_session, User, PosterJob, Poster, Asset, PosterMode, PosterStatus, PosterStyle
+import wallet
+import outbox
+import assets
+import migrate
+import db_metrics
+import metrics
+import resilience
 # Poster generation (SDK-free implementation):
 from poster_new import poster_bp
 
@@ -41,13 +50,8 @@ from app_health import health_bp
 from app_gallery import bp as gallery_bp
 from app_debug import debug_bp
 
-# --- Optional OpenAI (auto-disabled if key missing) ---
-OPENAI_AVAILABLE = False
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except Exception:
-    OPENAI_AVAILABLE = False
+# --- Optional OpenAI (auto-disabled if key missing; imported on first use) ---
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
 
 # ---------------------- BRAND ----------------------
 BRAND_NAME = "Mini-Visionary"
@@ -69,6 +73,9 @@ ALLOWED_EXTS = {"png", "jpg", "jpeg", "webp"}  # posters only
 
 # ---------------------- APP ----------------------
 app = Flask(__name__, static_folder="static", template_folder="templates")
+# request.remote_addr is the client, not Railway's proxy: take the address the last
+# TRUSTED_PROXY_HOPS proxies appended to X-Forwarded-For (what the client sent is ignored)
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.getenv("TRUSTED_PROXY_HOPS", "1")))
 app.config["SECRET_KEY"] = SECRET_KEY
 app.config["JSON_SORT_KEYS"] = False
 app.config["ASSET_VERSION"] = os.getenv("GIT_SHA", "")
@@ -107,37 +114,33 @@ app.config.update(
 )
 Compress(app)
 
+# Static assets: manifest loaded once; precompressed variants bypass Flask-Compress
+asset_index = assets.init_app(app)
+# Flask's built-in "static" rule shadows any /static/<path> route, so swap its view
+app.view_functions["static"] = lambda filename: assets.send_static(app, filename)
+
+# Schema: one version query; migrates (advisory-locked) only when a deploy adds steps
+with startup.phase("schema_check"):
+    migrate.ensure_schema()
+
+# Release credit holds whose generation never settled (crashed worker, killed request)
+wallet.start_hold_sweeper()
+# Send anything left in the email outbox by a previous process
+outbox.start_worker()
+
 # --- Observability: Sentry + Request IDs + JSON logs ---
-import sys, uuid, logging
+import uuid, logging
 from flask import g
-from pythonjsonlogger import jsonlogger
+import logconfig
 
-try:
-    import sentry_sdk
-    from sentry_sdk.integrations.flask import FlaskIntegration
-    from sentry_sdk.integrations.logging import LoggingIntegration
-except Exception:
-    sentry_sdk = None
+# sentry_sdk is only imported when a DSN is configured
+SENTRY_AVAILABLE = importlib.util.find_spec("sentry_sdk") is not None
 
 def _init_json_logging(app_name: str = "mini-visionary"):
-    """Setup JSON logging to stdout (works in Railway/Gunicorn)."""
-    root = logging.getLogger()
-    root.setLevel(logging.INFO)
-
-    # remove default handlers (avoid double logs)
-    for h in list(root.handlers):
-        root.removeHandler(h)
-
-    logHandler = logging.StreamHandler(sys.stdout)
-    formatter = jsonlogger.JsonFormatter(
-        "%(asctime)s %(levelname)s %(name)s %(message)s",
-        rename_fields={
-            "levelname": "level",
-            "asctime": "ts"
-        }
-    )
-    logHandler.setFormatter(formatter)
-    root.addHandler(logHandler)
+    """Setup JSON logging to stdout (works in Railway/Gunicorn).
+    Records are queued and written by a background thread; LOG_SAMPLE / LOG_RATE_LIMIT
+    thin out high-volume INFO/DEBUG lines (see logconfig.py)."""
+    logconfig.init(logging.INFO)
 
     logging.getLogger("werkzeug").setLevel(logging.WARNING)  # quieter dev server logs
     logging.info("json_logging_initialized", extra={"app": app_name})
@@ -145,11 +148,14 @@ def _init_json_logging(app_name: str = "mini-visionary"):
 def _init_sentry(flask_app):
     """Initialize Sentry if DSN is provided."""
     dsn = os.getenv("SENTRY_DSN", "").strip()
-    if not dsn or len(dsn) == 0 or not dsn.startswith("https://") or sentry_sdk is None:
-        logging.info("sentry_not_configured", extra={"dsn_length": len(dsn), "sentry_sdk_available": sentry_sdk is not None})
+    if not dsn or len(dsn) == 0 or not dsn.startswith("https://") or not SENTRY_AVAILABLE:
+        logging.info("sentry_not_configured", extra={"dsn_length": len(dsn), "sentry_sdk_available": SENTRY_AVAILABLE})
         return
 
     try:
+        import sentry_sdk
+        from sentry_sdk.integrations.flask import FlaskIntegration
+        from sentry_sdk.integrations.logging import LoggingIntegration
         sentry_sdk.init(
             dsn=dsn,
             integrations=[
@@ -202,13 +208,16 @@ def _log_request_end(response):
             "status": response.status_code,
             "duration_ms": dt,
             "length": response.calculate_content_length() if hasattr(response, "calculate_content_length") else None,
+            **db_metrics.request_stats(),
         }
     )
     return response
 
 # Initialize observability
-_init_json_logging(app_name="mini-visionary")
-_init_sentry(app)
+with startup.phase("json_logging"):
+    _init_json_logging(app_name="mini-visionary")
+with startup.phase("sentry"):
+    _init_sentry(app)
 
 @app.before_request
 def _before():
@@ -218,28 +227,36 @@ def _before():
 @app.after_request
 def _after(response):
     return _log_request_end(response)
+
+# Query count / DB time / rows per request, slow-query and N+1 warnings (after _before: uses g.request_id)
+db_metrics.init_app(app)
+# Prometheus request/upstream/pool metrics and GET /metrics (see metrics.py)
+metrics.init_app(app)
+# Bulkheads + circuit breakers for OpenAI/Stripe/Resend: 503 + Retry-After, state in /api/_health
+resilience.init_app(app)
 # --- end observability block ---
 
 # Initialize bcrypt - temporarily disabled
 bcrypt.init_app(app)
 
 # Register blueprints - Enable essential core functionality
-app.register_blueprint(new_auth_bp)
-app.register_blueprint(poster_bp)       # SDK-free poster generation
-app.register_blueprint(library_bp)        # Essential - poster library and gallery
-app.register_blueprint(legal_bp)          # Essential - privacy policy, terms of service
-app.register_blueprint(profile_upload_bp)  # Clean profile upload endpoint
-app.register_blueprint(payments_bp)       # Stripe payments
-# app.register_blueprint(storage_bp)      # Disabled - needs S3/R2 configuration
-# app.register_blueprint(ads_bp)          # Disabled - needs subscription logic
-app.register_blueprint(ads_portal_bp)
-app.register_blueprint(me_bp)             # Essential - user profile and account management
-app.register_blueprint(auth_alias_bp)     # Essential - /api/auth/whoami endpoint
-app.register_blueprint(webhooks_bp)
-app.register_blueprint(chat_bp)
-app.register_blueprint(health_bp)         # Essential - health monitoring endpoint
-app.register_blueprint(gallery_bp)        # Essential - gallery posting with credit deduction
-app.register_blueprint(debug_bp)          # Debug - config checks
+with startup.phase("register_blueprints"):
+    app.register_blueprint(new_auth_bp)
+    app.register_blueprint(poster_bp)       # SDK-free poster generation
+    app.register_blueprint(library_bp)        # Essential - poster library and gallery
+    app.register_blueprint(legal_bp)          # Essential - privacy policy, terms of service
+    app.register_blueprint(profile_upload_bp)  # Clean profile upload endpoint
+    app.register_blueprint(payments_bp)       # Stripe payments
+    # app.register_blueprint(storage_bp)      # Disabled - needs S3/R2 configuration
+    # app.register_blueprint(ads_bp)          # Disabled - needs subscription logic
+    app.register_blueprint(ads_portal_bp)
+    app.register_blueprint(me_bp)             # Essential - user profile and account management
+    app.register_blueprint(auth_alias_bp)     # Essential - /api/auth/whoami endpoint
+    app.register_blueprint(webhooks_bp)
+    app.register_blueprint(chat_bp)
+    app.register_blueprint(health_bp)         # Essential - health monitoring endpoint
+    app.register_blueprint(gallery_bp)        # Essential - gallery posting with credit deduction
+    app.register_blueprint(debug_bp)          # Debug - config checks
 
 # JSON error handlers (prevent HTML error pages from breaking JSON APIs)
 @app.errorhandler(405)
@@ -255,20 +272,26 @@ def handle_404(e):
         return jsonify({"ok": False, "error": "NOT_FOUND"}), 404
     return e  # Let HTML 404 page show for non-API routes
 
-# OpenAI client (only if key + lib present)
-oai_client: Optional["OpenAI"] = None
-if OPENAI_API_KEY and OPENAI_AVAILABLE:
-    try:
-        oai_client = OpenAI(api_key=OPENAI_API_KEY)
-        logging.info(f"OpenAI client initialized successfully (key starts with: {OPENAI_API_KEY[:10]}...)")
-    except Exception as e:
-        logging.error(f"Failed to initialize OpenAI client: {e}")
-        oai_client = None
-else:
-    if not OPENAI_API_KEY:
-        logging.warning("OPENAI_API_KEY is not set or empty")
-    if not OPENAI_AVAILABLE:
-        logging.warning("OpenAI library is not available")
+# OpenAI client (only if key + lib present), built on first use so the SDK
+# import stays off the worker boot path
+OPENAI_CONFIGURED = bool(OPENAI_API_KEY and OPENAI_AVAILABLE)
+_oai_client = None
+
+def get_oai_client():
+    global _oai_client
+    if _oai_client is None and OPENAI_CONFIGURED:
+        try:
+            from openai import OpenAI
+            _oai_client = OpenAI(api_key=OPENAI_API_KEY)
+            logging.info(f"OpenAI client initialized successfully (key starts with: {OPENAI_API_KEY[:10]}...)")
+        except Exception as e:
+            logging.error(f"Failed to initialize OpenAI client: {e}")
+    return _oai_client
+
+if not OPENAI_API_KEY:
+    logging.warning("OPENAI_API_KEY is not set or empty")
+if not OPENAI_AVAILABLE:
+    logging.warning("OpenAI library is not available")
 
 # ---------------------- SIMPLE RATE LIMIT ----------------------
 # in-memory IP bucket: { ip: [timestamps...] }
@@ -299,6 +322,7 @@ def b64_to_file(b64_png: str, dest_path: str) -> None:
     with open(dest_path, "wb") as f:
         f.write(base64.b64decode(b64_png))
 
+@metrics.timed_image("overlay_text")
 def overlay_text_cinematic(poster_path: str, title: str = "", tagline: str = "") -> str:
     """
     Adds cinematic title & tagline text. Returns path to the edited poster.
@@ -384,32 +408,14 @@ def make_public_url(local_path: str) -> str:
 # ---------- API ENDPOINTS ----------
 @app.get("/api/health")
 def health():
-    return {"ok": True, "service": "mini-visionary", "openai": bool(oai_client)}
+    return {"ok": True, "service": "mini-visionary", "openai": OPENAI_CONFIGURED}
 
 @app.post("/api/migrate")
 def migrate_database():
-    """Manual migration endpoint to add missing display_name column"""
+    """Apply pending schema migrations (see migrate.py); normally done at boot"""
     try:
-        from sqlalchemy import text
-        from models import get_engine
-
-        engine = get_engine()
-        with engine.connect() as conn:
-            # Check if display_name column exists
-            result = conn.execute(text("""
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_name = 'users' AND column_name = 'display_name'
-            """))
-
-            if result.fetchone():
-                return {"ok": True, "message": "display_name column already exists"}
-
-            # Add the column
-            conn.execute(text("ALTER TABLE users ADD COLUMN display_name VARCHAR(100)"))
-            conn.commit()
-            return {"ok": True, "message": "Successfully added display_name column"}
-
+        applied = migrate.upgrade()
+        return {"ok": True, "applied": applied, "steps": migrate.status()}
     except Exception as e:
         return {"ok": False, "error": str(e)}, 500
 
@@ -432,7 +438,7 @@ def version():
         "service": "mini-visionary",
         "timestamp": datetime.utcnow().isoformat(),
         "static_files": static_files,
-        "openai": bool(oai_client)
+        "openai": OPENAI_CONFIGURED
     }
 
 # Demo endpoints removed - now handled by auth.py with JWT authentication
@@ -514,6 +520,7 @@ def generate_poster():
     if rate_limited(ip):
         return {"ok": False, "error": "rate_limited"}, 429
 
+    oai_client = get_oai_client()
     if not oai_client:
         return {"ok": False, "error": "openai_not_configured"}, 503
 
@@ -588,26 +595,14 @@ def add_text_to_poster():
 # ---------------------- STATIC FILE ROUTE ----------------------
 @app.route('/static/<path:filename>')
 def static_files(filename):
-    """Custom static file handler with no-cache headers for HTML/JS"""
-    resp = make_response(send_from_directory(app.static_folder, filename))
-    # Add security headers
-    resp.headers['X-Content-Type-Options'] = 'nosniff'
-    # Prevent browser caching of HTML and JS files
-    if filename.endswith(('.html', '.js')):
-        resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-        resp.headers['Pragma'] = 'no-cache'
-        resp.headers['Expires'] = '0'
-    return resp
+    """Static files from the asset manifest: fingerprinted names are immutable, HTML revalidates"""
+    return assets.send_static(app, filename)
 
 # ---------------------- AUTH PAGES ----------------------
 @app.route('/auth.html')
 def auth_page():
-    """Serve auth.html directly with no-cache"""
-    resp = make_response(send_from_directory(app.static_folder, 'auth.html'))
-    resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    resp.headers['Pragma'] = 'no-cache'
-    resp.headers['Expires'] = '0'
-    return resp
+    """Serve auth.html directly (revalidated via ETag)"""
+    return assets.send_static(app, 'auth.html')
 
 @app.route('/register')
 def register_redirect():
@@ -627,12 +622,12 @@ def forgot_redirect():
 @app.route('/terms.html')
 def terms_page():
     """Serve terms.html directly"""
-    return send_from_directory(app.static_folder, 'terms.html')
+    return assets.send_static(app, 'terms.html')
 
 @app.route('/privacy.html')
 def privacy_page():
     """Serve privacy.html directly"""
-    return send_from_directory(app.static_folder, 'privacy.html')
+    return assets.send_static(app, 'privacy.html')
 
 # ---------------------- DASHBOARD ROUTES ----------------------
 
@@ -643,19 +638,15 @@ def create_redirect():
 
 @app.route('/generate')
 def generate_page():
-    """Serve the AI poster generation dashboard with no-cache"""
-    resp = make_response(send_from_directory(app.static_folder, 'generate.html'))
-    resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    resp.headers['Pragma'] = 'no-cache'
-    resp.headers['Expires'] = '0'
-    return resp
+    """Serve the AI poster generation dashboard (revalidated via ETag)"""
+    return assets.send_static(app, 'generate.html')
 
 # SPA routes are handled by serve_spa.py to avoid duplication
 
 # ---------------------- MAIN ----------------------
 @app.get("/healthz")
 def healthz():
-    return {"ok": True, "time": datetime.utcnow().isoformat(), "openai": bool(oai_client)}
+    return {"ok": True, "time": datetime.utcnow().isoformat(), "openai": OPENAI_CONFIGURED}
 
 @app.route("/__routes__", methods=["GET"])
 def __debug_routes():
@@ -708,7 +699,7 @@ def test_logging():
 # Serve logo from root path for backward compatibility
 @app.route('/logo.png')
 def serve_logo():
-    return send_from_directory(app.static_folder, 'logo.png')
+    return assets.send_static(app, 'logo.png')
 
 # Serve uploaded files (when using local storage instead of S3)
 @app.route('/uploads/<path:filename>')
@@ -723,20 +714,21 @@ def spa_frontend(path=""):
     """Serve SPA for all non-API, non-static routes"""
     # Static files
     if path.startswith("static/"):
-        subpath = path[len("static/"):]
-        return send_from_directory(app.static_folder, subpath)
+        return assets.send_static(app, path[len("static/"):])
 
     if path in ("favicon.ico", "robots.txt"):
-        return send_from_directory(app.static_folder, path)
+        return assets.send_static(app, path)
 
-    # If it looks like a file, try to serve from static
-    if "." in path:
-        candidate = os.path.join(app.static_folder, path)
-        if os.path.exists(candidate):
-            return send_from_directory(app.static_folder, path)
+    # If it looks like a file, try to serve from static (in-memory lookup, no stat)
+    if "." in path and asset_index.exists(path):
+        return asset_index.serve(path)
 
     # SPA fallback
-    return send_from_directory(app.static_folder, "index.html")
+    return assets.send_static(app, "index.html")
+
+# Startup profile (STARTUP_PROFILE=1), then pull the deferred SDKs in off the boot path
+startup.log_report()
+startup.prewarm()
 
 if __name__ == "__main__":
     # Initialize database
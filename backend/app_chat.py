@@ -1,16 +1,25 @@
 from flask import Blueprint, request, jsonify
 import os
+import json
+import importlib.util
 
-try:
-    from openai import OpenAI
-    _HAS_OPENAI = True
-except Exception:
-    _HAS_OPENAI = False
+from sqlalchemy import delete
+
+from models import ChatConversation, ChatMessage, get_session
+import conversations
+import resilience
+import vision_input
+
+# openai is imported on first chat request (it's ~0.6s of worker boot otherwise)
+_HAS_OPENAI = importlib.util.find_spec("openai") is not None
 
 bp = Blueprint("chat", __name__, url_prefix="/api/chat")
 
-def _normalize_parts(parts):
-    """Ensure content array matches OpenAI's expected schema."""
+# Delete idle conversations (CHAT_RETENTION_DAYS) in every process that serves chat
+bp.record_once(lambda state: conversations.start_pruner())
+
+def _normalize_parts(parts, prepare=True):
+    """Ensure content array matches OpenAI's expected schema (images downscaled for vision unless prepare=False)."""
     norm = []
     for p in parts:
         t = (p or {}).get("type")
@@ -21,12 +30,16 @@ def _normalize_parts(parts):
         elif t == "image_url":
             # accept either {image_url: "<url>"} or {image_url: {"url": "<url>"}}
             iu = p.get("image_url")
-            if isinstance(iu, str):
-                norm.append({"type": "image_url", "image_url": {"url": iu}})
-            elif isinstance(iu, dict) and iu.get("url"):
-                norm.append({"type": "image_url", "image_url": {"url": iu["url"]}})
+            url = iu if isinstance(iu, str) else iu.get("url") if isinstance(iu, dict) else None
+            if url:
+                norm.append({"type": "image_url", "image_url": {"url": url}})
         # ignore unknown types silently
-    return norm
+    return [_prepared(p) for p in norm] if prepare else norm
+
+def _prepared(part):
+    if part["type"] != "image_url":
+        return part
+    return {"type": "image_url", "image_url": {"url": vision_input.prepare_url(part["image_url"]["url"])}}
 
 @bp.post("")
 def chat():
@@ -44,15 +57,18 @@ def chat():
     temperature = max(0.0, min(1.0, temperature))
 
     system = js.get("system") or "You are a helpful assistant."
-    msgs = js.get("messages") or []          # list[{role, content}]
-    parts = js.get("parts") or None          # optional multimodal array for last user
+    parts = js.get("parts") or None          # optional multimodal array for the new user turn
+
+    if "conversation_id" in js or "message" in js:
+        return _chat_stored(js, model, temperature, system, parts)
 
-    # Build message list; enforce max history
+    # Legacy clients resend the transcript: keep the newest messages that fit the token budget
+    msgs = conversations.fit(js.get("messages") or [])          # list[{role, content}]
     built = [{"role": "system", "content": system}]
-    for i, m in enumerate(msgs[-29:]):       # keep recent 29 + system = 30
+    for i, m in enumerate(msgs):
         role = m.get("role")
         content = m.get("content", "")
-        is_last_user = (i == len(msgs[-29:]) - 1 and role == "user" and parts)
+        is_last_user = (i == len(msgs) - 1 and role == "user" and parts)
 
         if is_last_user:
             content_array = _normalize_parts(parts)
@@ -64,14 +80,96 @@ def chat():
             built.append({"role": role, "content": content})
 
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        text = _complete(model, temperature, built)
+        return jsonify(ok=True, message=text), 200
+    except resilience.UpstreamUnavailable as e:
+        return resilience.unavailable_response(e)
+    except Exception as e:
+        # You can log e for debugging
+        return jsonify(ok=False, error="chat_generation_failed"), 502
+
+
+def _complete(model, temperature, messages):
+    from openai import OpenAI
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    with resilience.upstream("openai", "chat.completions", model):
         resp = client.chat.completions.create(
             model=model,
             temperature=temperature,
-            messages=built,
+            messages=messages,
         )
-        text = (resp.choices[0].message.content or "").strip()
-        return jsonify(ok=True, message=text), 200
-    except Exception as e:
-        # You can log e for debugging
-        return jsonify(ok=False, error="chat_generation_failed"), 502
\ No newline at end of file
+    return (resp.choices[0].message.content or "").strip()
+
+
+def _chat_stored(js, model, temperature, system, parts):
+    """One turn of a server-side conversation: the client sends only the new message."""
+    message = str(js.get("message") or "")
+    content_array = _normalize_parts(parts, prepare=False) if parts else []
+    if not content_array and message:
+        content_array = [{"type": "text", "text": message}]
+    if not content_array:
+        return jsonify(ok=False, error="message_required"), 400
+    text_in = "\n".join(p["text"] for p in content_array if p["type"] == "text")
+    images = [p["image_url"]["url"] for p in content_array if p["type"] == "image_url"]
+    current = {"role": "user", "content": [_prepared(p) for p in content_array] if images else text_in}
+
+    conv_id = js.get("conversation_id")
+    conv_id = str(conv_id) if conv_id else None
+    with get_session() as s:
+        if conv_id:
+            conv = s.get(ChatConversation, conv_id)
+            if conv is None:
+                return jsonify(ok=False, error="conversation_not_found"), 404
+            conv.system = system  # a changed system prompt starts a new cached prefix
+        else:
+            conv = ChatConversation(system=system, summary_upto=0)  # saved below, with the first reply
+        built, trimmed = conversations.build_prompt(s, conv, current)
+
+    # no DB connection is held across the upstream call
+    try:
+        text = _complete(model, temperature, built)
+    except resilience.UpstreamUnavailable as e:
+        return resilience.unavailable_response(e)
+    except Exception:
+        return jsonify(ok=False, error="chat_generation_failed"), 502
+
+    with get_session() as s:
+        if conv_id:
+            conv = s.get(ChatConversation, conv_id)
+        else:  # remote_addr is the client, not the proxy (ProxyFix in app.py)
+            conv = conversations.create(s, system, conversations.client_key(request.remote_addr))
+        if conv is None:  # deleted while we were waiting
+            return jsonify(ok=False, error="conversation_not_found"), 404
+        conv.system = system
+        # the user turn is stored only with its reply, so a retry doesn't duplicate it
+        conversations.append(s, conv, "user", text_in, images)
+        conversations.append(s, conv, "assistant", text)
+        s.commit()
+        conv_id = conv.id
+
+    if trimmed:
+        conversations.schedule_summary(conv_id)
+    return jsonify(ok=True, message=text, conversation_id=conv_id), 200
+
+
+@bp.get("/<conv_id>")
+def get_conversation(conv_id):
+    with get_session() as s:
+        conv = s.get(ChatConversation, conv_id)
+        if conv is None:
+            return jsonify(ok=False, error="conversation_not_found"), 404
+        msgs = [{"role": m.role, "content": m.content, "images": json.loads(m.images) if m.images else [],
+                 "ts": m.created_at.isoformat() if m.created_at else None}
+                for m in conversations.history(s, conv)]
+        return jsonify(ok=True, conversation_id=conv.id, system=conv.system, messages=msgs), 200
+
+
+@bp.delete("/<conv_id>")
+def delete_conversation(conv_id):
+    with get_session() as s:
+        conv = s.get(ChatConversation, conv_id)
+        if conv is not None:
+            s.execute(delete(ChatMessage).where(ChatMessage.conversation_id == conv.id))
+            s.delete(conv)
+            s.commit()
+    return jsonify(ok=True), 200
@@ -1,41 +1,87 @@
 # app_email_templates.py
+"""
+Email templates, compiled once at import.
+
+Each template is split into static chunks and named slots when the module
+loads; static values (logo, app URL, support address, CSS) are baked in at
+that point, so render() is a single join of pre-built strings plus the
+escaped per-call fields.
+"""
 import os
+import re
+from datetime import datetime
+from html import escape
 
 # Logo URL - configure this in your environment or hardcode
 LOGO_URL = os.getenv("EMAIL_LOGO_URL", "https://minivisionary.soulbridgeai.com/static/logo.png")
+APP_URL = os.getenv("PUBLIC_APP_URL", "http://localhost:5000")
+SUPPORT_EMAIL = os.getenv("FROM_EMAIL", "support@minivisionary.soulbridgeai.com")
 
-def get_welcome_email_template(user_name: str = "New User") -> dict:
-    """Welcome email template for new signups"""
+_SLOT = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+class CompiledTemplate:
+    """
+    A template with {{ name }} slots. `static` values are substituted at compile
+    time; the rest are filled by render(). Slot values are HTML-escaped when
+    html=True (use safe_fields to pass pre-built markup through untouched).
+    """
 
-    html_content = f"""
+    def __init__(self, source: str, html: bool = True, safe_fields=(), **static):
+        self.html = html
+        self.safe_fields = frozenset(safe_fields)
+        source = _SLOT.sub(lambda m: str(static[m.group(1)]) if m.group(1) in static else m.group(0), source)
+        pieces = _SLOT.split(source)
+        self._chunks = pieces[0::2]        # static text between slots
+        self._fields = tuple(pieces[1::2])  # slot names, in order
+        self.fields = frozenset(self._fields)
+
+    def render(self, **values) -> str:
+        chunks, out = self._chunks, [self._chunks[0]]
+        for i, name in enumerate(self._fields, 1):
+            v = values[name]
+            out.append(str(v) if not self.html or name in self.safe_fields else escape(str(v)))
+            out.append(chunks[i])
+        return "".join(out)
+
+
+EMAIL_CSS = """
+            body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; background-color: #f4f4f4; }
+            .container { max-width: 600px; margin: 0 auto; background-color: #ffffff; padding: 20px; border-radius: 10px; box-shadow: 0 0 10px rgba(0,0,0,0.1); }
+            .header { text-align: center; margin-bottom: 30px; }
+            .logo { max-width: 120px; height: auto; margin-bottom: 20px; }
+            .title { color: #663399; font-size: 28px; font-weight: bold; margin: 0; }
+            .subtitle { color: #666; font-size: 16px; margin: 10px 0; }
+            .subtitle.success { color: #10b981; font-size: 18px; font-weight: bold; }
+            .content { padding: 20px 0; }
+            .purchase-details { background-color: #f8f9fa; padding: 20px; border-radius: 8px; margin: 20px 0; }
+            .button { display: inline-block; background: linear-gradient(90deg, #ec4899, #a855f7, #06b6d4); color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold; margin: 20px 0; }
+            .footer { text-align: center; margin-top: 30px; padding-top: 20px; border-top: 1px solid #eee; color: #666; font-size: 14px; }
+            .success-icon { font-size: 48px; color: #10b981; margin-bottom: 10px; }
+"""
+
+_STATIC = dict(css=EMAIL_CSS, logo_url=escape(LOGO_URL), app_url=escape(APP_URL), support_email=escape(SUPPORT_EMAIL))
+_TEXT_STATIC = dict(app_url=APP_URL, support_email=SUPPORT_EMAIL)
+
+_WELCOME_HTML_SRC = """
     <!DOCTYPE html>
     <html>
     <head>
         <meta charset="utf-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <title>Welcome to Mini Visionary</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; background-color: #f4f4f4; }}
-            .container {{ max-width: 600px; margin: 0 auto; background-color: #ffffff; padding: 20px; border-radius: 10px; box-shadow: 0 0 10px rgba(0,0,0,0.1); }}
-            .header {{ text-align: center; margin-bottom: 30px; }}
-            .logo {{ max-width: 120px; height: auto; margin-bottom: 20px; }}
-            .title {{ color: #663399; font-size: 28px; font-weight: bold; margin: 0; }}
-            .subtitle {{ color: #666; font-size: 16px; margin: 10px 0; }}
-            .content {{ padding: 20px 0; }}
-            .button {{ display: inline-block; background: linear-gradient(90deg, #ec4899, #a855f7, #06b6d4); color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold; margin: 20px 0; }}
-            .footer {{ text-align: center; margin-top: 30px; padding-top: 20px; border-top: 1px solid #eee; color: #666; font-size: 14px; }}
-        </style>
+        <style>{{css}}</style>
     </head>
     <body>
         <div class="container">
             <div class="header">
-                <img src="{LOGO_URL}" alt="Mini Visionary Logo" class="logo">
+                <img src="{{logo_url}}" alt="Mini Visionary Logo" class="logo">
                 <h1 class="title">Welcome to Mini Visionary!</h1>
                 <p class="subtitle">Your creative journey starts here</p>
             </div>
 
             <div class="content">
-                <h2>Hello {user_name}!</h2>
+                <h2>Hello {{user_name}}!</h2>
                 <p>Welcome to the Mini Visionary community! We're excited to have you on board.</p>
 
                 <p>With Mini Visionary, you can:</p>
@@ -49,13 +95,13 @@ def get_welcome_email_template(user_name: str = "New User") -> dict:
                 <p>Ready to get started? Click the button below to explore your new creative playground:</p>
 
                 <div style="text-align: center;">
-                    <a href="{os.getenv('PUBLIC_APP_URL', 'http://localhost:5000')}" class="button">Start Creating</a>
+                    <a href="{{app_url}}" class="button">Start Creating</a>
                 </div>
             </div>
 
             <div class="footer">
                 <p>Thank you for joining Mini Visionary!</p>
-                <p>If you have any questions, feel free to reach out to us at <a href="mailto:{os.getenv('FROM_EMAIL', 'support@minivisionary.soulbridgeai.com')}">{os.getenv('FROM_EMAIL', 'support@minivisionary.soulbridgeai.com')}</a></p>
+                <p>If you have any questions, feel free to reach out to us at <a href="mailto:{{support_email}}">{{support_email}}</a></p>
                 <p style="margin-top: 20px; font-size: 12px; color: #999;">
                     Mini Visionary - Where Creativity Meets AI
                 </p>
@@ -65,8 +111,8 @@ def get_welcome_email_template(user_name: str = "New User") -> dict:
     </html>
     """
 
-    text_content = f"""
-    Welcome to Mini Visionary, {user_name}!
+_WELCOME_TEXT_SRC = """
+    Welcome to Mini Visionary, {{user_name}}!
 
     Your creative journey starts here. We're excited to have you on board.
 
@@ -76,76 +122,54 @@ def get_welcome_email_template(user_name: str = "New User") -> dict:
     - Share your creations with fellow artists
     - Access premium features and tools
 
-    Get started at: {os.getenv('PUBLIC_APP_URL', 'http://localhost:5000')}
+    Get started at: {{app_url}}
 
     Thank you for joining Mini Visionary!
 
-    If you have any questions, contact us at {os.getenv('FROM_EMAIL', 'support@minivisionary.soulbridgeai.com')}
+    If you have any questions, contact us at {{support_email}}
 
     Mini Visionary - Where Creativity Meets AI
     """
 
-    return {{
-        "subject": "Welcome to Mini Visionary - Let's Create Something Amazing!",
-        "html": html_content,
-        "text": text_content
-    }}
-
-
-def get_purchase_confirmation_template(user_name: str = "Valued Customer", amount: str = "$0.00", product_name: str = "Premium Access") -> dict:
-    """Purchase confirmation email template for Stripe payments"""
-
-    html_content = f"""
+_PURCHASE_HTML_SRC = """
     <!DOCTYPE html>
     <html>
     <head>
         <meta charset="utf-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <title>Purchase Confirmation - Mini Visionary</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; background-color: #f4f4f4; }}
-            .container {{ max-width: 600px; margin: 0 auto; background-color: #ffffff; padding: 20px; border-radius: 10px; box-shadow: 0 0 10px rgba(0,0,0,0.1); }}
-            .header {{ text-align: center; margin-bottom: 30px; }}
-            .logo {{ max-width: 120px; height: auto; margin-bottom: 20px; }}
-            .title {{ color: #663399; font-size: 28px; font-weight: bold; margin: 0; }}
-            .subtitle {{ color: #10b981; font-size: 18px; margin: 10px 0; font-weight: bold; }}
-            .content {{ padding: 20px 0; }}
-            .purchase-details {{ background-color: #f8f9fa; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-            .button {{ display: inline-block; background: linear-gradient(90deg, #ec4899, #a855f7, #06b6d4); color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold; margin: 20px 0; }}
-            .footer {{ text-align: center; margin-top: 30px; padding-top: 20px; border-top: 1px solid #eee; color: #666; font-size: 14px; }}
-            .success-icon {{ font-size: 48px; color: #10b981; margin-bottom: 10px; }}
-        </style>
+        <style>{{css}}</style>
     </head>
     <body>
         <div class="container">
             <div class="header">
-                <img src="{LOGO_URL}" alt="Mini Visionary Logo" class="logo">
+                <img src="{{logo_url}}" alt="Mini Visionary Logo" class="logo">
                 <div class="success-icon">✓</div>
                 <h1 class="title">Purchase Confirmed!</h1>
-                <p class="subtitle">Thank you for your purchase</p>
+                <p class="subtitle success">Thank you for your purchase</p>
             </div>
 
             <div class="content">
-                <h2>Hello {user_name}!</h2>
+                <h2>Hello {{user_name}}!</h2>
                 <p>Your purchase has been successfully processed. Thank you for choosing Mini Visionary!</p>
 
                 <div class="purchase-details">
                     <h3>Purchase Details:</h3>
-                    <p><strong>Product:</strong> {product_name}</p>
-                    <p><strong>Amount:</strong> {amount}</p>
-                    <p><strong>Date:</strong> {{new Date().toLocaleDateString()}}</p>
+                    <p><strong>Product:</strong> {{product_name}}</p>
+                    <p><strong>Amount:</strong> {{amount}}</p>
+                    <p><strong>Date:</strong> {{date}}</p>
                 </div>
 
                 <p>Your premium features are now active and ready to use. Enjoy creating with enhanced tools and capabilities!</p>
 
                 <div style="text-align: center;">
-                    <a href="{os.getenv('PUBLIC_APP_URL', 'http://localhost:5000')}" class="button">Access Your Premium Features</a>
+                    <a href="{{app_url}}" class="button">Access Your Premium Features</a>
                 </div>
             </div>
 
             <div class="footer">
                 <p>Thank you for supporting Mini Visionary!</p>
-                <p>If you have any questions about your purchase, please contact us at <a href="mailto:{os.getenv('FROM_EMAIL', 'support@minivisionary.soulbridgeai.com')}">{os.getenv('FROM_EMAIL', 'support@minivisionary.soulbridgeai.com')}</a></p>
+                <p>If you have any questions about your purchase, please contact us at <a href="mailto:{{support_email}}">{{support_email}}</a></p>
                 <p style="margin-top: 20px; font-size: 12px; color: #999;">
                     Mini Visionary - Where Creativity Meets AI
                 </p>
@@ -155,31 +179,49 @@ def get_purchase_confirmation_template(user_name: str = "Valued Customer", amoun
     </html>
     """
 
-    text_content = f"""
+_PURCHASE_TEXT_SRC = """
     Purchase Confirmed - Mini Visionary
 
-    Hello {user_name}!
+    Hello {{user_name}}!
 
     Your purchase has been successfully processed. Thank you for choosing Mini Visionary!
 
     Purchase Details:
-    - Product: {product_name}
-    - Amount: {amount}
-    - Date: {{new Date().toLocaleDateString()}}
+    - Product: {{product_name}}
+    - Amount: {{amount}}
+    - Date: {{date}}
 
     Your premium features are now active and ready to use.
 
-    Access your premium features at: {os.getenv('PUBLIC_APP_URL', 'http://localhost:5000')}
+    Access your premium features at: {{app_url}}
 
     Thank you for supporting Mini Visionary!
 
-    If you have any questions, contact us at {os.getenv('FROM_EMAIL', 'support@minivisionary.soulbridgeai.com')}
+    If you have any questions, contact us at {{support_email}}
 
     Mini Visionary - Where Creativity Meets AI
     """
 
-    return {{
+WELCOME_HTML = CompiledTemplate(_WELCOME_HTML_SRC, **_STATIC)
+WELCOME_TEXT = CompiledTemplate(_WELCOME_TEXT_SRC, html=False, **_TEXT_STATIC)
+PURCHASE_HTML = CompiledTemplate(_PURCHASE_HTML_SRC, **_STATIC)
+PURCHASE_TEXT = CompiledTemplate(_PURCHASE_TEXT_SRC, html=False, **_TEXT_STATIC)
+
+
+def get_welcome_email_template(user_name: str = "New User") -> dict:
+    """Welcome email template for new signups"""
+    return {
+        "subject": "Welcome to Mini Visionary - Let's Create Something Amazing!",
+        "html": WELCOME_HTML.render(user_name=user_name),
+        "text": WELCOME_TEXT.render(user_name=user_name),
+    }
+
+
+def get_purchase_confirmation_template(user_name: str = "Valued Customer", amount: str = "$0.00", product_name: str = "Premium Access", date: str | None = None) -> dict:
+    """Purchase confirmation email template for Stripe payments"""
+    date = date or datetime.utcnow().strftime("%B %d, %Y")
+    return {
         "subject": f"Purchase Confirmed - {product_name} - Mini Visionary",
-        "html": html_content,
-        "text": text_content
-    }}
\ No newline at end of file
+        "html": PURCHASE_HTML.render(user_name=user_name, amount=amount, product_name=product_name, date=date),
+        "text": PURCHASE_TEXT.render(user_name=user_name, amount=amount, product_name=product_name, date=date),
+    }
@@ -1,9 +1,13 @@
 from flask import Blueprint, request, jsonify, g
 from auth import auth_required
-from models import get_session, User
+from models import get_session
+import wallet
+import metrics
 
 bp = Blueprint("gallery", __name__, url_prefix="/api/gallery")
 
+GALLERY_POST_COST = 3
+
 @bp.post("/post")
 @auth_required
 def post_to_gallery():
@@ -13,18 +17,13 @@ def post_to_gallery():
     user_id = g.user_id
 
     with get_session() as s:
-        user = s.query(User).filter_by(id=user_id).first()
-        if not user:
-            return jsonify({"ok": False, "error": "User not found"}), 404
-
-        if user.credits < 3:
+        balance = wallet.spend(s, user_id, GALLERY_POST_COST, notes="gallery post")
+        if balance is None:
             return jsonify({"ok": False, "error": "Insufficient credits"}), 400
-
-        # Deduct 3 credits
-        user.credits -= 3
         s.commit()
+        metrics.credits_spent("gallery post", GALLERY_POST_COST)
 
         return jsonify({
             "ok": True,
-            "credits": user.credits
-        }), 200
+            "credits": balance
+        }), 200
\ No newline at end of file
@@ -1,67 +1,207 @@
+"""
+Health endpoints.
+
+  GET /api/_health/live   liveness: the process is up and serving (no I/O)
+  GET /api/_health/ready  readiness: critical checks only (DB, static pages)
+  GET /api/_health        full report: every registered check
+
+Checks run concurrently on a small thread pool with a per-run deadline, and
+the report is cached for HEALTH_CACHE_SECONDS so probes from several load
+balancers don't multiply the work (?fresh=1 bypasses the cache). Static pages
+are checked in-process through the Flask test client instead of a round-trip
+over the public URL. Other modules add checks with register_check().
+"""
 from __future__ import annotations
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable
+
 from flask import Blueprint, jsonify, current_app, request
 import requests
 
 health_bp = Blueprint("health", __name__, url_prefix="/api")
 
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "10"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "3"))
+HEALTH_QUEUE_MAX = int(os.getenv("HEALTH_QUEUE_MAX", "500"))
+HEALTH_UPSTREAM_CHECKS = os.getenv("HEALTH_UPSTREAM_CHECKS", "1") == "1"
+
 SIGNATURES = {
     "/auth.html":    "Mini Visionary — You Envision it, We Generate It",
     "/terms.html":   "Mini Visionary — Terms of Service",
     "/privacy.html": "Mini Visionary — Privacy Policy",
 }
 
-def fetch(url: str) -> tuple[int, str]:
-    r = requests.get(url, timeout=5, headers={"Cache-Control": "no-cache"})
-    return r.status_code, r.text
+UPSTREAMS = {
+    "openai": ("https://api.openai.com/v1/models", "OPENAI_API_KEY"),
+    "stripe": ("https://api.stripe.com/v1/balance", "STRIPE_SECRET_KEY"),
+    "resend": ("https://api.resend.com/domains", "RESEND_API_KEY"),
+}
+
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="health")
+
+# name -> (fn(app) -> dict, critical)
+_CHECKS: dict[str, tuple[Callable, bool]] = {}
+
+
+def register_check(name: str, fn: Callable, critical: bool = False) -> None:
+    """
+    Add a health check. fn(app) returns a dict with at least {"ok": bool};
+    critical checks decide readiness, the rest are reported only.
+    """
+    _CHECKS[name] = (fn, critical)
+
 
 def is_spa(html: str) -> bool:
     return 'id="root"' in html.lower()
 
-@health_bp.get("/_health")
-def health():
-    base = current_app.config.get("PUBLIC_BASE_URL", "").rstrip("/")
-    # Fallback to local if not set
-    if not base:
-        host = current_app.config.get("HOST", "http://localhost:8080").rstrip("/")
-        base = host
 
-    checks = {}
-    all_ok = True
+# ---------------------------
+# Built-in checks
+# ---------------------------
+def _page_check(path: str, needle: str):
+    def check(app):
+        resp = app.test_client().get(path, headers={"Cache-Control": "no-cache"})
+        body = resp.get_data(as_text=True)
+        spa = is_spa(body)
+        has_sig = needle.lower() in body.lower()
+        return {"ok": resp.status_code == 200 and has_sig and not spa,
+                "status": resp.status_code, "spa_leak": spa, "has_signature": has_sig}
+    return check
+
+
+def _db_check(app):
+    from sqlalchemy import text
+    from models import get_engine
+    engine = get_engine()
+    t0 = time.perf_counter()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    out = {"ok": True, "latency_ms": round((time.perf_counter() - t0) * 1000, 1)}
+    pool = engine.pool
+    for stat in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, stat, None)
+        if callable(fn):
+            try:
+                out[f"pool_{stat}"] = fn()
+            except Exception:
+                pass
+    return out
+
+
+def _queue_check(app):
+    from datetime import datetime
+    from models import get_session, WebhookEvent, EmailOutbox, CreditHold
+    now = datetime.utcnow()
+    with get_session() as s:
+        depths = {
+            "webhooks_pending": s.query(WebhookEvent).filter(WebhookEvent.status == "pending").count(),
+            "webhooks_dead": s.query(WebhookEvent).filter(WebhookEvent.status == "dead").count(),
+            "email_pending": s.query(EmailOutbox).filter(EmailOutbox.status == "pending").count(),
+            "email_dead": s.query(EmailOutbox).filter(EmailOutbox.status == "dead").count(),
+            "credit_holds_expired": s.query(CreditHold).filter(CreditHold.status == "held",
+                                                               CreditHold.expires_at < now).count(),
+        }
+    backlog = depths["webhooks_pending"] + depths["email_pending"] + depths["credit_holds_expired"]
+    return {"ok": backlog <= HEALTH_QUEUE_MAX, **depths}
+
+
+def _upstream_check(url: str, key_env: str):
+    def check(app):
+        key = os.getenv(key_env)
+        if not key:
+            return {"ok": True, "skipped": f"{key_env} not set"}
+        t0 = time.perf_counter()
+        r = requests.get(url, headers={"Authorization": f"Bearer {key}"}, timeout=HEALTH_CHECK_TIMEOUT)
+        return {"ok": r.status_code < 500, "status": r.status_code,
+                "latency_ms": round((time.perf_counter() - t0) * 1000, 1)}
+    return check
+
 
-    for path, needle in SIGNATURES.items():
-        url = f"{base}{path}"
-        status, body = (0, "")
-        ok = False
-        spa = False
+for _path, _needle in SIGNATURES.items():
+    register_check(f"page:{_path}", _page_check(_path, _needle), critical=True)
+register_check("db", _db_check, critical=True)
+register_check("queues", _queue_check)
+if HEALTH_UPSTREAM_CHECKS:
+    for _name, (_url, _env) in UPSTREAMS.items():
+        register_check(f"upstream:{_name}", _upstream_check(_url, _env))
+
+
+# ---------------------------
+# Runner + cache
+# ---------------------------
+_cache: dict[bool, tuple[float, dict]] = {}
+_cache_lock = threading.Lock()
+
+
+def _run(app, critical_only: bool) -> dict:
+    def timed(fn):
+        t0 = time.perf_counter()
         try:
-            status, body = fetch(url)
-            spa = is_spa(body)
-            ok = (status == 200) and (needle.lower() in body.lower()) and (not spa)
+            res = fn(app)
         except Exception as e:
-            checks[path] = {"ok": False, "error": str(e)}
-            all_ok = False
-            continue
-
-        checks[path] = {
-            "ok": ok,
-            "status": status,
-            "spa_leak": spa,
-            "has_signature": needle.lower() in body.lower(),
-        }
-        if not ok:
-            all_ok = False
+            res = {"ok": False, "error": str(e)}
+        res.setdefault("ms", round((time.perf_counter() - t0) * 1000, 1))
+        return res
+
+    selected = {n: c for n, c in _CHECKS.items() if c[1] or not critical_only}
+    futures = {n: _pool.submit(timed, fn) for n, (fn, _) in selected.items()}
+    wait(futures.values(), timeout=HEALTH_CHECK_TIMEOUT)
+
+    checks = {}
+    for name, fut in futures.items():
+        if fut.done():
+            checks[name] = fut.result()
+        else:
+            checks[name] = {"ok": False, "error": f"timeout after {HEALTH_CHECK_TIMEOUT}s"}
+        checks[name]["critical"] = selected[name][1]
+
+    ready = all(c["ok"] for c in checks.values() if c["critical"])
+    return {"ok": ready, "degraded": ready and not all(c["ok"] for c in checks.values()),
+            "checked_at": time.time(), "checks": checks}
+
+
+def run_checks(critical_only: bool = False, fresh: bool = False) -> dict:
+    """Run (or reuse cached) health checks. Concurrent callers share one run."""
+    app = current_app._get_current_object()
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(critical_only)
+        if hit and not fresh and now - hit[0] < HEALTH_CACHE_SECONDS:
+            return {**hit[1], "cached": True}
+        report = _run(app, critical_only)
+        _cache[critical_only] = (time.monotonic(), report)
+    return {**report, "cached": False}
 
+
+def _respond(report: dict):
     return jsonify({
-        "ok": all_ok,
         "service": "mini-visionary",
         "version": current_app.config.get("APP_VERSION", "dev"),
-        "base": base,
-        "checks": checks,
-    }), (200 if all_ok else 503)
+        **report,
+    }), (200 if report["ok"] else 503)
+
+
+@health_bp.get("/_health/live")
+def live():
+    return jsonify({"ok": True, "service": "mini-visionary"}), 200
+
+
+@health_bp.get("/_health/ready")
+def ready():
+    return _respond(run_checks(critical_only=True, fresh=request.args.get("fresh") == "1"))
+
+
+@health_bp.get("/_health")
+def health():
+    return _respond(run_checks(fresh=request.args.get("fresh") == "1"))
+
 
 @health_bp.after_request
 def _no_cache_health(resp):
-    if request.path == "/api/_health":
+    if request.path.startswith("/api/_health"):
         resp.headers["Cache-Control"] = "no-store, must-revalidate"
         resp.headers["Pragma"] = "no-cache"
-    return resp
\ No newline at end of file
+    return resp
@@ -2,12 +2,15 @@
 from __future__ import annotations
 import os
 from flask import Blueprint, jsonify, make_response
+from response_cache import cached_response, GIT_SHA
 
 legal_bp = Blueprint("legal", __name__, url_prefix="/api/legal")
 
 BRAND = os.getenv("BRAND_NAME", "Mini-Visionary")
 SUPPORT = os.getenv("SUPPORT_EMAIL", "support@minivisionary.com")
 LAST_UPDATED = os.getenv("LEGAL_LAST_UPDATED", "January 2025")
+# compressed responses are cached until the legal text or the deploy changes
+CACHE_VERSION = f"{LAST_UPDATED}:{GIT_SHA}"
 
 def _json(payload: dict):
     resp = make_response(jsonify(payload))
@@ -16,6 +19,7 @@ def _json(payload: dict):
     return resp
 
 @legal_bp.get("/terms")
+@cached_response(version=CACHE_VERSION)
 def terms():
     return _json({
         "title": f"Terms of Service - {BRAND}",
@@ -65,6 +69,7 @@ def terms():
     })
 
 @legal_bp.get("/privacy")
+@cached_response(version=CACHE_VERSION)
 def privacy():
     return _json({
         "title": f"Privacy Policy - {BRAND}",
@@ -114,6 +119,7 @@ def privacy():
     })
 
 @legal_bp.get("/ads")
+@cached_response(version=CACHE_VERSION)
 def ads():
     """Ad/consent disclosure (handy for AdSense links or CMP)"""
     return _json({
@@ -6,13 +6,14 @@ import uuid
 from werkzeug.utils import secure_filename
 
 from flask import Blueprint, request, jsonify, g, current_app
-from sqlalchemy import func, or_
+from sqlalchemy import or_
 
 from models import (
-    get_session, Poster, Asset, PosterJob, CreditLedger,
+    get_session, Poster, Asset, PosterJob,
     PosterStyle, User
 )
 from auth import auth_required
+from wallet import get_summary
 
 library_bp = Blueprint("library", __name__, url_prefix="/api")
 
@@ -232,7 +233,7 @@ def delete_poster(poster_id):
 def get_profile():
     """Get user profile with stats"""
     with get_session() as s:
-        db_user = s.query(User).filter_by(id=g.user.id).first()
+        db_user, summary = get_summary(s, g.user.id)
         if not db_user:
             return jsonify({"ok": False, "error": "User not found"}), 404
 
@@ -241,15 +242,8 @@ def get_profile():
             is_deleted=False
         ).count()
 
-        credit_spent = s.query(func.sum(CreditLedger.amount)).filter(
-            CreditLedger.user_id == db_user.id,
-            CreditLedger.event == 'spend'
-        ).scalar() or 0
-
-        credit_purchased = s.query(func.sum(CreditLedger.amount)).filter(
-            CreditLedger.user_id == db_user.id,
-            CreditLedger.event == 'purchase'
-        ).scalar() or 0
+        credit_spent = summary.total_spent if summary else 0
+        credit_purchased = summary.total_purchased if summary else 0
 
         avatar = getattr(db_user, 'avatar_url', None)
         return jsonify({
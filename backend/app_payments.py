@@ -1,25 +1,34 @@
 # payments.py
 import os
-import stripe
 from datetime import datetime
 from flask import Blueprint, request, jsonify, g
 from werkzeug.exceptions import BadRequest, NotFound
 from auth import auth_required
-from models import get_session, User, CreditLedger, CreditEventType
-from mailer import send_email
+from models import get_session, CreditLedger, CreditEventType
+from wallet import get_summary
+from mailer import send_batch
+from receipts import load_receipts, render_receipt, render_receipts, UNKNOWN_PRODUCT
+from response_cache import cached_response
+import resilience
 
 # Stripe init (use STRIPE_SECRET_KEY or fall back to SECRET_KEY for backward compatibility)
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY") or os.getenv("SECRET_KEY")
+STRIPE_KEY = os.getenv("STRIPE_SECRET_KEY") or os.getenv("SECRET_KEY")
 FRONTEND_ORIGIN = (os.getenv("FRONTEND_ORIGIN") or "").rstrip("/")
 CURRENCY = "usd"
 
 # Debug: Log Stripe configuration status (remove in production)
 import logging
-logging.info(f"Stripe API Key configured: {bool(stripe.api_key)}")
+logging.info(f"Stripe API Key configured: {bool(STRIPE_KEY)}")
 logging.info(f"Price IDs configured - Starter: {bool(os.getenv('STORE_PRICE_STARTER'))}, Standard: {bool(os.getenv('STORE_PRICE_STANDARD'))}, Studio: {bool(os.getenv('STORE_PRICE_STUDIO'))}")
 
 payments_bp = Blueprint("payments", __name__, url_prefix="/api/payments")
 
+def _stripe():
+    """The stripe SDK takes ~1s to import; load it on first use, not at worker boot."""
+    import stripe
+    stripe.api_key = STRIPE_KEY
+    return stripe
+
 # ---- PRODUCT CATALOG (server authority) ----
 PRODUCTS = {
     "starter": {
@@ -53,6 +62,7 @@ PRODUCTS = {
 }
 
 @payments_bp.get("/products")
+@cached_response()
 def products():
     """List purchasable credit packs (no price IDs leaked)."""
     items = [{
@@ -69,8 +79,8 @@ def products():
 def debug_config():
     """Debug endpoint to check Stripe configuration (REMOVE IN PRODUCTION)"""
     return jsonify({
-        "stripe_api_key_set": bool(stripe.api_key),
-        "stripe_api_key_length": len(stripe.api_key) if stripe.api_key else 0,
+        "stripe_api_key_set": bool(STRIPE_KEY),
+        "stripe_api_key_length": len(STRIPE_KEY) if STRIPE_KEY else 0,
         "price_starter_set": bool(os.getenv("STORE_PRICE_STARTER")),
         "price_standard_set": bool(os.getenv("STORE_PRICE_STANDARD")),
         "price_studio_set": bool(os.getenv("STORE_PRICE_STUDIO")),
@@ -91,7 +101,7 @@ def checkout():
     product = PRODUCTS[sku]
 
     # Check if Stripe is configured
-    if not stripe.api_key or not product.get("stripe_price"):
+    if not STRIPE_KEY or not product.get("stripe_price"):
         return jsonify(
             ok=False,
             error="Stripe not configured. Please set STRIPE_SECRET_KEY and price IDs in environment variables."
@@ -101,19 +111,23 @@ def checkout():
     success_url = data.get("success_url") or f"{FRONTEND_ORIGIN}/checkout/success"
     cancel_url  = data.get("cancel_url")  or f"{FRONTEND_ORIGIN}/checkout/cancel"
 
+    stripe = _stripe()
     try:
         # Use subscription mode for recurring products, payment mode for one-time purchases
         mode = "subscription" if sku == "adfree" else "payment"
 
-        session = stripe.checkout.Session.create(
-            mode=mode,
-            line_items=[{"price": product["stripe_price"], "quantity": 1}],
-            success_url=success_url,
-            cancel_url=cancel_url,
-            client_reference_id=str(g.user_id),
-            metadata={"sku": sku, "user_id": str(g.user_id)},
-        )
+        with resilience.upstream("stripe", "checkout.sessions.create"):
+            session = stripe.checkout.Session.create(
+                mode=mode,
+                line_items=[{"price": product["stripe_price"], "quantity": 1}],
+                success_url=success_url,
+                cancel_url=cancel_url,
+                client_reference_id=str(g.user_id),
+                metadata={"sku": sku, "user_id": str(g.user_id)},
+            )
         return jsonify(ok=True, url=session.url)
+    except resilience.UpstreamUnavailable as e:
+        return resilience.unavailable_response(e)
     except stripe.error.StripeError as e:
         return jsonify(ok=False, error=str(e)), 500
     except Exception as e:
@@ -123,8 +137,10 @@ def checkout():
 @auth_required
 def get_session_status(session_id: str):
     """Verify a Checkout Session belongs to this user, then return status."""
+    stripe = _stripe()
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        with resilience.upstream("stripe", "checkout.sessions.retrieve"):
+            session = stripe.checkout.Session.retrieve(session_id)
         if (session.client_reference_id or "") != str(g.user_id):
             # Don’t leak existence; just 404
             raise NotFound("Session not found")
@@ -134,39 +150,44 @@ def get_session_status(session_id: str):
         return jsonify(ok=True, status=session.payment_status, customer_email=customer_email)
     except NotFound:
         raise
+    except resilience.UpstreamUnavailable as e:
+        return resilience.unavailable_response(e)
     except stripe.error.StripeError as e:
         return jsonify(ok=False, error=str(e)), 500
 
 @payments_bp.get("/wallet")
 @auth_required
 def wallet():
-    """Return current credits and last 10 purchase receipts."""
+    """Return current credits, purchase summary and last 10 purchase receipts."""
     with get_session() as s:
-        user = s.query(User).filter_by(id=g.user_id).first()
+        user, summary = get_summary(s, g.user_id)
         credits = user.credits if user else 0
 
+        # ix_credit_ledger_user_event_created: index range scan, no per-row SKU inference
         receipts_q = (s.query(CreditLedger)
-                        .filter_by(user_id=g.user_id, event=CreditEventType.PURCHASE)
+                        .filter_by(user_id=g.user_id, event_type=CreditEventType.PURCHASE)
                         .order_by(CreditLedger.created_at.desc())
                         .limit(10))
 
         receipts = []
         for r in receipts_q:
-            notes = r.notes or ""
-            # Try to infer SKU from notes (fallback to 'unknown')
-            sku = next((psku for psku, prod in PRODUCTS.items() if prod["name"] in notes), "unknown")
+            sku = r.sku or "unknown"
             receipts.append({
                 "id": r.id,
                 "sku": sku,
                 "amount": PRODUCTS.get(sku, {}).get("amount_cents", 0) / 100.0,
                 "currency": CURRENCY,
-                "provider_id": (r.ref or "").replace("stripe:", ""),
+                "provider_id": (r.reference or "").replace("stripe:", ""),
                 "created_at": r.created_at.isoformat(),
-                "notes": notes,
+                "notes": r.notes or "",
             })
 
         wallet_data = {
-        "credits": credits,
+            "credits": credits,
+            "total_purchased": summary.total_purchased if summary else 0,
+            "total_spent": summary.total_spent if summary else 0,
+            "last_purchase_at": summary.last_purchase_at.isoformat() if summary and summary.last_purchase_at else None,
+            "last_purchase_sku": summary.last_purchase_sku if summary else None,
             "updated_at": user.updated_at.isoformat() if user and user.updated_at else None
         }
         return jsonify(ok=True, wallet=wallet_data, receipts=receipts)
@@ -176,275 +197,49 @@ def wallet():
 def get_receipt(receipt_id: int):
     """Return a printable HTML receipt for a purchase."""
     with get_session() as s:
-        receipt = (s.query(CreditLedger)
-                     .filter_by(id=receipt_id, user_id=g.user_id, event=CreditEventType.PURCHASE)
-                     .first())
-        if not receipt:
+        rows = load_receipts(s, [receipt_id], user_id=g.user_id)
+        if not rows:
             raise NotFound("Receipt not found")
-
-        user = s.query(User).filter_by(id=g.user_id).first()
-        notes = receipt.notes or ""
-
-        sku = next((psku for psku, prod in PRODUCTS.items() if prod["name"] in notes), "unknown")
-        product_info = PRODUCTS.get(sku, {
-        "name": "Unknown Pack",
-            "desc": "Poster credits",
-            "credits": receipt.amount,
-            "amount_cents": 0
-        })
-
-        receipt_html = f"""<!DOCTYPE html>
-<html>
-<head>
-<meta charset="utf-8">
-<title>Receipt #{receipt.id} - Mini-Visionary</title>
-<style>
-  body {{
-    font-family: system-ui, -apple-system, sans-serif;
-    max-width: 600px;
-    margin: 0 auto;
-    padding: 20px;
-    background: black;
-    color: white;
-  }}
-
-  .header {{
-    text-align: center;
-    margin-bottom: 30px;
-    border-bottom: 2px solid #0891b2;
-    padding-bottom: 20px;
-  }}
-
-  .logo {{
-    color: #06b6d4;
-    font-size: 24px;
-    font-weight: bold;
-    margin-bottom: 8px;
-  }}
-
-  .company {{
-color: #a5b4fc;
-    font-size: 14px;
-  }}
-
-  .receipt-info {{
-display: flex;
-    justify-content: space-between;
-    margin: 20px 0;
-  }}
-
-  .receipt-info div {{
-color: #a5b4fc;
-  }}
-
-  .receipt-info strong {{
-color: #fff;
-    display: block;
-  }}
-
-  .items {{
-border: 1px solid #374151;
-    border-radius: 8px;
-    margin: 20px 0;
-  }}
-
-  .item-header {{
-background: #1e293b;
-    padding: 12px;
-    border-bottom: 1px solid #374151;
-    font-weight: bold;
-  }}
-
-  .item {{
-padding: 12px;
-    border-bottom: 1px solid #374151;
-  }}
-
-  .item:last-child {{
-border-bottom: none;
-  }}
-
-  .item-name {{
-font-weight: 600;
-    color: #06b6d4;
-  }}
-
-  .item-desc {{
-color: #a5b4fc;
-    font-size: 14px;
-    margin: 4px 0;
-  }}
-
-  .item-price {{
-float: right;
-    font-weight: bold;
-  }}
-
-  .total {{
-text-align: right;
-    margin: 20px 0;
-    font-size: 18px;
-  }}
-
-  .total-label {{
-color: #a5b4fc;
-  }}
-
-  .total-amount {{
-font-weight: bold;
-    color: #06b6d4;
-  }}
-
-  .footer {{
-    margin-top: 40px;
-    padding-top: 20px;
-    border-top: 1px solid #374151;
-    text-align: center;
-    color: #6b7280;
-    font-size: 12px;
-  }}
-
-  @media print {{
-    body {{ background: white; color: black; }}
-    .header {{ border-bottom-color: #0891b2; }}
-    .logo {{ color: #0891b2; }}
-    .company, .receipt-info div, .item-desc {{ color: #666; }}
-    .items {{ border-color: #ddd; }}
-    .item-header {{ background: #f8f9fa; border-bottom-color: #ddd; }}
-    .item {{ border-bottom-color: #ddd; }}
-    .item-name, .total-amount {{ color: #0891b2; }}
-    .footer {{ border-top-color: #ddd; color: #666; }}
-  }}
-</style>
-</head>
-<body>
-  <div class="header">
-    <div class="logo">Mini-Visionary</div>
-    <div class="company">AI-Powered Poster Generation</div>
-  </div>
-
-  <div class="receipt-info">
-    <div>
-      <strong>Receipt #{receipt.id}</strong>
-      Date: {receipt.created_at.strftime('%B %d, %Y at %I:%M %p')}
-    </div>
-    <div>
-      <strong>Customer</strong>
-      {(user.email if user else 'N/A')}
-    </div>
-  </div>
-
-  <div class="items">
-    <div class="item-header">Purchase Details</div>
-    <div class="item">
-      <div class="item-name">{product_info['name']}</div>
-      <div class="item-desc">{product_info['desc']}</div>
-      <div class="item-price">${product_info['amount_cents'] / 100:.2f}</div>
-    </div>
-  </div>
-
-  <div class="total">
-    <span class="total-label">Total Paid: </span>
-    <span class="total-amount">${product_info['amount_cents'] / 100:.2f} USD</span>
-  </div>
-
-  <div class="total">
-    <span class="total-label">Credits Added: </span>
-    <span class="total-amount">{receipt.amount} poster credits</span>
-  </div>
-
-  <div class="footer">
-    <p>Thank you for your purchase!</p>
-    <p>Transaction ID: {(receipt.ref or '').replace('stripe:', '') or 'N/A'}</p>
-    <p>Questions? Contact us at support@minivisionary.com</p>
-  </div>
-</body>
-</html>"""
+        receipt, user = rows[0]
+        receipt_html = render_receipt(receipt, user, _product_for(receipt), variant="page")
         return receipt_html, 200, {'Content-Type': 'text/html'}
 
 @payments_bp.post("/email-receipt")
 @auth_required
 def email_receipt():
-    """Email a receipt to the user."""
+    """Email one receipt (receipt_id) or several (receipt_ids) to the user in one provider batch."""
     data = request.get_json() or {}
-    receipt_id = data.get("receipt_id")
-    if not receipt_id:
+    receipt_ids = data.get("receipt_ids") or ([data["receipt_id"]] if data.get("receipt_id") else [])
+    if not receipt_ids:
         raise BadRequest("receipt_id is required")
+    try:
+        receipt_ids = [int(r) for r in receipt_ids]
+    except (TypeError, ValueError):
+        raise BadRequest("receipt_id must be an integer")
 
     with get_session() as s:
-        receipt = (s.query(CreditLedger)
-                     .filter_by(id=receipt_id, user_id=g.user_id, event=CreditEventType.PURCHASE)
-                     .first())
-        if not receipt:
+        rows = load_receipts(s, receipt_ids, user_id=g.user_id)
+        if len(rows) != len(set(receipt_ids)):
             raise NotFound("Receipt not found")
 
-        user = s.query(User).filter_by(id=g.user_id).first()
-        if not user:
-            raise NotFound("User not found")
-
-        notes = receipt.notes or ""
-        sku = next((psku for psku, prod in PRODUCTS.items() if prod["name"] in notes), "unknown")
-        product_info = PRODUCTS.get(sku, {
-        "name": "Unknown Pack",
-            "desc": "Poster credits",
-            "credits": receipt.amount,
-            "amount_cents": 0
-        })
-
-        # Email-friendly receipt HTML (light background)
-        receipt_html = f"""
-<div style="font-family: system-ui, -apple-system, sans-serif; max-width: 600px; margin: 0 auto; background: #f8f9fa; padding: 20px;">
-  <div style="text-align: center; margin-bottom: 30px; border-bottom: 2px solid #0891b2; padding-bottom: 20px;">
-    <div style="color: #0891b2; font-size: 24px; font-weight: bold; margin-bottom: 8px;">Mini-Visionary</div>
-    <div style="color: #666; font-size: 14px;">AI-Powered Poster Generation</div>
-  </div>
-
-  <div style="display: flex; justify-content: space-between; margin: 20px 0; flex-wrap: wrap;">
-    <div style="color: #666; margin-bottom: 10px;">
-      <strong style="color: #333; display: block;">Receipt #{receipt.id}</strong>
-      Date: {receipt.created_at.strftime('%B %d, %Y at %I:%M %p')}
-    </div>
-    <div style="color: #666; margin-bottom: 10px;">
-      <strong style="color: #333; display: block;">Customer</strong>
-      {user.email}
-    </div>
-  </div>
-
-  <div style="border: 1px solid #ddd; border-radius: 8px; margin: 20px 0; background: white;">
-    <div style="background: #f8f9fa; padding: 12px; border-bottom: 1px solid #ddd; font-weight: bold;">Purchase Details</div>
-    <div style="padding: 12px;">
-      <div style="font-weight: 600; color: #0891b2;">{product_info['name']}</div>
-      <div style="color: #666; font-size: 14px; margin: 4px 0;">{product_info['desc']}</div>
-      <div style="float: right; font-weight: bold;">${product_info['amount_cents'] / 100:.2f}</div>
-      <div style="clear: both;"></div>
-    </div>
-  </div>
+        bodies = render_receipts(rows, _product_for, variant="email")
+        messages = [{
+            "to": user.email,
+            "subject": f"Receipt #{receipt.id} - Mini-Visionary",
+            "html": html,
+            "tags": {"event": "receipt_email"},
+        } for (receipt, user), html in zip(rows, bodies)]
 
-  <div style="text-align: right; margin: 20px 0; font-size: 18px;">
-    <span style="color: #666;">Total Paid: </span>
-    <span style="font-weight: bold; color: #0891b2;">${product_info['amount_cents'] / 100:.2f} USD</span>
-  </div>
-
-  <div style="text-align: right; margin: 20px 0; font-size: 18px;">
-    <span style="color: #666;">Credits Added: </span>
-    <span style="font-weight: bold; color: #0891b2;">{receipt.amount} poster credits</span>
-  </div>
+    try:
+        errors = [str(r) for r in send_batch(messages) if isinstance(r, Exception)]
+    except Exception as e:
+        errors = [str(e)]
+    if errors:
+        return jsonify(ok=False, error=f"Failed to send email: {errors[0]}"), 500
+    return jsonify(ok=True, message="Receipt emailed successfully" if len(messages) == 1 else f"{len(messages)} receipts emailed successfully")
 
-  <div style="margin-top: 40px; padding-top: 20px; border-top: 1px solid #ddd; text-align: center; color: #666; font-size: 12px;">
-    <p>Thank you for your purchase!</p>
-    <p>Transaction ID: {(receipt.ref or '').replace('stripe:', '') or 'N/A'}</p>
-    <p>Questions? Contact us at support@minivisionary.com</p>
-  </div>
-</div>
-        """
 
-        try:
-            send_email(
-                to=user.email,
-                subject=f"Receipt #{receipt.id} - Mini-Visionary",
-                html=receipt_html,
-                tags={"event": "receipt_email"}
-            )
-            return jsonify(ok=True, message="Receipt emailed successfully")
-        except Exception as e:
-            return jsonify(ok=False, error=f"Failed to send email: {str(e)}"), 500
\ No newline at end of file
+def _product_for(receipt: CreditLedger) -> dict:
+    notes = receipt.notes or ""
+    sku = receipt.sku or next((psku for psku, prod in PRODUCTS.items() if prod["name"] in notes), "unknown")
+    return PRODUCTS.get(sku) or {**UNKNOWN_PRODUCT, "credits": receipt.amount}
@@ -148,10 +148,7 @@ def update_profile_name():
 @auth_required
 def change_password():
     """Change user password"""
-    from flask_bcrypt import Bcrypt
-    from werkzeug.security import check_password_hash
-
-    bcrypt_instance = Bcrypt()
+    import passwords
 
     try:
         data = request.get_json()
@@ -172,21 +169,12 @@ def change_password():
             if not user:
                 return jsonify({"ok": False, "error": "User not found"}), 404
 
-            # Verify current password
-            password_valid = False
-            if user.password_hash:
-                # Try bcrypt first
-                try:
-                    password_valid = bcrypt_instance.check_password_hash(user.password_hash, current_password)
-                except:
-                    # Fallback to werkzeug
-                    password_valid = check_password_hash(user.password_hash, current_password)
-
-            if not password_valid:
+            # Verify current password (bcrypt or legacy werkzeug)
+            if not passwords.check_password(user.password_hash, current_password):
                 return jsonify({"ok": False, "error": "Current password is incorrect"}), 401
 
             # Hash and save new password
-            user.password_hash = bcrypt_instance.generate_password_hash(new_password).decode('utf-8')
+            user.password_hash = passwords.hash_password(new_password)
             session.commit()
 
             return jsonify({"ok": True, "message": "Password changed successfully"}), 200
@@ -1,26 +1,47 @@
-import os, base64, traceback
+import startup  # first: with STARTUP_PROFILE=1 it times every import below
+import os, base64, logging, time, traceback, uuid
 from io import BytesIO
 from functools import wraps
 from datetime import timedelta
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, g, request, jsonify, send_file
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
-from werkzeug.security import generate_password_hash, check_password_hash
 
 # Use existing Mini-Visionary models and session management
-from models import User, ImageJob, Library, GalleryPost, Reaction, get_session
-
-# --- OpenAI new SDK ---
-from openai import OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# --- Stripe ---
-import stripe
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+from models import User, ImageJob, Library, GalleryPost, Reaction, CreditEventType, get_session
+import wallet
+import outbox
+import webhooks
+import migrate
+import db_metrics
+import logconfig
+import metrics
+import resilience
+import refine_cache
+import passwords
+from app_health import health_bp
+
+# --- OpenAI new SDK (client built on first use; the SDK import is ~750ms of worker boot) ---
+_oai_client = None
+
+def _openai():
+    global _oai_client
+    if _oai_client is None:
+        from openai import OpenAI
+        _oai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))  # honours OPENAI_BASE_URL
+    return _oai_client
+
+OPENAI_API_BASE = (os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").rstrip("/")
+
+# --- Stripe (imported on first use; the SDK is ~1s of worker boot) ---
+def _stripe():
+    import stripe
+    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+    return stripe
 
 app = Flask(__name__)
 
@@ -36,6 +57,21 @@ COST_VARIATION = int(os.getenv("CREDIT_COST_VARIATION", "5"))
 COST_REMIX = int(os.getenv("CREDIT_COST_REMIX", "15"))
 COST_GALLERY_POST = int(os.getenv("CREDIT_COST_GALLERY_POST", "3"))
 
+# JSON logs to stdout, written off the request thread; LOG_SAMPLE / LOG_RATE_LIMIT
+# thin out high-volume INFO/DEBUG lines (see logconfig.py)
+logconfig.init(logging.INFO)
+logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+# Schema: one version query; migrates (advisory-locked) only when a deploy adds steps
+migrate.ensure_schema()
+
+# Release credit holds whose generation never settled (crashed worker, killed request)
+wallet.start_hold_sweeper()
+# Send anything left in the email outbox by a previous process
+outbox.start_worker()
+# Apply webhook events left pending or due for retry by a previous process
+webhooks.start_worker()
+
 # Allowed image sizes
 ALLOWED_SIZES = {"1024x1024", "1024x1792", "1792x1024"}
 
@@ -48,6 +84,37 @@ limiter = Limiter(get_remote_address, app=app, default_limits=["60/minute", "600
 # JWT
 jwt = JWTManager(app)
 
+# Request ids and one request_end line per request with its DB counters, as in app.py
+@app.before_request
+def _request_start():
+    g.request_id = request.headers.get("X-Request-ID") or str(uuid.uuid4())
+    g._t0 = time.time()
+
+@app.after_request
+def _request_end(response):
+    rid = getattr(g, "request_id", None) or str(uuid.uuid4())  # unset if an earlier hook answered
+    response.headers["X-Request-ID"] = rid
+    logging.info("request_end", extra={
+        "rid": rid,
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "duration_ms": round((time.time() - getattr(g, "_t0", time.time())) * 1000, 2),
+        **db_metrics.request_stats(),
+    })
+    return response
+
+# Per-request query count / DB time; slow-query and N+1 warnings (see db_metrics.py; after _request_start: uses g.request_id)
+db_metrics.init_app(app)
+# Prometheus: per-route latency, upstream calls, pool, credits -> GET /metrics
+metrics.init_app(app)
+# Bulkheads + circuit breakers for OpenAI/Stripe: 503 + Retry-After when an upstream is down
+resilience.init_app(app)
+# /api/refine-prompt results are memoized (hit ratio in the "refine_cache" health check)
+refine_cache.register_health_check()
+# /api/_health/live (liveness), /api/_health/ready and /api/_health (the checks registered above)
+app.register_blueprint(health_bp)
+
 # --- Helpers ---
 def with_session(fn):
     @wraps(fn)
@@ -57,6 +124,8 @@ def with_session(fn):
     return wrapper
 
 def fail(msg, code=400, e=None):
+    if isinstance(e, resilience.UpstreamUnavailable):
+        return resilience.unavailable_response(e)
     if e:
         import sys
         sys.stderr.write(f"ERROR: {msg}\n{traceback.format_exc()}\n")
@@ -74,7 +143,7 @@ def register(db):
         return fail("Email and password required.")
     if db.query(User).filter_by(email=email).first():
         return fail("Email already registered.", 409)
-    user = User(email=email, password_hash=generate_password_hash(password), credits=CREDIT_START)
+    user = User(email=email, password_hash=passwords.hash_password(password), credits=CREDIT_START)
     db.add(user); db.commit()
     token = create_access_token(identity=user.id)
     return jsonify({"ok": True, "token": token, "credits": user.credits})
@@ -92,13 +161,12 @@ def login(db):
     if not user or not user.password_hash or not user.password_hash.strip():
         return fail("Invalid credentials.", 401)
 
-    # Verify password
-    try:
-        if not check_password_hash(user.password_hash, password):
-            return fail("Invalid credentials.", 401)
-    except ValueError:
-        # Invalid password hash format
+    # Verify password (bcrypt or legacy PBKDF2, on the hashing pool; malformed hashes fail)
+    if not passwords.check_password(user.password_hash, password):
         return fail("Invalid credentials.", 401)
+    if passwords.needs_rehash(user.password_hash):
+        user.password_hash = passwords.hash_password(password)
+        db.commit()
 
     token = create_access_token(identity=user.id)
     return jsonify({"ok": True, "token": token, "credits": user.credits})
@@ -123,8 +191,8 @@ def forgot_password(db):
         # Generate reset token (JWT with 1 hour expiration)
         reset_token = create_access_token(identity=user.id, expires_delta=timedelta(hours=1))
 
-        # Send email
-        from mailer import send_email_post
+        # Queue email (sent by the outbox worker)
+        from outbox import queue_email
         reset_url = f"{FRONTEND_ORIGIN}/reset-password.html?token={reset_token}"
 
         html = f"""
@@ -144,10 +212,11 @@ def forgot_password(db):
         </div>
         """
 
-        send_email_post(
+        queue_email(
             to=email,
             subject="Reset Your Password - Mini-Visionary",
-            html=html
+            html=html,
+            tags={"event": "password_reset"}
         )
 
         return jsonify({"ok": True, "message": "If that email exists, a reset link has been sent."})
@@ -183,7 +252,7 @@ def reset_password(db):
             return fail("User not found.", 404)
 
         # Update password
-        user.password_hash = generate_password_hash(new_password)
+        user.password_hash = passwords.hash_password(new_password)
         db.commit()
 
         return jsonify({"ok": True, "message": "Password reset successfully. You can now login."})
@@ -257,24 +326,26 @@ def change_password(db):
         return fail("Current and new password are required", 400)
 
     # Verify current password
-    if not bcrypt.checkpw(current_password.encode("utf-8"), user.password_hash.encode("utf-8")):
+    if not passwords.check_password(user.password_hash, current_password):
         return fail("Current password is incorrect", 401)
 
     if len(new_password) < 8:
         return fail("New password must be at least 8 characters", 400)
 
     # Hash and update new password
-    user.password_hash = bcrypt.hashpw(new_password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    user.password_hash = passwords.hash_password(new_password)
     db.commit()
 
     return jsonify({"ok": True, "message": "Password updated successfully"})
 
 # --- Credits ---
-def ensure_credits(user, needed):
-    if user.credits < needed:
-        return False, f"Not enough credits. Need {needed}, have {user.credits}."
-    user.credits -= needed
-    return True, None
+def ensure_credits(user, needed, notes=None):
+    """Reserve credits up-front (single conditional UPDATE, committed immediately).
+    Returns (reservation, error). Refund the reservation if the upstream call fails."""
+    hold = wallet.reserve_credits(user.id, needed, notes=notes)
+    if hold is None:
+        return None, f"Not enough credits. Need {needed}, have {wallet.get_credits(user.id)}."
+    return hold, None
 
 # --- Image Generate (DALL·E 3) ---
 @app.post("/api/generate")
@@ -282,6 +353,7 @@ def ensure_credits(user, needed):
 @limiter.limit("12/minute")
 @with_session
 def generate(db):
+    hold = None
     try:
         uid = get_jwt_identity()
         user = db.query(User).get(uid)
@@ -296,18 +368,19 @@ def generate(db):
         if size not in ALLOWED_SIZES:
             return fail(f"Invalid size. Allowed: {', '.join(ALLOWED_SIZES)}")
 
-        ok, err = ensure_credits(user, COST_GEN)
-        if not ok:
+        hold, err = ensure_credits(user, COST_GEN, "generate")
+        if not hold:
             return fail(err, 402)
 
         # OpenAI new SDK call with base64 response
-        resp = client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
-            size=size,
-            n=1,
-            response_format="b64_json"  # ✅ Get base64 directly
-        )
+        with resilience.upstream("openai", "images.generations", "dall-e-3"):
+            resp = _openai().images.generate(
+                model="dall-e-3",
+                prompt=prompt,
+                size=size,
+                n=1,
+                response_format="b64_json"  # ✅ Get base64 directly
+            )
         b64 = resp.data[0].b64_json
         png = base64.b64decode(b64)
 
@@ -330,6 +403,7 @@ def generate(db):
         )
         db.add(lib_item)
         db.commit()
+        hold.commit()
 
         return jsonify({
             "ok": True,
@@ -338,6 +412,8 @@ def generate(db):
             "image_b64_png": b64
         })
     except Exception as e:
+        if hold:
+            hold.refund()
         return fail("Image generation failed.", 500, e)
 
 # --- Legacy endpoint for backward compatibility ---
@@ -347,6 +423,7 @@ def generate(db):
 @with_session
 def poster_generate(db):
     """Legacy endpoint that calls the new generate() logic"""
+    hold = None
     try:
         uid = get_jwt_identity()
         user = db.query(User).get(uid)
@@ -368,25 +445,27 @@ def poster_generate(db):
         if not prompt:
             return fail("Prompt required.")
 
-        ok, err = ensure_credits(user, COST_GEN)
-        if not ok:
+        hold, err = ensure_credits(user, COST_GEN, "generate")
+        if not hold:
             return fail(err, 402)
 
         # OpenAI call
         try:
-            resp = client.images.generate(
-                model="dall-e-3",
-                prompt=prompt,
-                size=size,
-                n=1,
-                response_format="b64_json"
-            )
+            with resilience.upstream("openai", "images.generations", "dall-e-3"):
+                resp = _openai().images.generate(
+                    model="dall-e-3",
+                    prompt=prompt,
+                    size=size,
+                    n=1,
+                    response_format="b64_json"
+                )
             b64 = resp.data[0].b64_json
             png = base64.b64decode(b64)
         except Exception as openai_err:
             # Check if it's a content policy violation
             error_str = str(openai_err)
             if 'safety system' in error_str or 'content_policy_violation' in error_str:
+                hold.refund()
                 return fail("🚫 Your prompt was blocked by OpenAI's safety system. Please try a different, safer prompt.", 400)
             # Re-raise other errors
             raise
@@ -410,6 +489,7 @@ def poster_generate(db):
         )
         db.add(lib_item)
         db.commit()
+        hold.commit()
 
         # Return format compatible with old frontend
         return jsonify({
@@ -419,6 +499,8 @@ def poster_generate(db):
             "image_b64_png": b64
         })
     except Exception as e:
+        if hold:
+            hold.refund()
         return fail("Image generation failed.", 500, e)
 
 @app.post("/api/poster/remix")
@@ -434,6 +516,7 @@ def poster_remix(db):
     - Multipart form: image file + prompt + size
     - JSON: { "image": "data:image/png;base64,...", "prompt": "...", "size": "1024x1024" }
     """
+    hold = None
     try:
         uid = get_jwt_identity()
         user = db.query(User).get(uid)
@@ -462,7 +545,7 @@ def poster_remix(db):
                 image_data = base64.b64decode(b64_data)
         else:
             # Multipart form data
-            app.logger.info(f"Multipart - files: {list(request.files.keys())}, form: {list(request.form.keys())}")
+            app.logger.info("Multipart - files: %s, form: %s", list(request.files), list(request.form))
 
             if 'image' not in request.files:
                 return fail(f"No image in request. Files: {list(request.files.keys())}, Form: {list(request.form.keys())}", 400)
@@ -475,7 +558,7 @@ def poster_remix(db):
                 return fail("Empty image file", 400)
 
             image_data = image_file.read()
-            app.logger.info(f"Read {len(image_data)} bytes from image file")
+            app.logger.info("Read %d bytes from image file", len(image_data))
 
         if not prompt:
             return fail("Prompt required for image edits", 400)
@@ -487,8 +570,8 @@ def poster_remix(db):
         if size not in ["512x512", "1024x1024"]:
             size = "1024x1024"
 
-        ok, err = ensure_credits(user, COST_GEN)
-        if not ok:
+        hold, err = ensure_credits(user, COST_GEN, "remix")
+        if not hold:
             return fail(err, 402)
 
         # Convert to PNG RGBA
@@ -521,23 +604,26 @@ def poster_remix(db):
         }
 
         # Log request (without API key or full image)
-        app.logger.info(f"Remix request - model: gpt-image-1, size: {size}, prompt: {full_prompt[:180]}...")
+        app.logger.info("Remix request - model: gpt-image-1, size: %s, prompt: %.180s...", size, full_prompt)
 
         # Call OpenAI Image Edits REST API directly
-        openai_url = "https://api.openai.com/v1/images/edits"
+        openai_url = f"{OPENAI_API_BASE}/images/edits"
 
         try:
-            response = req.post(openai_url, headers=headers, files=files, data=form_data, timeout=120)
+            with resilience.upstream("openai", "images.edits", "gpt-image-1") as call:
+                response = req.post(openai_url, headers=headers, files=files, data=form_data, timeout=120)
+                call.status = response.status_code
 
             if response.status_code != 200:
                 error_data = response.json() if response.headers.get('content-type') == 'application/json' else {"error": response.text}
+                hold.refund()
                 return fail(f"OpenAI API error: {error_data}", response.status_code)
 
             result = response.json()
             item = (result.get("data") or [{}])[0]
 
             # Log response format
-            app.logger.info(f"Remix response - has_b64: {'b64_json' in item}, has_url: {'url' in item}")
+            app.logger.info("Remix response - has_b64: %s, has_url: %s", "b64_json" in item, "url" in item)
 
             # Get image (prefer base64)
             if "b64_json" in item:
@@ -549,11 +635,13 @@ def poster_remix(db):
                 png = img_response.content
                 b64 = base64.b64encode(png).decode('utf-8')
             else:
+                hold.refund()
                 return fail("Unexpected OpenAI response format", 502)
 
         except Exception as openai_err:
             error_str = str(openai_err)
             if 'safety system' in error_str or 'content_policy_violation' in error_str:
+                hold.refund()
                 return fail("🚫 Edit blocked by OpenAI's safety system. Try a different prompt or image.", 400)
             traceback.print_exc()
             raise
@@ -578,6 +666,7 @@ def poster_remix(db):
         )
         db.add(lib_item)
         db.commit()
+        hold.commit()
 
         # Return in items[] format expected by frontend
         return jsonify({
@@ -592,6 +681,8 @@ def poster_remix(db):
         })
     except Exception as e:
         traceback.print_exc()
+        if hold:
+            hold.refund()
         return fail("Image edit failed.", 500, e)
 
 # --- Image Edit ---
@@ -599,6 +690,7 @@ def poster_remix(db):
 @jwt_required()
 @with_session
 def edit_poster(db):
+    hold = None
     try:
         uid = get_jwt_identity()
         user = db.query(User).get(uid)
@@ -617,8 +709,8 @@ def edit_poster(db):
         if not orig_job:
             return fail("Original image not found.", 404)
 
-        ok, err = ensure_credits(user, COST_EDIT)
-        if not ok:
+        hold, err = ensure_credits(user, COST_EDIT, "edit")
+        if not hold:
             return fail(err, 402)
 
         # Save original image to temp file for OpenAI API
@@ -638,19 +730,21 @@ def edit_poster(db):
         # OpenAI edit call
         try:
             with open(tmp_path, "rb") as img_file, open(mask_path, "rb") as mask_file:
-                resp = client.images.edit(
-                    model="dall-e-2",  # Only dall-e-2 supports edit
-                    image=img_file,
-                    mask=mask_file,
-                    prompt=prompt,
-                    n=1,
-                    size="512x512",  # dall-e-2 only supports 256x256, 512x512, 1024x1024
-                    response_format="b64_json"
-                )
+                with resilience.upstream("openai", "images.edits", "dall-e-2"):
+                    resp = _openai().images.edit(
+                        model="dall-e-2",  # Only dall-e-2 supports edit
+                        image=img_file,
+                        mask=mask_file,
+                        prompt=prompt,
+                        n=1,
+                        size="512x512",  # dall-e-2 only supports 256x256, 512x512, 1024x1024
+                        response_format="b64_json"
+                    )
         except Exception as openai_err:
             # Check if it's a content policy violation
             error_str = str(openai_err)
             if 'safety system' in error_str or 'content_policy_violation' in error_str:
+                hold.refund()
                 return fail("🚫 Edit blocked by OpenAI's safety system. DALL-E 2 edit is very strict - try generating a new image instead.", 400)
             # Re-raise other errors
             raise
@@ -682,6 +776,7 @@ def edit_poster(db):
         )
         db.add(lib_item)
         db.commit()
+        hold.commit()
 
         return jsonify({
             "ok": True,
@@ -690,6 +785,8 @@ def edit_poster(db):
             "image_b64_png": b64
         })
     except Exception as e:
+        if hold:
+            hold.refund()
         return fail("Image edit failed.", 500, e)
 
 # --- Image History (paginated) ---
@@ -747,6 +844,23 @@ def purchase_credits(db):
     return fail("Credit purchase not yet implemented", 501)
 
 # --- Prompt Refiner (optional) ---
+# Bump REFINE_PROMPT_VERSION whenever the system prompt changes: it is part of the refine_cache key.
+REFINE_MODEL = "gpt-4o-mini"
+REFINE_SYSTEM_PROMPT = "Refine user image prompts: concise, vivid, safe."
+REFINE_PROMPT_VERSION = "1"
+
+def _refine_upstream(rough):
+    with resilience.upstream("openai", "chat.completions", REFINE_MODEL):
+        out = _openai().chat.completions.create(
+            model=REFINE_MODEL,
+            messages=[
+                {"role":"system","content":REFINE_SYSTEM_PROMPT},
+                {"role":"user","content": rough}
+            ],
+            temperature=0.4
+        )
+    return out.choices[0].message.content.strip()
+
 @app.post("/api/refine-prompt")
 @jwt_required()
 @limiter.limit("30/minute")
@@ -754,19 +868,12 @@ def purchase_credits(db):
 def refine_prompt(db):
     data = request.get_json() or {}
     rough = data.get("prompt","")
-    if not rough:
+    if not rough or not rough.strip():
         return fail("prompt required.")
     try:
-        out = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role":"system","content":"Refine user image prompts: concise, vivid, safe."},
-                {"role":"user","content": rough}
-            ],
-            temperature=0.4
-        )
-        refined = out.choices[0].message.content.strip()
-        return jsonify({"ok": True, "refined": refined})
+        refined, source = refine_cache.refine(rough, _refine_upstream,
+                                              version=f"{REFINE_PROMPT_VERSION}:{REFINE_MODEL}")
+        return jsonify({"ok": True, "refined": refined, "cached": source != "upstream"})
     except Exception as e:
         return fail("Refine failed.", 500, e)
 
@@ -917,10 +1024,10 @@ def add_credits_admin(db):
     if not user:
         return fail("User not found", 404)
 
-    user.credits += 100
+    balance = wallet.add(db, uid, 100, CreditEventType.GRANT, notes="admin test credits")
     db.commit()
 
-    return jsonify({"ok": True, "credits": user.credits, "message": "Added 100 credits"})
+    return jsonify({"ok": True, "credits": balance, "message": "Added 100 credits"})
 
 
 # --- Payments ---
@@ -928,6 +1035,7 @@ def add_credits_admin(db):
 @jwt_required()
 @with_session
 def create_checkout(db):
+    stripe = _stripe()
     try:
         uid = get_jwt_identity()
         user = db.query(User).get(uid)
@@ -967,24 +1075,27 @@ def create_checkout(db):
         package = packages[sku]
 
         # Create Stripe checkout session using Price ID
-        session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[{
-                "price": package["price_id"],
-                "quantity": 1,
-            }],
-            mode=package["mode"],
-            success_url=success_url,
-            cancel_url=cancel_url,
-            client_reference_id=str(user.id),
-            metadata={
-                "user_id": str(user.id),
-                "credits": str(package["credits"]),
-                "sku": sku
-            }
-        )
+        with resilience.upstream("stripe", "checkout.sessions.create"):
+            session = stripe.checkout.Session.create(
+                payment_method_types=["card"],
+                line_items=[{
+                    "price": package["price_id"],
+                    "quantity": 1,
+                }],
+                mode=package["mode"],
+                success_url=success_url,
+                cancel_url=cancel_url,
+                client_reference_id=str(user.id),
+                metadata={
+                    "user_id": str(user.id),
+                    "credits": str(package["credits"]),
+                    "sku": sku
+                }
+            )
 
         return jsonify({"ok": True, "url": session.url})
+    except resilience.UpstreamUnavailable as e:
+        return resilience.unavailable_response(e)
     except Exception as e:
         traceback.print_exc()
         return fail(f"Checkout failed: {str(e)}", 500)
@@ -997,15 +1108,6 @@ def gallery_post(db):
     """Deduct credits for posting to community gallery"""
     try:
         uid = get_jwt_identity()
-        user = db.query(User).get(uid)
-
-        # Check and deduct credits
-        ok, err = ensure_credits(user, COST_GALLERY_POST)
-        if not ok:
-            return fail(err, 402)
-
-        user.credits -= COST_GALLERY_POST
-        db.commit()
 
         # Create gallery post with image_url from request
         import json
@@ -1018,6 +1120,11 @@ def gallery_post(db):
         if not prompt or not image_url:
             return fail("Prompt and image required.", 400)
 
+        # Debit and post in one transaction (single conditional UPDATE, no extra deduction)
+        balance = wallet.spend(db, uid, COST_GALLERY_POST, notes="gallery post")
+        if balance is None:
+            return fail(f"Not enough credits. Need {COST_GALLERY_POST}, have {wallet.get_credits(uid)}.", 402)
+
         post = GalleryPost(
             user_id=uid,
             image_url=image_url,
@@ -1028,10 +1135,11 @@ def gallery_post(db):
         )
         db.add(post)
         db.commit()
+        metrics.credits_spent("gallery post", COST_GALLERY_POST)
 
         return jsonify({
             "ok": True,
-            "credits": user.credits,
+            "credits": balance,
             "post_id": post.id,
             "message": f"Posted to gallery! {COST_GALLERY_POST} credits deducted."
         })
@@ -1172,13 +1280,13 @@ def delete_gallery_post(db, post_id):
         return fail(f"Failed to delete post: {str(e)}", 500)
 
 @app.post("/api/payments/webhook")
-@with_session
-def stripe_webhook(db):
+def stripe_webhook():
     """Handle Stripe webhook events (payment completion)"""
     payload = request.data
     sig_header = request.headers.get("Stripe-Signature")
     webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
 
+    stripe = _stripe()
     try:
         event = stripe.Webhook.construct_event(
             payload, sig_header, webhook_secret
@@ -1188,24 +1296,19 @@ def stripe_webhook(db):
     except stripe.error.SignatureVerificationError:
         return fail("Invalid signature", 400)
 
-    # Handle checkout.session.completed event
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        user_id = session.get("metadata", {}).get("user_id")
-        credits = session.get("metadata", {}).get("credits")
-
-        if user_id and credits:
-            user = db.query(User).get(int(user_id))
-            if user:
-                user.credits += int(credits)
-                db.commit()
-
+    # Stored with a unique event id and applied by the webhook worker (see webhooks.py)
+    webhooks.accept_stripe_event(event, payload)
     return jsonify({"ok": True})
 
 # --- Health ---
 @app.get("/api/health")
 def health():
-    return {"ok": True, "release": os.getenv("RAILWAY_GIT_COMMIT_SHA", "local")}
+    return {"ok": True, "release": os.getenv("RAILWAY_GIT_COMMIT_SHA", "local"),
+            "upstreams": {name: b["state"] for name, b in resilience.health_check(app)["breakers"].items()}}
+
+# Startup profile (STARTUP_PROFILE=1), then pull the deferred SDKs in off the boot path
+startup.log_report()
+startup.prewarm()
 
 if __name__ == "__main__":
     # Run library table migration on startup
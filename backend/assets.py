@@ -0,0 +1,125 @@
+# assets.py
+"""
+Static asset serving backed by the build manifest (see build_assets.py).
+
+The manifest is read once per process. Requests are resolved from memory
+instead of stat-ing the filesystem, and each client gets the precompressed
+.br/.gz variant it accepts. Those responses already carry a Content-Encoding,
+so Flask-Compress leaves them alone.
+
+  /static/<name>.<hash>.<ext>  immutable, cached for a year
+  /static/<name>.<ext>         logical name: HTML revalidates (ETag), the rest for an hour
+
+Without a build (local dev) a one-time directory index answers "does this
+file exist" and files are sent as-is.
+"""
+from __future__ import annotations
+import json
+import logging
+import os
+
+from flask import abort, request, send_file, send_from_directory
+
+from build_assets import BUILD_DIR, MANIFEST
+
+log = logging.getLogger("assets")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+LOGICAL_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))
+
+_SUFFIX = {"br": ".br", "gzip": ".gz"}
+
+
+class AssetIndex:
+    def __init__(self, static_folder: str):
+        self.static_folder = os.path.abspath(static_folder)
+        self.build_root = os.path.join(self.static_folder, BUILD_DIR)
+        self.files: dict[str, dict] = {}
+        self.hashed: dict[str, dict] = {}
+        self.plain: set[str] = set()
+        self.built = False
+        self.load()
+
+    def load(self) -> None:
+        path = os.path.join(self.build_root, MANIFEST)
+        try:
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            self._index_directory()
+            log.info("asset manifest missing, serving %d files unbuilt", len(self.plain))
+            return
+        self.files = manifest["files"]
+        self.hashed = {e["hashed"]: e for e in self.files.values() if e.get("hashed")}
+        self.built = True
+        log.info("asset manifest loaded: %d files", len(self.files))
+
+    def _index_directory(self) -> None:
+        for dirpath, dirnames, filenames in os.walk(self.static_folder):
+            dirnames[:] = [d for d in dirnames if d != BUILD_DIR]
+            rel_dir = os.path.relpath(dirpath, self.static_folder)
+            for name in filenames:
+                rel = name if rel_dir == "." else os.path.join(rel_dir, name)
+                self.plain.add(rel.replace(os.sep, "/"))
+
+    def exists(self, path: str) -> bool:
+        return path in self.files or path in self.hashed or path in self.plain
+
+    def url_for(self, path: str) -> str:
+        """Public URL for a logical static path (fingerprinted when built)."""
+        entry = self.files.get(path)
+        return f"/static/{entry['hashed']}" if entry and entry.get("hashed") else f"/static/{path}"
+
+    def serve(self, path: str):
+        """Response for a static path, or None if there is no such file."""
+        entry, immutable = self.hashed.get(path), True
+        if entry is None:
+            entry, immutable = self.files.get(path), False
+        if entry is None:
+            if path in self.plain:
+                return send_from_directory(self.static_folder, path)
+            return None
+
+        encoding = None
+        for enc in ("br", "gzip"):
+            if enc in entry["encodings"] and request.accept_encodings[enc]:
+                encoding = enc
+                break
+
+        full = os.path.join(self.build_root, entry["file"]) + (_SUFFIX[encoding] if encoding else "")
+        resp = send_file(full, mimetype=entry["type"], conditional=True,
+                         etag=entry["etag"] + (f"-{encoding}" if encoding else ""))
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        if entry["encodings"]:
+            resp.vary.add("Accept-Encoding")
+        if immutable:
+            resp.headers["Cache-Control"] = IMMUTABLE
+        elif entry["type"].startswith("text/html"):
+            resp.headers["Cache-Control"] = REVALIDATE
+        else:
+            resp.headers["Cache-Control"] = f"public, max-age={LOGICAL_MAX_AGE}"
+        resp.headers["X-Content-Type-Options"] = "nosniff"
+        return resp
+
+
+def init_app(app) -> AssetIndex:
+    """Load the manifest for app.static_folder and keep it on app.extensions."""
+    index = AssetIndex(app.static_folder)
+    app.extensions["assets"] = index
+    app.jinja_env.globals.setdefault("asset_url", index.url_for)
+    return index
+
+
+def get_index(app) -> AssetIndex:
+    index = app.extensions.get("assets")
+    return index if index is not None else init_app(app)
+
+
+def send_static(app, path: str):
+    """Serve a static file through the asset index, 404 when unknown."""
+    resp = get_index(app).serve(path)
+    if resp is None:
+        abort(404)
+    return resp
@@ -1,3 +1,4 @@
+import logging
 import os
 import time
 import jwt
@@ -7,9 +8,11 @@ from typing import Optional
 from flask import Blueprint, request, jsonify, g, current_app
 from werkzeug.exceptions import Unauthorized
 from flask_bcrypt import Bcrypt
-from werkzeug.security import check_password_hash as wz_check_password_hash
 
 from models import get_session, User
+import passwords
+
+log = logging.getLogger("auth")
 
 # Public objects expected by app.py and other modules (e.g. /api/generate)
 bcrypt = Bcrypt()
@@ -50,29 +53,19 @@ def create_user(display_name: str, email: str, password_hash: str) -> dict:
 
 def verify_password(hashed: str, plain: str) -> bool:
     """
-    Backward-compatible password check.
+    Backward-compatible password check, run on the password hashing pool (passwords.py).
     Supports legacy Werkzeug PBKDF2 hashes ('pbkdf2:...') and current bcrypt ('$2b$', '$2a$', '$2y$').
     """
-    if not hashed or not plain:
-        return False
     try:
-        h = str(hashed)
-        if h.startswith("pbkdf2:"):
-            # Legacy accounts created with Werkzeug generate_password_hash
-            return wz_check_password_hash(h, plain)
-        if h.startswith("$2a$") or h.startswith("$2b$") or h.startswith("$2y$"):
-            # Bcrypt (current)
-            return bcrypt.check_password_hash(h, plain)
-        # Unknown format -> fail closed
-        return False
+        return passwords.check_password(hashed, plain)
     except Exception:
         return False
 
 def maybe_upgrade_hash_to_bcrypt(user: User, plain_password: str) -> None:
-    """If user has a legacy PBKDF2 hash, upgrade it to bcrypt after a successful login."""
+    """After a successful login, rehash legacy PBKDF2 (or below-cost bcrypt) hashes at BCRYPT_LOG_ROUNDS."""
     try:
-        if str(user.password_hash).startswith("pbkdf2:"):
-            new_hash = bcrypt.generate_password_hash(plain_password).decode()
+        if passwords.needs_rehash(user.password_hash):
+            new_hash = passwords.hash_password(plain_password)
             with get_session() as s:
                 u = s.query(User).filter_by(id=user.id).first()
                 if u:
@@ -95,38 +88,50 @@ def sign_jwt(user_id, email: str) -> str:
     }
     return jwt.encode(payload, SECRET, algorithm="HS256")
 
+def token_user_id() -> Optional[str]:
+    """User id from a valid bearer token on this request, or None (no DB lookup, never raises)."""
+    hdr = request.headers.get("Authorization", "")
+    if not hdr.startswith("Bearer "):
+        return None
+    try:
+        payload = jwt.decode(hdr.split(" ", 1)[1].strip(), SECRET, algorithms=["HS256"])
+    except Exception:
+        return None
+    if payload.get("type"):  # password-reset and other single-purpose tokens
+        return None
+    return str(payload["sub"]) if payload.get("sub") else None
+
 def auth_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        current_app.logger.info("[auth_required] Checking auth for %s", request.endpoint)
+        # per-request lines are DEBUG: LOG_LEVELS=auth=DEBUG turns them on, LOG_SAMPLE thins them
+        log.debug("[auth_required] Checking auth for %s", request.endpoint)
         hdr = request.headers.get("Authorization", "")
-        current_app.logger.info("[auth_required] Auth header: %s", hdr[:20] + "..." if len(hdr) > 20 else hdr)
 
         if not hdr.startswith("Bearer "):
-            current_app.logger.warning("[auth_required] Missing bearer token")
+            log.warning("[auth_required] Missing bearer token")
             raise Unauthorized("Missing bearer token")
 
         token = hdr.split(" ", 1)[1].strip()
-        current_app.logger.info("[auth_required] Token extracted: %s", token[:20] + "...")
 
         try:
             payload = jwt.decode(token, SECRET, algorithms=["HS256"])
-            current_app.logger.info("[auth_required] Token decoded successfully, user_id=%s", payload.get("sub"))
+            log.debug("[auth_required] Token decoded, user_id=%s", payload.get("sub"))
         except jwt.ExpiredSignatureError:
-            current_app.logger.warning("[auth_required] Token expired")
+            log.warning("[auth_required] Token expired")
             raise Unauthorized("Token expired")
         except Exception as e:
-            current_app.logger.warning("[auth_required] Invalid token: %s", str(e))
+            log.warning("[auth_required] Invalid token: %s", str(e))
             raise Unauthorized("Invalid token")
 
         with get_session() as s:
             user_id = int(payload.get("sub"))
             user = s.query(User).filter_by(id=user_id).first()
             if not user:
-                current_app.logger.warning("[auth_required] User not found: %s", payload.get("sub"))
+                log.warning("[auth_required] User not found: %s", payload.get("sub"))
                 raise Unauthorized("User not found")
 
-            current_app.logger.info("[auth_required] User found: %s", user.email)
+            log.debug("[auth_required] User found: %s", user.id)
             g.user_id = user.id
             g.user = user
             g.email = user.email
@@ -151,23 +156,24 @@ def signup():
         if get_user_by_email(email):
             return jsonify(ok=False, error="email_exists"), 400
 
-        hashed = bcrypt.generate_password_hash(password).decode()
+        hashed = passwords.hash_password(password)
         user = create_user(display_name, email, hashed)
         token = sign_jwt(user["id"], email)
 
-        # Send welcome email
+        # Queue welcome email (sent by the outbox worker, not on the signup path)
         try:
-            from app_email import send_email
+            from outbox import queue_email
             from app_email_templates import get_welcome_email_template
 
             email_template = get_welcome_email_template(display_name)
-            send_email(
+            queue_email(
                 to=email,
                 subject=email_template["subject"],
                 html=email_template["html"],
-                text=email_template["text"]
+                text=email_template["text"],
+                tags={"event": "welcome"}
             )
-            current_app.logger.info("Welcome email sent to %s", email)
+            current_app.logger.info("Welcome email queued for %s", email)
         except Exception as email_error:
             current_app.logger.warning("Welcome email failed for %s: %s", email, email_error)
             # Continue with signup even if email fails
@@ -258,8 +264,8 @@ def forgot():
             reset_token = jwt.encode(reset_payload, SECRET, algorithm="HS256")
             reset_url = f"{PUBLIC_APP_URL}/static/auth.html#reset?token={reset_token}"
             current_app.logger.info("Attempting to send reset email to %s with URL: %s", user.email, reset_url)
-            send_reset_email(user.email, reset_url)
-            current_app.logger.info("Password reset email sent successfully to %s", user.email)
+            send_reset_email(user.email, reset_url)  # queued in the email outbox
+            current_app.logger.info("Password reset email queued for %s", user.email)
         except MailError as e:
             current_app.logger.error("Reset email failed for %s: %s", user.email, str(e))
             # Return success anyway to avoid enumeration
@@ -289,12 +295,12 @@ def reset_password():
         user_id = int(payload["sub"])
         email = payload["email"]
 
+        hashed = passwords.hash_password(new_password)  # before taking a DB connection
         with get_session() as s:
             user = s.query(User).filter_by(id=user_id, email=email).first()
             if not user:
                 return jsonify(ok=False, error="user_not_found"), 404
 
-            hashed = bcrypt.generate_password_hash(new_password).decode()
             user.password_hash = hashed
             s.commit()
 
@@ -315,7 +321,7 @@ def wallet():
     with get_session() as s:
         receipts_q = (
             s.query(CreditLedger)
-            .filter_by(user_id=g.user_id, event=CreditEventType.PURCHASE)
+            .filter_by(user_id=g.user_id, event_type=CreditEventType.PURCHASE)
             .order_by(CreditLedger.created_at.desc())
             .limit(10)
         )
@@ -324,7 +330,7 @@ def wallet():
             "id": r.id,
             "amount": r.amount,
             "date": r.created_at.isoformat(),
-            "reference": r.ref,
+            "reference": r.reference,
             "notes": r.notes
         } for r in receipts_q]
 
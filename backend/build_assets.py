@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Build-time static asset step.
+
+Reads backend/static and writes backend/static/_build/:
+  - every non-HTML file copied as name.<hash>.ext (content-addressed, cacheable forever)
+  - HTML pages under their own names, with /logo.png and /static/... references
+    rewritten to the fingerprinted URLs
+  - .br (quality 11) and .gz (level 9) siblings for compressible files
+  - asset-manifest.json, loaded once at startup by assets.py
+
+Usage (run after the frontend build has been copied into static/):
+  python build_assets.py [--static DIR]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import sys
+
+BUILD_DIR = "_build"
+MANIFEST = "asset-manifest.json"
+COMPRESSIBLE = {".html", ".js", ".mjs", ".css", ".json", ".svg", ".txt", ".xml", ".map", ".ico", ".webmanifest"}
+MIN_COMPRESS_SIZE = 512
+
+# src="/logo.png", href="/static/shared.js", url('/static/x.css') ...
+_REF = re.compile(r"""(?P<q>["'(])/(?:static/)?(?P<path>[A-Za-z0-9_\-./]+\.[A-Za-z0-9]+)(?P<tail>[?#"')])""")
+
+
+def _hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _fingerprint(rel: str, digest: str) -> str:
+    root, ext = os.path.splitext(rel)
+    return f"{root}.{digest[:10]}{ext}"
+
+
+def _compress(path: str, data: bytes) -> dict:
+    sizes = {}
+    try:
+        import brotli
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            with open(path + ".br", "wb") as f:
+                f.write(br)
+            sizes["br"] = len(br)
+    except ImportError:
+        pass
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        with open(path + ".gz", "wb") as f:
+            f.write(gz)
+        sizes["gzip"] = len(gz)
+    return sizes
+
+
+def _write(out_root: str, rel: str, data: bytes) -> str:
+    path = os.path.join(out_root, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def build(static_dir: str) -> dict:
+    out_root = os.path.join(static_dir, BUILD_DIR)
+    shutil.rmtree(out_root, ignore_errors=True)
+
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        dirnames[:] = [d for d in dirnames if d != BUILD_DIR and not d.startswith(".")]
+        for name in filenames:
+            if name.startswith(".") or name.endswith((".br", ".gz")):
+                continue
+            full = os.path.join(dirpath, name)
+            sources.append(os.path.relpath(full, static_dir).replace(os.sep, "/"))
+
+    files = {}
+    # 1) assets first so HTML can point at their fingerprinted names
+    for rel in sorted(r for r in sources if not r.endswith(".html")):
+        with open(os.path.join(static_dir, rel), "rb") as f:
+            data = f.read()
+        digest = _hash(data)
+        hashed = _fingerprint(rel, digest)
+        path = _write(out_root, hashed, data)
+        ext = os.path.splitext(rel)[1].lower()
+        enc = _compress(path, data) if ext in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE else {}
+        files[rel] = {"file": hashed, "hashed": hashed, "etag": digest[:20], "size": len(data),
+                      "type": mimetypes.guess_type(rel)[0] or "application/octet-stream", "encodings": enc}
+
+    def rewrite(m):
+        entry = files.get(m.group("path"))
+        if not entry:
+            return m.group(0)
+        return f'{m.group("q")}/static/{entry["hashed"]}{m.group("tail")}'
+
+    # 2) HTML keeps its URL; references inside are rewritten
+    for rel in sorted(r for r in sources if r.endswith(".html")):
+        with open(os.path.join(static_dir, rel), "r", encoding="utf-8") as f:
+            html = f.read()
+        data = _REF.sub(rewrite, html).encode("utf-8")
+        path = _write(out_root, rel, data)
+        files[rel] = {"file": rel, "hashed": None, "etag": _hash(data)[:20], "size": len(data),
+                      "type": "text/html; charset=utf-8", "encodings": _compress(path, data)}
+
+    manifest = {"version": 1, "build_dir": BUILD_DIR, "files": files}
+    with open(os.path.join(out_root, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fingerprint + precompress static assets")
+    ap.add_argument("--static", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+    args = ap.parse_args()
+
+    manifest = build(args.static)
+    files = manifest["files"].values()
+    raw = sum(f["size"] for f in files)
+    br = sum(f["encodings"].get("br", f["size"]) for f in files)
+    gz = sum(f["encodings"].get("gzip", f["size"]) for f in files)
+    print(f"✓ {len(manifest['files'])} files -> {os.path.join(args.static, BUILD_DIR)}")
+    print(f"  raw {raw / 1024:.0f} KiB | gzip {gz / 1024:.0f} KiB | br {br / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
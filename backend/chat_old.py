@@ -5,6 +5,8 @@ from typing import Any, Dict, List, Union
 
 from flask import Blueprint, request, jsonify, g
 from auth import auth_required
+from response_cache import cached_response
+import metrics
 
 bp = Blueprint("chat", __name__, url_prefix="/api/chat")
 
@@ -221,12 +223,13 @@ def chat_send():
     # ---- Regular chat completion ----
     try:
         if _USE_NEW_SDK:
-            resp = _client.chat.completions.create(
-                model=model,
-                messages=processed_messages,
-                max_tokens=1500,
-                temperature=0.7,
-            )
+            with metrics.upstream("openai", "chat.completions", model):
+                resp = _client.chat.completions.create(
+                    model=model,
+                    messages=processed_messages,
+                    max_tokens=1500,
+                    temperature=0.7,
+                )
             assistant_msg = resp.choices[0].message.content
         else:
             # legacy
@@ -250,6 +253,7 @@ def chat_send():
 
 
 @bp.get("/models")
+@cached_response()
 def get_models():
     """Get available OpenAI models (front-end helper)."""
     return jsonify(
@@ -0,0 +1,76 @@
+"""
+Shared pytest fixtures for the backend regression tests.
+
+    cd backend && pytest -q
+
+Each test gets its own SQLite file; no server, Postgres or network is needed.
+(test_auth.py and ../test_api.py exercise a running server instead.)
+"""
+import importlib
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("PREWARM_SDKS", "0")
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """An empty SQLite database behind models.get_engine() / get_session(), for one test."""
+    import models
+    import migrate
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(models, "_engine", None)
+    monkeypatch.setattr(models, "_SessionLocal", None)
+    monkeypatch.setattr(migrate, "_schema_current", False)
+    yield models.get_engine()
+    models.get_engine().dispose()
+
+
+@pytest.fixture
+def db(fresh_db, monkeypatch):
+    """fresh_db with the full schema applied; the outbox, webhook and chat-prune threads are not started."""
+    import conversations
+    import migrate
+    import outbox
+    import webhooks
+    migrate.upgrade()
+    monkeypatch.setattr(outbox, "start_worker", lambda: None)
+    monkeypatch.setattr(webhooks, "start_worker", lambda: None)
+    monkeypatch.setattr(conversations, "start_pruner", lambda interval=None: None)
+    return fresh_db
+
+
+@pytest.fixture
+def threaded_db(db, monkeypatch):
+    """
+    db with one connection per session. get_engine() gives SQLite a single
+    shared connection (StaticPool), so a test whose threads use the database
+    at the same time would see them roll back each other's transactions.
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+    import models
+    engine = create_engine(str(db.url), poolclass=NullPool,
+                           connect_args={"check_same_thread": False, "timeout": 30})
+    monkeypatch.setattr(models, "_engine", engine)
+    monkeypatch.setattr(models, "_SessionLocal", None)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def boot_app_secure(db, monkeypatch):
+    """(Re)import app_secure against the test database, as a worker boot would; returns its Flask app."""
+    import logconfig
+    import wallet
+    monkeypatch.setattr(logconfig, "init", lambda level=None: None)  # keep pytest's log capture
+    monkeypatch.setattr(wallet, "start_hold_sweeper", lambda interval=None: None)
+
+    def boot():
+        if "app_secure" in sys.modules:
+            return importlib.reload(sys.modules["app_secure"]).app
+        return importlib.import_module("app_secure").app
+    return boot
@@ -0,0 +1,269 @@
+# conversations.py
+"""
+Server-side chat history for /api/chat.
+
+The client used to resend the whole transcript (up to 29 messages, image parts
+included) on every turn, so both the request body and the prompt sent upstream
+grew with each turn. Now the client sends a conversation_id and only the new
+message. History lives in chat_conversations / chat_messages.
+
+The prompt for a turn is built as
+
+  [system prompt] [summary of older turns] [recent turns ...] [new user turn]
+
+Recent turns are kept by token budget, not by message count. Once they exceed
+CHAT_HISTORY_TOKENS, the oldest are dropped until CHAT_TRIM_RATIO of the
+budget is left, and a background thread folds the dropped turns into the
+stored summary. The trim takes a big step (hysteresis) rather than one turn
+at a time, so between trims the prompt only grows at the end. The system
+prompt and summary at the front stay byte-identical across turns, so
+OpenAI's automatic prompt caching keeps matching the prefix.
+
+Older turns are re-sent as text only. Images in them appear as "[image]"
+markers, and only the current turn carries image parts.
+
+  CHAT_HISTORY_TOKENS=4000   budget for recent turns (system, summary and the new turn excluded)
+  CHAT_TRIM_RATIO=0.6        trim down to this fraction of the budget
+  CHAT_SUMMARY_MODEL=gpt-4o-mini  CHAT_SUMMARY_TOKENS=400
+  CHAT_RETENTION_DAYS=30     idle conversations are deleted after this many days, by a
+                             daemon thread every CHAT_PRUNE_SECONDS=3600 (0 = off; then
+                             run `python conversations.py prune` from cron)
+  CHAT_MAX_CONVERSATIONS_PER_CLIENT=50  /api/chat has no login, so conversations are
+                             counted per client address (stored as a keyed hash); a new one
+                             past the cap deletes that client's least recently used
+"""
+from __future__ import annotations
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from models import ChatConversation, ChatMessage, get_session
+import resilience
+
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "4000"))
+CHAT_TRIM_RATIO = float(os.getenv("CHAT_TRIM_RATIO", "0.6"))
+CHAT_SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL", "gpt-4o-mini")
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "400"))
+CHAT_RETENTION_DAYS = int(os.getenv("CHAT_RETENTION_DAYS", "30"))
+CHAT_PRUNE_SECONDS = int(os.getenv("CHAT_PRUNE_SECONDS", "3600"))
+CHAT_MAX_CONVERSATIONS_PER_CLIENT = int(os.getenv("CHAT_MAX_CONVERSATIONS_PER_CLIENT", "50"))
+IMAGE_TOKENS = 765  # a 1024px image at detail=auto
+
+SUMMARY_PROMPT = ("Summarize the conversation below for the assistant's own memory. Keep names, facts, "
+                  "decisions, user preferences and open questions; drop pleasantries. Write at most "
+                  "a few short paragraphs.")
+
+log = logging.getLogger("conversations")
+
+try:
+    import tiktoken
+    _enc = tiktoken.get_encoding("o200k_base")
+except Exception:  # optional: fall back to ~4 characters per token
+    _enc = None
+
+_summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+_summarizing: set[str] = set()
+_summarizing_lock = threading.Lock()
+
+
+def count_tokens(text: str, images: int = 0) -> int:
+    n = len(_enc.encode(text)) if _enc is not None else len(text) // 4 + 1
+    return n + 4 + images * IMAGE_TOKENS  # + per-message overhead
+
+
+def client_key(addr: Optional[str]) -> Optional[str]:
+    """Keyed hash of a client address, so chat_conversations never holds the address itself."""
+    if not addr:
+        return None
+    secret = os.getenv("SECRET_KEY", "change_me").encode()
+    return hmac.new(secret, addr.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def create(s: Session, system: str, client: Optional[str] = None) -> ChatConversation:
+    """New conversation; with `client` (client_key()), that client's oldest ones past the cap are deleted."""
+    if client and CHAT_MAX_CONVERSATIONS_PER_CLIENT > 0:
+        _delete(s, list(s.scalars(
+            select(ChatConversation.id)
+            .where(ChatConversation.client == client)
+            .order_by(ChatConversation.updated_at.desc(), ChatConversation.id)
+            .offset(CHAT_MAX_CONVERSATIONS_PER_CLIENT - 1)
+        )))
+    conv = ChatConversation(id=str(uuid.uuid4()), system=system, summary_upto=0, client=client)
+    s.add(conv)
+    return conv
+
+
+def _delete(s: Session, ids: list[str]) -> None:
+    if ids:
+        s.execute(delete(ChatMessage).where(ChatMessage.conversation_id.in_(ids)))
+        s.execute(delete(ChatConversation).where(ChatConversation.id.in_(ids)))
+
+
+def history(s: Session, conv: ChatConversation, after_id: Optional[int] = None) -> list[ChatMessage]:
+    q = select(ChatMessage).where(ChatMessage.conversation_id == conv.id)
+    if after_id is not None:
+        q = q.where(ChatMessage.id > after_id)
+    return list(s.scalars(q.order_by(ChatMessage.id)))
+
+
+def append(s: Session, conv: ChatConversation, role: str, text: str, images: Sequence[str] = ()) -> ChatMessage:
+    """Store one turn. `images` are the turn's image URLs; only http(s) ones are kept."""
+    content = "\n".join([text] + ["[image]"] * len(images)).strip()
+    urls = [u for u in images if u.startswith(("http://", "https://"))]
+    msg = ChatMessage(conversation_id=conv.id, role=role, content=content,
+                      images=json.dumps(urls) if urls else None, tokens=count_tokens(content))
+    s.add(msg)
+    conv.updated_at = datetime.utcnow()
+    return msg
+
+
+def window(tokens: Sequence[int], budget: int = CHAT_HISTORY_TOKENS) -> int:
+    """Index of the first turn to keep, given per-turn token counts (oldest first)."""
+    total = sum(tokens)
+    if total <= budget:
+        return 0
+    target = budget * CHAT_TRIM_RATIO
+    cut = 0
+    while cut < len(tokens) and total > target:
+        total -= tokens[cut]
+        cut += 1
+    return cut
+
+
+def fit(messages: list[dict], budget: int = CHAT_HISTORY_TOKENS) -> list[dict]:
+    """Newest {role, content} messages that fit the budget (for clients that still send the transcript)."""
+    kept, total = [], 0
+    for m in reversed(messages):
+        c = m.get("content")
+        total += count_tokens(c if isinstance(c, str) else json.dumps(c))
+        if total > budget and kept:
+            break
+        kept.append(m)
+    return kept[::-1]
+
+
+def build_prompt(s: Session, conv: ChatConversation, current: dict) -> tuple[list[dict], bool]:
+    """
+    Messages to send upstream for this turn: stable prefix, recent turns, then
+    `current` (the new user message, which may hold image parts). Returns
+    (messages, trimmed); trimmed means older turns should be rolled into the
+    summary (schedule_summary).
+    """
+    turns = history(s, conv, after_id=conv.summary_upto) if conv.id else []
+    cut = window([t.tokens for t in turns])
+    built = [{"role": "system", "content": conv.system}]
+    if conv.summary:
+        built.append({"role": "system", "content": "Summary of the earlier conversation:\n" + conv.summary})
+    built.extend({"role": t.role, "content": t.content} for t in turns[cut:])
+    built.append(current)
+    return built, cut > 0
+
+
+def _summarize(conv_id: str) -> None:
+    with get_session() as s:
+        conv = s.get(ChatConversation, conv_id)
+        if conv is None:
+            return
+        turns = history(s, conv, after_id=conv.summary_upto)
+        cut = window([t.tokens for t in turns])
+        if cut == 0:
+            return
+        folded, upto_was = turns[:cut], conv.summary_upto
+        transcript = "\n\n".join(f"{t.role}: {t.content}" for t in folded)
+        if conv.summary:
+            transcript = f"Earlier summary:\n{conv.summary}\n\nConversation since:\n{transcript}"
+
+    from openai import OpenAI
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    with resilience.upstream("openai", "chat.completions", CHAT_SUMMARY_MODEL):
+        resp = client.chat.completions.create(
+            model=CHAT_SUMMARY_MODEL,
+            temperature=0.2,
+            max_tokens=CHAT_SUMMARY_TOKENS,
+            messages=[{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": transcript}],
+        )
+    summary = (resp.choices[0].message.content or "").strip()
+    if not summary:
+        return
+
+    with get_session() as s:
+        # another worker may have rolled the same turns meanwhile; first writer wins
+        res = s.execute(update(ChatConversation)
+                        .where(ChatConversation.id == conv_id, ChatConversation.summary_upto == upto_was)
+                        .values(summary=summary, summary_upto=folded[-1].id))
+        s.commit()
+    log.info("chat_summary_rolled", extra={"conversation_id": conv_id, "turns": len(folded),
+                                           "applied": bool(res.rowcount)})
+
+
+def _run_summary(conv_id: str) -> None:
+    try:
+        _summarize(conv_id)
+    except Exception as e:  # the next trimmed turn schedules it again
+        log.warning("chat_summary_failed", extra={"conversation_id": conv_id, "error": str(e)[:200]})
+    finally:
+        with _summarizing_lock:
+            _summarizing.discard(conv_id)
+
+
+def schedule_summary(conv_id: str) -> None:
+    """Fold trimmed turns into the summary off the request path (at most one run per conversation)."""
+    with _summarizing_lock:
+        if conv_id in _summarizing:
+            return
+        _summarizing.add(conv_id)
+    _summary_pool.submit(_run_summary, conv_id)
+
+
+def prune(days: int = CHAT_RETENTION_DAYS) -> int:
+    """Delete conversations idle for more than `days`. Returns how many."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    with get_session() as s:
+        ids = list(s.scalars(select(ChatConversation.id).where(ChatConversation.updated_at < cutoff)))
+        if ids:
+            _delete(s, ids)
+            s.commit()
+        return len(ids)
+
+
+_pruner_started = False
+
+
+def start_pruner(interval: int = CHAT_PRUNE_SECONDS) -> None:
+    """Run prune() every `interval` seconds in a daemon thread (once per process)."""
+    global _pruner_started
+    if _pruner_started or interval <= 0:
+        return
+    _pruner_started = True
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                n = prune()
+                if n:
+                    log.info("pruned %d idle conversations", n)
+            except Exception:
+                log.exception("chat prune failed")
+
+    threading.Thread(target=loop, name="chat-pruner", daemon=True).start()
+
+
+if __name__ == "__main__":
+    # Cron: python conversations.py prune [days]
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:2] == ["prune"]:
+        n = prune(int(sys.argv[2]) if len(sys.argv) > 2 else CHAT_RETENTION_DAYS)
+        log.info("pruned %d idle conversations", n)
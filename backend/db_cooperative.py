@@ -0,0 +1,125 @@
+# db_cooperative.py
+"""
+Cooperative psycopg2 for gevent workers, and pool sizing per worker type.
+
+psycopg2 is a C extension that talks to Postgres through libpq's blocking
+calls, which gevent's monkey-patching can't reach. Under `-k gevent`, every
+query blocks the whole worker until Postgres answers, so DB-bound requests
+run one at a time however many greenlets are waiting.
+
+psycopg2 can run libpq in non-blocking mode and hand each wait to a Python
+callback (the psycogreen approach). install() registers a callback that
+waits on the socket through gevent's hub, so a greenlet waiting on Postgres
+yields to the others. It has to run in the worker before its first
+connection is opened. gunicorn.conf.py does this in post_fork for gevent
+workers, and models.get_engine() does it whenever gevent has patched
+socket.
+
+Pool sizing follows the worker's concurrency rather than SQLAlchemy's fixed
+5 + 10. gunicorn.conf.py exports the number of workers and the concurrency
+each worker allows (gevent: worker_connections greenlets; gthread: threads;
+sync: 1), and engine_options() spreads DB_MAX_CONNECTIONS across the workers:
+
+  share        = DB_MAX_CONNECTIONS // workers
+  pool_size    = min(share, max(DB_POOL_MIN, concurrency))   kept open
+  max_overflow = share - pool_size              opened on demand (a request may
+                                                hold two sessions), closed after
+
+DB_POOL_MIN keeps SQLAlchemy's 5 as a floor: a sync worker serves one request
+at a time, but the outbox, webhook and hold-sweeper threads use the same pool.
+The share is per process, not per engine: everything in a worker goes through
+models.get_engine() (poster_new.get_db_engine() returns it too), so a second
+engine would hold a second share.
+
+Greenlets beyond the share wait for a free connection (up to DB_POOL_TIMEOUT).
+The pool's queue uses monkey-patched locks, so that wait is cooperative as
+well.
+
+  DB_COOPERATIVE=auto        auto: when gevent has patched socket; 1: always; 0: never
+  DB_MAX_CONNECTIONS=90      Postgres connections this app may hold, all workers together
+  DB_POOL_SIZE=              explicit per-worker pool size (overrides the computation)
+  DB_POOL_MIN=5              smallest computed pool_size (capped by the share)
+  DB_POOL_TIMEOUT=10         seconds to wait for a pooled connection
+"""
+from __future__ import annotations
+import logging
+import os
+import sys
+
+log = logging.getLogger("db_cooperative")
+
+DB_COOPERATIVE = os.getenv("DB_COOPERATIVE", "auto").lower()
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "90"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "5"))
+
+_installed = False
+
+
+def gevent_patched() -> bool:
+    if "gevent" not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched("socket")
+
+
+def gevent_wait_callback(conn, timeout=None):
+    """psycopg2 wait callback: poll the connection, yielding to the gevent hub while libpq waits."""
+    from psycopg2 import extensions, OperationalError
+    from gevent.socket import wait_read, wait_write
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f"Bad result from poll: {state!r}")
+
+
+def install(force: bool = False) -> bool:
+    """Make psycopg2 cooperative in this process (force: without checking for gevent; DB_COOPERATIVE=0 still wins)."""
+    global _installed
+    if _installed:
+        return True
+    if DB_COOPERATIVE == "0" or (not force and DB_COOPERATIVE == "auto" and not gevent_patched()):
+        return False
+    try:
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+    extensions.set_wait_callback(gevent_wait_callback)
+    _installed = True
+    log.info("psycopg2_cooperative", extra={"pid": os.getpid()})
+    return True
+
+
+def installed() -> bool:
+    return _installed
+
+
+def pool_limits(concurrency: int | None = None, workers: int | None = None) -> tuple[int, int] | None:
+    """(pool_size, max_overflow) per worker process, or None to keep SQLAlchemy's defaults."""
+    if concurrency is None:
+        concurrency = int(os.getenv("DB_WORKER_CONCURRENCY", "0")) or None
+    if workers is None:
+        workers = int(os.getenv("DB_WORKERS", "1"))
+    share = max(1, DB_MAX_CONNECTIONS // max(1, workers))
+    if os.getenv("DB_POOL_SIZE"):
+        size = int(os.environ["DB_POOL_SIZE"])
+        return size, max(0, share - size)
+    if concurrency is None:
+        return None
+    size = max(1, min(share, max(DB_POOL_MIN, concurrency)))
+    return size, share - size
+
+
+def engine_options() -> dict:
+    """create_engine() keyword arguments for a server database (not SQLite)."""
+    opts = {"pool_pre_ping": True, "pool_recycle": 300}
+    limits = pool_limits()
+    if limits is not None:
+        opts.update(pool_size=limits[0], max_overflow=limits[1], pool_timeout=DB_POOL_TIMEOUT)
+    return opts
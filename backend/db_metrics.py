@@ -0,0 +1,152 @@
+# db_metrics.py
+"""
+Per-request database instrumentation.
+
+SQLAlchemy cursor events (on the Engine class, so any engine counts, though
+the app has one: models.get_engine(), which poster_new.get_db_engine() also
+returns) count statements, DB time and rows per request:
+
+  request_stats()  -> {"db_queries", "db_ms", "db_rows"}; app.py and app_secure add it to request_end
+  X-DB-Queries / X-DB-Time-Ms / Server-Timing headers when app.debug or DB_METRICS_HEADER=1
+  slow_query       WARNING for any statement over SLOW_QUERY_MS, SQL normalized
+                   (literals -> ?), with the request id and path
+  n_plus_one       WARNING when one statement runs N_PLUS_ONE_THRESHOLD+ times in a
+                   request (a lazy relationship or a per-row lookup inside a loop)
+
+Statements are tallied by their raw text, which for SQLAlchemy queries is
+already parameterized, so nothing is normalized unless it gets logged.
+Rows come from cursor.rowcount (rows returned on Postgres; SQLite reports -1
+for SELECTs, so only DML rows count there). Work outside a request
+(background threads, CLI) is not tracked.
+"""
+from __future__ import annotations
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+log = logging.getLogger("db")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+DB_METRICS_HEADER = os.getenv("DB_METRICS_HEADER", "0") == "1"
+
+_local = threading.local()
+_installed = False
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,?)+\)", re.I)
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(sql: str) -> str:
+    """Statement shape for logs: literals and IN lists collapsed to ?, whitespace squeezed."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (?)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+class _RequestStats:
+    __slots__ = ("queries", "seconds", "rows", "statements", "rid", "path")
+
+    def __init__(self, rid=None, path=None):
+        self.queries = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.statements: Counter = Counter()
+        self.rid, self.path = rid, path
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # the start time lives on the execution context, which is dropped with a failed
+    # statement (after_cursor_execute never fires for it), so nothing goes stale
+    if context is not None and getattr(_local, "stats", None) is not None:
+        context._db_metrics_t0 = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_local, "stats", None)
+    t0 = getattr(context, "_db_metrics_t0", None)
+    if stats is None or t0 is None:
+        return
+    elapsed = time.perf_counter() - t0
+    stats.queries += 1
+    stats.seconds += elapsed
+    stats.statements[statement] += 1
+    rc = getattr(cursor, "rowcount", -1)
+    if rc and rc > 0:
+        stats.rows += rc
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        log.warning("slow_query", extra={"rid": stats.rid, "path": stats.path,
+                                         "ms": round(elapsed * 1000, 1), "sql": normalize(statement)[:2000]})
+
+
+def install() -> None:
+    """Attach the cursor listeners to every Engine (idempotent)."""
+    global _installed
+    if _installed:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    _installed = True
+
+
+def begin(rid=None, path=None) -> None:
+    _local.stats = _RequestStats(rid, path)
+
+
+def request_stats() -> dict:
+    """Counters for the current request so far (empty outside one)."""
+    stats = getattr(_local, "stats", None)
+    if stats is None:
+        return {}
+    return {"db_queries": stats.queries, "db_ms": round(stats.seconds * 1000, 2), "db_rows": stats.rows}
+
+
+def repeated_statements(threshold: int = N_PLUS_ONE_THRESHOLD) -> list[tuple[str, int]]:
+    stats = getattr(_local, "stats", None)
+    if stats is None:
+        return []
+    return [(sql, n) for sql, n in stats.statements.most_common() if n >= threshold]
+
+
+def end() -> None:
+    """Flag N+1 patterns and stop tracking for this thread."""
+    stats = getattr(_local, "stats", None)
+    if stats is None:
+        return
+    for sql, n in repeated_statements():
+        log.warning("n_plus_one", extra={"rid": stats.rid, "path": stats.path, "count": n,
+                                         "queries": stats.queries, "sql": normalize(sql)[:2000]})
+    _local.stats = None
+
+
+def init_app(app) -> None:
+    """Track every request of `app`; adds the debug headers when enabled."""
+    install()
+
+    @app.before_request
+    def _db_metrics_begin():
+        from flask import g, request
+        begin(getattr(g, "request_id", None) or request.headers.get("X-Request-ID"), request.path)
+
+    @app.after_request
+    def _db_metrics_headers(response):
+        if app.debug or DB_METRICS_HEADER:
+            st = request_stats()
+            if st:
+                response.headers["X-DB-Queries"] = str(st["db_queries"])
+                response.headers["X-DB-Time-Ms"] = str(st["db_ms"])
+                response.headers.add("Server-Timing", f"db;dur={st['db_ms']}")
+        return response
+
+    @app.teardown_request
+    def _db_metrics_end(exc=None):
+        end()
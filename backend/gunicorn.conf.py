@@ -0,0 +1,36 @@
+# gunicorn.conf.py - loaded automatically by gunicorn from the working directory.
+# Settings stay on the command line (Dockerfile / start.sh / railway.toml); this file only adds
+# the hooks Prometheus multiprocess mode needs (see metrics.py) and the
+# per-worker DB setup (see db_cooperative.py).
+import os
+import shutil
+
+# Must be set before workers import prometheus_client, so set it here in the master.
+PROMETHEUS_DIR = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus-multiproc")
+
+
+def on_starting(server):
+    # samples from a previous master's workers would otherwise be summed in
+    shutil.rmtree(PROMETHEUS_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    # pool sizing follows how many requests one worker can run at once
+    cfg = server.cfg
+    gevent = type(worker).__module__.endswith("ggevent")
+    concurrency = cfg.worker_connections if gevent else max(1, cfg.threads)
+    os.environ["DB_WORKER_CONCURRENCY"] = str(concurrency)
+    os.environ["DB_WORKERS"] = str(cfg.workers)
+    if gevent:
+        # before the worker opens its first Postgres connection
+        import db_cooperative
+        db_cooperative.install(force=True)
@@ -0,0 +1,118 @@
+# image_cache.py
+"""
+Opt-in exact-match cache for public image generations.
+
+Showcase and demo flows keep asking DALL-E for the same (prompt, size,
+quality, style) combinations. Here the final upstream payload is hashed, with
+the prompt whitespace-collapsed and case-folded. The key maps to the posters
+already generated for it. A repeat request gets those posters back at once,
+with no upstream call and no new rows.
+
+Caching only happens when a request asks for it ("public": true) or its
+endpoint is listed in IMAGE_CACHE_ROUTES. Personalized requests (user_id set)
+are never cached, so private generations behave exactly as before.
+
+Each key keeps up to IMAGE_CACHE_PER_KEY posters, so n=4 requests still get
+four different images. A request for more than are stored gets the stored
+ones and generates only the rest. Entries are poster references (ids and
+URLs), not image bytes. LRU eviction past IMAGE_CACHE_SIZE keys; entries
+expire after IMAGE_CACHE_TTL_SECONDS. The cache is per process.
+
+    key = image_cache.payload_key(payload)
+    hits = image_cache.get(key, n)
+    ...
+    image_cache.put(key, {"poster_id": ..., "url": ..., "filename": ...})
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "512"))
+IMAGE_CACHE_TTL_SECONDS = int(os.getenv("IMAGE_CACHE_TTL_SECONDS", str(7 * 86400)))
+IMAGE_CACHE_PER_KEY = int(os.getenv("IMAGE_CACHE_PER_KEY", "4"))
+# endpoints (e.g. "poster.generate_poster") where public caching is on unless the request says "public": false
+IMAGE_CACHE_ROUTES = {r.strip() for r in os.getenv("IMAGE_CACHE_ROUTES", "").split(",") if r.strip()}
+
+# key -> (created_at, [poster refs])
+_cache: "OrderedDict[str, tuple[float, list]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "partial_hits": 0, "misses": 0, "evictions": 0, "expired": 0, "images_served": 0}
+
+
+def enabled(public_flag=None, endpoint: Optional[str] = None, user_id=None) -> bool:
+    """Whether this request may use the cache: opt-in per request or per route, never when personalized."""
+    if user_id:
+        return False
+    if public_flag is not None:
+        return bool(public_flag)
+    return endpoint in IMAGE_CACHE_ROUTES
+
+
+def payload_key(payload: dict) -> str:
+    norm = dict(payload)
+    if isinstance(norm.get("prompt"), str):
+        norm["prompt"] = " ".join(norm["prompt"].split()).casefold()
+    norm.pop("n", None)  # each cached poster stands for one n=1 call
+    blob = json.dumps(norm, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def get(key: str, n: int, ttl: Optional[float] = None) -> list:
+    """Up to n stored posters for key (may be fewer, or empty)."""
+    ttl = IMAGE_CACHE_TTL_SECONDS if ttl is None else min(ttl, IMAGE_CACHE_TTL_SECONDS)
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None and time.time() - hit[0] > ttl:
+            del _cache[key]
+            _stats["expired"] += 1
+            hit = None
+        if hit is None:
+            _stats["misses"] += 1
+            return []
+        _cache.move_to_end(key)
+        refs = hit[1][:n]
+        _stats["hits" if len(refs) >= n else "partial_hits"] += 1
+        _stats["images_served"] += len(refs)
+        return [dict(r) for r in refs]
+
+
+def put(key: str, ref: dict) -> None:
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is None:
+            hit = _cache[key] = (time.time(), [])
+        else:
+            _cache.move_to_end(key)
+        if len(hit[1]) < IMAGE_CACHE_PER_KEY:
+            hit[1].append(dict(ref))
+        while len(_cache) > IMAGE_CACHE_SIZE:
+            _cache.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def cache_info() -> dict:
+    with _cache_lock:
+        lookups = _stats["hits"] + _stats["partial_hits"] + _stats["misses"]
+        return {**_stats, "keys": len(_cache), "images": sum(len(v[1]) for v in _cache.values()),
+                "max_keys": IMAGE_CACHE_SIZE, "hit_ratio": round(_stats["hits"] / lookups, 3) if lookups else None}
+
+
+def clear() -> None:
+    with _cache_lock:
+        _cache.clear()
+        for k in _stats:
+            _stats[k] = 0
+
+
+def _health_check(app) -> dict:
+    return {"ok": True, **cache_info()}
+
+
+def register_health_check() -> None:
+    import app_health
+    app_health.register_check("image_cache", _health_check)
@@ -0,0 +1,222 @@
+# logconfig.py
+"""
+JSON logging with the write moved off the request path.
+
+Request threads only put the LogRecord on a bounded queue (QueueHandler);
+one QueueListener thread does the %-merge, the JSON encoding and the write
+to stdout. Records are kept lazy: when the args are plain scalars, the
+message is merged in the listener. Other args (dicts, lists, objects that
+may change later) are merged in the caller, as the stdlib QueueHandler does.
+
+Before a record is queued, a filter can drop high-volume INFO/DEBUG lines.
+WARNING and above are never dropped.
+
+  LOG_SAMPLE="auth=0.05,poster=0.2"   keep a fraction of a logger's (and its
+                                      children's) INFO/DEBUG records
+  LOG_RATE_LIMIT=50                   at most N records/s per (logger, message
+                                      template); 0 = off. The next record that
+                                      gets through carries "suppressed": <count>
+  LOG_RATE_LIMIT_KEYS=1024            rate-limit buckets kept (least recently used
+                                      evicted; a message built with an f-string is
+                                      its own template, so this bounds the memory)
+  LOG_LEVELS="auth=DEBUG"             per-logger levels (e.g. to turn on the
+                                      per-request auth lines, then sample them)
+  LOG_QUEUE_SIZE=10000                if the writer falls behind, new records are
+                                      dropped and counted instead of blocking a request
+  LOG_ASYNC=0                         write synchronously (the old behaviour)
+"""
+from __future__ import annotations
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "0"))
+LOG_RATE_LIMIT_KEYS = int(os.getenv("LOG_RATE_LIMIT_KEYS", "1024"))
+
+_LAZY_TYPES = (str, int, float, bool, type(None))
+
+_listener: logging.handlers.QueueListener | None = None
+_handler: "AsyncQueueHandler | None" = None
+
+
+def _parse_map(raw: str) -> dict[str, str]:
+    out = {}
+    for part in (raw or "").split(","):
+        name, sep, value = part.partition("=")
+        if sep and name.strip():
+            out[name.strip()] = value.strip()
+    return out
+
+
+class SamplingFilter(logging.Filter):
+    """Per-logger sampling and per-template rate limiting for records below WARNING."""
+
+    def __init__(self, sample: dict[str, float] | None = None, rate_limit: float = 0.0,
+                 max_keys: int = LOG_RATE_LIMIT_KEYS):
+        super().__init__()
+        self.sample = sample or {}
+        self.rate_limit = rate_limit
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[tuple, list]" = OrderedDict()  # key -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def _sample_rate(self, name: str) -> float:
+        # most specific configured ancestor wins: "auth.reset" falls back to "auth"
+        while name:
+            if name in self.sample:
+                return self.sample[name]
+            name = name.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.sample:
+            rate = self._sample_rate(record.name)
+            if rate < 1.0 and random.random() >= rate:
+                return False
+        if self.rate_limit <= 0:
+            return True
+        # the unformatted template, not getMessage(): "user %s" is one bucket for every user
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.rate_limit, now, 0]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.rate_limit, bucket[0] + (now - bucket[1]) * self.rate_limit)
+                bucket[1] = now
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1.0
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps records lazy where safe and never blocks on a full queue."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args and not all(isinstance(a, _LAZY_TYPES) for a in
+                                   (record.args.values() if isinstance(record.args, dict) else record.args)):
+            record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            # tracebacks pin frames; render the text here and let them go
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _DropReporter(logging.Handler):
+    """Runs in the listener; reports how many records the full queue dropped since the last report."""
+
+    def __init__(self, source: AsyncQueueHandler, target: logging.Handler):
+        super().__init__()
+        self.source, self.target = source, target
+        self.reported = 0
+
+    def emit(self, record):
+        dropped = self.source.dropped
+        if dropped != self.reported:
+            note = logging.LogRecord("logconfig", logging.WARNING, __file__, 0, "log_records_dropped", None, None)
+            note.dropped = dropped - self.reported
+            self.reported = dropped
+            self.target.handle(note)
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # blocking put: the stock put_nowait raises queue.Full when the writer is behind,
+        # and stop() then returns with the thread still writing
+        self.queue.put(self._sentinel)
+
+
+def _stream_handler() -> logging.Handler:
+    from pythonjsonlogger import jsonlogger
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(jsonlogger.JsonFormatter(
+        "%(asctime)s %(levelname)s %(name)s %(message)s",
+        rename_fields={"levelname": "level", "asctime": "ts"},
+    ))
+    return handler
+
+
+def _start(root: logging.Logger, sample: dict, rate_limit: float) -> None:
+    global _listener, _handler
+    writer = _stream_handler()
+    if not LOG_ASYNC:
+        writer.addFilter(SamplingFilter(sample, rate_limit))
+        root.addHandler(writer)
+        return
+    _handler = AsyncQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _handler.addFilter(SamplingFilter(sample, rate_limit))
+    _listener = _Listener(_handler.queue, _DropReporter(_handler, writer), writer, respect_handler_level=True)
+    _listener.start()
+    root.addHandler(_handler)
+
+
+def stop() -> None:
+    """Flush what's queued and stop the writer thread (registered with atexit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _after_fork() -> None:
+    # the listener thread doesn't survive fork(); give the child its own queue and thread
+    global _listener
+    if _handler is None or _listener is None:
+        return
+    _handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _handler.dropped = 0
+    for h in _listener.handlers:
+        if isinstance(h, _DropReporter):
+            h.reported = 0
+    _listener = _Listener(_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def init(level: int = logging.INFO) -> None:
+    """Replace the root handlers with the (async, sampled) JSON writer."""
+    root = logging.getLogger()
+    root.setLevel(level)
+    stop()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+
+    sample = {name: float(v) for name, v in _parse_map(os.getenv("LOG_SAMPLE", "")).items()}
+    for name, lvl in _parse_map(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(lvl.upper())
+    _start(root, sample, LOG_RATE_LIMIT)
+
+
+atexit.register(stop)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -5,6 +5,8 @@ import smtplib
 from email.message import EmailMessage
 from typing import Optional, Sequence
 
+import resilience
+
 # ---- BRAND/SENDER (Mini-Visionary) ----
 BRAND_NAME = "Mini-Visionary"
 BRAND_TAGLINE = "You Envision it, We Generate it"
@@ -14,7 +16,34 @@ RESEND_API_KEY = os.getenv("RESEND_API_KEY")           # set in Railway
 FROM_EMAIL = os.getenv("FROM_EMAIL", SUPPORT_EMAIL)
 
 class MailError(Exception):
-    pass
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+# One pooled HTTPS session for every Resend call (keep-alive instead of a TLS handshake per email)
+RESEND_URL = os.getenv("RESEND_BASE_URL", "https://api.resend.com").rstrip("/")
+RESEND_BATCH_MAX = 100  # Resend /emails/batch limit
+
+_http = requests.Session()
+_http.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=int(os.getenv("MAIL_HTTP_POOL", "8"))))
+
+def _resend_post(path: str, payload, timeout: float):
+    try:
+        with resilience.upstream("resend", path) as call:
+            r = _http.post(
+                f"{RESEND_URL}{path}",
+                headers={"Authorization": f"Bearer {RESEND_API_KEY}", "Content-Type": "application/json"},
+                json=payload,
+                timeout=timeout,
+            )
+            call.status = r.status_code
+    except resilience.UpstreamUnavailable as e:
+        raise MailError(str(e), retryable=True)
+    if r.status_code >= 300:
+        # 4xx other than rate limiting means the message itself is bad; retrying won't help
+        retryable = r.status_code == 429 or r.status_code >= 500
+        raise MailError(f"Resend error {r.status_code}: {r.text}", retryable=retryable)
+    return r.json()
 
 def send_email_post(to: str | Sequence[str], subject: str, html: str, cc=None, bcc=None, reply_to=None):
     """
@@ -34,18 +63,7 @@ def send_email_post(to: str | Sequence[str], subject: str, html: str, cc=None, b
     if bcc: payload["bcc"] = bcc
     if reply_to: payload["reply_to"] = reply_to
 
-    r = requests.post(
-        "https://api.resend.com/emails",
-        headers={
-            "Authorization": f"Bearer {RESEND_API_KEY}",
-            "Content-Type": "application/json"
-        },
-        json=payload,
-        timeout=30,
-    )
-    if r.status_code >= 300:
-        raise MailError(f"Resend error {r.status_code}: {r.text}")
-    return r.json()   # includes {"id": "..."}
+    return _resend_post("/emails", payload, timeout=30)   # includes {"id": "..."}
 
 # ---- LEGACY FUNCTIONS (keep for compatibility) ----
 # Preferred: use RESEND_FROM (domain sender). Fallback: FROM_EMAIL (Gmail/SMTP).
@@ -75,10 +93,21 @@ def _send_via_resend(
     cc: Optional[Sequence[str]] = None,
     bcc: Optional[Sequence[str]] = None,
     tags: Optional[dict] = None,
-) -> None:
+) -> Optional[str]:
     if not RESEND_API_KEY:
         raise MailError("RESEND_API_KEY not set")
+    return _resend_post("/emails", _resend_payload(to, subject, html, text, reply_to, cc, bcc, tags), timeout=20.0).get("id")
 
+def _resend_payload(
+    to: Sequence[str],
+    subject: str,
+    html: Optional[str] = None,
+    text: Optional[str] = None,
+    reply_to: Optional[str] = None,
+    cc: Optional[Sequence[str]] = None,
+    bcc: Optional[Sequence[str]] = None,
+    tags: Optional[dict] = None,
+) -> dict:
     payload = {
         "from": _fmt_sender(),           # <- includes name + address
         "to": list(to),
@@ -96,16 +125,7 @@ def _send_via_resend(
     if tags:
         # Resend supports tags via headers; we also include them in payload for logs
         payload["headers"] = {f"X-Tag-{k}": str(v) for k, v in tags.items()}
-
-    headers = {"Authorization": f"Bearer {RESEND_API_KEY}"}
-    r = requests.post(
-        "https://api.resend.com/emails",
-        json=payload,
-        headers=headers,
-        timeout=20.0
-    )
-    if r.status_code >= 300:
-        raise MailError(f"Resend failed: {r.status_code} {r.text}")
+    return payload
 
 def _send_via_smtp(
     to: Sequence[str],
@@ -115,9 +135,13 @@ def _send_via_smtp(
     reply_to: Optional[str] = None,
     cc: Optional[Sequence[str]] = None,
     bcc: Optional[Sequence[str]] = None,
+    conn: Optional[smtplib.SMTP] = None,
 ) -> None:
-    if not (SMTP_HOST and SMTP_USER and SMTP_PASS):
+    if not SMTP_HOST:
         raise MailError("SMTP env not configured")
+    if conn is None:
+        with _smtp_connect() as conn:
+            return _send_via_smtp(to, subject, html, text, reply_to, cc, bcc, conn=conn)
 
     msg = EmailMessage()
     msg["From"] = _fmt_sender()         # <- includes name + address
@@ -136,12 +160,68 @@ def _send_via_smtp(
         msg.set_content(text or "")
 
     targets = list(to) + (list(cc) if cc else []) + (list(bcc) if bcc else [])
+    conn.send_message(msg, to_addrs=targets)
 
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=20) as s:
+def _smtp_connect() -> smtplib.SMTP:
+    """Open an SMTP connection. Without SMTP_USER (e.g. a local debug server) no auth/TLS is attempted."""
+    if not SMTP_HOST:
+        raise MailError("No mail transport configured (set RESEND_API_KEY or SMTP_HOST)")
+    conn = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=20)
+    if SMTP_USER:
         if SMTP_STARTTLS:
-            s.starttls()
-        s.login(SMTP_USER, SMTP_PASS)
-        s.send_message(msg, to_addrs=targets)
+            conn.starttls()
+        conn.login(SMTP_USER, SMTP_PASS or "")
+    return conn
+
+def send_batch(messages: Sequence[dict]) -> list:
+    """
+    Send many messages with as few provider round-trips as possible.
+    Each message is a dict of send_email() keyword arguments.
+    Returns one result per message: provider id (or None) on success, MailError on failure.
+    Resend: POST /emails/batch in chunks of 100; if a chunk is rejected as a whole
+    (validation error), its messages are retried one by one so a bad address only
+    fails itself. SMTP: all messages over one connection.
+    """
+    results: list = []
+    if RESEND_API_KEY:
+        for i in range(0, len(messages), RESEND_BATCH_MAX):
+            chunk = messages[i:i + RESEND_BATCH_MAX]
+            payloads = [_resend_payload(_as_list(m["to"]), m["subject"], m.get("html"), m.get("text"),
+                                        m.get("reply_to"), m.get("cc"), m.get("bcc"), m.get("tags")) for m in chunk]
+            try:
+                data = _resend_post("/emails/batch", payloads, timeout=30).get("data") or []
+                results.extend([d.get("id") for d in data] + [None] * (len(chunk) - len(data)))
+            except MailError as e:
+                if e.retryable or len(chunk) == 1:
+                    results.extend([e] * len(chunk))
+                    continue
+                for p in payloads:
+                    try:
+                        results.append(_resend_post("/emails", p, timeout=20.0).get("id"))
+                    except MailError as one:
+                        results.append(one)
+            except Exception as e:
+                results.extend([MailError(str(e))] * len(chunk))
+        return results
+
+    try:
+        conn = _smtp_connect()
+    except Exception as e:
+        return [MailError(str(e))] * len(messages)
+    with conn:
+        for m in messages:
+            try:
+                _send_via_smtp(_as_list(m["to"]), m["subject"], m.get("html"), m.get("text"),
+                               m.get("reply_to"), m.get("cc"), m.get("bcc"), conn=conn)
+                results.append(None)
+            except smtplib.SMTPRecipientsRefused as e:
+                results.append(MailError(str(e), retryable=False))
+            except Exception as e:
+                results.append(MailError(str(e)))
+    return results
+
+def _as_list(to) -> list:
+    return [to] if isinstance(to, str) else list(to)
 
 def send_email(
     to: Sequence[str] | str,
@@ -166,6 +246,12 @@ def send_email(
         raise MailError(str(e)) from e
 
 # ---- Convenience templates (Mini-Visionary) ----
+# These are queued in the email outbox (outbox.py) rather than sent inline,
+# so request handlers never wait on the provider.
+def _deliver(to: str, subject: str, html: str, text: str, tags: dict) -> None:
+    from outbox import queue_email
+    queue_email(to, subject, html=html, text=text, tags=tags)
+
 def poster_ready_email(user_email: str, poster_url: str, dashboard_url: Optional[str] = None) -> None:
     subject = f"🎨 Your {BRAND_NAME} poster is ready!"
     dash = dashboard_url or poster_url
@@ -180,7 +266,7 @@ def poster_ready_email(user_email: str, poster_url: str, dashboard_url: Optional
     </div>
     """
     text = f"Your poster is ready: {poster_url}\nDashboard: {dash}"
-    send_email(user_email, subject, html=html, text=text, tags={"event": "poster_ready"})
+    _deliver(user_email, subject, html, text, tags={"event": "poster_ready"})
 
 def poster_failed_email(user_email: str, error_message: str) -> None:
     subject = f"⚠️ {BRAND_NAME} failed"
@@ -193,7 +279,7 @@ def poster_failed_email(user_email: str, error_message: str) -> None:
     </div>
     """
     text = f"Your poster job failed:\n\n{error_message}\n\nPlease try again."
-    send_email(user_email, subject, html=html, text=text, tags={"event": "poster_failed"})
+    _deliver(user_email, subject, html, text, tags={"event": "poster_failed"})
 
 def welcome_email(user_email: str, display_name: Optional[str] = None) -> None:
     subject = f"Welcome to {BRAND_NAME} 🌟"
@@ -211,7 +297,7 @@ def welcome_email(user_email: str, display_name: Optional[str] = None) -> None:
     </div>
     """
     text = f"Welcome {name}! {BRAND_NAME} is ready for you."
-    send_email(user_email, subject, html=html, text=text, tags={"event": "welcome"})
+    _deliver(user_email, subject, html, text, tags={"event": "welcome"})
 
 def send_reset_email(user_email: str, reset_url: str) -> None:
     subject = f"Reset your {BRAND_NAME} password"
@@ -227,4 +313,4 @@ def send_reset_email(user_email: str, reset_url: str) -> None:
     </div>
     """
     text = f"Reset your password: {reset_url}\n\nThis link expires in 24 hours."
-    send_email(user_email, subject, html=html, text=text, tags={"event": "password_reset"})
\ No newline at end of file
+    _deliver(user_email, subject, html, text, tags={"event": "password_reset"})
\ No newline at end of file
@@ -0,0 +1,189 @@
+# metrics.py
+"""
+Prometheus metrics, exposed at GET /metrics.
+
+  http_requests_total / http_request_duration_seconds    by route template (url_rule), method, status
+  http_request_db_queries                                 statements per request (from db_metrics)
+  upstream_requests_total / upstream_request_duration_seconds
+                                                          OpenAI / Stripe / Resend calls by endpoint and model
+  db_pool_checked_out, db_pool_connects_total             SQLAlchemy pools (all engines)
+  credits_spent_total                                     settled credits by operation
+  image_processing_seconds                                Pillow work by operation
+  cache_requests_total                                    cache lookups by cache and result (hits, misses, ...)
+
+Under gunicorn, gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR before the
+workers fork. Every worker then writes its samples to mmap files there, and a
+scrape from any worker aggregates all of them. Without the variable (dev
+server, scripts), the default in-process registry is used.
+
+prometheus_client is optional: without it every helper is a no-op and
+/metrics answers 503. Set METRICS_TOKEN to require "Authorization: Bearer <token>".
+
+    with metrics.upstream("openai", "images.generations", model) as call:
+        resp = requests.post(...)
+        call.status = resp.status_code
+
+    @metrics.timed_image("overlay_text")
+    def overlay_text_cinematic(...): ...
+"""
+from __future__ import annotations
+import functools
+import hmac
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+    METRICS_AVAILABLE = True
+except ImportError:
+    prometheus_client = None
+    METRICS_AVAILABLE = False
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir")
+
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+IMAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+class _Noop:
+    """Stands in for a metric when prometheus_client isn't installed."""
+    def labels(self, *a, **kw): return self
+    def inc(self, *a, **kw): pass
+    def dec(self, *a, **kw): pass
+    def set(self, *a, **kw): pass
+    def observe(self, *a, **kw): pass
+
+
+if METRICS_AVAILABLE:
+    HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests", ["route", "method", "status"])
+    HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ["route", "method"])
+    HTTP_DB_QUERIES = Histogram("http_request_db_queries", "SQL statements per request", ["route"],
+                                buckets=QUERY_BUCKETS)
+    UPSTREAM_REQUESTS = Counter("upstream_requests_total", "Calls to third-party APIs",
+                                ["service", "endpoint", "model", "outcome"])
+    UPSTREAM_LATENCY = Histogram("upstream_request_duration_seconds", "Third-party API call latency",
+                                 ["service", "endpoint", "model"], buckets=UPSTREAM_BUCKETS)
+    DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections currently checked out of SQLAlchemy pools",
+                                multiprocess_mode="livesum")
+    DB_POOL_CONNECTS = Counter("db_pool_connects_total", "New DB connections opened by SQLAlchemy pools")
+    CREDITS_SPENT = Counter("credits_spent_total", "Credits charged (settled), by operation", ["operation"])
+    IMAGE_SECONDS = Histogram("image_processing_seconds", "Image processing time", ["operation"],
+                              buckets=IMAGE_BUCKETS)
+    CACHE_REQUESTS = Counter("cache_requests_total", "Lookups in process-local caches, by result",
+                             ["cache", "result"])
+else:
+    HTTP_REQUESTS = HTTP_LATENCY = HTTP_DB_QUERIES = UPSTREAM_REQUESTS = UPSTREAM_LATENCY = _Noop()
+    DB_POOL_CHECKED_OUT = DB_POOL_CONNECTS = CREDITS_SPENT = IMAGE_SECONDS = CACHE_REQUESTS = _Noop()
+
+
+# ---------- helpers used across the app ----------
+
+class _Call:
+    __slots__ = ("status",)
+
+    def __init__(self):
+        self.status = None
+
+
+@contextmanager
+def upstream(service: str, endpoint: str, model: str = ""):
+    """Time a third-party call. Set `call.status` to the HTTP status when it doesn't raise on errors."""
+    call = _Call()
+    t0 = time.perf_counter()
+    outcome = "exception"
+    try:
+        yield call
+        status = call.status or 200
+        outcome = "ok" if status < 400 else f"http_{status // 100}xx"
+    finally:
+        UPSTREAM_LATENCY.labels(service, endpoint, model or "").observe(time.perf_counter() - t0)
+        UPSTREAM_REQUESTS.labels(service, endpoint, model or "", outcome).inc()
+
+
+def credits_spent(operation: str | None, amount: int) -> None:
+    if amount > 0:
+        CREDITS_SPENT.labels((operation or "other")[:32]).inc(amount)
+
+
+def timed_image(operation: str):
+    """Decorator: observe the wrapped function's runtime in image_processing_seconds."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                IMAGE_SECONDS.labels(operation).observe(time.perf_counter() - t0)
+        return wrapper
+    return decorator
+
+
+# ---------- DB pool ----------
+
+_pool_hooks = False
+
+
+def _install_pool_hooks() -> None:
+    global _pool_hooks
+    if _pool_hooks or not METRICS_AVAILABLE:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.pool import Pool
+    event.listen(Pool, "connect", lambda *_: DB_POOL_CONNECTS.inc())
+    event.listen(Pool, "checkout", lambda *_: DB_POOL_CHECKED_OUT.inc())
+    event.listen(Pool, "checkin", lambda *_: DB_POOL_CHECKED_OUT.dec())
+    _pool_hooks = True
+
+
+# ---------- exposition ----------
+
+def render() -> tuple[bytes, str]:
+    """Text exposition of every worker's metrics (multiprocess) or this process's."""
+    if MULTIPROC_DIR:
+        from prometheus_client import CollectorRegistry, multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def init_app(app) -> None:
+    """Per-request HTTP metrics and the /metrics endpoint."""
+    from flask import Response, g, request
+
+    _install_pool_hooks()
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_t0 = time.perf_counter()
+
+    @app.after_request
+    def _metrics_observe(response):
+        t0 = getattr(g, "_metrics_t0", None)
+        if t0 is None or not METRICS_AVAILABLE:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        HTTP_LATENCY.labels(route, request.method).observe(time.perf_counter() - t0)
+        HTTP_REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+        import db_metrics
+        queries = db_metrics.request_stats().get("db_queries")
+        if queries is not None:
+            HTTP_DB_QUERIES.labels(route).observe(queries)
+        return response
+
+    @app.get("/metrics", endpoint="metrics")
+    def _metrics():
+        if not METRICS_AVAILABLE:
+            return Response("prometheus_client not installed\n", status=503, mimetype="text/plain")
+        if METRICS_TOKEN:
+            auth = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+                return Response("unauthorized\n", status=401, mimetype="text/plain")
+        body, content_type = render()
+        return Response(body, content_type=content_type)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations.
+
+Steps live in migrations/ as NNN_name.sql or NNN_name.py and run in version
+order, each once, in its own transaction. Applied versions are recorded in
+schema_migrations.
+
+  NNN_name.sql              runs on every database
+  NNN_name.postgresql.sql   dialect-specific (skipped elsewhere, still recorded)
+  NNN_name.py               defines upgrade(conn, dialect); optional
+                            DIALECTS = ("postgresql",) and MANUAL = True
+
+A first line of "-- migrate: manual" (SQL), or MANUAL = True (Python), marks a
+destructive step. Boot never runs these; run them explicitly with --manual.
+
+Boot calls ensure_schema(). That is one SELECT of the applied versions and one
+catalog read of the table names. Only when this deploy ships new steps, or a
+model's table is missing, does it take a Postgres advisory lock (so one worker
+migrates while the others wait), run create_all (idempotent: it only creates
+missing tables), then run the pending steps.
+
+A new model table still gets its own step with the DDL and indexes (see
+007_chat_conversations.py), so the schema history stays in this directory and
+dialect differences are explicit. create_all is the safety net, not the way
+tables ship.
+
+Usage:
+  python migrate.py status
+  python migrate.py upgrade [--manual] [--yes]
+"""
+from __future__ import annotations
+import argparse
+import importlib.util
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import Base, SchemaMigration, get_engine
+
+log = logging.getLogger("migrate")
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATE_ON_BOOT = os.getenv("MIGRATE_ON_BOOT", "1") == "1"
+LOCK_KEY = 0x6D766D67  # "mvmg": pg_advisory_lock key shared by all workers
+
+_FILE = re.compile(r"^(?P<version>\d{3,})_(?P<name>[\w-]+?)(?:\.(?P<dialect>postgresql|sqlite))?\.(?P<kind>sql|py)$")
+_process_lock = threading.Lock()
+_schema_current = False
+
+
+@dataclass
+class Step:
+    version: str
+    name: str
+    path: str
+    kind: str                     # "sql" | "py"
+    dialects: tuple = ()          # empty: any
+    manual: bool = False
+
+    def applies_to(self, dialect: str) -> bool:
+        return not self.dialects or dialect in self.dialects
+
+
+def _load_py(path: str):
+    spec = importlib.util.spec_from_file_location(f"migration_{os.path.basename(path)[:-3]}", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def discover(directory: str = MIGRATIONS_DIR) -> list[Step]:
+    steps: dict[str, Step] = {}
+    for fn in sorted(os.listdir(directory)):
+        m = _FILE.match(fn)
+        if not m:
+            continue
+        path = os.path.join(directory, fn)
+        step = Step(m["version"], m["name"], path, m["kind"],
+                    (m["dialect"],) if m["dialect"] else ())
+        if step.kind == "sql":
+            with open(path, encoding="utf-8") as f:
+                step.manual = f.readline().strip().lower() == "-- migrate: manual"
+        else:
+            mod = _load_py(path)
+            step.dialects = tuple(getattr(mod, "DIALECTS", step.dialects))
+            step.manual = bool(getattr(mod, "MANUAL", False))
+        if step.version in steps:
+            raise RuntimeError(f"duplicate migration version {step.version}: {fn}")
+        steps[step.version] = step
+    return [steps[v] for v in sorted(steps, key=int)]
+
+
+def _sql_statements(sql: str) -> list[str]:
+    """Split a migration file on ';' line endings, dropping '--' comments."""
+    lines = [l for l in sql.splitlines() if not l.strip().startswith("--")]
+    return [st.strip() for st in re.split(r";\s*$", "\n".join(lines), flags=re.M) if st.strip()]
+
+
+def applied_versions(engine=None) -> set[str]:
+    engine = engine or get_engine()
+    try:
+        with engine.connect() as conn:
+            return {r[0] for r in conn.execute(text("SELECT version FROM schema_migrations"))}
+    except SQLAlchemyError:
+        return set()  # fresh database: no schema_migrations yet
+
+
+def pending_steps(engine=None, include_manual: bool = False) -> list[Step]:
+    engine = engine or get_engine()
+    done = applied_versions(engine)
+    return [s for s in discover() if s.version not in done and (include_manual or not s.manual)]
+
+
+def missing_tables(engine=None) -> list[str]:
+    """Model tables that don't exist in the database yet."""
+    engine = engine or get_engine()
+    return sorted(set(Base.metadata.tables) - set(inspect(engine).get_table_names()))
+
+
+@contextmanager
+def _migration_lock(engine):
+    """Cross-worker lock: a session-level advisory lock on Postgres, a process lock elsewhere."""
+    if engine.dialect.name != "postgresql":
+        with _process_lock:
+            yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": LOCK_KEY})
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY})
+            conn.commit()
+
+
+def _run_step(engine, step: Step) -> None:
+    dialect = engine.dialect.name
+    t0 = time.perf_counter()
+    note = None
+    with engine.begin() as conn:
+        if not step.applies_to(dialect):
+            note = f"skipped: {'/'.join(step.dialects)} only"
+        elif step.kind == "sql":
+            with open(step.path, encoding="utf-8") as f:
+                for stmt in _sql_statements(f.read()):
+                    conn.exec_driver_sql(stmt)
+        else:
+            _load_py(step.path).upgrade(conn, dialect)
+        conn.execute(SchemaMigration.__table__.insert().values(
+            version=step.version, name=step.name, note=note,
+            duration_ms=int((time.perf_counter() - t0) * 1000)))
+    log.info("migration_applied", extra={"version": step.version, "step": step.name, "note": note})
+
+
+def upgrade(include_manual: bool = False, engine=None) -> list[str]:
+    """Create missing tables and apply pending steps under the migration lock; returns the versions applied."""
+    global _schema_current
+    engine = engine or get_engine()
+    with _migration_lock(engine):
+        Base.metadata.create_all(bind=engine)
+        # re-read under the lock: another worker may have just finished
+        pending = pending_steps(engine, include_manual)
+        for step in pending:
+            _run_step(engine, step)
+    _schema_current = True
+    return [s.version for s in pending]
+
+
+def ensure_schema() -> None:
+    """Boot hook: a version query and a table-name read; migrates only if something is missing."""
+    global _schema_current
+    if _schema_current:
+        return
+    try:
+        pending = pending_steps()
+        missing = missing_tables()
+        if not pending and not missing:
+            _schema_current = True
+        elif MIGRATE_ON_BOOT:
+            upgrade()
+        else:
+            log.warning("schema_out_of_date", extra={"pending": [s.version for s in pending], "missing": missing})
+    except Exception as e:
+        # a DB outage at boot shouldn't keep the worker from serving health/static
+        log.error("schema_check_failed", extra={"error": str(e)})
+
+
+def status(engine=None) -> list[dict]:
+    engine = engine or get_engine()
+    rows = {}
+    try:
+        with engine.connect() as conn:
+            rows = {r.version: r for r in conn.execute(
+                text("SELECT version, applied_at, duration_ms, note FROM schema_migrations"))}
+    except SQLAlchemyError:
+        pass
+    out = []
+    for s in discover():
+        r = rows.get(s.version)
+        out.append({"version": s.version, "name": s.name, "kind": s.kind,
+                    "dialects": list(s.dialects), "manual": s.manual,
+                    "applied_at": str(r.applied_at) if r else None,
+                    "note": r.note if r else None})
+    return out
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Apply versioned schema migrations")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status", help="list steps and whether they are applied")
+    up = sub.add_parser("upgrade", help="apply pending steps")
+    up.add_argument("--manual", action="store_true", help="also run steps marked manual (destructive)")
+    up.add_argument("--yes", action="store_true", help="don't prompt before manual steps")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "status":
+        for row in status():
+            flag = "x" if row["applied_at"] else " "
+            extra = " (manual)" if row["manual"] else ""
+            extra += f" [{'/'.join(row['dialects'])}]" if row["dialects"] else ""
+            note = f" - {row['note']}" if row["note"] else ""
+            print(f"[{flag}] {row['version']} {row['name']}{extra}{note}")
+        return 0
+
+    if args.manual and not args.yes:
+        manual = [s for s in pending_steps(include_manual=True) if s.manual]
+        if manual:
+            print("Manual steps to run:")
+            for s in manual:
+                print(f"  {s.version} {s.name}")
+            print("Make sure you have a database backup before proceeding!")
+            if input("Proceed? (yes/no): ").strip().lower() not in ("yes", "y"):
+                print("Cancelled.")
+                return 1
+    applied = upgrade(include_manual=args.manual)
+    print(f"Applied {len(applied)} migration(s){': ' + ', '.join(applied) if applied else ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    sys.exit(main())
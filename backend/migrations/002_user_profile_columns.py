@@ -0,0 +1,49 @@
+"""
+Columns added to users / poster_jobs after their tables first shipped.
+
+Replaces the information_schema probes in models.init_db, the /api/migrate
+endpoint, migrate_add_display_name.py and migrate_db.py. A column is only
+added when it is missing, so this is a no-op on databases created from the
+current models.
+"""
+from sqlalchemy import inspect
+
+COLUMNS = {
+    "users": [
+        ("display_name", "VARCHAR(100)"),
+        ("profile_picture_url", "TEXT"),
+        ("avatar_url", "TEXT"),
+        ("credits", "INTEGER DEFAULT 0"),
+        ("ad_free", "BOOLEAN DEFAULT FALSE"),
+        ("stripe_customer_id", "VARCHAR(255)"),
+        ("is_active", "BOOLEAN DEFAULT TRUE"),
+        ("created_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+        ("updated_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+    ],
+    "poster_jobs": [
+        ("progress", "INTEGER DEFAULT 0"),
+        ("error_message", "VARCHAR(1000)"),
+    ],
+}
+
+
+def add_missing_columns(conn, columns: dict, dialect: str) -> None:
+    insp = inspect(conn)
+    tables = set(insp.get_table_names())
+    for table, cols in columns.items():
+        if table not in tables:
+            continue
+        existing = {c["name"] for c in insp.get_columns(table)}
+        for name, ddl in cols:
+            if name in existing:
+                continue
+            if dialect == "sqlite" and "CURRENT_TIMESTAMP" in ddl:
+                # SQLite can't ADD COLUMN with a non-constant default: add, then backfill
+                conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} TIMESTAMP")
+                conn.exec_driver_sql(f"UPDATE {table} SET {name} = CURRENT_TIMESTAMP")
+            else:
+                conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+
+
+def upgrade(conn, dialect):
+    add_missing_columns(conn, COLUMNS, dialect)
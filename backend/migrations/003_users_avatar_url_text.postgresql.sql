@@ -0,0 +1,4 @@
+-- avatar_url holds data URLs, which overflow the old VARCHAR(255/500).
+-- Replaces migrate_avatar_column.py (whose avatar_image_url/avatar_video_url
+-- split never made it into models.User).
+ALTER TABLE users ALTER COLUMN avatar_url TYPE TEXT;
@@ -0,0 +1,11 @@
+"""
+credit_ledger.sku (purchase SKU per ledger row). Run
+`python wallet.py rebuild-summaries` afterwards to backfill credit_summaries.
+"""
+from sqlalchemy import inspect
+
+
+def upgrade(conn, dialect):
+    cols = {c["name"] for c in inspect(conn).get_columns("credit_ledger")}
+    if "sku" not in cols:
+        conn.exec_driver_sql("ALTER TABLE credit_ledger ADD COLUMN sku VARCHAR(32)")
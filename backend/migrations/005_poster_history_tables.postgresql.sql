@@ -0,0 +1,34 @@
+-- Tables used by poster_new (previously created by poster_new.ensure_table in every process).
+
+-- Generated images (bytea)
+CREATE TABLE IF NOT EXISTS posters (
+    id UUID PRIMARY KEY,
+    filename TEXT NOT NULL,
+    mime TEXT NOT NULL,
+    width INT,
+    height INT,
+    prompt TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    data BYTEA NOT NULL
+);
+
+-- Prompt history for learning patterns
+CREATE TABLE IF NOT EXISTS user_prompt_history (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id TEXT NOT NULL,
+    original_prompt TEXT NOT NULL,
+    enhanced_prompt TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_prompt_history_user
+    ON user_prompt_history(user_id, created_at DESC);
+
+-- Manual style presets
+CREATE TABLE IF NOT EXISTS user_style_preferences (
+    user_id TEXT PRIMARY KEY,
+    default_style TEXT,
+    auto_apply BOOLEAN DEFAULT TRUE,
+    custom_instructions TEXT,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,16 @@
+-- migrate: manual
+-- Remove the leftover gambling/betting columns and tables (was cleanup_database.py).
+-- Destructive: take a backup, then run `python migrate.py upgrade --manual`.
+
+ALTER TABLE users DROP COLUMN IF EXISTS balance;
+ALTER TABLE users DROP COLUMN IF EXISTS referral_code;
+ALTER TABLE users DROP COLUMN IF EXISTS username;
+ALTER TABLE users DROP COLUMN IF EXISTS is_admin;
+ALTER TABLE users DROP COLUMN IF EXISTS last_login;
+
+DROP TABLE IF EXISTS games CASCADE;
+DROP TABLE IF EXISTS bets CASCADE;
+DROP TABLE IF EXISTS transactions CASCADE;
+DROP TABLE IF EXISTS game_sessions CASCADE;
+DROP TABLE IF EXISTS withdrawals CASCADE;
+DROP TABLE IF EXISTS deposits CASCADE;
@@ -0,0 +1,33 @@
+"""
+Server-side chat history (conversations.py): chat_conversations and
+chat_messages. Tables and indexes are only created when missing, so this is
+a no-op on databases created from the current models.
+"""
+
+STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS chat_conversations (
+        id VARCHAR(36) NOT NULL PRIMARY KEY,
+        system TEXT NOT NULL,
+        summary TEXT,
+        summary_upto INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS chat_messages (
+        id {serial} NOT NULL PRIMARY KEY,
+        conversation_id VARCHAR(36) NOT NULL REFERENCES chat_conversations (id) ON DELETE CASCADE,
+        role VARCHAR(16) NOT NULL,
+        content TEXT NOT NULL,
+        images TEXT,
+        tokens INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_chat_messages_conversation_id ON chat_messages (conversation_id, id)",
+    "CREATE INDEX IF NOT EXISTS ix_chat_conversations_updated ON chat_conversations (updated_at)",
+]
+
+
+def upgrade(conn, dialect):
+    serial = "SERIAL" if dialect == "postgresql" else "INTEGER"
+    for stmt in STATEMENTS:
+        conn.exec_driver_sql(stmt.format(serial=serial))
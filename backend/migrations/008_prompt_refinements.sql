@@ -0,0 +1,10 @@
+-- Shared /api/refine-prompt results (refine_cache.py, REFINE_CACHE_PERSIST=1).
+-- A no-op on databases created from the current models.
+
+CREATE TABLE IF NOT EXISTS prompt_refinements (
+    key VARCHAR(64) NOT NULL PRIMARY KEY,
+    version VARCHAR(64) NOT NULL,
+    prompt TEXT NOT NULL,
+    refined TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,27 @@
+"""
+Unique index on credit_ledger.reference for PURCHASE rows, so a Stripe
+checkout can be granted only once even when a webhook replay races the
+worker (webhooks._grant_purchase). Other event types keep sharing
+references (a hold's SPEND and REFUND rows, for example).
+
+If duplicate purchase grants already exist the step stops and lists them;
+they need a manual decision (refund or annotate) before the index can be
+built.
+"""
+
+DUPLICATES = """
+    SELECT reference, COUNT(*) FROM credit_ledger
+    WHERE event_type = 'PURCHASE' AND reference IS NOT NULL
+    GROUP BY reference HAVING COUNT(*) > 1
+"""
+
+
+def upgrade(conn, dialect):
+    dupes = conn.exec_driver_sql(DUPLICATES).fetchall()
+    if dupes:
+        listed = ", ".join(f"{ref} x{n}" for ref, n in dupes[:20])
+        raise RuntimeError(f"duplicate purchase grants in credit_ledger: {listed}")
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_credit_ledger_purchase_reference "
+        "ON credit_ledger (reference) WHERE event_type = 'PURCHASE'"
+    )
@@ -0,0 +1,6 @@
+-- Index behind the per-user ledger history and summary queries (user_id,
+-- event_type, newest first). create_all only adds indexes along with a new
+-- table, so databases that already had credit_ledger never got it.
+
+CREATE INDEX IF NOT EXISTS ix_credit_ledger_user_event_created
+    ON credit_ledger (user_id, event_type, created_at DESC);
@@ -0,0 +1,6 @@
+-- Lookup index on credit_ledger.reference (webhook replays and hold refunds
+-- find their rows by reference). create_all only adds indexes along with a
+-- new table, so databases that already had credit_ledger never got it.
+
+CREATE INDEX IF NOT EXISTS ix_credit_ledger_reference
+    ON credit_ledger (reference);
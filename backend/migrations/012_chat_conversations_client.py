@@ -0,0 +1,15 @@
+"""
+chat_conversations.client (keyed hash of the client address) and its index,
+for the per-client conversation cap in conversations.create(). Rows from
+before this step have no client and are left to the retention prune.
+"""
+from sqlalchemy import inspect
+
+
+def upgrade(conn, dialect):
+    cols = {c["name"] for c in inspect(conn).get_columns("chat_conversations")}
+    if "client" not in cols:
+        conn.exec_driver_sql("ALTER TABLE chat_conversations ADD COLUMN client VARCHAR(64)")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_chat_conversations_client ON chat_conversations (client, updated_at)"
+    )
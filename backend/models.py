@@ -1,5 +1,4 @@
 import os
-import sys
 from datetime import datetime
 from typing import Optional
 from enum import Enum as PyEnum
@@ -135,12 +134,52 @@ class CreditLedger(Base):
     amount: Mapped[int] = mapped_column(Integer)  # positive for credit, negative for debit
     balance_after: Mapped[int] = mapped_column(Integer)  # user balance after this transaction
     reference: Mapped[Optional[str]] = mapped_column(String(255))  # external ref (invoice, etc)
+    sku: Mapped[Optional[str]] = mapped_column(String(32))  # store product for purchases
     notes: Mapped[Optional[str]] = mapped_column(String(500))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
 
     user: Mapped["User"] = relationship()
 
 
+Index("ix_credit_ledger_user_event_created", CreditLedger.user_id, CreditLedger.event_type, CreditLedger.created_at.desc())
+Index("ix_credit_ledger_reference", CreditLedger.reference)
+# One purchase grant per checkout session (webhooks._grant_purchase); other event types may share a reference
+Index("ux_credit_ledger_purchase_reference", CreditLedger.reference, unique=True,
+      postgresql_where=CreditLedger.event_type == CreditEventType.PURCHASE,
+      sqlite_where=CreditLedger.event_type == CreditEventType.PURCHASE)
+
+
+class CreditSummary(Base):
+    """Per-user running totals, maintained by the ledger write path (wallet.py)."""
+    __tablename__ = "credit_summaries"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total_purchased: Mapped[int] = mapped_column(Integer, default=0)
+    total_spent: Mapped[int] = mapped_column(Integer, default=0)  # net of refunds
+    purchase_count: Mapped[int] = mapped_column(Integer, default=0)
+    last_purchase_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    last_purchase_sku: Mapped[Optional[str]] = mapped_column(String(32))
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class CreditHold(Base):
+    """Credits reserved for an in-flight generation (held -> settled | released)."""
+    __tablename__ = "credit_holds"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    amount: Mapped[int] = mapped_column(Integer)
+    status: Mapped[str] = mapped_column(String(16), default="held")  # held, settled, released
+    reference: Mapped[Optional[str]] = mapped_column(String(255))
+    notes: Mapped[Optional[str]] = mapped_column(String(500))
+    expires_at: Mapped[datetime] = mapped_column(DateTime)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+    resolved_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+
+Index("ix_credit_holds_status_expires", CreditHold.status, CreditHold.expires_at)
+
+
 # Database setup
 _engine = None
 _SessionLocal = None
@@ -157,7 +196,9 @@ def get_engine():
                 poolclass=StaticPool,
             )
         else:
-            _engine = create_engine(database_url)
+            import db_cooperative
+            db_cooperative.install()  # no-op unless gevent has patched socket
+            _engine = create_engine(database_url, **db_cooperative.engine_options())
     return _engine
 
 def get_session():
@@ -167,42 +208,108 @@ def get_session():
     return _SessionLocal()
 
 def init_db():
-    """Initialize database tables."""
-    engine = get_engine()
-    Base.metadata.create_all(bind=engine)
-
-    # Run migrations for existing databases
-    try:
-        from sqlalchemy import text
-        with engine.connect() as conn:
-            # Check if display_name column exists, add if missing
-            result = conn.execute(text("""
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_name = 'users' AND column_name = 'display_name'
-            """))
-
-            if not result.fetchone():
-                sys.stderr.write("Adding missing display_name column to users table...\n")
-                conn.execute(text("ALTER TABLE users ADD COLUMN display_name VARCHAR(100)"))
-                conn.commit()
-                sys.stderr.write("✅ Added display_name column\n")
-
-            # Check if avatar_url column exists, add if missing
-            result = conn.execute(text("""
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_name = 'users' AND column_name = 'avatar_url'
-            """))
-
-            if not result.fetchone():
-                sys.stderr.write("Adding missing avatar_url column to users table...\n")
-                conn.execute(text("ALTER TABLE users ADD COLUMN avatar_url TEXT"))
-                conn.commit()
-                sys.stderr.write("✅ Added avatar_url column\n")
-    except Exception as e:
-        sys.stderr.write(f"Migration warning: {e}\n")
-        # Continue anyway - this might be a new database
+    """Create tables and apply pending schema migrations (see migrate.py)."""
+    from migrate import upgrade
+    upgrade()
+
+
+class SchemaMigration(Base):
+    """One row per applied migration step (migrations/NNN_name.sql|py)."""
+    __tablename__ = "schema_migrations"
+
+    version: Mapped[str] = mapped_column(String(16), primary_key=True)  # "002"
+    name: Mapped[str] = mapped_column(String(200))
+    applied_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+    duration_ms: Mapped[int] = mapped_column(Integer, default=0)
+    note: Mapped[Optional[str]] = mapped_column(String(200))  # e.g. "skipped: postgresql only"
+
+
+class WebhookEvent(Base):
+    """Inbound webhook events: dedupe by (provider, event_id), processed off the request path."""
+    __tablename__ = "webhook_events"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    provider: Mapped[str] = mapped_column(String(16))  # stripe, resend
+    event_id: Mapped[str] = mapped_column(String(255))
+    event_type: Mapped[Optional[str]] = mapped_column(String(100))
+    payload: Mapped[str] = mapped_column(Text)  # raw JSON body as received
+    status: Mapped[str] = mapped_column(String(16), default="pending")  # pending, processing, done, dead
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[Optional[str]] = mapped_column(Text)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+    locked_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+    processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+
+Index("ux_webhook_events_provider_event", WebhookEvent.provider, WebhookEvent.event_id, unique=True)
+Index("ix_webhook_events_status_next", WebhookEvent.status, WebhookEvent.next_attempt_at)
+
+
+class EmailOutbox(Base):
+    """Outbound email queue; rows are sent by the outbox worker (outbox.py)."""
+    __tablename__ = "email_outbox"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    to_addrs: Mapped[str] = mapped_column(Text)  # JSON list
+    subject: Mapped[str] = mapped_column(String(500))
+    html: Mapped[Optional[str]] = mapped_column(Text)
+    text: Mapped[Optional[str]] = mapped_column(Text)
+    reply_to: Mapped[Optional[str]] = mapped_column(String(255))
+    tags: Mapped[Optional[str]] = mapped_column(Text)  # JSON object
+    status: Mapped[str] = mapped_column(String(16), default="pending")  # pending, sending, sent, dead
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[Optional[str]] = mapped_column(Text)
+    provider_id: Mapped[Optional[str]] = mapped_column(String(255))
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+    locked_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+
+Index("ix_email_outbox_status_next", EmailOutbox.status, EmailOutbox.next_attempt_at)
+
+
+class ChatConversation(Base):
+    """Server-side chat history (conversations.py); the id is the client's handle to it."""
+    __tablename__ = "chat_conversations"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)  # uuid4
+    system: Mapped[str] = mapped_column(Text)
+    summary: Mapped[Optional[str]] = mapped_column(Text)  # rolled-up turns up to summary_upto
+    summary_upto: Mapped[int] = mapped_column(Integer, default=0)  # last chat_messages.id folded into summary
+    client: Mapped[Optional[str]] = mapped_column(String(64))  # conversations.client_key(remote address)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+
+
+class ChatMessage(Base):
+    """One turn of a chat conversation."""
+    __tablename__ = "chat_messages"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    conversation_id: Mapped[str] = mapped_column(ForeignKey("chat_conversations.id", ondelete="CASCADE"))
+    role: Mapped[str] = mapped_column(String(16))  # user, assistant
+    content: Mapped[str] = mapped_column(Text)  # plain text; image parts become "[image]" markers
+    images: Mapped[Optional[str]] = mapped_column(Text)  # JSON list of http(s) image URLs sent with the turn
+    tokens: Mapped[int] = mapped_column(Integer, default=0)  # estimate, for budget trimming
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+
+
+Index("ix_chat_messages_conversation_id", ChatMessage.conversation_id, ChatMessage.id)
+Index("ix_chat_conversations_updated", ChatConversation.updated_at)
+Index("ix_chat_conversations_client", ChatConversation.client, ChatConversation.updated_at)
+
+
+class PromptRefinement(Base):
+    """Stored /api/refine-prompt results, shared across workers (refine_cache.py, REFINE_CACHE_PERSIST=1)."""
+    __tablename__ = "prompt_refinements"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)  # sha256(version + normalized prompt)
+    version: Mapped[str] = mapped_column(String(64))
+    prompt: Mapped[str] = mapped_column(Text)  # normalized rough prompt
+    refined: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
 
 
 class ImageJob(Base):
@@ -0,0 +1,186 @@
+# outbox.py
+"""
+Outbound email queue.
+
+Request handlers call queue_email(), which inserts an email_outbox row and
+returns immediately; a per-process worker sends pending rows in batches through
+mailer.send_batch() (Resend /emails/batch over a pooled HTTPS session, or SMTP
+when only SMTP_HOST is set - e.g. a local debug server in tests).
+
+Failed sends retry with exponential backoff up to OUTBOX_MAX_ATTEMPTS; rows are
+claimed with a conditional UPDATE so several workers can share the table, and a
+row stuck in "sending" (killed worker) is reclaimed after OUTBOX_LOCK_SECONDS.
+"""
+from __future__ import annotations
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
+
+from sqlalchemy import and_, event, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import get_session, EmailOutbox
+import resilience
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "10"))
+OUTBOX_LOCK_SECONDS = int(os.getenv("OUTBOX_LOCK_SECONDS", "300"))
+
+log = logging.getLogger("outbox")
+
+_wake = threading.Event()
+_worker_started = False
+_worker_lock = threading.Lock()
+
+
+def queue_email(
+    to: Sequence[str] | str,
+    subject: str,
+    html: Optional[str] = None,
+    text: Optional[str] = None,
+    reply_to: Optional[str] = None,
+    tags: Optional[dict] = None,
+    s: Optional[Session] = None,
+) -> Optional[int]:
+    """
+    Queue an email for background delivery. Pass `s` to enqueue inside the
+    caller's transaction (sent only if it commits); otherwise commits on its own.
+    Returns the outbox row id (None when enqueued on a caller's session).
+    """
+    row = EmailOutbox(
+        to_addrs=json.dumps([to] if isinstance(to, str) else list(to)),
+        subject=subject,
+        html=html,
+        text=text,
+        reply_to=reply_to,
+        tags=json.dumps(tags) if tags else None,
+    )
+    if s is not None:
+        s.add(row)
+        start_worker()
+        event.listen(s, "after_commit", lambda _s: _wake.set(), once=True)
+        return None
+    with get_session() as own:
+        own.add(row)
+        own.commit()
+        row_id = row.id
+    start_worker()
+    _wake.set()
+    return row_id
+
+
+def _claimable(now: datetime):
+    stale = now - timedelta(seconds=OUTBOX_LOCK_SECONDS)
+    return or_(
+        and_(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now),
+        and_(EmailOutbox.status == "sending", EmailOutbox.locked_at < stale),
+    )
+
+
+def _claim_batch(limit: int) -> list:
+    now = datetime.utcnow()
+    with get_session() as s:
+        ids = list(s.execute(
+            select(EmailOutbox.id).where(_claimable(now)).order_by(EmailOutbox.id).limit(limit)
+        ).scalars())
+        if not ids:
+            return []
+        rows = s.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id.in_(ids), _claimable(now))
+            .values(status="sending", locked_at=now, attempts=EmailOutbox.attempts + 1)
+            .returning(EmailOutbox.id, EmailOutbox.to_addrs, EmailOutbox.subject, EmailOutbox.html,
+                       EmailOutbox.text, EmailOutbox.reply_to, EmailOutbox.tags, EmailOutbox.attempts)
+            .execution_options(synchronize_session=False)
+        ).all()
+        s.commit()
+        return rows
+
+
+def send_pending(limit: int = OUTBOX_BATCH_SIZE) -> int:
+    """Claim and send one batch of due emails. Returns how many were sent."""
+    from mailer import send_batch, MailError
+
+    if not resilience.available("resend"):
+        return 0  # leave rows pending (attempts untouched) until the breaker lets a probe through
+    rows = _claim_batch(limit)
+    if not rows:
+        return 0
+
+    messages = [{
+        "to": json.loads(r.to_addrs),
+        "subject": r.subject,
+        "html": r.html,
+        "text": r.text,
+        "reply_to": r.reply_to,
+        "tags": json.loads(r.tags) if r.tags else None,
+    } for r in rows]
+    try:
+        results = send_batch(messages)
+    except Exception as e:
+        results = [MailError(str(e))] * len(rows)
+
+    now = datetime.utcnow()
+    sent = 0
+    with get_session() as s:
+        for r, res in zip(rows, results):
+            if isinstance(res, Exception):
+                retryable = getattr(res, "retryable", True)
+                dead = not retryable or r.attempts >= OUTBOX_MAX_ATTEMPTS
+                values = {"status": "dead" if dead else "pending", "last_error": str(res)[:2000], "locked_at": None}
+                if not dead:
+                    values["next_attempt_at"] = now + timedelta(seconds=min(10 * 2 ** r.attempts, 3600))
+                log.warning("email %s to %s failed (attempt %s): %s", r.id, r.to_addrs, r.attempts, res)
+            else:
+                values = {"status": "sent", "sent_at": now, "provider_id": res, "last_error": None, "locked_at": None}
+                sent += 1
+            s.execute(update(EmailOutbox).where(EmailOutbox.id == r.id).values(**values))
+        s.commit()
+    return sent
+
+
+def drain(max_batches: int = 100) -> int:
+    """Send everything that is currently due (cron / tests)."""
+    total = 0
+    for _ in range(max_batches):
+        n = send_pending()
+        total += n
+        if n == 0 and not _claimable_count():
+            break
+    return total
+
+
+def _claimable_count() -> int:
+    with get_session() as s:
+        return s.query(EmailOutbox.id).filter(_claimable(datetime.utcnow())).limit(1).count()
+
+
+def _worker_loop():
+    while True:
+        _wake.wait(OUTBOX_POLL_SECONDS)
+        _wake.clear()
+        try:
+            while send_pending():
+                pass
+        except Exception:
+            log.exception("email outbox worker error")
+
+
+def start_worker() -> None:
+    """Start this process's outbox worker thread (idempotent)."""
+    global _worker_started
+    with _worker_lock:
+        if _worker_started:
+            return
+        _worker_started = True
+    threading.Thread(target=_worker_loop, name="email-outbox", daemon=True).start()
+
+
+if __name__ == "__main__":
+    # Manual / cron usage: python outbox.py  -> send everything due once
+    logging.basicConfig(level=logging.INFO)
+    log.info("sent %d emails", drain())
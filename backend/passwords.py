@@ -0,0 +1,119 @@
+# passwords.py
+"""
+Password hashing and verification off the request thread.
+
+A bcrypt check at cost 12 is 200-300 ms of CPU. A legacy Werkzeug PBKDF2 check
+costs about the same. Done on the request thread under a gevent worker, that
+time blocks the hub, so every other greenlet in the worker (health checks,
+gallery reads, streaming responses) freezes for the length of each login.
+
+Here the work runs on a dedicated pool of native threads, PASSWORD_HASH_THREADS
+in size. pyca/bcrypt and hashlib release the GIL while hashing, so the calling
+greenlet or thread just waits for the result. A burst of logins can't use more
+than that many cores per worker; the rest queue.
+
+  gevent (monkey-patched)  gevent.threadpool.ThreadPool: real OS threads; the caller
+                           yields to the hub until the hash is done (railway.toml
+                           runs app:app with -k gevent)
+  threads / sync workers   concurrent.futures.ThreadPoolExecutor
+
+  BCRYPT_LOG_ROUNDS=12     cost for new hashes (the Flask-Bcrypt setting name).
+                           Hashes below it are upgraded on the next login
+                           (needs_rehash).
+  PASSWORD_HASH_THREADS=2  pool size per worker process
+
+Only bcrypt's first 72 bytes of a password count, as with every bcrypt
+version before 5.0, so existing hashes keep verifying.
+"""
+from __future__ import annotations
+import hmac
+import os
+import sys
+import threading
+
+import bcrypt
+from werkzeug.security import check_password_hash as _wz_check
+
+BCRYPT_LOG_ROUNDS = int(os.getenv("BCRYPT_LOG_ROUNDS", "12"))
+PASSWORD_HASH_THREADS = int(os.getenv("PASSWORD_HASH_THREADS", "2"))
+
+_BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _gevent_patched() -> bool:
+    if "gevent" not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched("threading")
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():  # a forked worker needs its own threads
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                if _gevent_patched():
+                    from gevent.threadpool import ThreadPool
+                    _pool = ThreadPool(PASSWORD_HASH_THREADS)
+                else:
+                    from concurrent.futures import ThreadPoolExecutor
+                    _pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_THREADS, thread_name_prefix="pwhash")
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _run(fn, *args):
+    pool = _get_pool()
+    if hasattr(pool, "apply"):  # gevent ThreadPool
+        return pool.apply(fn, args)
+    return pool.submit(fn, *args).result()
+
+
+def _secret(plain: str) -> bytes:
+    return plain.encode("utf-8")[:72]
+
+
+def _hash(plain: str, rounds: int) -> str:
+    return bcrypt.hashpw(_secret(plain), bcrypt.gensalt(rounds)).decode("ascii")
+
+
+def _check(hashed: str, plain: str) -> bool:
+    if hashed.startswith("pbkdf2:") or hashed.startswith("scrypt:"):
+        return _wz_check(hashed, plain)  # legacy Werkzeug hashes
+    if hashed.startswith(_BCRYPT_PREFIXES):
+        h = hashed.encode("ascii")
+        return hmac.compare_digest(bcrypt.hashpw(_secret(plain), h), h)
+    return False  # unknown format: fail closed
+
+
+def hash_password(plain: str, rounds: int | None = None) -> str:
+    """bcrypt hash of `plain` at BCRYPT_LOG_ROUNDS (computed on the hashing pool)."""
+    if not plain:
+        raise ValueError("Password must be non-empty.")
+    return _run(_hash, plain, rounds or BCRYPT_LOG_ROUNDS)
+
+
+def check_password(hashed: str | None, plain: str | None) -> bool:
+    """Whether `plain` matches `hashed` (bcrypt or legacy Werkzeug); False for malformed input."""
+    if not hashed or not plain:
+        return False
+    try:
+        return _run(_check, str(hashed).strip(), plain)
+    except ValueError:  # malformed hash
+        return False
+
+
+def needs_rehash(hashed: str | None) -> bool:
+    """True for legacy Werkzeug hashes and bcrypt hashes below the configured cost."""
+    if not hashed:
+        return False
+    if hashed.startswith(_BCRYPT_PREFIXES):
+        try:
+            return int(hashed.split("$")[2]) < BCRYPT_LOG_ROUNDS
+        except (IndexError, ValueError):
+            return False
+    return hashed.startswith(("pbkdf2:", "scrypt:"))
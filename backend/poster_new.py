@@ -6,9 +6,18 @@ import os
 import time
 import uuid
 from datetime import datetime, timezone
-from typing import Optional, Tuple, List, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, Tuple, List, Dict, Iterator
 
-from flask import Blueprint, request, jsonify, current_app, send_file
+from flask import Blueprint, Response, request, jsonify, current_app, send_file, stream_with_context
+
+from auth import token_user_id
+import image_cache
+import metrics
+import resilience
+import vision_input
+from presets.styles import STYLE_PROMPTS
 
 # ---- Optional deps kept local to avoid global import conflicts ----
 def _lazy_imports():
@@ -27,6 +36,8 @@ def _lazy_imports():
     return requests, create_engine, text, Image
 
 poster_bp = Blueprint("poster", __name__, url_prefix="/api/poster")
+image_cache.register_health_check()  # hit/miss/eviction stats in /api/_health
+vision_input.register_health_check()
 
 # ---------------------------
 # Config helpers
@@ -37,6 +48,9 @@ def env_bool(name: str, default: bool = False) -> bool:
         return default
     return str(v).strip().lower() in ("1", "true", "yes", "on")
 
+# Same variable the OpenAI SDK reads; lets tools/loadtest.py point everything at its local stand-in
+OPENAI_API_BASE = (os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").rstrip("/")
+
 def get_openai_headers() -> Dict[str, str]:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
@@ -55,99 +69,29 @@ def get_openai_headers() -> Dict[str, str]:
 def get_db_engine():
     # If DATABASE_URL is missing or SQLAlchemy not installed, we'll return None (fallback: base64 response only)
     _, create_engine, _, _ = _lazy_imports()
-    db_url = os.getenv("DATABASE_URL")
-    if not db_url or create_engine is None:
+    if not os.getenv("DATABASE_URL") or create_engine is None:
         return None
-    # Railway often provides a full postgres URL. SQLAlchemy accepts it directly.
-    return create_engine(db_url, pool_pre_ping=True, pool_recycle=300)
-
-# Track if table has been initialized in this process
-_TABLE_INITIALIZED = False
-
-def ensure_table(engine):
-    # Create a small table to store generated images (bytea) if it doesn't exist
-    global _TABLE_INITIALIZED
-
-    if engine is None:
-        return
-
-    # Only initialize once per process
-    if _TABLE_INITIALIZED:
-        return
-
-    _, _, text, _ = _lazy_imports()
-
-    with engine.begin() as conn:
-        # Create posters table if not exists (don't drop to preserve data)
-        create_ddl = text("""
-            CREATE TABLE IF NOT EXISTS posters (
-                id UUID PRIMARY KEY,
-                filename TEXT NOT NULL,
-                mime TEXT NOT NULL,
-                width INT,
-                height INT,
-                prompt TEXT,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                data BYTEA NOT NULL
-            );
-        """)
-        conn.execute(create_ddl)
-
-        # Create user_prompt_history table for learning patterns
-        history_ddl = text("""
-            CREATE TABLE IF NOT EXISTS user_prompt_history (
-                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-                user_id TEXT NOT NULL,
-                original_prompt TEXT NOT NULL,
-                enhanced_prompt TEXT,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-            );
-        """)
-        conn.execute(history_ddl)
-
-        # Create index for faster user lookups
-        index_ddl = text("""
-            CREATE INDEX IF NOT EXISTS idx_prompt_history_user
-            ON user_prompt_history(user_id, created_at DESC);
-        """)
-        conn.execute(index_ddl)
-
-        # Create user_style_preferences table for manual presets
-        prefs_ddl = text("""
-            CREATE TABLE IF NOT EXISTS user_style_preferences (
-                user_id TEXT PRIMARY KEY,
-                default_style TEXT,
-                auto_apply BOOLEAN DEFAULT TRUE,
-                custom_instructions TEXT,
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-            );
-        """)
-        conn.execute(prefs_ddl)
-
-    _TABLE_INITIALIZED = True
+    # The app's engine (models.py): one pool per process, so this blueprint doesn't take a
+    # second DB_MAX_CONNECTIONS share (see db_cooperative.py)
+    from models import get_engine
+    return get_engine()
 
 # ---------------------------
 # OpenAI Images client (SDK-free)
 # ---------------------------
 class OpenAIImagesClient:
-    GENERATIONS_URL = "https://api.openai.com/v1/images/generations"
+    GENERATIONS_URL = f"{OPENAI_API_BASE}/images/generations"
     # If you later need edits/variations, add their endpoints similarly
 
     @staticmethod
-    def generate(
+    def build_payload(
         prompt: str,
         size: str = "1024x1024",
         n: int = 1,
-        quality: str = "standard",   # "hd" if your plan supports it
-        background: Optional[str] = None,  # "transparent" or None
-        timeout_seconds: int = 60
-    ) -> List[Dict]:
-        """
-        Calls OpenAI Images (DALL·E) via HTTPS and returns list of items with base64 data.
-        We request base64 to manage storage ourselves (DB/local/file).
-        """
-        requests, _, _, _ = _lazy_imports()
-        headers = get_openai_headers()
+        quality: str = "standard",
+        background: Optional[str] = None,
+    ) -> Dict:
+        """The exact JSON body sent to /images/generations (also the image_cache key)."""
         payload = {
             "model": "dall-e-3",
             "prompt": prompt,
@@ -159,14 +103,37 @@ class OpenAIImagesClient:
         if background == "transparent":
             # API supports background transparency on some models; pass if requested
             payload["background"] = "transparent"
+        return payload
+
+    @staticmethod
+    def generate(
+        prompt: str,
+        size: str = "1024x1024",
+        n: int = 1,
+        quality: str = "standard",   # "hd" if your plan supports it
+        background: Optional[str] = None,  # "transparent" or None
+        timeout_seconds: int = 60,
+        bulkhead_wait: Optional[float] = None,
+    ) -> List[Dict]:
+        """
+        Calls OpenAI Images (DALL·E) via HTTPS and returns list of items with base64 data.
+        We request base64 to manage storage ourselves (DB/local/file).
+        """
+        requests, _, _, _ = _lazy_imports()
+        headers = get_openai_headers()
+        payload = OpenAIImagesClient.build_payload(prompt, size, n, quality, background)
 
         try:
-            resp = requests.post(
-                OpenAIImagesClient.GENERATIONS_URL,
-                headers=headers,
-                data=json.dumps(payload),
-                timeout=timeout_seconds
-            )
+            with resilience.upstream("openai", "images.generations", payload["model"], wait=bulkhead_wait) as call:
+                resp = requests.post(
+                    OpenAIImagesClient.GENERATIONS_URL,
+                    headers=headers,
+                    data=json.dumps(payload),
+                    timeout=timeout_seconds
+                )
+                call.status = resp.status_code
+        except resilience.UpstreamUnavailable:
+            raise
         except Exception as e:
             raise RuntimeError(f"Image API request failed: {e}")
 
@@ -185,10 +152,90 @@ class OpenAIImagesClient:
         return items
 
 
+# ---------------------------
+# Fan-out for n > 1 (DALL-E 3 only accepts n=1)
+# ---------------------------
+# An n-image request becomes n single-image calls running side by side, so 4 images
+# take about as long as 1. Lanes are limited per user (POSTER_FANOUT_PER_USER) and
+# by the shared pool; the OpenAI bulkhead in resilience.py is the global cap, and
+# fan-out calls wait up to POSTER_FANOUT_SLOT_WAIT for one of its slots.
+POSTER_FANOUT_WORKERS = int(os.getenv("POSTER_FANOUT_WORKERS", "8"))
+POSTER_FANOUT_PER_USER = int(os.getenv("POSTER_FANOUT_PER_USER", "4"))
+POSTER_FANOUT_SLOT_WAIT = float(os.getenv("POSTER_FANOUT_SLOT_WAIT", "10"))
+
+_fanout_pool = ThreadPoolExecutor(max_workers=POSTER_FANOUT_WORKERS, thread_name_prefix="poster-fanout")
+
+
+class _UserBudget:
+    """In-flight upstream calls per user; grants up to the remaining lanes without blocking."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._in_flight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, want: int) -> int:
+        with self._lock:
+            used = self._in_flight.get(key, 0)
+            granted = max(0, min(want, self.limit - used))
+            if granted:
+                self._in_flight[key] = used + granted
+            return granted
+
+    def release(self, key: str, count: int) -> None:
+        with self._lock:
+            left = self._in_flight.get(key, 0) - count
+            if left > 0:
+                self._in_flight[key] = left
+            else:
+                self._in_flight.pop(key, None)
+
+
+_user_budget = _UserBudget(POSTER_FANOUT_PER_USER)
+
+
+def _fan_out_generate(n: int, lanes: int, **kwargs) -> Iterator[Tuple[int, Optional[Dict], Optional[Exception]]]:
+    """
+    Run n single-image generations on at most `lanes` concurrent calls and yield
+    (index, item, error) in completion order. Closing the generator early cancels
+    the calls that haven't started.
+    """
+    if n == 1:
+        # nothing to overlap: stay on the request thread
+        try:
+            items = OpenAIImagesClient.generate(n=1, **kwargs)
+        except Exception as e:
+            yield 0, None, e
+        else:
+            yield 0, (items[0] if items else None), None
+        return
+
+    kwargs.setdefault("bulkhead_wait", POSTER_FANOUT_SLOT_WAIT)
+    pending = {}
+    next_index = 0
+    try:
+        while next_index < n or pending:
+            while next_index < n and len(pending) < lanes:
+                fut = _fanout_pool.submit(OpenAIImagesClient.generate, n=1, **kwargs)
+                pending[fut] = next_index
+                next_index += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                index = pending.pop(fut)
+                try:
+                    items = fut.result()
+                    yield index, (items[0] if items else None), None
+                except Exception as e:
+                    yield index, None, e
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
 class OpenAIImagesEditClient:
     """DALL-E 2 image editing with reference image support"""
-    EDITS_URL = "https://api.openai.com/v1/images/edits"
-    VARIATIONS_URL = "https://api.openai.com/v1/images/variations"
+    EDITS_URL = f"{OPENAI_API_BASE}/images/edits"
+    VARIATIONS_URL = f"{OPENAI_API_BASE}/images/variations"
     MODEL = "dall-e-2"
 
     @staticmethod
@@ -221,13 +268,17 @@ class OpenAIImagesEditClient:
         }
 
         try:
-            resp = requests.post(
-                OpenAIImagesEditClient.EDITS_URL,
-                headers=headers,
-                data=data,
-                files=files,
-                timeout=timeout_seconds
-            )
+            with resilience.upstream("openai", "images.edits", OpenAIImagesEditClient.MODEL) as call:
+                resp = requests.post(
+                    OpenAIImagesEditClient.EDITS_URL,
+                    headers=headers,
+                    data=data,
+                    files=files,
+                    timeout=timeout_seconds
+                )
+                call.status = resp.status_code
+        except resilience.UpstreamUnavailable:
+            raise
         except Exception as e:
             raise RuntimeError(f"Image edit request failed: {e}")
 
@@ -247,7 +298,7 @@ class OpenAIImagesEditClient:
 
 class OpenAIImagesVariationClient:
     """DALL-E 2 image variations - creates similar images without prompt control"""
-    VARIATIONS_URL = "https://api.openai.com/v1/images/variations"
+    VARIATIONS_URL = f"{OPENAI_API_BASE}/images/variations"
     MODEL = "dall-e-2"
 
     @staticmethod
@@ -278,13 +329,17 @@ class OpenAIImagesVariationClient:
         }
 
         try:
-            resp = requests.post(
-                OpenAIImagesVariationClient.VARIATIONS_URL,
-                headers=headers,
-                data=data,
-                files=files,
-                timeout=timeout_seconds
-            )
+            with resilience.upstream("openai", "images.variations", OpenAIImagesVariationClient.MODEL) as call:
+                resp = requests.post(
+                    OpenAIImagesVariationClient.VARIATIONS_URL,
+                    headers=headers,
+                    data=data,
+                    files=files,
+                    timeout=timeout_seconds
+                )
+                call.status = resp.status_code
+        except resilience.UpstreamUnavailable:
+            raise
         except Exception as e:
             raise RuntimeError(f"Image variations request failed: {e}")
 
@@ -306,9 +361,8 @@ class OpenAIImagesVariationClient:
 # ---------------------------
 class PosterStorage:
     def __init__(self):
+        # tables come from migrations/005_poster_history_tables.postgresql.sql
         self.engine = get_db_engine()
-        if self.engine:
-            ensure_table(self.engine)
 
     def save(self, b64: str, filename: str, mime: str, prompt: str, size: str) -> str:
         """
@@ -417,6 +471,7 @@ def _sanitize_prompt(p: str) -> str:
         p = p[:2000]
     return p
 
+@metrics.timed_image("reference_preprocess")
 def _preprocess_reference_to_square_png_alpha(file_storage, size: str) -> bytes:
     """
     - Loads uploaded image via Pillow
@@ -483,6 +538,7 @@ def _alpha_coverage(png_bytes: bytes) -> float:
     total_pixels = alpha.size[0] * alpha.size[1]
     return nonzero / float(total_pixels)
 
+@metrics.timed_image("transparent_border")
 def _add_transparent_border(png_bytes: bytes, pad_px: int) -> bytes:
     """
     Add transparent padding around image for DALL-E edits to fill.
@@ -693,22 +749,30 @@ def generate_poster():
       "prompt": "cinematic cyberpunk poster of ...",
       "size": "1024x1024",      # optional: 256x256|512x512|1024x1024|1024x1792|1792x1024
       "quality": "standard",    # or "hd" (if your plan supports it)
-      "n": 1,                   # 1..4 (we cap it to 4)
+      "n": 1,                   # 1..4 (we cap it to 4); n > 1 runs as parallel single-image calls
       "transparent": false,     # if true, ask for transparent background
-      "user_id": "user123"      # optional: for learning patterns
+      "user_id": "user123",     # optional: for learning patterns
+      "style": "scifi",         # optional: a presets/styles.py STYLE_PROMPTS key, appended to the prompt
+      "public": false,          # optional: public/demo content, may be served from image_cache
+      "stream": false           # optional: NDJSON, one line per image as it completes + a summary line
     }
 
     Response JSON:
     {
       "ok": true,
       "items": [
-         {"poster_id": "...", "url": "/api/poster/file/<id>", "filename": "poster-....png"}
+         {"index": 0, "poster_id": "...", "url": "/api/poster/file/<id>", "filename": "poster-....png"}
       ],
+      "requested": 4,
+      "generated": 3,            # new images that succeeded (the only ones that count as usage)
+      "cached": 0,               # images served from image_cache (public requests only)
+      "failed": [{"index": 2, "error": "..."}],
       "enhanced_prompt": "...",  # shows what was sent to DALL-E
       "learned_styles": {...}    # shows detected patterns
     }
 
-    On failure: {"ok": false, "error": "..."}
+    On failure: {"ok": false, "error": "..."} (503 + Retry-After when OpenAI is unavailable,
+    429 when this user already has POSTER_FANOUT_PER_USER calls in flight)
     """
     try:
         data = request.get_json(force=True, silent=False) or {}
@@ -728,6 +792,10 @@ def generate_poster():
     # Smart enhancement with learning and presets
     enhanced_prompt = _smart_enhance_prompt(original_prompt, user_id, engine)
 
+    style = data.get("style")
+    if STYLE_PROMPTS.get(style):
+        enhanced_prompt = f"{enhanced_prompt}, {STYLE_PROMPTS[style]}"
+
     # Get learned patterns for response
     learned_styles = _learn_from_history(user_id, engine) if user_id and engine else {}
 
@@ -746,49 +814,108 @@ def generate_poster():
     transparent = bool(data.get("transparent", False))
     background = "transparent" if transparent else None
 
-    try:
-        items = OpenAIImagesClient.generate(
-            prompt=enhanced_prompt,
-            size=size,
-            n=n,
-            quality=quality,
-            background=background,
-            timeout_seconds=int(os.getenv("POSTER_TIMEOUT_SECONDS", "60")),
-        )
-    except Exception as e:
-        current_app.logger.exception("Poster generation failed")
-        return jsonify({"ok": False, "error": str(e)}), 502
-
+    # Public/demo content: identical payloads reuse posters already generated for them
+    cache_key, cached = None, []
+    if image_cache.enabled(data.get("public"), request.endpoint, user_id):
+        cache_key = image_cache.payload_key(
+            {**OpenAIImagesClient.build_payload(enhanced_prompt, size, 1, quality, background), "style": style})
+        # without a DB, posters live in the dev memory cache for _MemoryCache._TTL_SECONDS only
+        cached = image_cache.get(cache_key, n, ttl=None if engine else _MemoryCache._TTL_SECONDS)
+    for i, ref in enumerate(cached):
+        ref["index"] = i
+    remaining = n - len(cached)
+
+    # charged to the token's user, else the client address (ProxyFix in app.py); never to body
+    # fields or a raw X-Forwarded-For, which the client can set to anything
+    authed = token_user_id()
+    budget_key = f"user:{authed}" if authed else f"ip:{request.remote_addr}"
+    lanes = _user_budget.acquire(budget_key, remaining) if remaining else 0
+    if remaining and not lanes:
+        resp = jsonify({"ok": False, "error": "Too many generations in progress, try again shortly"})
+        resp.status_code = 429
+        resp.headers["Retry-After"] = "5"
+        return resp
+
+    results = _fan_out_generate(
+        remaining, lanes,
+        prompt=enhanced_prompt,
+        size=size,
+        quality=quality,
+        background=background,
+        timeout_seconds=int(os.getenv("POSTER_TIMEOUT_SECONDS", "60")),
+    ) if remaining else iter(())
     storage = PosterStorage()
-    out_items = []
-    for i, item in enumerate(items):
-        b64 = item.get("b64_json")
-        if not b64:
-            continue
-        filename = f"poster-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.png"
-        poster_id = storage.save(b64, filename, "image/png", enhanced_prompt, size)
-        out_items.append({
-            "poster_id": poster_id,
-            "url": f"/api/poster/file/{poster_id}",
-            "filename": filename
-        })
-
-    if not out_items:
-        return jsonify({"ok": False, "error": "No images returned"}), 502
-
-    # Save to history for future learning
-    if user_id and engine:
+    out_items, failed, errors = [], [], []
+    released = []
+
+    def release_budget():
+        if not released:
+            released.append(True)
+            if remaining:
+                results.close()
+                _user_budget.release(budget_key, lanes)
+
+    def collect():
+        """Cached posters first, then save each new image as it arrives; record failures."""
+        for ref in cached:
+            yield {"ok": True, "cached": True, **ref}
         try:
-            _save_prompt_to_history(user_id, original_prompt, enhanced_prompt, engine)
-        except Exception:
-            current_app.logger.warning("Failed to save prompt history", exc_info=True)
+            for index, item, error in results:
+                index += len(cached)
+                b64 = item.get("b64_json") if item else None
+                if error is None and not b64:
+                    error = RuntimeError("No image returned from OpenAI.")
+                if error is not None:
+                    if not isinstance(error, resilience.UpstreamUnavailable):
+                        current_app.logger.error("Poster generation %s/%s failed: %s", index + 1, n, error)
+                    errors.append(error)
+                    failed.append({"index": index, "error": str(error)})
+                    yield {"index": index, "ok": False, "error": str(error)}
+                    continue
+                filename = f"poster-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.png"
+                poster_id = storage.save(b64, filename, "image/png", enhanced_prompt, size)
+                out = {"index": index, "poster_id": poster_id, "url": f"/api/poster/file/{poster_id}",
+                       "filename": filename}
+                out_items.append(out)
+                if cache_key:
+                    image_cache.put(cache_key, {k: out[k] for k in ("poster_id", "url", "filename")})
+                yield {"ok": True, **out}
+        finally:
+            release_budget()
+        # Save to history for future learning
+        if out_items and user_id and engine:
+            try:
+                _save_prompt_to_history(user_id, original_prompt, enhanced_prompt, engine)
+            except Exception:
+                current_app.logger.warning("Failed to save prompt history", exc_info=True)
 
-    return jsonify({
-        "ok": True,
-        "items": out_items,
-        "enhanced_prompt": enhanced_prompt,
-        "learned_styles": learned_styles
-    }), 200
+    def summary():
+        # only successful images count toward usage; "failed" lists the rest
+        return {"requested": n, "generated": len(out_items), "cached": len(cached), "failed": failed,
+                "enhanced_prompt": enhanced_prompt, "learned_styles": learned_styles}
+
+    if data.get("stream"):
+        # NDJSON: one line per image as it completes, then a summary line
+        def lines():
+            for result in collect():
+                yield json.dumps(result) + "\n"
+            yield json.dumps({"done": True, "ok": bool(out_items or cached), **summary()}) + "\n"
+        resp = Response(stream_with_context(lines()), mimetype="application/x-ndjson",
+                        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-store"})
+        resp.call_on_close(release_budget)  # client gone before the first line
+        return resp
+
+    for _ in collect():
+        pass
+    if not out_items and not cached:
+        unavailable = [e for e in errors if isinstance(e, resilience.UpstreamUnavailable)]
+        if unavailable and len(unavailable) == len(errors):
+            return resilience.unavailable_response(unavailable[0])
+        return jsonify({"ok": False, "error": str(errors[0]) if errors else "No images returned",
+                        **summary()}), 502
+
+    items = sorted([*({**ref, "cached": True} for ref in cached), *out_items], key=lambda it: it["index"])
+    return jsonify({"ok": True, "items": items, **summary()}), 200
 
 
 @poster_bp.route("/preferences", methods=["GET", "POST"])
@@ -928,12 +1055,12 @@ def edit_poster():
         # Check alpha coverage - DALL-E 2 edit only fills transparent areas
         try:
             coverage = _alpha_coverage(processed_png)
-            current_app.logger.info(f"Alpha coverage: {coverage:.2%}")
+            current_app.logger.info("Alpha coverage: %.2f%%", coverage * 100)
 
             if coverage > 0.999:  # Fully opaque
                 if border_pad > 0:
                     # Add transparent border so DALL-E can edit edges
-                    current_app.logger.info(f"Adding {border_pad}px transparent border")
+                    current_app.logger.info("Adding %dpx transparent border", border_pad)
                     processed_png = _add_transparent_border(processed_png, border_pad)
                 else:
                     # Image is fully opaque - DALL-E edit won't work
@@ -960,6 +1087,8 @@ def edit_poster():
                 n=n,
                 timeout_seconds=int(os.getenv("POSTER_TIMEOUT_SECONDS", "60")),
             )
+        except resilience.UpstreamUnavailable as e:
+            return resilience.unavailable_response(e)
         except Exception as e:
             error_msg = str(e)
             current_app.logger.exception(f"Edit generation failed: {error_msg}")
@@ -1064,6 +1193,8 @@ def variations_poster():
                 n=n,
                 timeout_seconds=int(os.getenv("POSTER_TIMEOUT_SECONDS", "60")),
             )
+        except resilience.UpstreamUnavailable as e:
+            return resilience.unavailable_response(e)
         except Exception as e:
             error_msg = str(e)
             current_app.logger.exception(f"Variations generation failed: {error_msg}")
@@ -1155,7 +1286,8 @@ def remix_poster():
             image_bytes = image_file.read()
             image_file.seek(0)  # Reset for potential reuse
 
-            image_b64 = base64.b64encode(image_bytes).decode("utf-8")
+            # downscaled to the vision model's effective resolution (cached by content hash)
+            image_url = vision_input.data_url(image_bytes, mime=image_file.mimetype or "image/png")
 
             requests, _, _, _ = _lazy_imports()
             headers = get_openai_headers()
@@ -1174,7 +1306,7 @@ def remix_poster():
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/png;base64,{image_b64}"
+                                    "url": image_url
                                 }
                             }
                         ]
@@ -1184,12 +1316,14 @@ def remix_poster():
             }
 
             current_app.logger.info("Calling vision API...")
-            vision_resp = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=vision_payload,
-                timeout=30
-            )
+            with resilience.upstream("openai", "chat.completions.vision", vision_payload["model"]) as call:
+                vision_resp = requests.post(
+                    f"{OPENAI_API_BASE}/chat/completions",
+                    headers=headers,
+                    json=vision_payload,
+                    timeout=30
+                )
+                call.status = vision_resp.status_code
 
             if vision_resp.status_code >= 400:
                 error_text = vision_resp.text[:500] if vision_resp.text else "No response"
@@ -1197,16 +1331,20 @@ def remix_poster():
                 vision_failed = True
             else:
                 vision_data = vision_resp.json()
-                current_app.logger.info(f"Vision response keys: {vision_data.keys()}")
+                current_app.logger.debug("Vision response keys: %s", list(vision_data))
 
                 # Safely extract description
                 if "choices" in vision_data and vision_data["choices"]:
                     description = vision_data["choices"][0]["message"]["content"]
-                    current_app.logger.info(f"Vision description: {description[:100]}...")
+                    current_app.logger.info("Vision description: %.100s...", description)
                 else:
                     current_app.logger.warning(f"No choices in vision response: {vision_data}")
                     vision_failed = True
 
+        except resilience.UpstreamUnavailable as e:
+            # fall back to the prompt alone; the generation call below decides whether to 503
+            current_app.logger.warning("Vision skipped: %s", e)
+            vision_failed = True
         except Exception as e:
             current_app.logger.exception(f"Vision call failed: {str(e)}")
             vision_failed = True
@@ -1226,7 +1364,7 @@ def remix_poster():
         # Smart enhancement with learning and presets
         enhanced_prompt = _smart_enhance_prompt(combined_prompt, user_id, engine)
 
-        current_app.logger.info(f"Remix prompt: {enhanced_prompt[:200]}...")
+        current_app.logger.info("Remix prompt: %.200s...", enhanced_prompt)
 
         # Step 3: Generate with DALL-E 3
         try:
@@ -1237,6 +1375,8 @@ def remix_poster():
                 n=1,  # DALL-E 3 only supports n=1
                 timeout_seconds=int(os.getenv("POSTER_TIMEOUT_SECONDS", "60")),
             )
+        except resilience.UpstreamUnavailable as e:
+            return resilience.unavailable_response(e)
         except Exception as e:
             error_msg = str(e)
             current_app.logger.exception(f"Remix generation failed: {error_msg}")
@@ -0,0 +1,222 @@
+# receipts.py
+"""
+Purchase receipt rendering (printable page + email body).
+
+Templates are compiled once at import (see app_email_templates.CompiledTemplate)
+with their CSS baked in, and rendered receipts are cached by
+(variant, receipt id, receipt created_at, user updated_at): ledger rows never
+change, so the key only moves when the customer's details do.
+"""
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Sequence
+
+from app_email_templates import CompiledTemplate
+from models import CreditLedger, CreditEventType, User
+
+RECEIPT_CACHE_SIZE = int(os.getenv("RECEIPT_CACHE_SIZE", "1024"))
+
+UNKNOWN_PRODUCT = {"name": "Unknown Pack", "desc": "Poster credits", "amount_cents": 0}
+
+PAGE_CSS = """
+  body { font-family: system-ui, -apple-system, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; background: black; color: white; }
+  .header { text-align: center; margin-bottom: 30px; border-bottom: 2px solid #0891b2; padding-bottom: 20px; }
+  .logo { color: #06b6d4; font-size: 24px; font-weight: bold; margin-bottom: 8px; }
+  .company { color: #a5b4fc; font-size: 14px; }
+  .receipt-info { display: flex; justify-content: space-between; margin: 20px 0; }
+  .receipt-info div { color: #a5b4fc; }
+  .receipt-info strong { color: #fff; display: block; }
+  .items { border: 1px solid #374151; border-radius: 8px; margin: 20px 0; }
+  .item-header { background: #1e293b; padding: 12px; border-bottom: 1px solid #374151; font-weight: bold; }
+  .item { padding: 12px; border-bottom: 1px solid #374151; }
+  .item:last-child { border-bottom: none; }
+  .item-name { font-weight: 600; color: #06b6d4; }
+  .item-desc { color: #a5b4fc; font-size: 14px; margin: 4px 0; }
+  .item-price { float: right; font-weight: bold; }
+  .total { text-align: right; margin: 20px 0; font-size: 18px; }
+  .total-label { color: #a5b4fc; }
+  .total-amount { font-weight: bold; color: #06b6d4; }
+  .footer { margin-top: 40px; padding-top: 20px; border-top: 1px solid #374151; text-align: center; color: #6b7280; font-size: 12px; }
+
+  @media print {
+    body { background: white; color: black; }
+    .header { border-bottom-color: #0891b2; }
+    .logo { color: #0891b2; }
+    .company, .receipt-info div, .item-desc { color: #666; }
+    .items { border-color: #ddd; }
+    .item-header { background: #f8f9fa; border-bottom-color: #ddd; }
+    .item { border-bottom-color: #ddd; }
+    .item-name, .total-amount { color: #0891b2; }
+    .footer { border-top-color: #ddd; color: #666; }
+  }
+"""
+
+PAGE = CompiledTemplate("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Receipt #{{id}} - Mini-Visionary</title>
+<style>{{css}}</style>
+</head>
+<body>
+  <div class="header">
+    <div class="logo">Mini-Visionary</div>
+    <div class="company">AI-Powered Poster Generation</div>
+  </div>
+
+  <div class="receipt-info">
+    <div>
+      <strong>Receipt #{{id}}</strong>
+      Date: {{date}}
+    </div>
+    <div>
+      <strong>Customer</strong>
+      {{email}}
+    </div>
+  </div>
+
+  <div class="items">
+    <div class="item-header">Purchase Details</div>
+    <div class="item">
+      <div class="item-name">{{name}}</div>
+      <div class="item-desc">{{desc}}</div>
+      <div class="item-price">${{price}}</div>
+    </div>
+  </div>
+
+  <div class="total">
+    <span class="total-label">Total Paid: </span>
+    <span class="total-amount">${{price}} USD</span>
+  </div>
+
+  <div class="total">
+    <span class="total-label">Credits Added: </span>
+    <span class="total-amount">{{credits}} poster credits</span>
+  </div>
+
+  <div class="footer">
+    <p>Thank you for your purchase!</p>
+    <p>Transaction ID: {{txn}}</p>
+    <p>Questions? Contact us at support@minivisionary.com</p>
+  </div>
+</body>
+</html>""", css=PAGE_CSS)
+
+# Email clients ignore <style> blocks, so the email variant keeps its styles inline
+EMAIL = CompiledTemplate("""
+<div style="font-family: system-ui, -apple-system, sans-serif; max-width: 600px; margin: 0 auto; background: #f8f9fa; padding: 20px;">
+  <div style="text-align: center; margin-bottom: 30px; border-bottom: 2px solid #0891b2; padding-bottom: 20px;">
+    <div style="color: #0891b2; font-size: 24px; font-weight: bold; margin-bottom: 8px;">Mini-Visionary</div>
+    <div style="color: #666; font-size: 14px;">AI-Powered Poster Generation</div>
+  </div>
+
+  <div style="display: flex; justify-content: space-between; margin: 20px 0; flex-wrap: wrap;">
+    <div style="color: #666; margin-bottom: 10px;">
+      <strong style="color: #333; display: block;">Receipt #{{id}}</strong>
+      Date: {{date}}
+    </div>
+    <div style="color: #666; margin-bottom: 10px;">
+      <strong style="color: #333; display: block;">Customer</strong>
+      {{email}}
+    </div>
+  </div>
+
+  <div style="border: 1px solid #ddd; border-radius: 8px; margin: 20px 0; background: white;">
+    <div style="background: #f8f9fa; padding: 12px; border-bottom: 1px solid #ddd; font-weight: bold;">Purchase Details</div>
+    <div style="padding: 12px;">
+      <div style="font-weight: 600; color: #0891b2;">{{name}}</div>
+      <div style="color: #666; font-size: 14px; margin: 4px 0;">{{desc}}</div>
+      <div style="float: right; font-weight: bold;">${{price}}</div>
+      <div style="clear: both;"></div>
+    </div>
+  </div>
+
+  <div style="text-align: right; margin: 20px 0; font-size: 18px;">
+    <span style="color: #666;">Total Paid: </span>
+    <span style="font-weight: bold; color: #0891b2;">${{price}} USD</span>
+  </div>
+
+  <div style="text-align: right; margin: 20px 0; font-size: 18px;">
+    <span style="color: #666;">Credits Added: </span>
+    <span style="font-weight: bold; color: #0891b2;">{{credits}} poster credits</span>
+  </div>
+
+  <div style="margin-top: 40px; padding-top: 20px; border-top: 1px solid #ddd; text-align: center; color: #666; font-size: 12px;">
+    <p>Thank you for your purchase!</p>
+    <p>Transaction ID: {{txn}}</p>
+    <p>Questions? Contact us at support@minivisionary.com</p>
+  </div>
+</div>
+""")
+
+_TEMPLATES = {"page": PAGE, "email": EMAIL}
+
+_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _fields(receipt: CreditLedger, user: Optional[User], product: dict) -> dict:
+    return {
+        "id": receipt.id,
+        "date": receipt.created_at.strftime('%B %d, %Y at %I:%M %p'),
+        "email": user.email if user else "N/A",
+        "name": product["name"],
+        "desc": product["desc"],
+        "price": f"{product['amount_cents'] / 100:.2f}",
+        "credits": receipt.amount,
+        "txn": (receipt.reference or "").replace("stripe:", "") or "N/A",
+    }
+
+
+def render_receipt(receipt: CreditLedger, user: Optional[User], product: Optional[dict], variant: str = "page") -> str:
+    """Render one receipt ("page" or "email"), served from the cache when unchanged."""
+    key = (variant, receipt.id, receipt.created_at, user.updated_at if user else None)
+    with _cache_lock:
+        html = _cache.get(key)
+        if html is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return html
+        _stats["misses"] += 1
+
+    html = _TEMPLATES[variant].render(**_fields(receipt, user, product or UNKNOWN_PRODUCT))
+
+    with _cache_lock:
+        _cache[key] = html
+        while len(_cache) > RECEIPT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return html
+
+
+def render_receipts(
+    rows: Iterable[tuple],
+    product_for: Callable[[CreditLedger], Optional[dict]],
+    variant: str = "email",
+) -> list[str]:
+    """Bulk render [(receipt, user), ...] - e.g. for sending many receipt emails at once."""
+    return [render_receipt(r, u, product_for(r), variant) for r, u in rows]
+
+
+def load_receipts(s, receipt_ids: Sequence[int], user_id: Optional[int] = None) -> list[tuple]:
+    """Fetch [(receipt, user), ...] for purchase receipts in one query, in id order."""
+    q = (s.query(CreditLedger, User)
+           .join(User, User.id == CreditLedger.user_id)
+           .filter(CreditLedger.id.in_(list(receipt_ids)),
+                   CreditLedger.event_type == CreditEventType.PURCHASE))
+    if user_id is not None:
+        q = q.filter(CreditLedger.user_id == user_id)
+    return q.order_by(CreditLedger.id).all()
+
+
+def cache_info() -> dict:
+    with _cache_lock:
+        return {**_stats, "size": len(_cache), "max_size": RECEIPT_CACHE_SIZE}
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+        _stats.update(hits=0, misses=0)
@@ -0,0 +1,202 @@
+# refine_cache.py
+"""
+Memoized prompt refinement for /api/refine-prompt.
+
+Users keep refining the same short rough prompts ("dragon", "cyberpunk
+city"), and each one cost a gpt-4o-mini round trip of a second or more. The
+refinement is keyed on the rough prompt (whitespace-collapsed, case-folded)
+plus a version string for the system prompt and model. Changing the system
+prompt means bumping the version, and old entries are no longer matched.
+
+  memory   per-process LRU (REFINE_CACHE_SIZE keys) with a TTL
+           (REFINE_CACHE_TTL_SECONDS); a hit costs a dict lookup
+  table    optional (REFINE_CACHE_PERSIST=1): prompt_refinements rows survive
+           restarts and are shared by all workers
+  flight   concurrent requests for the same key share one upstream call; the
+           others wait up to REFINE_WAIT_SECONDS for its result
+
+Only successful refinements are stored. If the shared call fails, every
+waiter gets the same exception.
+
+    refined, source = refine_cache.refine(rough, compute, version="1:gpt-4o-mini")
+    # source: "memory", "table", "shared" or "upstream"
+
+Lookups are counted in cache_requests_total{cache="refine"} and summarized
+by cache_info() (also in the "refine_cache" health check).
+"""
+from __future__ import annotations
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable
+
+import metrics
+
+log = logging.getLogger("refine_cache")
+
+REFINE_CACHE_SIZE = int(os.getenv("REFINE_CACHE_SIZE", "2048"))
+REFINE_CACHE_TTL_SECONDS = int(os.getenv("REFINE_CACHE_TTL_SECONDS", str(7 * 86400)))
+REFINE_CACHE_PERSIST = os.getenv("REFINE_CACHE_PERSIST", "0") == "1"
+REFINE_WAIT_SECONDS = float(os.getenv("REFINE_WAIT_SECONDS", "60"))
+
+# key -> (created_at, refined)
+_cache: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "table_hits": 0, "shared": 0, "misses": 0, "evictions": 0, "expired": 0, "errors": 0}
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: str | None = None
+        self.error: BaseException | None = None
+
+
+_inflight: dict[str, _Flight] = {}
+
+
+def normalize(rough: str) -> str:
+    return " ".join(rough.split()).casefold()
+
+
+def key(rough: str, version: str) -> str:
+    return hashlib.sha256(f"{version}\0{normalize(rough)}".encode("utf-8")).hexdigest()
+
+
+def _count(result: str) -> None:
+    # called with _cache_lock held
+    _stats[result] += 1
+    metrics.CACHE_REQUESTS.labels("refine", result).inc()
+
+
+def _memory_get(k: str) -> str | None:
+    hit = _cache.get(k)
+    if hit is None:
+        return None
+    if time.time() - hit[0] > REFINE_CACHE_TTL_SECONDS:
+        del _cache[k]
+        _stats["expired"] += 1
+        return None
+    _cache.move_to_end(k)
+    return hit[1]
+
+
+def _memory_put(k: str, refined: str, created_at: float | None = None) -> None:
+    with _cache_lock:
+        _cache[k] = (created_at or time.time(), refined)
+        _cache.move_to_end(k)
+        while len(_cache) > REFINE_CACHE_SIZE:
+            _cache.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def _table_get(k: str) -> tuple[str, float] | None:
+    from models import PromptRefinement, get_session
+    db = get_session()
+    try:
+        row = db.get(PromptRefinement, k)
+        if row is None or row.created_at < datetime.utcnow() - timedelta(seconds=REFINE_CACHE_TTL_SECONDS):
+            return None
+        return row.refined, row.created_at.timestamp()
+    finally:
+        db.close()
+
+
+def _table_put(k: str, version: str, rough: str, refined: str) -> None:
+    from models import PromptRefinement, get_session
+    db = get_session()
+    try:
+        db.merge(PromptRefinement(key=k, version=version[:64], prompt=normalize(rough), refined=refined,
+                                  created_at=datetime.utcnow()))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _load_or_compute(k: str, rough: str, version: str, compute: Callable[[str], str]) -> tuple[str, str]:
+    if REFINE_CACHE_PERSIST:
+        try:
+            stored = _table_get(k)
+        except Exception as e:  # the table is an optimisation; never fail the request over it
+            log.warning("refine_cache_table_read_failed", extra={"error": str(e)[:200]})
+            stored = None
+        if stored is not None:
+            _memory_put(k, stored[0], stored[1])
+            return stored[0], "table"
+
+    refined = compute(rough)
+    _memory_put(k, refined)
+    if REFINE_CACHE_PERSIST:
+        try:
+            _table_put(k, version, rough, refined)
+        except Exception as e:
+            log.warning("refine_cache_table_write_failed", extra={"error": str(e)[:200]})
+    return refined, "upstream"
+
+
+def refine(rough: str, compute: Callable[[str], str], version: str) -> tuple[str, str]:
+    """The refinement of `rough`, from cache or from compute(rough). Returns (refined, source)."""
+    k = key(rough, version)
+    with _cache_lock:
+        refined = _memory_get(k)
+        if refined is not None:
+            _count("hits")
+            return refined, "memory"
+        flight = _inflight.get(k)
+        leader = flight is None
+        if leader:
+            flight = _inflight[k] = _Flight()
+
+    if not leader:
+        if not flight.done.wait(REFINE_WAIT_SECONDS):
+            raise TimeoutError("refinement still in progress")
+        with _cache_lock:
+            _count("shared")
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, "shared"
+
+    try:
+        flight.result, source = _load_or_compute(k, rough, version, compute)
+        with _cache_lock:
+            _count("table_hits" if source == "table" else "misses")
+        return flight.result, source
+    except BaseException as e:
+        flight.error = e
+        with _cache_lock:
+            _count("errors")
+        raise
+    finally:
+        with _cache_lock:
+            _inflight.pop(k, None)
+        flight.done.set()
+
+
+def cache_info() -> dict:
+    with _cache_lock:
+        lookups = _stats["hits"] + _stats["table_hits"] + _stats["shared"] + _stats["misses"]
+        saved = _stats["hits"] + _stats["table_hits"] + _stats["shared"]
+        return {**_stats, "keys": len(_cache), "max_keys": REFINE_CACHE_SIZE, "in_flight": len(_inflight),
+                "persist": REFINE_CACHE_PERSIST, "hit_ratio": round(saved / lookups, 3) if lookups else None}
+
+
+def clear() -> None:
+    with _cache_lock:
+        _cache.clear()
+        for k in _stats:
+            _stats[k] = 0
+
+
+def _health_check(app) -> dict:
+    return {"ok": True, **cache_info()}
+
+
+def register_health_check() -> None:
+    import app_health
+    app_health.register_check("refine_cache", _health_check)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Re-run stored webhook events (webhook_events table).
+
+  python replay_webhooks.py --list [--status dead]        # show events
+  python replay_webhooks.py --id 42                       # replay one row
+  python replay_webhooks.py --event-id evt_123            # replay by provider event id
+  python replay_webhooks.py --status dead                 # replay every dead event
+  python replay_webhooks.py --pending                     # drain due pending events now
+
+Replays run synchronously in this process through the same handlers the worker
+uses; handlers are idempotent, so replaying a "done" event is safe.
+"""
+import argparse
+import sys
+sys.path.append('.')
+
+from sqlalchemy import select
+
+from models import get_session, WebhookEvent
+from webhooks import process_event, due_event_ids
+
+
+def _rows(args):
+    q = select(WebhookEvent).order_by(WebhookEvent.id)
+    if args.id:
+        q = q.where(WebhookEvent.id == args.id)
+    if args.event_id:
+        q = q.where(WebhookEvent.event_id == args.event_id)
+    if args.status:
+        q = q.where(WebhookEvent.status == args.status)
+    if args.provider:
+        q = q.where(WebhookEvent.provider == args.provider)
+    with get_session() as s:
+        return [(r.id, r.provider, r.event_id, r.event_type, r.status, r.attempts, r.last_error)
+                for r in s.execute(q.limit(args.limit)).scalars()]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay stored webhook events")
+    ap.add_argument("--id", type=int)
+    ap.add_argument("--event-id")
+    ap.add_argument("--status", choices=["pending", "processing", "done", "dead"])
+    ap.add_argument("--provider", default=None)
+    ap.add_argument("--limit", type=int, default=500)
+    ap.add_argument("--list", action="store_true", help="only list matching events")
+    ap.add_argument("--pending", action="store_true", help="process events that are due for (re)try")
+    args = ap.parse_args()
+
+    if args.pending:
+        ids = due_event_ids(args.limit)
+        ok = sum(process_event(i) for i in ids)
+        print(f"processed {ok}/{len(ids)} due events")
+        return
+
+    if not (args.list or args.id or args.event_id or args.status):
+        ap.error("pick events with --id, --event-id or --status (or use --list / --pending)")
+
+    rows = _rows(args)
+    if args.list:
+        for r in rows:
+            print("#%s %s %s %s status=%s attempts=%s %s" % (*r[:6], r[6] or ""))
+        return
+
+    ok = 0
+    for row_id, provider, event_id, *_ in rows:
+        done = process_event(row_id, force=True)
+        ok += done
+        print(f"{'✅' if done else '❌'} #{row_id} {provider} {event_id}")
+    print(f"replayed {ok}/{len(rows)} events")
+    sys.exit(0 if ok == len(rows) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# resilience.py
+"""
+Bulkheads and circuit breakers for third-party calls (OpenAI, Stripe, Resend).
+
+Each upstream has a concurrency cap per process (bulkhead). When the cap is
+reached, a request waits up to BULKHEAD_WAIT_SECONDS for a slot and is then
+turned away, instead of tying up a worker behind a slow API. Each upstream
+also has a circuit breaker:
+
+  closed     calls go through; <SERVICE>_BREAKER_FAILURES consecutive failures open it
+  open       calls fail immediately for <SERVICE>_BREAKER_RESET_SECONDS
+  half_open  one probe call is let through; success closes the breaker, failure reopens it
+
+Failures are timeouts, connection errors, HTTP 5xx and 429. Other 4xx responses
+(bad prompt, content policy, unknown session) show the upstream is up and
+count as successes.
+
+Rejected calls raise UpstreamUnavailable. Route handlers turn it into
+503 + Retry-After with unavailable_response(), and init_app() adds the same as
+an error handler for anything uncaught. Breaker state is reported by the
+"upstream_breakers" health check and counted in upstream_requests_total
+(outcome circuit_open / bulkhead_full).
+
+    with resilience.upstream("openai", "images.generations", model) as call:
+        resp = requests.post(...)
+        call.status = resp.status_code
+
+Settings (per process, so each gunicorn worker has its own breakers):
+  OPENAI_MAX_CONCURRENT=4  STRIPE_MAX_CONCURRENT=8  RESEND_MAX_CONCURRENT=4
+  <SERVICE>_BREAKER_FAILURES=5  <SERVICE>_BREAKER_RESET_SECONDS=30
+  BULKHEAD_WAIT_SECONDS=0.5
+"""
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+log = logging.getLogger("resilience")
+
+BULKHEAD_WAIT_SECONDS = float(os.getenv("BULKHEAD_WAIT_SECONDS", "0.5"))
+
+# service -> default concurrency cap per process
+DEFAULT_MAX_CONCURRENT = {"openai": 4, "stripe": 8, "resend": 4}
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream whose breaker is open or whose bulkhead is full."""
+
+    def __init__(self, service: str, reason: str, retry_after: int):
+        super().__init__(f"{service} temporarily unavailable ({reason})")
+        self.service = service
+        self.reason = reason
+        self.retry_after = max(1, int(retry_after))
+
+
+def _env(service: str, name: str, default):
+    return type(default)(os.getenv(f"{service.upper()}_{name}", str(default)))
+
+
+class Breaker:
+    def __init__(self, service: str, max_concurrent: int, failure_threshold: int, reset_seconds: float):
+        self.service = service
+        self.max_concurrent = max_concurrent
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0            # consecutive
+        self.opened_at = 0.0
+        self.probing = False
+        self.in_flight = 0
+        self.rejected = 0
+        self.last_error: str | None = None
+
+    @classmethod
+    def from_env(cls, service: str) -> "Breaker":
+        return cls(service,
+                   _env(service, "MAX_CONCURRENT", DEFAULT_MAX_CONCURRENT.get(service, 4)),
+                   _env(service, "BREAKER_FAILURES", 5),
+                   _env(service, "BREAKER_RESET_SECONDS", 30.0))
+
+    def retry_after(self) -> int:
+        if self.state == "open":
+            return int(self.reset_seconds - (time.monotonic() - self.opened_at)) + 1
+        return 1
+
+    def _admit(self) -> bool:
+        """Breaker check (under the lock). Returns True if this call is the half-open probe."""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                raise UpstreamUnavailable(self.service, "circuit_open", self.retry_after())
+            self.state = "half_open"
+            log.info("breaker_half_open", extra={"service": self.service})
+        if self.state == "half_open":
+            if self.probing:
+                raise UpstreamUnavailable(self.service, "circuit_open", 1)
+            self.probing = True
+            return True
+        return False
+
+    def acquire(self, wait: float | None = None) -> bool:
+        with self._lock:
+            try:
+                probe = self._admit()
+            except UpstreamUnavailable:
+                self.rejected += 1
+                raise
+        if not self._slots.acquire(timeout=BULKHEAD_WAIT_SECONDS if wait is None else wait):
+            with self._lock:
+                self.rejected += 1
+                if probe:
+                    self.probing = False
+            raise UpstreamUnavailable(self.service, "bulkhead_full", 1)
+        with self._lock:
+            self.in_flight += 1
+        return probe
+
+    def release(self, probe: bool, ok: bool, error: str | None = None) -> None:
+        self._slots.release()
+        with self._lock:
+            self.in_flight -= 1
+            if probe:
+                self.probing = False
+            if ok:
+                if self.state != "closed":
+                    log.info("breaker_closed", extra={"service": self.service})
+                self.state, self.failures = "closed", 0
+                return
+            self.failures += 1
+            self.last_error = error
+            if probe or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state, self.opened_at = "open", time.monotonic()
+                log.warning("breaker_open", extra={"service": self.service, "failures": self.failures,
+                                                   "error": error, "reset_seconds": self.reset_seconds})
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            out = {"state": self.state, "consecutive_failures": self.failures, "in_flight": self.in_flight,
+                   "max_concurrent": self.max_concurrent, "rejected": self.rejected}
+            if self.state == "open":
+                out["retry_after"] = self.retry_after()
+            if self.last_error:
+                out["last_error"] = self.last_error[:200]
+            return out
+
+
+_breakers: dict[str, Breaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(service: str) -> Breaker:
+    b = _breakers.get(service)
+    if b is None:
+        with _breakers_lock:
+            b = _breakers.setdefault(service, Breaker.from_env(service))
+    return b
+
+
+def available(service: str) -> bool:
+    """False while the breaker is open (cheap pre-check for background senders)."""
+    b = breaker(service)
+    return b.state != "open" or time.monotonic() - b.opened_at >= b.reset_seconds
+
+
+def _is_failure_status(status) -> bool:
+    return status is not None and (status >= 500 or status == 429)
+
+
+def _is_failure(exc: BaseException) -> bool:
+    # SDK errors carry the HTTP status (openai: status_code, stripe: http_status)
+    status = getattr(exc, "status_code", None) or getattr(exc, "http_status", None)
+    return not isinstance(status, int) or _is_failure_status(status)
+
+
+@contextmanager
+def upstream(service: str, endpoint: str, model: str = "", wait: float | None = None):
+    """metrics.upstream() behind this service's bulkhead and breaker (`wait` overrides BULKHEAD_WAIT_SECONDS)."""
+    b = breaker(service)
+    try:
+        probe = b.acquire(wait)
+    except UpstreamUnavailable as e:
+        metrics.UPSTREAM_REQUESTS.labels(service, endpoint, model or "", e.reason).inc()
+        raise
+    ok, error = False, None
+    try:
+        with metrics.upstream(service, endpoint, model) as call:
+            yield call
+        ok = not _is_failure_status(call.status)
+        if not ok:
+            error = f"HTTP {call.status}"
+    except Exception as e:
+        ok = not _is_failure(e)
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        b.release(probe, ok, error)
+
+
+def unavailable_response(e: UpstreamUnavailable):
+    from flask import jsonify
+    resp = jsonify({"ok": False, "error": f"{e.service} is temporarily unavailable, please retry shortly",
+                    "service": e.service, "retry_after": e.retry_after})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+
+def health_check(app) -> dict:
+    states = {name: b.snapshot() for name, b in sorted(_breakers.items())}
+    return {"ok": all(s["state"] != "open" for s in states.values()), "breakers": states}
+
+
+def init_app(app) -> None:
+    """503 + Retry-After for uncaught UpstreamUnavailable; breaker state in the health report."""
+    import app_health
+    app.register_error_handler(UpstreamUnavailable, unavailable_response)
+    app_health.register_check("upstream_breakers", health_check)
+    for service in DEFAULT_MAX_CONCURRENT:
+        breaker(service)
@@ -0,0 +1,138 @@
+# response_cache.py
+"""
+Process-local cache of finished, already-compressed responses.
+
+For endpoints that return the same JSON to everyone (legal pages, product
+catalog, model list). The cache key is (endpoint, view args, query args,
+negotiated encoding). An entry holds the brotli/gzip bytes, the headers the
+view set and a strong ETag. A repeat hit is a dict lookup plus building a
+Response object. Flask-Compress skips these responses because they already
+carry a Content-Encoding.
+
+Entries are tagged with a version string (GIT_SHA by default, or whatever the
+decorator is given, e.g. LEGAL_LAST_UPDATED). When the version changes, the
+entry is rebuilt on the next hit.
+
+    @bp.get("/terms")
+    @cached_response(version=lambda: f"{LAST_UPDATED}:{GIT_SHA}")
+    def terms(): ...
+"""
+from __future__ import annotations
+import functools
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Union
+
+from flask import Response, make_response, request
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+GIT_SHA = os.getenv("GIT_SHA", "dev")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+RESPONSE_CACHE_MIN_SIZE = int(os.getenv("RESPONSE_CACHE_MIN_SIZE", "512"))  # same floor as COMPRESS_MIN_SIZE
+
+# hop-by-hop / per-response headers never replayed from the cache
+_SKIP_HEADERS = {"content-length", "content-encoding", "etag", "vary", "set-cookie", "date"}
+
+_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stale": 0}
+
+
+def _encoding() -> Optional[str]:
+    if brotli is not None and request.accept_encodings["br"]:
+        return "br"
+    if request.accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress(body: bytes, encoding: Optional[str]) -> bytes:
+    # compressed once per (key, version), so use the max levels
+    if encoding == "br":
+        return brotli.compress(body, quality=11)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    return body
+
+
+def _build(rv, encoding: Optional[str]) -> Optional[tuple]:
+    """Freeze a view's return value into a cache entry, or None if it isn't cacheable."""
+    resp = make_response(rv)
+    if resp.status_code != 200 or resp.is_streamed or "Set-Cookie" in resp.headers:
+        return None
+    body = resp.get_data()
+    if len(body) < RESPONSE_CACHE_MIN_SIZE:
+        encoding = None
+    etag = hashlib.sha1(body).hexdigest()[:20] + (f"-{encoding}" if encoding else "")
+    headers = [(k, v) for k, v in resp.headers.items() if k.lower() not in _SKIP_HEADERS]
+    return resp.mimetype, headers, _compress(body, encoding), encoding, etag
+
+
+def _respond(entry: tuple) -> Response:
+    mimetype, headers, body, encoding, etag = entry
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype=mimetype)
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+    for k, v in headers:
+        if k.lower() != "content-type":
+            resp.headers[k] = v
+    resp.set_etag(etag)
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+def cached_response(version: Union[str, Callable[[], str], None] = None):
+    """
+    Cache the view's compressed output per (endpoint, args, Accept-Encoding).
+    `version` (a string, or a callable evaluated per request) invalidates
+    entries when it changes; defaults to GIT_SHA.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            ver = version() if callable(version) else (version or GIT_SHA)
+            encoding = _encoding()
+            key = (request.endpoint, tuple(sorted(kwargs.items())),
+                   tuple(sorted(request.args.items(multi=True))), encoding)
+
+            with _cache_lock:
+                hit = _cache.get(key)
+                if hit is not None and hit[0] == ver:
+                    _cache.move_to_end(key)
+                    _stats["hits"] += 1
+                    return _respond(hit[1])
+                _stats["stale" if hit is not None else "misses"] += 1
+
+            rv = view(*args, **kwargs)
+            entry = _build(rv, encoding)
+            if entry is None:
+                return rv
+
+            with _cache_lock:
+                _cache[key] = (ver, entry)
+                while len(_cache) > RESPONSE_CACHE_SIZE:
+                    _cache.popitem(last=False)
+            return _respond(entry)
+        return wrapper
+    return decorator
+
+
+def cache_info() -> dict:
+    with _cache_lock:
+        return {**_stats, "size": len(_cache), "max_size": RESPONSE_CACHE_SIZE}
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+        _stats.update(hits=0, misses=0, stale=0)
@@ -1,11 +1,15 @@
-import os
-from flask import send_from_directory, abort
+from flask import abort
 from app_secure import app as flask_app
+import assets
 
 app = flask_app
 app.static_folder = "static"
 app.static_url_path = "/static"
 
+# Manifest-backed static serving: fingerprinted + precompressed (see build_assets.py)
+asset_index = assets.init_app(app)
+app.view_functions["static"] = lambda filename: assets.send_static(app, filename)
+
 # Auth routes are defined in app.py to avoid duplicates
 
 # SPA catch-all that won't swallow real files
@@ -18,17 +22,14 @@ def spa_frontend(path=""):
 
     # serve explicit static files
     if path.startswith("static/"):
-        subpath = path[len("static/"):]
-        return send_from_directory(app.static_folder, subpath)
+        return assets.send_static(app, path[len("static/"):])
 
     if path in ("favicon.ico", "robots.txt"):
-        return send_from_directory(app.static_folder, path)
+        return assets.send_static(app, path)
 
-    # if it looks like a file, try to serve it from /static
-    if "." in path:
-        candidate = os.path.join(app.static_folder, path)
-        if os.path.exists(candidate):
-            return send_from_directory(app.static_folder, path)
+    # if it looks like a file, try to serve it from /static (in-memory lookup, no stat)
+    if "." in path and asset_index.exists(path):
+        return asset_index.serve(path)
 
     # Specific page routes - serve corresponding HTML files
     page_routes = {
@@ -47,10 +48,10 @@ def spa_frontend(path=""):
     }
 
     if path in page_routes:
-        return send_from_directory(app.static_folder, page_routes[path])
+        return assets.send_static(app, page_routes[path])
 
     # SPA fallback for all other routes
-    return send_from_directory(app.static_folder, "index.html")
+    return assets.send_static(app, "index.html")
 
 @app.get("/healthz", endpoint="healthcheck")
 def healthcheck():
@@ -0,0 +1,181 @@
+# startup.py
+"""
+Worker boot-time helpers.
+
+Profiling (STARTUP_PROFILE=1, or `python startup.py [module]`):
+  - an import hook records wall time per imported module, as self time
+    (excluding nested imports) and cumulative time
+  - phase("name") blocks time init steps (logging, blueprints, clients...)
+  - report() logs the top modules and each first-party module's total, so
+    it's clear which blueprint pulls in which SDK
+
+Lazy SDKs:
+  Heavy SDKs (stripe, openai, sentry_sdk) are imported on first use through
+  small accessors in the blueprints, not at module import. The first request
+  that needs one would pay for the import, so prewarm() imports them on a
+  daemon thread after the worker starts serving (PREWARM_SDKS=0 disables it).
+"""
+from __future__ import annotations
+import importlib
+import importlib.abc
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.getenv("STARTUP_PROFILE", "0") == "1"
+PREWARM_SDKS = os.getenv("PREWARM_SDKS", "1") == "1"
+# let the worker answer its first healthcheck before the import holds the GIL (or the gevent hub)
+PREWARM_DELAY_SECONDS = float(os.getenv("PREWARM_DELAY_SECONDS", "2"))
+DEFERRED_SDKS = ("stripe", "openai")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+
+log = logging.getLogger("startup")
+
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, profiler: "ImportProfiler", loader):
+        self.profiler, self.loader = profiler, loader
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = self.profiler._stack()
+        stack.append(0.0)
+        t0 = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - t0
+            children = stack.pop()
+            if stack:
+                stack[-1] += total
+            self.profiler.modules[module.__name__] = (total - children, total)
+
+    def __getattr__(self, name):  # get_resource_reader, is_package, ...
+        return getattr(self.loader, name)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """Times every module executed while installed (first import only)."""
+
+    def __init__(self):
+        self.modules: dict[str, tuple[float, float]] = {}  # name -> (self_s, cumulative_s)
+        self.phases: list[tuple[str, float]] = []
+        self._local = threading.local()
+        self.started = time.perf_counter()
+
+    def _stack(self) -> list[float]:
+        # per thread: nested-import time still to subtract from the parent's self time
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, "busy", False):
+            return None
+        self._local.busy = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                        spec.loader = _TimedLoader(self, spec.loader)
+                    return spec
+            return None
+        finally:
+            self._local.busy = False
+
+    def install(self) -> "ImportProfiler":
+        sys.meta_path.insert(0, self)
+        return self
+
+    def uninstall(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def first_party(self) -> dict[str, float]:
+        """Cumulative import cost of each backend module."""
+        out = {}
+        for name, (_, cum) in self.modules.items():
+            mod = sys.modules.get(name)
+            f = getattr(mod, "__file__", None) or ""
+            if f.startswith(_BACKEND) and os.sep + "site-packages" + os.sep not in f:
+                out[name] = cum
+        return out
+
+    def report(self, top: int = 25) -> dict:
+        by_top: dict[str, float] = {}
+        for name, (self_s, _) in self.modules.items():
+            root = name.split(".")[0]
+            by_top[root] = by_top.get(root, 0.0) + self_s
+        return {
+            "wall_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "phases_ms": {n: round(s * 1000, 1) for n, s in self.phases},
+            "first_party_ms": {n: round(s * 1000, 1) for n, s in
+                               sorted(self.first_party().items(), key=lambda kv: -kv[1])[:top]},
+            "packages_ms": {n: round(s * 1000, 1) for n, s in
+                            sorted(by_top.items(), key=lambda kv: -kv[1])[:top]},
+        }
+
+
+profiler: ImportProfiler | None = ImportProfiler().install() if ENABLED else None
+
+
+@contextmanager
+def phase(name: str):
+    """Time an init step when profiling; a no-op otherwise."""
+    if profiler is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.phases.append((name, time.perf_counter() - t0))
+
+
+def log_report(top: int = 25) -> None:
+    if profiler is not None:
+        log.info("startup_profile", extra=profiler.report(top))
+
+
+def prewarm(modules=DEFERRED_SDKS) -> None:
+    """Import deferred SDKs in the background so the first request doesn't pay for them."""
+    if not PREWARM_SDKS:
+        return
+
+    def run():
+        time.sleep(PREWARM_DELAY_SECONDS)
+        for name in modules:
+            t0 = time.perf_counter()
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                log.warning("prewarm_failed", extra={"module": name, "error": str(e)})
+                continue
+            log.info("prewarm", extra={"module": name, "ms": round((time.perf_counter() - t0) * 1000, 1)})
+
+    threading.Thread(target=run, name="sdk-prewarm", daemon=True).start()
+
+
+if __name__ == "__main__":
+    # python startup.py [module]   - cold-import a module (default: app) under the profiler
+    import json
+    if profiler is not None:
+        profiler.uninstall()
+    os.environ["STARTUP_PROFILE"] = "1"
+    os.environ.setdefault("PREWARM_SDKS", "0")
+    import startup  # the instance app.py sees, with its profiler installed
+
+    target = sys.argv[1] if len(sys.argv) > 1 else "app"
+    t0 = time.perf_counter()
+    importlib.import_module(target)
+    print(json.dumps({"module": target, "import_ms": round((time.perf_counter() - t0) * 1000, 1),
+                      **startup.profiler.report()}, indent=2))
@@ -0,0 +1,208 @@
+"""
+Regression tests for server-side chat (conversations.py, app_chat.py): token
+trimming and who can reach a conversation.
+
+/api/chat has no login. A conversation belongs to whoever holds its id, a
+server-generated uuid4, so these tests check that the id is the only way in.
+"""
+import threading
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+import app_chat
+import conversations
+from models import ChatConversation, ChatMessage, get_session
+
+_start_pruner = conversations.start_pruner  # the db fixture stubs it out
+
+
+def test_window_keeps_everything_under_budget():
+    assert conversations.window([100, 100, 100], budget=1000) == 0
+
+
+def test_window_trims_to_the_ratio_not_one_turn_at_a_time():
+    # 6 x 1000 over a 4000 budget: drop the oldest until <= 0.6 * 4000 is left
+    assert conversations.window([1000] * 6, budget=4000) == 4
+
+
+def test_window_hysteresis_leaves_room_to_grow():
+    cut = conversations.window([1000] * 6, budget=4000)
+    kept = [1000] * (6 - cut)
+    assert conversations.window(kept + [1000], budget=4000) == 0
+
+
+def test_fit_keeps_the_newest_messages():
+    msgs = [{"role": "user", "content": "x" * 4000} for _ in range(5)] + [{"role": "user", "content": "last"}]
+    kept = conversations.fit(msgs, budget=2500)
+    assert kept[-1]["content"] == "last"
+    assert len(kept) < len(msgs)
+
+
+def test_fit_always_keeps_the_current_message():
+    msgs = [{"role": "user", "content": "x" * 40000}]
+    assert conversations.fit(msgs, budget=10) == msgs
+
+
+def test_build_prompt_keeps_a_stable_prefix(db):
+    with get_session() as s:
+        conv = conversations.create(s, "You are terse.")
+        conv.summary = "They like dragons."
+        s.flush()
+        for i in range(6):
+            s.add(ChatMessage(conversation_id=conv.id, role="user" if i % 2 == 0 else "assistant",
+                              content=f"turn {i}", tokens=1000))
+        s.commit()
+
+        built, trimmed = conversations.build_prompt(s, conv, {"role": "user", "content": "now"})
+    assert trimmed
+    assert built[0] == {"role": "system", "content": "You are terse."}
+    assert built[1]["content"].endswith("They like dragons.")
+    assert [m["content"] for m in built[2:]] == ["turn 4", "turn 5", "now"]
+
+
+def test_build_prompt_skips_turns_already_summarized(db):
+    with get_session() as s:
+        conv = conversations.create(s, "sys")
+        s.flush()
+        first = conversations.append(s, conv, "user", "old")
+        s.flush()
+        conversations.append(s, conv, "user", "new")
+        conv.summary, conv.summary_upto = "old stuff", first.id
+        s.commit()
+        built, trimmed = conversations.build_prompt(s, conv, {"role": "user", "content": "now"})
+    assert not trimmed
+    assert [m["content"] for m in built[2:]] == ["new", "now"]
+
+
+def test_older_images_are_text_markers(db):
+    with get_session() as s:
+        conv = conversations.create(s, "sys")
+        s.flush()
+        msg = conversations.append(s, conv, "user", "look", ["https://example.com/a.png", "data:image/png;base64,AA"])
+        s.commit()
+        assert msg.content == "look\n[image]\n[image]"
+        assert "data:" not in (msg.images or "")
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    replies = iter(f"reply {i}" for i in range(100))
+    monkeypatch.setattr(app_chat, "_HAS_OPENAI", True)
+    monkeypatch.setattr(app_chat, "_complete", lambda model, temperature, messages: next(replies))
+    monkeypatch.setattr(conversations, "schedule_summary", lambda conv_id: None)
+    app = Flask(__name__)
+    app.register_blueprint(app_chat.bp)
+    return app.test_client()
+
+
+def _turn(client, message, conversation_id=None, addr="203.0.113.7"):
+    body = {"message": message}
+    if conversation_id:
+        body["conversation_id"] = conversation_id
+    return client.post("/api/chat", json=body, environ_base={"REMOTE_ADDR": addr})
+
+
+def test_new_conversation_gets_a_random_id(client):
+    a = _turn(client, "hi").get_json()["conversation_id"]
+    b = _turn(client, "hi").get_json()["conversation_id"]
+    assert a != b
+    assert uuid.UUID(a).version == 4
+
+
+def test_conversation_is_reachable_only_by_its_id(client):
+    mine = _turn(client, "my secret").get_json()["conversation_id"]
+    theirs = _turn(client, "their question").get_json()["conversation_id"]
+
+    history = client.get(f"/api/chat/{theirs}").get_json()["messages"]
+    assert [m["content"] for m in history] == ["their question", "reply 1"]
+    assert client.get(f"/api/chat/{uuid.uuid4()}").status_code == 404
+    assert _turn(client, "hello", conversation_id=str(uuid.uuid4())).status_code == 404
+    assert len(client.get(f"/api/chat/{mine}").get_json()["messages"]) == 2
+
+
+def test_deleted_conversation_is_gone(client):
+    conv_id = _turn(client, "hi").get_json()["conversation_id"]
+    assert client.delete(f"/api/chat/{conv_id}").status_code == 200
+    assert client.get(f"/api/chat/{conv_id}").status_code == 404
+    assert _turn(client, "again", conversation_id=conv_id).status_code == 404
+    with get_session() as s:
+        assert s.query(ChatMessage).filter_by(conversation_id=conv_id).count() == 0
+        assert s.get(ChatConversation, conv_id) is None
+
+
+def test_failed_turn_is_not_stored(client, monkeypatch):
+    conv_id = _turn(client, "hi").get_json()["conversation_id"]
+    monkeypatch.setattr(app_chat, "_complete", lambda *a: (_ for _ in ()).throw(RuntimeError("upstream")))
+    assert _turn(client, "lost", conversation_id=conv_id).status_code == 502
+    assert len(client.get(f"/api/chat/{conv_id}").get_json()["messages"]) == 2
+
+
+def test_conversations_are_capped_per_client(client, monkeypatch):
+    monkeypatch.setattr(conversations, "CHAT_MAX_CONVERSATIONS_PER_CLIENT", 2)
+    oldest = _turn(client, "one").get_json()["conversation_id"]
+    kept = _turn(client, "two").get_json()["conversation_id"]
+    other = _turn(client, "elsewhere", addr="198.51.100.9").get_json()["conversation_id"]
+    assert _turn(client, "more", conversation_id=oldest).status_code == 200  # now the most recent
+    newest = _turn(client, "three").get_json()["conversation_id"]
+
+    assert client.get(f"/api/chat/{kept}").status_code == 404
+    for conv_id in (oldest, newest, other):
+        assert client.get(f"/api/chat/{conv_id}").status_code == 200
+    with get_session() as s:
+        assert s.query(ChatMessage).filter_by(conversation_id=kept).count() == 0
+
+
+def test_client_address_is_not_stored(client):
+    conv_id = _turn(client, "hi").get_json()["conversation_id"]
+    with get_session() as s:
+        stored = s.get(ChatConversation, conv_id).client
+    assert stored == conversations.client_key("203.0.113.7")
+    assert "203.0.113.7" not in stored
+
+
+def test_prune_deletes_idle_conversations(client):
+    idle = _turn(client, "old").get_json()["conversation_id"]
+    active = _turn(client, "new").get_json()["conversation_id"]
+    with get_session() as s:
+        s.get(ChatConversation, idle).updated_at = datetime.utcnow() - timedelta(days=31)
+        s.commit()
+    assert conversations.prune(days=30) == 1
+    assert client.get(f"/api/chat/{idle}").status_code == 404
+    assert client.get(f"/api/chat/{active}").status_code == 200
+    with get_session() as s:
+        assert s.query(ChatMessage).filter_by(conversation_id=idle).count() == 0
+
+
+def test_serving_chat_starts_the_pruner(db, monkeypatch):
+    started = []
+    monkeypatch.setattr(conversations, "start_pruner", lambda: started.append(1))
+    Flask(__name__).register_blueprint(app_chat.bp)
+    assert started == [1]
+
+
+def test_pruner_runs_prune_on_its_interval(monkeypatch):
+    runs, slept, parked = [], [], threading.Event()
+
+    def sleep(seconds):
+        slept.append(seconds)
+        if len(slept) > 2:
+            parked.set()
+            threading.Event().wait()  # leave the daemon thread parked here
+
+    def prune():
+        runs.append(1)
+        if len(runs) == 1:
+            raise RuntimeError("db down")  # logged, the loop carries on
+        return 0
+
+    monkeypatch.setattr(conversations, "_pruner_started", False)
+    monkeypatch.setattr(conversations, "prune", prune)
+    monkeypatch.setattr(conversations, "time", SimpleNamespace(sleep=sleep))
+    _start_pruner(interval=60)
+    _start_pruner(interval=60)  # once per process
+    assert parked.wait(5)
+    assert (len(runs), slept) == (2, [60, 60, 60])
@@ -0,0 +1,100 @@
+"""Regression tests for credit holds in wallet.py: reserve, settle, release, expiry sweep, late settle."""
+from sqlalchemy import select
+
+import wallet
+from models import CreditEventType, CreditHold, CreditLedger, User, get_session
+
+
+def _user(credits=100):
+    with get_session() as s:
+        u = User(email="holds@example.com", credits=credits)
+        s.add(u)
+        s.commit()
+        return u.id
+
+
+def _hold(hold_id):
+    with get_session() as s:
+        return s.get(CreditHold, hold_id).status
+
+
+def _events(user_id):
+    with get_session() as s:
+        return [(r.event_type, r.amount) for r in
+                s.scalars(select(CreditLedger).where(CreditLedger.user_id == user_id).order_by(CreditLedger.id))]
+
+
+def test_reserve_debits_up_front(db):
+    uid = _user(credits=10)
+    r = wallet.reserve_credits(uid, 4, ref="job:1", notes="generate")
+    assert (r.amount, r.balance, r.state) == (4, 6, "held")
+    assert wallet.get_credits(uid) == 6
+    assert _hold(r.hold_id) == "held"
+    assert _events(uid) == [(CreditEventType.SPEND, -4)]
+
+
+def test_reserve_needs_the_balance(db):
+    uid = _user(credits=3)
+    assert wallet.reserve_credits(uid, 4) is None
+    assert wallet.get_credits(uid) == 3
+    with get_session() as s:
+        assert s.query(CreditHold).count() == 0
+
+
+def test_commit_settles_once(db):
+    uid = _user(credits=10)
+    r = wallet.reserve_credits(uid, 4)
+    assert r.commit()
+    assert not r.commit() and not r.refund()
+    assert not wallet.release_hold(r.hold_id)
+    assert _hold(r.hold_id) == "settled"
+    assert wallet.get_credits(uid) == 6
+
+
+def test_refund_returns_the_credits_once(db):
+    uid = _user(credits=10)
+    r = wallet.reserve_credits(uid, 4, ref="job:2", notes="generate")
+    assert r.refund()
+    assert not r.refund() and not r.commit()
+    assert not wallet.release_hold(r.hold_id)
+    assert _hold(r.hold_id) == "released"
+    assert wallet.get_credits(uid) == 10
+    assert _events(uid) == [(CreditEventType.SPEND, -4), (CreditEventType.REFUND, 4)]
+
+
+def test_sweep_releases_only_expired_holds(db):
+    uid = _user(credits=10)
+    expired = wallet.reserve_credits(uid, 3, ttl_seconds=-1)
+    live = wallet.reserve_credits(uid, 2)
+    assert wallet.sweep_expired_holds() == 1
+    assert wallet.sweep_expired_holds() == 0
+    assert (_hold(expired.hold_id), _hold(live.hold_id)) == ("released", "held")
+    assert wallet.get_credits(uid) == 8
+
+
+def test_late_settle_charges_again(db):
+    uid = _user(credits=10)
+    r = wallet.reserve_credits(uid, 3, ttl_seconds=-1)
+    wallet.sweep_expired_holds()
+    assert wallet.get_credits(uid) == 10
+    assert r.commit()  # the generation finished after all
+    assert _hold(r.hold_id) == "settled"
+    assert wallet.get_credits(uid) == 7
+    with get_session() as s:
+        last = s.scalars(select(CreditLedger).order_by(CreditLedger.id.desc())).first()
+        assert (last.amount, last.notes) == (-3, f"late settle of hold #{r.hold_id}")
+
+
+def test_late_settle_without_the_balance_fails(db):
+    uid = _user(credits=3)
+    r = wallet.reserve_credits(uid, 3, ttl_seconds=-1)
+    wallet.sweep_expired_holds()
+    assert wallet.spend_credits(uid, 2)
+    assert not r.commit()
+    assert _hold(r.hold_id) == "released"
+    assert wallet.get_credits(uid) == 1
+
+
+def test_unknown_hold(db):
+    assert not wallet.settle_hold(404)
+    assert not wallet.release_hold(404)
@@ -0,0 +1,63 @@
+"""Regression tests for db_cooperative.py pool sizing and the one-engine-per-process rule."""
+import pytest
+
+import db_cooperative
+
+
+@pytest.fixture(autouse=True)
+def env(monkeypatch):
+    for name in ("DB_POOL_SIZE", "DB_WORKER_CONCURRENCY", "DB_WORKERS"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(db_cooperative, "DB_MAX_CONNECTIONS", 90)
+    monkeypatch.setattr(db_cooperative, "DB_POOL_MIN", 5)
+
+
+def test_gevent_worker_pool_is_the_share():
+    # -w 2 -k gevent (railway.toml): 1000 greenlets each, 45 connections each
+    assert db_cooperative.pool_limits(concurrency=1000, workers=2) == (45, 0)
+
+
+def test_sync_worker_keeps_the_floor():
+    # one request at a time, but the outbox/webhook/hold-sweeper threads share the pool
+    assert db_cooperative.pool_limits(concurrency=1, workers=2) == (5, 40)
+
+
+def test_gthread_worker_pool_follows_threads():
+    assert db_cooperative.pool_limits(concurrency=8, workers=4) == (8, 14)
+
+
+def test_floor_never_exceeds_the_share():
+    size, overflow = db_cooperative.pool_limits(concurrency=1, workers=30)
+    assert (size, overflow) == (3, 0)
+
+
+def test_workers_together_stay_within_max_connections():
+    for workers in (1, 2, 3, 7, 30, 90, 200):
+        for concurrency in (1, 4, 1000):
+            size, overflow = db_cooperative.pool_limits(concurrency=concurrency, workers=workers)
+            assert size >= 1
+            assert (size + overflow) * workers <= max(90, workers)
+
+
+def test_explicit_pool_size_wins(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "12")
+    assert db_cooperative.pool_limits(concurrency=1000, workers=2) == (12, 33)
+
+
+def test_without_gunicorn_sqlalchemy_defaults_apply():
+    assert db_cooperative.pool_limits() is None
+    assert "pool_size" not in db_cooperative.engine_options()
+
+
+def test_engine_options_read_the_worker_env(monkeypatch):
+    monkeypatch.setenv("DB_WORKER_CONCURRENCY", "1000")
+    monkeypatch.setenv("DB_WORKERS", "2")
+    opts = db_cooperative.engine_options()
+    assert (opts["pool_size"], opts["max_overflow"]) == (45, 0)
+    assert opts["pool_pre_ping"]
+
+
+def test_poster_blueprint_shares_the_app_engine(fresh_db):
+    import models
+    import poster_new
+    assert poster_new.get_db_engine() is models.get_engine()
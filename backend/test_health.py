@@ -0,0 +1,119 @@
+"""Regression tests for app_health.py and the health endpoints of the production app (serve_spa -> app_secure)."""
+import importlib
+import sys
+import time
+
+import pytest
+from flask import Flask
+
+import app_health
+
+
+@pytest.fixture
+def checks(monkeypatch):
+    """An empty check registry and cache; returns the registry for the test to fill."""
+    registry = {}
+    monkeypatch.setattr(app_health, "_CHECKS", registry)
+    monkeypatch.setattr(app_health, "_cache", {})
+    return registry
+
+
+@pytest.fixture
+def client(checks):
+    app = Flask(__name__)
+    app.register_blueprint(app_health.health_bp)
+    return app.test_client()
+
+
+class Counter:
+    def __init__(self, result=None):
+        self.calls = 0
+        self.result = result or {"ok": True}
+
+    def __call__(self, app):
+        self.calls += 1
+        return dict(self.result)
+
+
+def test_live_runs_no_checks(client, checks):
+    probe = Counter()
+    checks["db"] = (probe, True)
+    resp = client.get("/api/_health/live")
+    assert resp.status_code == 200 and resp.get_json()["ok"] is True
+    assert resp.headers["Cache-Control"] == "no-store, must-revalidate"
+    assert probe.calls == 0
+
+
+def test_ready_runs_only_critical_checks(client, checks):
+    db, queues = Counter(), Counter({"ok": False})
+    checks.update(db=(db, True), queues=(queues, False))
+    body = client.get("/api/_health/ready").get_json()
+    assert set(body["checks"]) == {"db"}
+    assert (db.calls, queues.calls) == (1, 0)
+
+
+def test_failing_critical_check_is_503(client, checks):
+    checks["db"] = (Counter({"ok": False}), True)
+    assert client.get("/api/_health/ready").status_code == 503
+    assert client.get("/api/_health").status_code == 503
+
+
+def test_failing_optional_check_is_degraded_not_down(client, checks):
+    checks.update(db=(Counter(), True), queues=(Counter({"ok": False, "email_pending": 900}), False))
+    resp = client.get("/api/_health")
+    body = resp.get_json()
+    assert resp.status_code == 200
+    assert (body["ok"], body["degraded"]) == (True, True)
+    assert body["checks"]["queues"] == {"ok": False, "email_pending": 900, "critical": False,
+                                        "ms": body["checks"]["queues"]["ms"]}
+
+
+def test_report_is_cached_unless_fresh(client, checks):
+    db = Counter()
+    checks["db"] = (db, True)
+    assert client.get("/api/_health").get_json()["cached"] is False
+    assert client.get("/api/_health").get_json()["cached"] is True
+    assert db.calls == 1
+    assert client.get("/api/_health?fresh=1").get_json()["cached"] is False
+    assert db.calls == 2
+
+
+def test_raising_or_slow_check_fails_alone(client, checks, monkeypatch):
+    monkeypatch.setattr(app_health, "HEALTH_CHECK_TIMEOUT", 0.2)
+    checks.update(
+        db=(Counter(), True),
+        broken=(lambda app: 1 / 0, False),
+        slow=(lambda app: time.sleep(1) or {"ok": True}, False),
+    )
+    t0 = time.monotonic()
+    body = client.get("/api/_health").get_json()
+    assert time.monotonic() - t0 < 0.9
+    assert body["checks"]["broken"]["error"] == "division by zero"
+    assert body["checks"]["slow"]["error"] == "timeout after 0.2s"
+    assert (body["ok"], body["degraded"]) == (True, True)
+
+
+@pytest.fixture
+def production_client(boot_app_secure, monkeypatch):
+    """serve_spa:app as gunicorn loads it, without the checks that call third-party APIs."""
+    boot_app_secure()
+    monkeypatch.setattr(app_health, "_cache", {})
+    monkeypatch.setattr(app_health, "_CHECKS", {n: c for n, c in app_health._CHECKS.items()
+                                                if not n.startswith("upstream:")})
+    if "serve_spa" in sys.modules:
+        spa = importlib.reload(sys.modules["serve_spa"])
+    else:
+        spa = importlib.import_module("serve_spa")
+    return spa.app.test_client()
+
+
+def test_production_app_serves_the_health_endpoints(production_client):
+    assert production_client.get("/api/_health/live").status_code == 200
+
+    ready = production_client.get("/api/_health/ready")
+    assert ready.status_code == 200
+    assert set(ready.get_json()["checks"]) == {"db", "page:/auth.html", "page:/terms.html", "page:/privacy.html"}
+
+    report = production_client.get("/api/_health").get_json()
+    assert {"queues", "upstream_breakers", "refine_cache"} <= set(report["checks"])
+    assert report["checks"]["upstream_breakers"]["ok"]
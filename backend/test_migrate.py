@@ -0,0 +1,97 @@
+"""Regression tests for migrate.py: fresh databases, existing databases and missing tables."""
+import pytest
+from sqlalchemy import inspect, text
+
+import migrate
+from models import User, get_session
+
+
+def _versions(engine):
+    with engine.connect() as conn:
+        return {r[0] for r in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def _indexes(engine, table):
+    return {ix["name"] for ix in inspect(engine).get_indexes(table)}
+
+
+LEDGER_INDEXES = {"ux_credit_ledger_purchase_reference", "ix_credit_ledger_user_event_created",
+                  "ix_credit_ledger_reference"}
+
+
+def test_fresh_database_gets_every_table_and_step(fresh_db):
+    applied = migrate.upgrade()
+
+    assert migrate.missing_tables() == []
+    auto = [s.version for s in migrate.discover() if not s.manual]
+    assert applied == auto
+    assert _versions(fresh_db) >= set(auto)
+    assert LEDGER_INDEXES <= _indexes(fresh_db, "credit_ledger")
+    assert "ix_chat_messages_conversation_id" in _indexes(fresh_db, "chat_messages")
+
+
+def test_second_upgrade_is_a_no_op(fresh_db):
+    migrate.upgrade()
+    assert migrate.upgrade() == []
+    assert migrate.pending_steps() == []
+
+
+def test_existing_database_gets_new_steps_only(fresh_db):
+    # a database from before 007: no chat tables, no ledger indexes beyond the
+    # original ones (create_all never adds indexes to an existing table), 001-006 recorded
+    migrate.upgrade()
+    with fresh_db.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE chat_messages")
+        conn.exec_driver_sql("DROP TABLE chat_conversations")
+        conn.exec_driver_sql("DROP TABLE prompt_refinements")
+        for name in LEDGER_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX {name}")
+        conn.exec_driver_sql("DELETE FROM schema_migrations WHERE version >= '007'")
+
+    new = ["007", "008", "009", "010", "011", "012"]
+    assert [s.version for s in migrate.pending_steps()] == new
+    assert migrate.upgrade() == new
+    assert migrate.missing_tables() == []
+    assert "ix_chat_messages_conversation_id" in _indexes(fresh_db, "chat_messages")
+    assert LEDGER_INDEXES <= _indexes(fresh_db, "credit_ledger")
+    assert "client" in {c["name"] for c in inspect(fresh_db).get_columns("chat_conversations")}
+    assert "ix_chat_conversations_client" in _indexes(fresh_db, "chat_conversations")
+
+
+def test_missing_table_without_pending_steps_is_created(fresh_db):
+    migrate.upgrade()
+    with fresh_db.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE chat_messages")
+    assert migrate.pending_steps() == []
+    assert migrate.missing_tables() == ["chat_messages"]
+
+    migrate._schema_current = False
+    migrate.ensure_schema()
+    assert migrate.missing_tables() == []
+
+
+def test_ensure_schema_is_one_check_when_current(fresh_db, monkeypatch):
+    migrate.upgrade()
+    migrate._schema_current = False
+    monkeypatch.setattr(migrate, "upgrade", lambda *a, **k: pytest.fail("upgrade() on a current schema"))
+    migrate.ensure_schema()
+    assert migrate._schema_current
+
+
+def test_purchase_reference_step_refuses_duplicates(fresh_db):
+    migrate.upgrade()
+    with get_session() as s:
+        s.add(User(id=1, email="a@example.com"))
+        s.commit()
+    with fresh_db.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ux_credit_ledger_purchase_reference")
+        conn.exec_driver_sql("DELETE FROM schema_migrations WHERE version = '009'")
+        for _ in range(2):
+            conn.exec_driver_sql(
+                "INSERT INTO credit_ledger (user_id, amount, balance_after, event_type, reference, created_at) "
+                "VALUES (1, 60, 60, 'PURCHASE', 'stripe:cs_dup', CURRENT_TIMESTAMP)")
+
+    with pytest.raises(RuntimeError, match="stripe:cs_dup"):
+        migrate.upgrade()
+    assert "009" not in _versions(fresh_db)
+
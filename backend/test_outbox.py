@@ -0,0 +1,143 @@
+"""Regression tests for outbox.py: queueing inside a transaction, batch sends, retries and dead rows."""
+import time
+from datetime import datetime, timedelta
+from functools import partial
+
+import pytest
+from sqlalchemy import update
+
+import mailer
+import outbox
+import resilience
+from mailer import MailError
+from models import EmailOutbox, User, get_session
+
+
+class Resend:
+    """Stands in for mailer.send_batch(); `results` are returned in order, then everything is delivered."""
+
+    def __init__(self):
+        self.batches = []
+        self.results = []
+
+    def __call__(self, messages):
+        self.batches.append(messages)
+        if self.results:
+            return self.results.pop(0)
+        return [f"re_{len(self.batches)}_{i}" for i in range(len(messages))]
+
+
+@pytest.fixture
+def resend(db, monkeypatch):
+    stub = Resend()
+    monkeypatch.setattr(mailer, "send_batch", stub)
+    monkeypatch.setitem(resilience._breakers, "resend", resilience.Breaker("resend", 4, 5, 30.0))
+    return stub
+
+
+def _row(row_id):
+    with get_session() as s:
+        return s.get(EmailOutbox, row_id)
+
+
+def _make_due(row_id):
+    with get_session() as s:
+        s.execute(update(EmailOutbox).where(EmailOutbox.id == row_id)
+                  .values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+        s.commit()
+
+
+def test_queued_email_is_sent_in_one_batch(resend):
+    ids = [outbox.queue_email(f"user{i}@example.com", "Welcome", html="<p>hi</p>", tags={"kind": "welcome"})
+           for i in range(3)]
+    assert outbox.send_pending() == 3
+    assert len(resend.batches) == 1
+    assert resend.batches[0][0] == {"to": ["user0@example.com"], "subject": "Welcome", "html": "<p>hi</p>",
+                                    "text": None, "reply_to": None, "tags": {"kind": "welcome"}}
+    row = _row(ids[0])
+    assert (row.status, row.attempts, row.provider_id) == ("sent", 1, "re_1_0")
+    assert outbox.send_pending() == 0
+
+
+def test_email_in_a_transaction_is_queued_only_if_it_commits(resend):
+    with get_session() as s:
+        s.add(User(email="kept@example.com"))
+        assert outbox.queue_email("kept@example.com", "Kept", s=s) is None
+        s.commit()
+    with get_session() as s:
+        outbox.queue_email("lost@example.com", "Lost", s=s)
+        s.rollback()
+    assert outbox.drain() == 1
+    assert [m["to"] for m in resend.batches[0]] == [["kept@example.com"]]
+
+
+def test_failed_send_backs_off_and_retries(resend):
+    row_id = outbox.queue_email("a@example.com", "Receipt")
+    resend.results.append([MailError("502 from provider")])
+    before = datetime.utcnow()
+    assert outbox.send_pending() == 0
+
+    row = _row(row_id)
+    assert (row.status, row.attempts, row.last_error) == ("pending", 1, "502 from provider")
+    assert row.next_attempt_at >= before + timedelta(seconds=20)  # 10 * 2 ** 1
+    assert outbox.send_pending() == 0  # backing off
+    _make_due(row_id)
+    assert outbox.send_pending() == 1
+    assert (_row(row_id).status, _row(row_id).attempts) == ("sent", 2)
+
+
+def test_row_is_dead_after_max_attempts(resend, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    row_id = outbox.queue_email("a@example.com", "Receipt")
+    resend.results += [[MailError("timeout")], [MailError("timeout")]]
+    outbox.send_pending()
+    _make_due(row_id)
+    outbox.send_pending()
+    assert (_row(row_id).status, _row(row_id).attempts) == ("dead", 2)
+    _make_due(row_id)
+    assert outbox.send_pending() == 0 and len(resend.batches) == 2
+
+
+def test_rejected_address_is_dead_at_once_without_failing_the_batch(resend):
+    bad = outbox.queue_email("not-an-address", "Receipt")
+    good = outbox.queue_email("b@example.com", "Receipt")
+    resend.results.append([MailError("invalid `to` field", retryable=False), "re_ok"])
+    assert outbox.send_pending() == 1
+    assert (_row(bad).status, _row(bad).attempts) == ("dead", 1)
+    assert _row(good).status == "sent"
+
+
+def test_send_batch_exception_fails_every_row(resend, monkeypatch):
+    ids = [outbox.queue_email(f"u{i}@example.com", "Receipt") for i in range(2)]
+    monkeypatch.setattr(mailer, "send_batch", lambda messages: 1 / 0)
+    assert outbox.send_pending() == 0
+    assert {_row(i).status for i in ids} == {"pending"}
+    assert "division by zero" in _row(ids[0]).last_error
+
+
+def test_open_breaker_leaves_rows_untouched(resend):
+    row_id = outbox.queue_email("a@example.com", "Receipt")
+    b = resilience.breaker("resend")
+    b.state, b.opened_at = "open", time.monotonic()
+    assert outbox.send_pending() == 0
+    assert resend.batches == []
+    assert (_row(row_id).status, _row(row_id).attempts) == ("pending", 0)
+
+
+def test_stuck_sending_row_is_reclaimed(resend):
+    row_id = outbox.queue_email("a@example.com", "Receipt")
+    with get_session() as s:
+        s.execute(update(EmailOutbox).where(EmailOutbox.id == row_id).values(
+            status="sending", attempts=1,
+            locked_at=datetime.utcnow() - timedelta(seconds=outbox.OUTBOX_LOCK_SECONDS + 1)))
+        s.commit()
+    assert outbox.send_pending() == 1
+    assert (_row(row_id).status, _row(row_id).attempts) == ("sent", 2)
+
+
+def test_drain_sends_every_batch(resend, monkeypatch):
+    monkeypatch.setattr(outbox, "send_pending", partial(outbox.send_pending, 2))
+    for i in range(5):
+        outbox.queue_email(f"u{i}@example.com", "Digest")
+    assert outbox.drain() == 5
+    assert [len(b) for b in resend.batches] == [2, 2, 1]
@@ -0,0 +1,111 @@
+"""Regression tests for refine_cache.py: memo keys, TTL, single flight and the shared table."""
+import threading
+import time
+
+import pytest
+
+import refine_cache
+
+V = "1:gpt-4o-mini"
+
+
+@pytest.fixture(autouse=True)
+def clean():
+    refine_cache.clear()
+    yield
+    refine_cache.clear()
+
+
+class Upstream:
+    def __init__(self, gate=None):
+        self.calls = []
+        self.gate = gate
+
+    def __call__(self, rough):
+        self.calls.append(rough)
+        if self.gate is not None:
+            self.gate.wait(5)
+        return f"refined {rough.strip()}"
+
+
+def test_repeat_prompt_is_served_from_memory():
+    up = Upstream()
+    assert refine_cache.refine("dragon", up, V) == ("refined dragon", "upstream")
+    assert refine_cache.refine("  Dragon ", up, V) == ("refined dragon", "memory")
+    assert len(up.calls) == 1
+
+
+def test_version_is_part_of_the_key():
+    up = Upstream()
+    refine_cache.refine("dragon", up, V)
+    assert refine_cache.refine("dragon", up, "2:gpt-4o-mini")[1] == "upstream"
+    assert len(up.calls) == 2
+
+
+def test_expired_entry_is_recomputed():
+    up = Upstream()
+    k = refine_cache.key("dragon", V)
+    refine_cache._memory_put(k, "stale", created_at=time.time() - refine_cache.REFINE_CACHE_TTL_SECONDS - 1)
+    assert refine_cache.refine("dragon", up, V) == ("refined dragon", "upstream")
+    assert refine_cache.cache_info()["expired"] == 1
+
+
+def test_lru_is_bounded(monkeypatch):
+    monkeypatch.setattr(refine_cache, "REFINE_CACHE_SIZE", 2)
+    up = Upstream()
+    for rough in ("a", "b", "c"):
+        refine_cache.refine(rough, up, V)
+    info = refine_cache.cache_info()
+    assert (info["keys"], info["evictions"]) == (2, 1)
+    assert refine_cache.refine("a", up, V)[1] == "upstream"
+
+
+def test_concurrent_requests_share_one_upstream_call():
+    gate = threading.Event()
+    up = Upstream(gate)
+    results = []
+
+    def ask():
+        results.append(refine_cache.refine("cyberpunk city", up, V))
+
+    threads = [threading.Thread(target=ask) for _ in range(5)]
+    for t in threads:
+        t.start()
+    deadline = time.time() + 5
+    while refine_cache.cache_info()["in_flight"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)  # let the followers reach the wait
+    gate.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(up.calls) == 1
+    assert sorted(source for _, source in results) == ["shared"] * 4 + ["upstream"]
+    assert {refined for refined, _ in results} == {"refined cyberpunk city"}
+
+
+def test_failure_is_not_cached():
+    def broken(rough):
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        refine_cache.refine("dragon", broken, V)
+    assert refine_cache.cache_info()["keys"] == 0
+    assert refine_cache.refine("dragon", Upstream(), V)[1] == "upstream"
+
+
+def test_table_survives_a_restart(db, monkeypatch):
+    monkeypatch.setattr(refine_cache, "REFINE_CACHE_PERSIST", True)
+    up = Upstream()
+    refine_cache.refine("dragon", up, V)
+    refine_cache.clear()  # a new worker: empty memory, same table
+    assert refine_cache.refine("dragon", up, V) == ("refined dragon", "table")
+    assert refine_cache.refine("dragon", up, V)[1] == "memory"
+    assert len(up.calls) == 1
+
+
+def test_unreadable_table_falls_back_to_upstream(monkeypatch):
+    monkeypatch.setattr(refine_cache, "REFINE_CACHE_PERSIST", True)
+    monkeypatch.setattr(refine_cache, "_table_get", lambda k: 1 / 0)
+    monkeypatch.setattr(refine_cache, "_table_put", lambda *a: 1 / 0)
+    assert refine_cache.refine("dragon", Upstream(), V) == ("refined dragon", "upstream")
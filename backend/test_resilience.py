@@ -0,0 +1,154 @@
+"""Regression tests for resilience.py: circuit breaker states, bulkheads and the 503 response."""
+import threading
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+import resilience
+from resilience import UpstreamUnavailable
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=c))
+    return c
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    """A fresh "stripe" breaker: 2 concurrent calls, opens after 3 failures, 30s reset."""
+    b = resilience.Breaker("stripe", max_concurrent=2, failure_threshold=3, reset_seconds=30.0)
+    monkeypatch.setitem(resilience._breakers, "stripe", b)
+    monkeypatch.setattr(resilience, "BULKHEAD_WAIT_SECONDS", 0.01)
+    return b
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.http_status = status
+
+
+def call(status=200, exc=None):
+    with resilience.upstream("stripe", "checkout.sessions.retrieve") as c:
+        if exc is not None:
+            raise exc
+        c.status = status
+
+
+def fail(n, **kwargs):
+    for _ in range(n):
+        try:
+            call(**kwargs)
+        except (HTTPError, TimeoutError):
+            pass
+
+
+def test_consecutive_failures_open_the_breaker(breaker):
+    fail(2, status=503)
+    assert breaker.state == "closed"
+    call()  # a success resets the count
+    fail(3, exc=TimeoutError("read timeout"))
+    assert breaker.state == "open"
+    assert breaker.last_error == "TimeoutError: read timeout"
+    assert not resilience.available("stripe")
+
+    with pytest.raises(UpstreamUnavailable) as e:
+        call()
+    assert (e.value.reason, e.value.retry_after) == ("circuit_open", 31)
+    assert breaker.rejected == 1
+
+
+def test_client_errors_count_as_success(breaker):
+    fail(5, exc=HTTPError(400))
+    fail(5, status=404)
+    assert (breaker.state, breaker.failures) == ("closed", 0)
+    fail(3, status=429)
+    assert breaker.state == "open"
+
+
+def test_half_open_probe_closes_on_success(breaker, clock):
+    fail(3, status=500)
+    clock.now += 30
+    assert resilience.available("stripe")
+    call()
+    assert (breaker.state, breaker.failures) == ("closed", 0)
+
+
+def test_half_open_probe_failure_reopens(breaker, clock):
+    fail(3, status=500)
+    clock.now += 30
+    fail(1, status=502)
+    assert breaker.state == "open"
+    assert breaker.retry_after() == 31
+
+
+def test_only_one_probe_at_a_time(breaker, clock):
+    fail(3, status=500)
+    clock.now += 30
+    probe = breaker.acquire()
+    assert probe and breaker.state == "half_open"
+    with pytest.raises(UpstreamUnavailable, match="circuit_open"):
+        call()
+    breaker.release(probe, ok=True)
+    call()
+
+
+def test_full_bulkhead_turns_calls_away(breaker):
+    inside, leave = threading.Barrier(3), threading.Event()
+
+    def slow():
+        with resilience.upstream("stripe", "balance.retrieve"):
+            inside.wait(5)
+            leave.wait(5)
+
+    threads = [threading.Thread(target=slow) for _ in range(2)]
+    for t in threads:
+        t.start()
+    inside.wait(5)
+    try:
+        with pytest.raises(UpstreamUnavailable) as e:
+            call()
+        assert e.value.reason == "bulkhead_full"
+        assert breaker.snapshot()["in_flight"] == 2
+    finally:
+        leave.set()
+        for t in threads:
+            t.join(5)
+    assert breaker.state == "closed"  # turned-away calls are not upstream failures
+    call()
+
+
+def test_unavailable_becomes_503_with_retry_after(breaker):
+    app = Flask(__name__)
+    app.config["TESTING"] = True
+    resilience.init_app(app)
+
+    @app.get("/buy")
+    def buy():
+        call()
+        return {"ok": True}
+
+    fail(3, status=500)
+    resp = app.test_client().get("/buy")
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "31"
+    assert resp.get_json()["service"] == "stripe"
+
+
+def test_health_check_reports_open_breakers(breaker):
+    assert resilience.health_check(None)["breakers"]["stripe"]["state"] == "closed"
+    fail(3, status=500)
+    report = resilience.health_check(None)
+    assert not report["ok"]
+    assert report["breakers"]["stripe"]["retry_after"] == 31
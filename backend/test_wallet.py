@@ -0,0 +1,141 @@
+"""Regression tests for the credit engine in wallet.py: conditional debits, batched ledger rows, summaries."""
+import threading
+
+from sqlalchemy import event, func, select
+
+import wallet
+from models import CreditLedger, CreditEventType, CreditSummary, User, get_session
+
+
+def _user(credits=100, email="wallet@example.com"):
+    with get_session() as s:
+        u = User(email=email, credits=credits)
+        s.add(u)
+        s.commit()
+        return u.id
+
+
+def _ledger(user_id):
+    with get_session() as s:
+        return [(r.event_type, r.amount, r.balance_after) for r in
+                s.scalars(select(CreditLedger).where(CreditLedger.user_id == user_id).order_by(CreditLedger.id))]
+
+
+def test_debit_is_conditional(db):
+    uid = _user(credits=10)
+    with get_session() as s:
+        assert wallet.debit(s, uid, 11) is None
+        assert wallet.debit(s, uid, 0) is None
+        assert wallet.debit(s, uid, 10) == 0
+        s.commit()
+    assert wallet.get_credits(uid) == 0
+    with get_session() as s:
+        assert wallet.debit(s, 9999, 1) is None
+
+
+def test_loaded_user_sees_the_new_balance(db):
+    uid = _user(credits=10)
+    with get_session() as s:
+        user = s.get(User, uid)
+        assert wallet.debit(s, uid, 3) == 7
+        assert wallet.credit(s, uid, 1) == 8
+        assert user.credits == 8 and not s.dirty
+        s.commit()
+    assert wallet.get_credits(uid) == 8
+
+
+def test_spend_and_refund_write_ledger_rows(db):
+    uid = _user(credits=50)
+    assert wallet.spend_credits(uid, 20, ref="job:1", notes="generate")
+    assert not wallet.spend_credits(uid, 31)
+    assert wallet.refund_credits(uid, 5, ref="job:1")
+    assert wallet.get_credits(uid) == 35
+    assert _ledger(uid) == [(CreditEventType.SPEND, -20, 30), (CreditEventType.REFUND, 5, 35)]
+
+
+def test_ledger_rows_are_one_insert_at_commit(db):
+    uid = _user(credits=100)
+    inserts = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("INSERT INTO CREDIT_LEDGER"):
+            inserts.append(executemany)
+
+    event.listen(db, "before_cursor_execute", count)
+    try:
+        with get_session() as s:
+            for _ in range(5):
+                wallet.spend(s, uid, 1)
+            assert inserts == []  # queued on the session, not written yet
+            s.commit()
+    finally:
+        event.remove(db, "before_cursor_execute", count)
+    assert len(inserts) == 1
+    assert len(_ledger(uid)) == 5
+
+
+def test_rollback_drops_queued_rows(db):
+    uid = _user(credits=100)
+    with get_session() as s:
+        wallet.spend(s, uid, 10)
+        s.rollback()
+        wallet.spend(s, uid, 1)
+        s.commit()
+    assert wallet.get_credits(uid) == 99
+    assert _ledger(uid) == [(CreditEventType.SPEND, -1, 99)]
+
+
+def test_summaries_track_the_ledger(db):
+    uid = _user(credits=0)
+    assert wallet.grant_credits(uid, 60, CreditEventType.PURCHASE, ref="stripe:cs_1", sku="starter")
+    assert wallet.grant_credits(uid, 100, CreditEventType.PURCHASE, ref="stripe:cs_2", sku="standard")
+    assert wallet.grant_credits(uid, 5, CreditEventType.BONUS)
+    assert wallet.spend_credits(uid, 30)
+    assert wallet.refund_credits(uid, 10)
+
+    with get_session() as s:
+        user, summary = wallet.get_summary(s, uid)
+        assert user.credits == 145
+        live = (summary.total_purchased, summary.total_spent, summary.purchase_count, summary.last_purchase_sku)
+    assert live == (160, 20, 2, "standard")
+
+    wallet.rebuild_summaries()
+    with get_session() as s:
+        summary = s.get(CreditSummary, uid)
+        assert (summary.total_purchased, summary.total_spent, summary.purchase_count,
+                summary.last_purchase_sku) == live
+
+
+def test_user_without_activity_has_no_summary(db):
+    uid = _user()
+    with get_session() as s:
+        user, summary = wallet.get_summary(s, uid)
+    assert user.id == uid and summary is None
+
+
+def test_parallel_debits_lose_no_update(threaded_db):
+    start, threads, each = 50, 16, 5  # 80 attempts against 50 credits
+    uid = _user(credits=start)
+    barrier = threading.Barrier(threads)
+    won = []
+
+    def worker():
+        barrier.wait()
+        for _ in range(each):
+            if wallet.spend_credits(uid, 1, notes="parallel"):
+                won.append(1)
+
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join(60)
+
+    assert len(won) == start  # every credit spent exactly once, none overdrawn
+    assert wallet.get_credits(uid) == 0
+    with get_session() as s:
+        rows = s.scalar(select(func.count()).select_from(CreditLedger).where(CreditLedger.user_id == uid))
+        assert rows == start
+        assert s.get(CreditSummary, uid).total_spent == start
+        balances = sorted(s.scalars(select(CreditLedger.balance_after).where(CreditLedger.user_id == uid)))
+    assert balances == list(range(start))  # each debit saw the balance the previous one left
@@ -0,0 +1,191 @@
+"""Regression tests for webhooks.py: stored-event idempotency, retries and one grant per checkout."""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import func, select, update
+
+import outbox
+import webhooks
+from models import CreditLedger, CreditEventType, EmailOutbox, User, WebhookEvent, get_session
+
+_start_worker = webhooks.start_worker  # the db fixture stubs it out
+
+
+@pytest.fixture
+def user(db):
+    with get_session() as s:
+        u = User(email="buyer@example.com", display_name="Buyer", credits=0)
+        s.add(u)
+        s.commit()
+        return u.id
+
+
+@pytest.fixture
+def stripe_stub(monkeypatch):
+    """Checkout sessions with no known price ids: the grant comes from metadata.credits."""
+    session = SimpleNamespace(retrieve=lambda *a, **k: {"line_items": {"data": []}})
+    monkeypatch.setattr(webhooks, "_stripe", lambda: SimpleNamespace(checkout=SimpleNamespace(Session=session)))
+
+
+def _checkout(user_id, session_id="cs_1", credits=60):
+    return {"id": f"evt_{session_id}", "type": "checkout.session.completed",
+            "data": {"object": {"id": session_id, "mode": "payment", "client_reference_id": str(user_id),
+                                "amount_total": 900, "metadata": {"credits": str(credits), "sku": "starter"}}}}
+
+
+def _store(event):
+    return webhooks.store_event("stripe", event["id"], event["type"], json.dumps(event))
+
+
+def _row(row_id):
+    with get_session() as s:
+        return s.get(WebhookEvent, row_id)
+
+
+def _make_due(row_id):
+    with get_session() as s:
+        s.execute(update(WebhookEvent).where(WebhookEvent.id == row_id)
+                  .values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+        s.commit()
+
+
+def _state(user_id):
+    with get_session() as s:
+        credits = s.get(User, user_id).credits
+        grants = s.scalar(select(func.count()).select_from(CreditLedger)
+                          .where(CreditLedger.event_type == CreditEventType.PURCHASE))
+        emails = s.scalar(select(func.count()).select_from(EmailOutbox))
+        return credits, grants, emails
+
+
+def test_duplicate_delivery_is_stored_once(db):
+    event = {"id": "evt_dup", "type": "invoice.paid", "data": {"object": {}}}
+    assert _store(event) is not None
+    assert _store(event) is None
+
+
+def test_checkout_grants_credits_and_queues_the_receipt(user, stripe_stub):
+    row_id = _store(_checkout(user))
+    assert webhooks.process_event(row_id)
+    assert _row(row_id).status == "done"
+    assert _state(user) == (60, 1, 1)
+
+
+def test_replayed_checkout_grants_once(user, stripe_stub):
+    row_id = _store(_checkout(user))
+    assert webhooks.process_event(row_id)
+    assert webhooks.process_event(row_id, force=True)
+    assert _state(user) == (60, 1, 1)
+
+
+def test_failed_email_rolls_back_the_grant_and_the_retry_completes(user, stripe_stub, monkeypatch):
+    real, down = outbox.queue_email, [True]
+
+    def flaky(**kwargs):
+        if down[0]:
+            raise RuntimeError("outbox unavailable")
+        return real(**kwargs)
+
+    monkeypatch.setattr(outbox, "queue_email", flaky)
+    row_id = _store(_checkout(user))
+    assert not webhooks.process_event(row_id)
+
+    row = _row(row_id)
+    assert (row.status, row.attempts) == ("pending", 1)
+    assert "outbox unavailable" in row.last_error
+    assert row.next_attempt_at > datetime.utcnow()
+    assert _state(user) == (0, 0, 0)
+    assert webhooks.due_event_ids() == []  # backing off
+
+    down[0] = False
+    _make_due(row_id)
+    assert webhooks.due_event_ids() == [row_id]
+    assert webhooks.process_event(row_id)
+    assert _row(row_id).status == "done"
+    assert _state(user) == (60, 1, 1)
+
+
+def test_concurrent_second_grant_is_rejected(user):
+    # a replay racing the worker: both passed _already_granted before either committed
+    assert webhooks._grant_purchase(user, 60, "stripe:cs_race", "starter", 900)
+    assert not webhooks._grant_purchase(user, 60, "stripe:cs_race", "starter", 900)
+    assert _state(user) == (60, 1, 1)
+
+
+def test_event_is_dead_after_max_attempts(db, monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_MAX_ATTEMPTS", 2)
+    monkeypatch.setitem(webhooks._HANDLERS, "stripe", lambda event: 1 / 0)
+    row_id = _store({"id": "evt_bad", "type": "invoice.paid", "data": {"object": {}}})
+
+    assert not webhooks.process_event(row_id)
+    assert _row(row_id).status == "pending"
+    _make_due(row_id)
+    assert not webhooks.process_event(row_id)
+    row = _row(row_id)
+    assert (row.status, row.attempts) == ("dead", 2)
+    assert webhooks.due_event_ids() == []
+
+
+def test_stuck_processing_row_is_reclaimed(db):
+    row_id = _store({"id": "evt_stuck", "type": "invoice.paid", "data": {"object": {}}})
+    with get_session() as s:
+        s.execute(update(WebhookEvent).where(WebhookEvent.id == row_id).values(
+            status="processing", locked_at=datetime.utcnow() - timedelta(seconds=webhooks.WEBHOOK_LOCK_SECONDS + 1)))
+        s.commit()
+    assert webhooks.due_event_ids() == [row_id]
+    assert webhooks.process_event(row_id)
+    assert _row(row_id).status == "done"
+
+
+def test_worker_polls_due_rows_while_the_queue_is_busy(db, monkeypatch):
+    # a steady stream of new events must not starve the retry poll
+    polled, processed = [], []
+    monkeypatch.setattr(webhooks, "WEBHOOK_POLL_SECONDS", 0)
+    monkeypatch.setattr(webhooks, "due_event_ids", lambda: polled.append(1) or [99])
+
+    def process(rid):
+        processed.append(rid)
+        if len(processed) >= 6:
+            raise SystemExit  # leave the loop
+
+    monkeypatch.setattr(webhooks, "process_event", process)
+    for i in range(10):
+        webhooks._queue.put(i)
+    try:
+        with pytest.raises(SystemExit):
+            webhooks._worker_loop()
+    finally:
+        while not webhooks._queue.empty():
+            webhooks._queue.get_nowait()
+    assert len(polled) >= 3
+    assert 99 in processed
+
+
+def test_app_boot_applies_events_left_by_a_previous_process(threaded_db, user, stripe_stub, boot_app_secure,
+                                                            monkeypatch):
+    pending = _store(_checkout(user, "cs_pending"))
+    retry = _store(_checkout(user, "cs_retry", credits=100))
+    with get_session() as s:
+        s.execute(update(WebhookEvent).where(WebhookEvent.id == retry).values(attempts=1, last_error="timeout"))
+        s.commit()
+
+    monkeypatch.setattr(webhooks, "start_worker", _start_worker)
+    monkeypatch.setattr(webhooks, "_worker_started", False)
+    boot_app_secure()  # nothing is enqueued: the boot itself must start the worker
+    assert "webhook-worker" in [t.name for t in threading.enumerate()]
+    try:
+        deadline = time.time() + 10
+        while time.time() < deadline and {_row(pending).status, _row(retry).status} != {"done"}:
+            time.sleep(0.05)
+        assert (_row(pending).status, _row(retry).status) == ("done", "done")
+        assert _state(user) == (160, 2, 2)
+    finally:
+        # park the thread before the test database goes away (it is a daemon; nothing to join)
+        parked = threading.Event()
+        monkeypatch.setattr(webhooks, "process_event", lambda rid: parked.set() or threading.Event().wait())
+        webhooks._queue.put(0)
+        assert parked.wait(5)
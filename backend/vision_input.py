@@ -0,0 +1,226 @@
+# vision_input.py
+"""
+Shrink images before they are sent to a vision model.
+
+Phone-camera uploads are 3-12 MB and 12+ megapixels. Vision models look at
+them at a much lower effective resolution anyway, so the full-size base64
+only inflates the request body, the upload time and the image token count.
+Before an image goes to a vision model it is:
+
+  decoded   with Pillow's draft mode: JPEGs are decoded at 1/2, 1/4 or 1/8
+            scale directly by libjpeg, so a 12 MP photo never fully decodes
+  rotated   per its EXIF orientation (phones store portrait shots sideways)
+  resized   to VISION_MAX_SIDE on the long side (768 px by default)
+  encoded   as JPEG (or WebP if the image has transparency, or with
+            VISION_FORMAT=webp) at VISION_QUALITY
+
+Results are cached by content hash (LRU, at most VISION_CACHE_MB), so a
+reference image that is remixed or re-sent again is prepared only once.
+Images that are already small enough, or that Pillow can't read, are sent
+unchanged.
+
+    url = vision_input.data_url(upload_bytes)      # "data:image/jpeg;base64,..."
+    url = vision_input.prepare_url(part_url)       # data: URLs and our own storage URLs
+
+prepare_url() only downloads http(s) images from our own storage (S3_BUCKET /
+CDN_BASE, or VISION_FETCH_HOSTS). Other URLs are passed through for the model
+provider to fetch.
+"""
+from __future__ import annotations
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import urlparse
+
+import metrics
+
+log = logging.getLogger("vision_input")
+
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "768"))
+VISION_FORMAT = os.getenv("VISION_FORMAT", "jpeg").lower()  # jpeg | webp
+VISION_QUALITY = int(os.getenv("VISION_QUALITY", "85"))
+VISION_CACHE_MB = int(os.getenv("VISION_CACHE_MB", "32"))
+VISION_FETCH_TIMEOUT = float(os.getenv("VISION_FETCH_TIMEOUT", "5"))
+VISION_FETCH_MAX_MB = int(os.getenv("VISION_FETCH_MAX_MB", "20"))
+
+
+def _fetch_hosts() -> set[str]:
+    hosts = {h.strip().lower() for h in os.getenv("VISION_FETCH_HOSTS", "").split(",") if h.strip()}
+    if os.getenv("CDN_BASE"):
+        hosts.add((urlparse(os.environ["CDN_BASE"]).hostname or "").lower())
+    if os.getenv("S3_BUCKET"):
+        hosts.add(f"{os.environ['S3_BUCKET']}.s3.amazonaws.com".lower())
+    hosts.discard("")
+    return hosts
+
+
+VISION_FETCH_HOSTS = _fetch_hosts()
+
+# sha256 of the input (or the URL) -> (mime, prepared bytes)
+_cache: "OrderedDict[str, tuple[str, bytes]]" = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "passthrough": 0, "evictions": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def _cache_get(key: str) -> Optional[tuple[str, bytes]]:
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+        else:
+            _stats["misses"] += 1
+    metrics.CACHE_REQUESTS.labels("vision", "hits" if hit is not None else "misses").inc()
+    return hit
+
+
+def _cache_put(key: str, value: tuple[str, bytes]) -> None:
+    global _cache_bytes
+    with _cache_lock:
+        old = _cache.pop(key, None)
+        if old is not None:
+            _cache_bytes -= len(old[1])
+        _cache[key] = value
+        _cache_bytes += len(value[1])
+        while _cache_bytes > VISION_CACHE_MB * 1024 * 1024 and len(_cache) > 1:
+            _, (_, evicted) = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+            _stats["evictions"] += 1
+
+
+@metrics.timed_image("vision_prepare")
+def _shrink(data: bytes, max_side: int) -> Optional[tuple[str, bytes]]:
+    """(mime, bytes) resized for vision, or None to send the original."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    try:
+        img = Image.open(io.BytesIO(data))
+        fmt = img.format
+        if max(img.size) <= max_side and fmt in ("JPEG", "WEBP") and len(data) <= 512 * 1024:
+            return None  # already vision-sized
+        scale = max_side / max(img.size)
+        # JPEG only: libjpeg decodes at the smallest 1/2^k scale that still covers the target size
+        img.draft("RGB", (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+        img = ImageOps.exif_transpose(img)
+        alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+        img = img.convert("RGBA" if alpha else "RGB")
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+    except Exception as e:  # not an image Pillow can read; let the model try
+        log.info("vision_prepare_skipped", extra={"error": str(e)[:200]})
+        return None
+
+    out = io.BytesIO()
+    if alpha or VISION_FORMAT == "webp":
+        img.save(out, format="WEBP", quality=VISION_QUALITY, method=4)
+        mime = "image/webp"
+    else:
+        img.save(out, format="JPEG", quality=VISION_QUALITY, optimize=True)
+        mime = "image/jpeg"
+    if out.tell() >= len(data):
+        return None
+    return mime, out.getvalue()
+
+
+def _prepare(data: bytes, max_side: int) -> Optional[tuple[str, bytes]]:
+    shrunk = _shrink(data, max_side)
+    with _cache_lock:
+        _stats["bytes_in"] += len(data)
+        _stats["bytes_out"] += len(shrunk[1]) if shrunk else len(data)
+        if shrunk is None:
+            _stats["passthrough"] += 1
+    return shrunk
+
+
+def prepare(data: bytes, max_side: int = VISION_MAX_SIDE, mime: str = "image/png") -> tuple[str, bytes]:
+    """(mime, bytes) to send to a vision model for this image; `mime` describes the original."""
+    key = hashlib.sha256(data).hexdigest() + f":{max_side}"
+    hit = _cache_get(key)
+    if hit is not None:
+        return hit
+    shrunk = _prepare(data, max_side)
+    if shrunk is None:
+        return mime, data  # originals aren't cached: they'd only duplicate the caller's copy
+    _cache_put(key, shrunk)
+    return shrunk
+
+
+def data_url(data: bytes, max_side: int = VISION_MAX_SIDE, mime: str = "image/png") -> str:
+    mime, out = prepare(data, max_side, mime)
+    return f"data:{mime};base64,{base64.b64encode(out).decode('ascii')}"
+
+
+def _fetch(url: str) -> Optional[bytes]:
+    import requests
+    limit = VISION_FETCH_MAX_MB * 1024 * 1024
+    with requests.get(url, timeout=VISION_FETCH_TIMEOUT, stream=True) as r:
+        if r.status_code != 200:
+            return None
+        body = r.raw.read(limit + 1, decode_content=True)
+    return body if len(body) <= limit else None
+
+
+def prepare_url(url: str, max_side: int = VISION_MAX_SIDE) -> str:
+    """URL to put in an image_url part: a smaller data: URL where possible, else `url` unchanged."""
+    if url.startswith("data:"):
+        header, sep, payload = url.partition(",")
+        if not sep or ";base64" not in header:
+            return url
+        try:
+            data = base64.b64decode(payload, validate=False)
+        except (binascii.Error, ValueError):
+            return url
+        mime, out = prepare(data, max_side, header[5:].split(";")[0] or "image/png")
+        return url if out is data else f"data:{mime};base64,{base64.b64encode(out).decode('ascii')}"
+
+    host = (urlparse(url).hostname or "").lower()
+    if host not in VISION_FETCH_HOSTS:
+        return url
+    key = "url:" + hashlib.sha256(url.encode("utf-8")).hexdigest() + f":{max_side}"
+    hit = _cache_get(key)
+    if hit is not None:
+        return f"data:{hit[0]};base64,{base64.b64encode(hit[1]).decode('ascii')}"
+    try:
+        data = _fetch(url)
+    except Exception as e:
+        log.info("vision_fetch_failed", extra={"host": host, "error": str(e)[:200]})
+        return url
+    shrunk = _prepare(data, max_side) if data is not None else None
+    if shrunk is None:
+        return url  # already small (or unreadable): let the provider fetch it
+    _cache_put(key, shrunk)
+    return f"data:{shrunk[0]};base64,{base64.b64encode(shrunk[1]).decode('ascii')}"
+
+
+def cache_info() -> dict:
+    with _cache_lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {**_stats, "entries": len(_cache), "bytes": _cache_bytes, "max_bytes": VISION_CACHE_MB * 1024 * 1024,
+                "hit_ratio": round(_stats["hits"] / lookups, 3) if lookups else None}
+
+
+def clear() -> None:
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
+        for k in _stats:
+            _stats[k] = 0
+
+
+def _health_check(app) -> dict:
+    return {"ok": True, **cache_info()}
+
+
+def register_health_check() -> None:
+    import app_health
+    app_health.register_check("vision_input", _health_check)
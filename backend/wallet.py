@@ -1,43 +1,242 @@
 # wallet.py
+"""
+Credit engine.
+
+Every balance change is a single conditional statement:
+
+    UPDATE users SET credits = credits - :n
+    WHERE id = :id AND credits >= :n
+    RETURNING credits
+
+so concurrent requests never read-modify-write the balance and never take a
+SELECT ... FOR UPDATE lock. Ledger rows are buffered on the session and written
+with one batched INSERT right before the transaction commits; the same hook
+folds them into credit_summaries (per-user totals) with one upsert per user,
+so wallet/profile reads never aggregate over the ledger.
+
+Long-running generations reserve credits as a hold (credit_holds row):
+
+    hold = reserve_credits(user_id, 10, notes="generate")
+    if hold is None: ...            # insufficient balance
+    try:
+        call_upstream()
+    except Exception:
+        hold.refund()               # release -> REFUND ledger row
+        raise
+    hold.commit()                   # settle
+
+Holds carry an expiry; start_hold_sweeper() releases any that were never
+settled (crashed worker, killed request, async job that never reported back).
+"""
 from __future__ import annotations
-from datetime import datetime
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
 from typing import Optional
 
-from sqlalchemy import select
+from sqlalchemy import event, insert, update, func, case, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from models import get_session, User, CreditLedger, CreditEventType, CreditHold, CreditSummary
+import metrics
+
+_LEDGER_KEY = "credit_ledger_pending"
+
+
+# ---------------------------
+# Low-level primitives (run inside the caller's session / transaction)
+# ---------------------------
+def _balance(s: Session, user_id: int, stmt) -> Optional[int]:
+    """
+    Run a RETURNING balance update and copy the result onto a User already in the session.
+    (synchronize_session="fetch" races on a cold statement cache and can hand back the
+    primary key; "evaluate" recomputes from the stale in-memory balance.)
+    """
+    balance = s.execute(stmt.execution_options(synchronize_session=False)).scalar_one_or_none()
+    user = s.identity_map.get(identity_key(User, user_id))
+    if balance is not None and user is not None:
+        set_committed_value(user, "credits", balance)
+    return balance
+
+
+def debit(s: Session, user_id: int, amount: int) -> Optional[int]:
+    """
+    Atomically subtract `amount` from the user's balance.
+    Returns the new balance, or None if the user is missing or short on credits.
+    """
+    if amount <= 0:
+        return None
+    stmt = (
+        update(User)
+        .where(User.id == user_id, User.credits >= amount)
+        .values(credits=User.credits - amount)
+        .returning(User.credits)
+    )
+    return _balance(s, user_id, stmt)
+
+
+def credit(s: Session, user_id: int, amount: int) -> Optional[int]:
+    """Atomically add `amount` to the user's balance. Returns the new balance or None."""
+    if amount <= 0:
+        return None
+    stmt = (
+        update(User)
+        .where(User.id == user_id)
+        .values(credits=User.credits + amount)
+        .returning(User.credits)
+    )
+    return _balance(s, user_id, stmt)
+
+
+def record(
+    s: Session,
+    user_id: int,
+    amount: int,
+    balance_after: int,
+    event_type: CreditEventType,
+    ref: Optional[str] = None,
+    notes: Optional[str] = None,
+    sku: Optional[str] = None,
+) -> None:
+    """Queue a ledger row; all queued rows are inserted in one batch at commit."""
+    s.info.setdefault(_LEDGER_KEY, []).append({
+        "user_id": user_id,
+        "event_type": event_type,
+        "amount": amount,
+        "balance_after": balance_after,
+        "reference": ref,
+        "sku": sku,
+        "notes": notes,
+        "created_at": datetime.utcnow(),
+    })
+
+
+def spend(s: Session, user_id: int, amount: int, ref: Optional[str] = None, notes: Optional[str] = None) -> Optional[int]:
+    """debit() + SPEND ledger row. Returns the new balance or None."""
+    balance = debit(s, user_id, amount)
+    if balance is not None:
+        record(s, user_id, -amount, balance, CreditEventType.SPEND, ref, notes)
+    return balance
+
+
+def add(
+    s: Session,
+    user_id: int,
+    amount: int,
+    event_type: CreditEventType = CreditEventType.GRANT,
+    ref: Optional[str] = None,
+    notes: Optional[str] = None,
+    sku: Optional[str] = None,
+) -> Optional[int]:
+    """credit() + ledger row of the given type. Returns the new balance or None."""
+    balance = credit(s, user_id, amount)
+    if balance is not None:
+        record(s, user_id, amount, balance, event_type, ref, notes, sku)
+    return balance
+
+
+def _summary_deltas(rows) -> dict:
+    """Fold queued ledger rows into one credit_summaries delta per user."""
+    deltas = {}
+    for r in rows:
+        d = deltas.setdefault(r["user_id"], {
+            "user_id": r["user_id"], "total_purchased": 0, "total_spent": 0, "purchase_count": 0,
+            "last_purchase_at": None, "last_purchase_sku": None,
+        })
+        kind = r["event_type"]
+        if kind == CreditEventType.PURCHASE:
+            d["total_purchased"] += r["amount"]
+            d["purchase_count"] += 1
+            d["last_purchase_at"] = r["created_at"]
+            d["last_purchase_sku"] = r["sku"]
+        elif kind == CreditEventType.SPEND:
+            d["total_spent"] -= r["amount"]  # spend rows are negative
+        elif kind == CreditEventType.REFUND:
+            d["total_spent"] -= r["amount"]
+    return deltas
+
+
+def _upsert_summaries(s: Session, deltas: dict) -> None:
+    dialect = s.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        upsert = None
+
+    t = CreditSummary.__table__
+    for d in deltas.values():
+        if upsert is None:
+            _upsert_summary_fallback(s, d)
+            continue
+        stmt = upsert(t).values(**d, updated_at=datetime.utcnow())
+        ex = stmt.excluded
+        s.execute(stmt.on_conflict_do_update(
+            index_elements=[t.c.user_id],
+            set_={
+                "total_purchased": t.c.total_purchased + ex.total_purchased,
+                "total_spent": t.c.total_spent + ex.total_spent,
+                "purchase_count": t.c.purchase_count + ex.purchase_count,
+                "last_purchase_at": func.coalesce(ex.last_purchase_at, t.c.last_purchase_at),
+                "last_purchase_sku": case(
+                    (ex.last_purchase_at.is_(None), t.c.last_purchase_sku), else_=ex.last_purchase_sku
+                ),
+                "updated_at": ex.updated_at,
+            },
+        ))
+
+
+def _upsert_summary_fallback(s: Session, d: dict) -> None:
+    row = s.get(CreditSummary, d["user_id"])
+    if row is None:
+        s.add(CreditSummary(**d))
+        s.flush()
+        return
+    row.total_purchased = (row.total_purchased or 0) + d["total_purchased"]
+    row.total_spent = (row.total_spent or 0) + d["total_spent"]
+    row.purchase_count = (row.purchase_count or 0) + d["purchase_count"]
+    if d["last_purchase_at"] is not None:
+        row.last_purchase_at = d["last_purchase_at"]
+        row.last_purchase_sku = d["last_purchase_sku"]
+    s.flush()
+
+
+@event.listens_for(Session, "before_commit")
+def _flush_ledger(s: Session):
+    rows = s.info.pop(_LEDGER_KEY, None)
+    if rows:
+        s.execute(insert(CreditLedger), rows)
+        _upsert_summaries(s, _summary_deltas(rows))
 
-from models import get_session, User, CreditLedger, CreditEventType
 
+@event.listens_for(Session, "after_rollback")
+def _drop_ledger(s: Session):
+    s.info.pop(_LEDGER_KEY, None)
+
+
+# ---------------------------
+# Self-contained operations (own short transaction)
+# ---------------------------
 def grant_credits(
     user_id: int,
     amount: int,
     event: CreditEventType = CreditEventType.GRANT,
     ref: Optional[str] = None,
     notes: Optional[str] = None,
+    sku: Optional[str] = None,
 ) -> bool:
     """
     Add credits to user's balance and log to CreditLedger.
-    Use event=PURCHASE for store purchases, event=GRANT for bonuses, etc.
+    Use event=PURCHASE for store purchases (with the product sku), event=GRANT for bonuses, etc.
     """
-    if amount <= 0:
-        return False
-
     with get_session() as s:
-        # Lock the row to avoid race conditions
-        stmt = select(User).where(User.id == user_id).with_for_update()
-        user = s.execute(stmt).scalar_one_or_none()
-        if not user:
+        if add(s, user_id, amount, event, ref, notes, sku) is None:
             return False
-
-        user.credits = (user.credits or 0) + amount
-
-        s.add(CreditLedger(
-            user_id=user.id,
-            event=event,
-            amount=amount,   # positive for grants/purchases
-            ref=ref,
-            notes=notes,
-            created_at=datetime.utcnow()
-        ))
         s.commit()
         return True
 
@@ -51,29 +250,11 @@ def spend_credits(
     """
     Deduct credits and log as SPEND. Returns False if insufficient balance.
     """
-    if amount <= 0:
-        return False
-
     with get_session() as s:
-        stmt = select(User).where(User.id == user_id).with_for_update()
-        user = s.execute(stmt).scalar_one_or_none()
-        if not user:
+        if spend(s, user_id, amount, ref, notes) is None:
             return False
-
-        current = user.credits or 0
-        if current < amount:
-            return False
-
-        user.credits = current - amount
-        s.add(CreditLedger(
-            user_id=user.id,
-            event=CreditEventType.SPEND,
-            amount=-amount,  # negative for spend
-            ref=ref,
-            notes=notes,
-            created_at=datetime.utcnow()
-        ))
         s.commit()
+        metrics.credits_spent(notes, amount)
         return True
 
 
@@ -86,29 +267,221 @@ def refund_credits(
     """
     Refund (add back) credits and log as REFUND.
     """
-    if amount <= 0:
-        return False
+    with get_session() as s:
+        if add(s, user_id, amount, CreditEventType.REFUND, ref, notes) is None:
+            return False
+        s.commit()
+        return True
 
+
+def get_credits(user_id: int) -> int:
     with get_session() as s:
-        stmt = select(User).where(User.id == user_id).with_for_update()
-        user = s.execute(stmt).scalar_one_or_none()
-        if not user:
+        credits = s.query(User.credits).filter_by(id=user_id).scalar()
+        return int(credits or 0)
+
+
+def rebuild_summaries(sku_by_name: Optional[dict] = None) -> int:
+    """
+    Recompute credit_summaries from the full ledger (backfill / repair).
+    If sku_by_name ({product name: sku}) is given, purchase rows without a sku
+    get one inferred from their notes first.
+    """
+    with get_session() as s:
+        if sku_by_name:
+            for name, sku in sku_by_name.items():
+                s.execute(
+                    update(CreditLedger)
+                    .where(CreditLedger.event_type == CreditEventType.PURCHASE,
+                           CreditLedger.sku.is_(None),
+                           CreditLedger.notes.contains(name))
+                    .values(sku=sku)
+                    .execution_options(synchronize_session=False)
+                )
+
+        kind = CreditLedger.event_type
+        totals = s.execute(
+            select(
+                CreditLedger.user_id,
+                func.coalesce(func.sum(case((kind == CreditEventType.PURCHASE, CreditLedger.amount), else_=0)), 0),
+                func.coalesce(-func.sum(case((kind.in_([CreditEventType.SPEND, CreditEventType.REFUND]), CreditLedger.amount), else_=0)), 0),
+                func.count(case((kind == CreditEventType.PURCHASE, 1))),
+                func.max(case((kind == CreditEventType.PURCHASE, CreditLedger.created_at))),
+            ).group_by(CreditLedger.user_id)
+        ).all()
+
+        s.query(CreditSummary).delete(synchronize_session=False)
+        for user_id, purchased, spent, count, last_at in totals:
+            last_sku = None
+            if last_at is not None:
+                last_sku = s.execute(
+                    select(CreditLedger.sku)
+                    .where(CreditLedger.user_id == user_id, kind == CreditEventType.PURCHASE)
+                    .order_by(CreditLedger.created_at.desc())
+                    .limit(1)
+                ).scalar()
+            s.add(CreditSummary(
+                user_id=user_id, total_purchased=int(purchased), total_spent=int(spent),
+                purchase_count=int(count), last_purchase_at=last_at, last_purchase_sku=last_sku,
+            ))
+        s.commit()
+        return len(totals)
+
+
+def get_summary(s: Session, user_id: int):
+    """(User, CreditSummary | None) in one indexed read."""
+    return (s.query(User, CreditSummary)
+              .outerjoin(CreditSummary, CreditSummary.user_id == User.id)
+              .filter(User.id == user_id)
+              .first()) or (None, None)
+
+
+# ---------------------------
+# Reservations (holds) for long-running generations
+# ---------------------------
+HOLD_TTL_SECONDS = int(os.getenv("CREDIT_HOLD_TTL_SECONDS", "600"))
+HOLD_SWEEP_SECONDS = int(os.getenv("CREDIT_HOLD_SWEEP_SECONDS", "60"))
+
+log = logging.getLogger("wallet")
+
+
+class Reservation:
+    """
+    Handle for a row in credit_holds. The debit is committed when the hold is
+    created, so no row lock is held while the upstream call runs.
+    commit() settles the hold, refund() releases it back to the user; only the
+    first transition wins (also against the expiry sweeper).
+    """
+
+    def __init__(self, hold_id: int, user_id: int, amount: int, balance: int):
+        self.hold_id = hold_id
+        self.user_id = user_id
+        self.amount = amount
+        self.balance = balance
+        self.state = "held"
+
+    def commit(self) -> bool:
+        if self.state != "held":
+            return False
+        self.state = "settled"
+        return settle_hold(self.hold_id)
+
+    def refund(self, notes: Optional[str] = None) -> bool:
+        if self.state != "held":
             return False
+        self.state = "released"
+        return release_hold(self.hold_id, notes)
 
-        user.credits = (user.credits or 0) + amount
-        s.add(CreditLedger(
-            user_id=user.id,
-            event=CreditEventType.REFUND,
-            amount=amount,  # positive
-            ref=ref,
+
+def reserve_credits(
+    user_id: int,
+    amount: int,
+    ref: Optional[str] = None,
+    notes: Optional[str] = None,
+    ttl_seconds: Optional[int] = None,
+) -> Optional[Reservation]:
+    """Debit `amount` now and record a hold; returns None if the balance is too low."""
+    ttl = HOLD_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    with get_session() as s:
+        balance = spend(s, user_id, amount, ref, notes)
+        if balance is None:
+            return None
+        hold = CreditHold(
+            user_id=user_id,
+            amount=amount,
+            status="held",
+            reference=ref,
             notes=notes,
-            created_at=datetime.utcnow()
-        ))
+            expires_at=datetime.utcnow() + timedelta(seconds=ttl),
+        )
+        s.add(hold)
+        s.commit()
+        return Reservation(hold.id, user_id, amount, balance)
+
+
+def _resolve(s: Session, hold_ids, status: str):
+    """Flip held -> status for the given ids (or expired ones); returns the rows that changed."""
+    stmt = (
+        update(CreditHold)
+        .where(CreditHold.status == "held", hold_ids)
+        .values(status=status, resolved_at=datetime.utcnow())
+        .returning(CreditHold.id, CreditHold.user_id, CreditHold.amount, CreditHold.reference, CreditHold.notes)
+        .execution_options(synchronize_session=False)
+    )
+    return s.execute(stmt).all()
+
+
+def settle_hold(hold_id: int) -> bool:
+    """Mark a hold as spent. If the sweeper already released it, charge again (best effort)."""
+    with get_session() as s:
+        rows = _resolve(s, CreditHold.id == hold_id, "settled")
+        if rows:
+            s.commit()
+            metrics.credits_spent(rows[0].notes, rows[0].amount)
+            return True
+        row = s.get(CreditHold, hold_id)
+        if row is None or row.status != "released":
+            return False
+        if spend(s, row.user_id, row.amount, row.reference, f"late settle of hold #{hold_id}") is None:
+            log.warning("hold %s settled after expiry and user %s cannot cover it", hold_id, row.user_id)
+            return False
+        row.status = "settled"
         s.commit()
+        metrics.credits_spent(row.notes, row.amount)
         return True
 
 
-def get_credits(user_id: int) -> int:
+def release_hold(hold_id: int, notes: Optional[str] = None) -> bool:
+    """Return a held amount to the user. No-op if already settled or released."""
     with get_session() as s:
-        user = s.get(User, user_id)
-        return int(user.credits or 0) if user else 0
+        rows = _resolve(s, CreditHold.id == hold_id, "released")
+        for r in rows:
+            add(s, r.user_id, r.amount, CreditEventType.REFUND, r.reference, notes or f"refund: {r.notes or 'failed call'}")
+        s.commit()
+        return bool(rows)
+
+
+def sweep_expired_holds() -> int:
+    """Release every hold past its expiry. Safe to run from several workers at once."""
+    with get_session() as s:
+        rows = _resolve(s, CreditHold.expires_at < datetime.utcnow(), "released")
+        for r in rows:
+            add(s, r.user_id, r.amount, CreditEventType.REFUND, r.reference, f"expired hold #{r.id}")
+        s.commit()
+    if rows:
+        log.info("released %d expired credit holds", len(rows))
+    return len(rows)
+
+
+_sweeper_started = False
+
+
+def start_hold_sweeper(interval: int = HOLD_SWEEP_SECONDS) -> None:
+    """Run sweep_expired_holds() every `interval` seconds in a daemon thread (once per process)."""
+    global _sweeper_started
+    if _sweeper_started or interval <= 0:
+        return
+    _sweeper_started = True
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                sweep_expired_holds()
+            except Exception:
+                log.exception("credit hold sweep failed")
+
+    threading.Thread(target=loop, name="credit-hold-sweeper", daemon=True).start()
+
+
+if __name__ == "__main__":
+    # Manual / cron usage:
+    #   python wallet.py                    -> release expired holds once
+    #   python wallet.py rebuild-summaries  -> backfill ledger skus + credit_summaries
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] == ["rebuild-summaries"]:
+        from app_payments import PRODUCTS
+        n = rebuild_summaries({p["name"]: sku for sku, p in PRODUCTS.items()})
+        log.info("rebuilt credit summaries for %d users", n)
+    else:
+        sweep_expired_holds()
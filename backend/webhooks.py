@@ -1,10 +1,17 @@
 # webhooks.py
 import os
-import stripe
+import json
+import queue
 import logging
+import threading
+import time
+from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify, abort
-from models import get_session, User, CreditEventType
-from wallet import grant_credits
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from models import get_session, User, CreditLedger, CreditEventType, WebhookEvent
+import wallet
+import metrics
 
 # Set up logging
 log = logging.getLogger("webhooks")
@@ -12,8 +19,9 @@ log = logging.getLogger("webhooks")
 bp = Blueprint("webhooks", __name__, url_prefix="/api")
 
 # --- Stripe config ---
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY", "").strip()
+STRIPE_KEY = os.getenv("STRIPE_SECRET_KEY", "").strip()
 WH_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "").strip()
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "").strip()  # e.g. a local stand-in for load tests
 
 # Price IDs from env (Stripe Dashboard) -> map to credits
 PRICE_STARTER  = (os.getenv("STORE_PRICE_STARTER")  or "").strip()  # 60 credits
@@ -21,6 +29,14 @@ PRICE_STANDARD = (os.getenv("STORE_PRICE_STANDARD") or "").strip()  # 100 credit
 PRICE_STUDIO   = (os.getenv("STORE_PRICE_STUDIO")   or "").strip()  # 400 credits
 PRICE_ADFREE   = (os.getenv("STORE_PRICE_ADFREE")   or "").strip()  # subscription price
 
+def _stripe():
+    """Import the stripe SDK on first use instead of at worker boot."""
+    import stripe
+    stripe.api_key = STRIPE_KEY
+    if STRIPE_API_BASE:
+        stripe.api_base = STRIPE_API_BASE
+    return stripe
+
 CREDIT_MAP = {
     PRICE_STARTER:  60,
     PRICE_STANDARD: 100,
@@ -30,22 +46,163 @@ CREDIT_MAP = {
 # --- Resend config ---
 RESEND_WEBHOOK_SECRET = os.getenv("RESEND_WEBHOOK_SECRET", "").strip()
 
-# ---- Simple in-memory idempotency (for prod, store in DB) ----
-_PROCESSED: set[str] = set()
-_MAX_IDS = 2000  # rotate to avoid unbounded growth
+# ---- Durable idempotency + async processing ----
+# Every verified event is stored in webhook_events (unique on provider + event_id)
+# and acknowledged right away; a per-process worker applies it off the request
+# path. Failures are retried with exponential backoff, and any worker's poll
+# picks up events left pending by a restart or a crashed process.
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_POLL_SECONDS = int(os.getenv("WEBHOOK_POLL_SECONDS", "30"))  # due retries are polled this often, busy or not
+WEBHOOK_LOCK_SECONDS = int(os.getenv("WEBHOOK_LOCK_SECONDS", "300"))  # reclaim stuck "processing" rows
+
+_queue: "queue.Queue[int]" = queue.Queue()
+_worker_started = False
+_worker_lock = threading.Lock()
+
+
+def store_event(provider: str, event_id: str, event_type: str | None, payload: str) -> int | None:
+    """Persist an inbound event. Returns the row id, or None if it was already received."""
+    with get_session() as s:
+        row = WebhookEvent(provider=provider, event_id=event_id, event_type=event_type, payload=payload)
+        s.add(row)
+        try:
+            s.commit()
+        except IntegrityError:
+            s.rollback()
+            return None
+        return row.id
+
+
+def enqueue(row_id: int) -> None:
+    start_worker()
+    _queue.put(row_id)
+
+
+def _claimable(now: datetime):
+    stale = now - timedelta(seconds=WEBHOOK_LOCK_SECONDS)
+    return or_(
+        and_(WebhookEvent.status == "pending", WebhookEvent.next_attempt_at <= now),
+        and_(WebhookEvent.status == "processing", WebhookEvent.locked_at < stale),
+    )
+
+
+def _claim(row_id: int, force: bool = False):
+    """Atomically move an event to processing; returns (provider, payload, attempts) or None."""
+    now = datetime.utcnow()
+    cond = WebhookEvent.status != "processing" if force else _claimable(now)
+    with get_session() as s:
+        row = s.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id == row_id, cond)
+            .values(status="processing", locked_at=now, attempts=WebhookEvent.attempts + 1)
+            .returning(WebhookEvent.provider, WebhookEvent.payload, WebhookEvent.attempts)
+            .execution_options(synchronize_session=False)
+        ).first()
+        s.commit()
+        return row
+
 
-def _mark_processed(eid: str) -> bool:
-    """True if already processed; otherwise mark and return False."""
-    global _PROCESSED
-    if not eid:
+def _finish(row_id: int, error: str | None, attempts: int) -> None:
+    now = datetime.utcnow()
+    values = {"locked_at": None}
+    if error is None:
+        values.update(status="done", processed_at=now, last_error=None)
+    elif attempts >= WEBHOOK_MAX_ATTEMPTS:
+        values.update(status="dead", last_error=error)
+    else:
+        values.update(status="pending", last_error=error,
+                      next_attempt_at=now + timedelta(seconds=min(5 * 2 ** attempts, 3600)))
+    with get_session() as s:
+        s.execute(update(WebhookEvent).where(WebhookEvent.id == row_id).values(**values))
+        s.commit()
+
+
+def process_event(row_id: int, force: bool = False) -> bool:
+    """Apply one stored event. force=True re-runs done/dead events (replay)."""
+    claimed = _claim(row_id, force)
+    if not claimed:
+        return False
+    provider, payload, attempts = claimed
+    try:
+        _HANDLERS[provider](json.loads(payload))
+    except Exception as e:
+        log.exception("webhook event %s failed (attempt %s)", row_id, attempts)
+        _finish(row_id, f"{type(e).__name__}: {e}", attempts)
         return False
-    if eid in _PROCESSED:
-        return True
-    if len(_PROCESSED) >= _MAX_IDS:
-        # crude rotation
-        _PROCESSED.clear()
-    _PROCESSED.add(eid)
-    return False
+    _finish(row_id, None, attempts)
+    return True
+
+
+def due_event_ids(limit: int = 100) -> list[int]:
+    with get_session() as s:
+        return list(s.execute(
+            select(WebhookEvent.id)
+            .where(_claimable(datetime.utcnow()))
+            .order_by(WebhookEvent.id)
+            .limit(limit)
+        ).scalars())
+
+
+def _worker_loop():
+    next_poll = 0.0  # drain leftovers from before a restart right away
+    while True:
+        row_ids = []
+        try:
+            row_ids.append(_queue.get(timeout=max(0.0, next_poll - time.monotonic())))
+        except queue.Empty:
+            pass
+        try:
+            # poll on a fixed schedule, not only when the queue is idle, so
+            # retries aren't starved by a steady stream of new events
+            if time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + WEBHOOK_POLL_SECONDS
+                row_ids += due_event_ids()
+            for rid in dict.fromkeys(row_ids):
+                process_event(rid)
+        except Exception:
+            log.exception("webhook worker error")
+
+
+def start_worker() -> None:
+    """Start this process's webhook worker thread (idempotent)."""
+    global _worker_started
+    with _worker_lock:
+        if _worker_started:
+            return
+        _worker_started = True
+    threading.Thread(target=_worker_loop, name="webhook-worker", daemon=True).start()
+
+
+# Drain anything left pending from before a restart as soon as the blueprint is live
+bp.record_once(lambda state: start_worker())
+
+
+def _already_granted(ref: str) -> bool:
+    with get_session() as s:
+        return s.query(CreditLedger.id).filter_by(reference=ref, event_type=CreditEventType.PURCHASE).first() is not None
+
+
+def _grant_purchase(user_id: int, credits: int, ref: str, sku: str | None, amount_cents: int | None) -> bool:
+    """
+    Credit a checkout and queue its receipt email in one transaction, so a
+    retry never finds the credits granted but the email missing. The partial
+    unique index on purchase references (ux_credit_ledger_purchase_reference)
+    makes a concurrent second grant (a replay racing the worker) fail.
+    Returns False if the user is missing or `ref` was already granted.
+    """
+    with get_session() as s:
+        if wallet.add(s, user_id, credits, CreditEventType.PURCHASE, ref,
+                      f"checkout purchase {credits} credits", sku) is None:
+            return False
+        _send_purchase_email(user_id, amount_cents, f"{credits} Credits", s=s)
+        try:
+            s.commit()
+        except IntegrityError:
+            s.rollback()
+            log.info("credits for %s were granted concurrently; skipping grant", ref)
+            return False
+    return True
+
 
 def _set_adfree_by_user_id(user_id: int, active: bool, customer_id: str | None = None):
     with get_session() as s:
@@ -79,7 +236,7 @@ def _resolve_user_id_from_session(sess: dict) -> int | None:
 
 @bp.post("/stripe-webhook")
 def stripe_webhook():
-    """Stripe webhook handler: credits purchases + ad-free subscriptions."""
+    """Stripe webhook: verify, store, acknowledge. Credits/ad-free/emails are applied by the worker."""
     if not WH_SECRET:
         # Fail fast if the webhook secret isn't set
         return jsonify(ok=False, error="webhook_secret_not_configured"), 500
@@ -87,6 +244,7 @@ def stripe_webhook():
     payload = request.data
     sig = request.headers.get("Stripe-Signature", "")
 
+    stripe = _stripe()
     try:
         event = stripe.Webhook.construct_event(payload=payload, sig_header=sig, secret=WH_SECRET)
     except stripe.error.SignatureVerificationError as e:
@@ -94,11 +252,27 @@ def stripe_webhook():
     except Exception as e:
         return jsonify(ok=False, error=f"webhook_parse_error: {e}"), 400
 
-    # Idempotency
-    ev_id = event.get("id")
-    if _mark_processed(ev_id):
-        return ("", 200)
+    accept_stripe_event(event, payload)
+    return ("", 200)
+
+
+def accept_stripe_event(event, payload: bytes) -> bool:
+    """Store a verified Stripe event and queue it. False if it is a duplicate delivery."""
+    row_id = store_event("stripe", event.get("id") or "", event.get("type"), payload.decode("utf-8"))
+    if row_id is None:
+        return False
+    enqueue(row_id)
+    return True
 
+
+def _handle_stripe_event(event: dict):
+    """
+    Apply a Stripe event. Raising makes the worker retry it, so every step is
+    safe to re-run: ad-free flags are set absolutely and credit grants are
+    skipped when the checkout session's ledger row already exists. A grant
+    and its receipt email commit together (_grant_purchase); the outbox
+    retries the send on its own.
+    """
     etype = event.get("type", "")
     obj = event.get("data", {}).get("object", {}) or {}
 
@@ -106,53 +280,25 @@ def stripe_webhook():
     if etype == "checkout.session.completed":
         mode = obj.get("mode")
         user_id = _resolve_user_id_from_session(obj)
+        if user_id is None:
+            return
 
         if mode == "subscription":
             # Activate Ad-Free on start
-            if user_id is not None:
-                _set_adfree_by_user_id(user_id, True, customer_id=obj.get("customer"))
-
-                # Send subscription confirmation email
-                try:
-                    with get_session() as s:
-                        user = s.query(User).filter_by(id=user_id).first()
-                        if user and user.email:
-                            from app_email import send_email
-                            from app_email_templates import get_purchase_confirmation_template
-
-                            amount_cents = obj.get("amount_total", 0)
-                            amount_dollars = f"${amount_cents / 100:.2f}" if amount_cents else "$0.00"
-                            product_name = "Ad-Free Premium Access"
-
-                            email_template = get_purchase_confirmation_template(
-                                user_name=user.display_name or "Valued Customer",
-                                amount=amount_dollars,
-                                product_name=product_name
-                            )
-
-                            send_email(
-                                to=user.email,
-                                subject=email_template["subject"],
-                                html=email_template["html"],
-                                text=email_template["text"]
-                            )
-                            log.info("Subscription confirmation email sent to %s for ad-free access", user.email)
-                except Exception as email_error:
-                    log.warning("Subscription confirmation email failed for user_id %s: %s", user_id, email_error)
-                    # Continue processing even if email fails
-
-            return ("", 200)
-
-        if mode == "payment" and user_id is not None:
-            # Need expanded line items to get price IDs reliably
-            try:
-                sess = stripe.checkout.Session.retrieve(
-                    obj["id"],
-                    expand=["line_items.data.price"]
-                )
-                items = (sess.get("line_items") or {}).get("data", [])
-            except Exception:
-                items = []
+            _set_adfree_by_user_id(user_id, True, customer_id=obj.get("customer"))
+            _send_purchase_email(user_id, obj.get("amount_total", 0), "Ad-Free Premium Access")
+
+        elif mode == "payment":
+            ref = f"stripe:{obj.get('id')}"
+            if _already_granted(ref):
+                # the receipt email was queued in the same transaction as the grant
+                log.info("credits for %s already granted; skipping grant", ref)
+                return
+
+            # Need expanded line items to get price IDs reliably (off the request path now)
+            with metrics.upstream("stripe", "checkout.sessions.retrieve"):
+                sess = _stripe().checkout.Session.retrieve(obj["id"], expand=["line_items.data.price"])
+            items = (sess.get("line_items") or {}).get("data", [])
 
             total_credits = 0
             for li in items:
@@ -161,70 +307,65 @@ def stripe_webhook():
                 qty = int(li.get("quantity") or 1)
                 if price_id in CREDIT_MAP:
                     total_credits += CREDIT_MAP[price_id] * qty
+            if total_credits == 0:
+                # legacy checkouts carry the pack size in metadata
+                total_credits = int((obj.get("metadata") or {}).get("credits") or 0)
 
             if total_credits > 0:
-                grant_credits(
-                    user_id=user_id,
-                    amount=total_credits,
-                    event=CreditEventType.PURCHASE,
-                    ref=f"stripe:{obj.get('id')}",
-                    notes=f"checkout purchase {total_credits} credits"
-                )
-
-                # Send purchase confirmation email
-                try:
-                    with get_session() as s:
-                        user = s.query(User).filter_by(id=user_id).first()
-                        if user and user.email:
-                            from app_email import send_email
-                            from app_email_templates import get_purchase_confirmation_template
-
-                            amount_cents = obj.get("amount_total", 0)
-                            amount_dollars = f"${amount_cents / 100:.2f}" if amount_cents else "$0.00"
-                            product_name = f"{total_credits} Credits"
-
-                            email_template = get_purchase_confirmation_template(
-                                user_name=user.display_name or "Valued Customer",
-                                amount=amount_dollars,
-                                product_name=product_name
-                            )
-
-                            send_email(
-                                to=user.email,
-                                subject=email_template["subject"],
-                                html=email_template["html"],
-                                text=email_template["text"]
-                            )
-                            log.info("Purchase confirmation email sent to %s for %s credits", user.email, total_credits)
-                except Exception as email_error:
-                    log.warning("Purchase confirmation email failed for user_id %s: %s", user_id, email_error)
-                    # Continue processing even if email fails
-
-            return ("", 200)
-
-        return ("", 200)
+                _grant_purchase(user_id, total_credits, ref, (obj.get("metadata") or {}).get("sku"),
+                                obj.get("amount_total", 0))
+        return
 
     # --- 2) Invoice paid (subscription renewals) ---
     # This also fires on the first invoice for some subscription flows.
     if etype == "invoice.paid":
         # If you only have one subscription type (Ad-Free), simply mark active
-        customer_id = obj.get("customer")
         # Optional: you can check each line to verify it's for PRICE_ADFREE
-        _set_adfree_by_customer(customer_id, True)
-        return ("", 200)
+        _set_adfree_by_customer(obj.get("customer"), True)
+        return
 
     # --- 3) Subscription lifecycle updates that disable Ad-Free ---
     if etype in ("customer.subscription.deleted", "customer.subscription.updated"):
         status = obj.get("status")
-        customer = obj.get("customer")
         if etype == "customer.subscription.deleted" or status in (
             "canceled", "unpaid", "incomplete_expired", "past_due"
         ):
-            _set_adfree_by_customer(customer, False)
-        return ("", 200)
+            _set_adfree_by_customer(obj.get("customer"), False)
+        return
+
+    # --- 4) Other events: nothing to do ---
+
+
+def _send_purchase_email(user_id: int, amount_cents: int | None, product_name: str, s=None):
+    """Queue the purchase confirmation; with `s`, inside that session's transaction."""
+    with get_session() as own:
+        row = (s if s is not None else own).query(User.email, User.display_name).filter_by(id=user_id).first()
+    if not row or not row.email:
+        return
+    email, name = row.email, row.display_name
+
+    from outbox import queue_email
+    from app_email_templates import get_purchase_confirmation_template
+
+    amount_dollars = f"${amount_cents / 100:.2f}" if amount_cents else "$0.00"
+    email_template = get_purchase_confirmation_template(
+        user_name=name or "Valued Customer",
+        amount=amount_dollars,
+        product_name=product_name
+    )
+    queue_email(
+        to=email,
+        subject=email_template["subject"],
+        html=email_template["html"],
+        text=email_template["text"],
+        tags={"event": "purchase_confirmation"},
+        s=s,
+    )
+    log.info("Purchase confirmation email queued for %s (%s)", email, product_name)
+
+
+_HANDLERS = {"stripe": _handle_stripe_event}
 
-    # --- 4) Other events: acknowledge ---
-    return ("", 200)
 
 @bp.post("/resend-webhook")
 def resend_webhook():
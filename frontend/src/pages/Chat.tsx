@@ -20,6 +20,8 @@ export default function Chat() {
   const [temperature, setTemperature] = useState(0.7);
   const [model, setModel] = useState<(typeof MODELS)[number]>("gpt-4o-mini");
   const [messages, setMessages] = useState<ChatMessage[]>([{ role: "assistant", content: "Hi! I'm your friendly helper. How can I assist today?", ts: Date.now() }]);
+  // server-side history handle: only the new message is sent each turn
+  const [conversationId, setConversationId] = useState<string | null>(null);
   const [input, setInput] = useState("");
   const [loading, setLoading] = useState(false);
   const [stopped, setStopped] = useState(false);
@@ -57,18 +59,20 @@ export default function Chat() {
       setSystem(s.system || PRESETS[preset].system);
       setTemperature(s.temperature ?? 0.7);
       setModel(s.model || "gpt-4o-mini");
+      setConversationId(s.conversationId || null);
     } else {
       setMessages([{ role: "assistant", content: "Hi! I'm your friendly helper. How can I assist today?" }]);
       setSystem(PRESETS[preset].system);
       setTemperature(0.7);
       setModel("gpt-4o-mini");
+      setConversationId(null);
     }
   }, [preset]);
 
   useEffect(() => {
     const key = `mdp:chatmini:${preset}`;
-    localStorage.setItem(key, JSON.stringify({ messages, system, temperature, model }));
-  }, [messages, system, temperature, model, preset]);
+    localStorage.setItem(key, JSON.stringify({ messages, system, temperature, model, conversationId }));
+  }, [messages, system, temperature, model, conversationId, preset]);
 
   useEffect(() => {
     scrollerRef.current?.scrollTo({ top: scrollerRef.current.scrollHeight, behavior: "smooth" });
@@ -136,7 +140,7 @@ export default function Chat() {
       model,
       temperature,
       system,
-      messages: [...messages, userMsg].map(({ role, content }) => ({ role, content })),
+      message: userMsg.content,
       parts: userParts, // backend consumes this for multimodal
     };
 
@@ -145,13 +149,17 @@ export default function Chat() {
     setStopped(false);
 
     try {
-      const res = await fetch("/api/chat", {
+      const post = (conversation_id: string | null) => fetch("/api/chat", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(payload),
-        signal: abortRef.current.signal,
+        body: JSON.stringify(conversation_id ? { ...payload, conversation_id } : payload),
+        signal: abortRef.current!.signal,
       });
+      let res = await post(conversationId);
+      // expired or pruned on the server: start a new conversation
+      if (res.status === 404 && conversationId) res = await post(null);
       const js = await res.json();
+      if (js?.conversation_id) setConversationId(js.conversation_id);
       if (js?.ok && js.message) addMessage({ role: "assistant", content: js.message });
       else addMessage({ role: "assistant", content: `⚠️ Error: ${js?.error || "Unknown error"}` });
     } catch (e: any) {
@@ -172,7 +180,11 @@ export default function Chat() {
     const lastUser = [...messages].reverse().find(m => m.role === "user");
     if (lastUser) { setInput(lastUser.content); setTimeout(send, 0); }
   }
-  function clearChat() { setMessages([{ role: "assistant", content: "Chat cleared. How can I help now?", ts: Date.now() }]); }
+  function clearChat() {
+    if (conversationId) fetch(`/api/chat/${conversationId}`, { method: "DELETE" }).catch(() => {});
+    setConversationId(null);
+    setMessages([{ role: "assistant", content: "Chat cleared. How can I help now?", ts: Date.now() }]);
+  }
   function copyText(id: number, text: string) { navigator.clipboard.writeText(text).then(() => { setCopiedId(String(id)); setTimeout(()=>setCopiedId(null), 1100); }); }
 
   const assistantCountUpTo = (idx: number) => messages.slice(0, idx + 1).filter(m => m.role === "assistant").length;
@@ -6,8 +6,15 @@ CLI admin for public.posters
 
 New commands:
   search "<text>" [--limit N]
-  export <path> [--format json|ndjson] [--author ID] [--category CAT] [--published true|false]
-  import <path> [--on-conflict url|id] [--dry-run]
+  export <path> [--format json|ndjson|csv] [--author ID] [--category CAT] [--published true|false] [--batch-size N]
+  import <path> [--on-conflict url|id] [--method copy|values] [--batch-size N] [--dry-run]
+  bench [--rows 1000000] [--methods copy values] [--legacy-sample N] [--keep-fixture]
+
+Bulk engine (import/export/bench):
+  import  one connection; batches are COPY'd (or execute_values'd) into a temp
+          staging table, then applied with a single INSERT ... ON CONFLICT.
+          Inserted vs updated counts come from xmax on the RETURNING rows.
+  export  server-side cursor, streamed to disk; memory stays flat.
 
 Existing + extras:
   latest [N]              show latest N
@@ -29,9 +36,14 @@ DB connection:
 """
 
 import argparse
+import csv
+import io
 import json
 import os
+import shutil
 import sys
+import tempfile
+import time
 from datetime import datetime
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
@@ -282,24 +294,208 @@ def build_where(author: Optional[int], category: Optional[str], published: Optio
     where = " WHERE " + " AND ".join(clauses) if clauses else ""
     return where, params
 
+# ---------- BULK ENGINE ----------
+# One connection per command. Import streams records into a temp staging
+# table (COPY or execute_values, in batches), then applies them with a single
+# INSERT ... ON CONFLICT; xmax = 0 on the RETURNING rows tells inserts from
+# updates. Export reads through a server-side cursor, so memory stays flat.
+
+COLUMNS = ["id", "description", "tags", "likes_count", "views_count", "shared_url",
+           "created_at", "updated_at", "author_id", "category", "is_published", "updated_by"]
+UPDATE_COLUMNS = ["description", "tags", "likes_count", "views_count", "shared_url",
+                  "author_id", "category", "is_published", "updated_by"]
+BATCH_SIZE = int(os.getenv("TOOLKIT_BATCH_SIZE", "50000"))
+
+class Progress:
+    """Rate-limited progress line on stderr: rows, rows/s, elapsed."""
+
+    def __init__(self, label: str, every: float = 1.0, quiet: bool = False):
+        self.label, self.every, self.quiet = label, every, quiet
+        self.rows = 0
+        self.t0 = self._last = time.perf_counter()
+
+    def add(self, n: int):
+        self.rows += n
+        now = time.perf_counter()
+        if not self.quiet and now - self._last >= self.every:
+            self._last = now
+            self._print(now)
+
+    def _print(self, now: float, end: str = "\r"):
+        dt = max(now - self.t0, 1e-9)
+        print(f"  {self.label}: {self.rows:,} rows  {self.rows / dt:,.0f} rows/s  {dt:.1f}s",
+              end=end, file=sys.stderr, flush=True)
+
+    def done(self) -> float:
+        now = time.perf_counter()
+        if not self.quiet:
+            self._print(now, end="\n")
+        return now - self.t0
+
+def _copy_value(v: Any) -> str:
+    """Encode one value for COPY ... FROM STDIN (text format)."""
+    if v is None:
+        return "\\N"
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    if isinstance(v, (dict, list)):
+        v = json.dumps(v, ensure_ascii=False)
+    return (str(v).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+def _batches(records: Iterable[Dict[str, Any]], key: str, size: int, skipped: List[int]):
+    """Normalized rows in batches, (ord, *COLUMNS); rows without the conflict key are skipped."""
+    keycol = "shared_url" if key == "url" else "id"
+    batch: List[tuple] = []
+    for n, rec in enumerate(records, 1):
+        r = normalize_rec(rec)
+        if not r.get(keycol):
+            skipped.append(n)
+            continue
+        batch.append((n, *(r[c] for c in COLUMNS)))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _stage(cur, table: str):
+    # CREATE TABLE AS copies column types but not NOT NULL/unique constraints
+    cur.execute(f"""
+        CREATE TEMP TABLE _import_stage ON COMMIT DROP AS
+        SELECT 0::bigint AS _ord, {", ".join(COLUMNS)} FROM {table} WITH NO DATA
+    """)
+
+def _load_copy(cur, batch: List[tuple]):
+    buf = io.StringIO()
+    for row in batch:
+        buf.write("\t".join(_copy_value(v) for v in row))
+        buf.write("\n")
+    buf.seek(0)
+    cur.copy_expert(f"COPY _import_stage (_ord, {', '.join(COLUMNS)}) FROM STDIN", buf)
+
+def _load_values(cur, batch: List[tuple]):
+    psycopg2.extras.execute_values(
+        cur, f"INSERT INTO _import_stage (_ord, {', '.join(COLUMNS)}) VALUES %s",
+        batch, page_size=1000)
+
+def _deduped(key: str) -> str:
+    # last occurrence of a key wins, as it did with per-row upserts
+    keycol = "shared_url" if key == "url" else "id"
+    return f"SELECT DISTINCT ON ({keycol}) * FROM _import_stage ORDER BY {keycol}, _ord DESC"
+
+def _upsert_sql(table: str, key: str) -> str:
+    keycol = "shared_url" if key == "url" else "id"
+    cols = COLUMNS if key == "id" else [c for c in COLUMNS if c != "id"]
+    select = ", ".join("COALESCE(s.%s, NOW())" % c if c in ("created_at", "updated_at") else "s." + c
+                       for c in cols)
+    sets = ",\n                ".join(f"{c} = EXCLUDED.{c}" for c in UPDATE_COLUMNS if c != keycol)
+    return f"""
+        WITH up AS (
+            INSERT INTO {table} ({", ".join(cols)})
+            SELECT {select} FROM ({_deduped(key)}) s
+            ON CONFLICT ({keycol}) DO UPDATE
+            SET {sets},
+                updated_at = EXCLUDED.updated_at
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted) AS inserted,
+               count(*) FILTER (WHERE NOT inserted) AS updated
+        FROM up
+    """
+
+def bulk_import(conn, records: Iterable[Dict[str, Any]], key: str = "url", table: str = TABLE,
+                method: str = "copy", batch_size: int = BATCH_SIZE, dry_run: bool = False,
+                quiet: bool = False) -> Dict[str, Any]:
+    """Stage + single upsert on one connection. Returns counts and per-phase timings."""
+    skipped: List[int] = []
+    load = _load_copy if method == "copy" else _load_values
+    keycol = "shared_url" if key == "url" else "id"
+    with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+        _stage(cur, table)
+        prog = Progress(f"stage ({method})", quiet=quiet)
+        for batch in _batches(records, key, batch_size, skipped):
+            load(cur, batch)
+            prog.add(len(batch))
+        stage_s = prog.done()
+
+        t0 = time.perf_counter()
+        if dry_run:
+            cur.execute(f"""
+                SELECT count(*) FILTER (WHERE t.{keycol} IS NULL),
+                       count(*) FILTER (WHERE t.{keycol} IS NOT NULL)
+                FROM ({_deduped(key)}) s LEFT JOIN {table} t ON t.{keycol} = s.{keycol}
+            """)
+            inserted, updated = cur.fetchone()
+            conn.rollback()
+        else:
+            cur.execute(_upsert_sql(table, key))
+            inserted, updated = cur.fetchone()
+            if key == "id":
+                # explicit ids can run past the serial sequence
+                cur.execute(f"SELECT setval(pg_get_serial_sequence(%s, 'id'), GREATEST(MAX(id), 1)) FROM {table}",
+                            (table,))
+            conn.commit()
+        upsert_s = time.perf_counter() - t0
+
+    for n in skipped[:10]:
+        print(f"[skip] row {n}: missing {keycol}", file=sys.stderr)
+    if len(skipped) > 10:
+        print(f"[skip] ... and {len(skipped) - 10} more", file=sys.stderr)
+    return {"staged": prog.rows, "inserted": inserted, "updated": updated, "skipped": len(skipped),
+            "stage_s": stage_s, "upsert_s": upsert_s}
+
+def bulk_export(conn, out, fmt: str = "ndjson", table: str = TABLE, where: str = "",
+                params: Tuple = (), batch_size: int = BATCH_SIZE, quiet: bool = False) -> int:
+    """Stream SELECT * through a server-side cursor into `out` as json, ndjson or csv."""
+    n = 0
+    prog = Progress(f"export ({fmt})", quiet=quiet)
+    with conn.cursor(name="toolkit_export", cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.itersize = batch_size
+        cur.execute(f"SELECT * FROM {table}{where} ORDER BY id ASC", params)
+        writer = None
+        if fmt == "json":
+            out.write("[")
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            if fmt == "csv":
+                if writer is None:
+                    writer = csv.DictWriter(out, fieldnames=list(rows[0].keys()))
+                    writer.writeheader()
+                writer.writerows(rows)
+            elif fmt == "json":
+                for r in rows:
+                    out.write(("\n  " if n == 0 else ",\n  ") + json.dumps(r, ensure_ascii=False, default=str))
+                    n += 1
+                prog.add(len(rows))
+                continue
+            else:
+                out.write("".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in rows))
+            n += len(rows)
+            prog.add(len(rows))
+        if fmt == "json":
+            out.write("\n]\n" if n else "]\n")
+    conn.commit()  # close the cursor's transaction
+    prog.done()
+    return n
+
 def cmd_export(args):
     fmt = (args.format or "json").lower()
-    if fmt not in ("json", "ndjson"):
-        print("format must be json or ndjson", file=sys.stderr)
+    if fmt not in ("json", "ndjson", "csv"):
+        print("format must be json, ndjson or csv", file=sys.stderr)
         sys.exit(2)
 
     where, params = build_where(args.author, args.category, args.published)
-    rows = q_select(f"SELECT * FROM {TABLE}{where} ORDER BY id ASC", tuple(params))
-
-    if fmt == "json":
-        with open(args.path, "w", encoding="utf-8") as f:
-            json.dump(rows, f, ensure_ascii=False, indent=2, default=str)
-    else:
-        with open(args.path, "w", encoding="utf-8") as f:
-            for r in rows:
-                f.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+    conn = get_conn()
+    try:
+        with open(args.path, "w", encoding="utf-8", newline="") as f:
+            n = bulk_export(conn, f, fmt, where=where, params=tuple(params), batch_size=args.batch_size)
+    finally:
+        conn.close()
 
-    print(f"exported {len(rows)} rows -> {args.path}")
+    print(f"exported {n} rows -> {args.path}")
 
 def iter_import_records(path: str) -> Iterable[Dict[str, Any]]:
     with open(path, "r", encoding="utf-8") as f:
@@ -312,6 +508,9 @@ def iter_import_records(path: str) -> Iterable[Dict[str, Any]]:
             for item in data:
                 if isinstance(item, dict):
                     yield item
+        elif path.lower().endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield {k: (v if v != "" else None) for k, v in row.items()}
         else:
             for line in f:
                 line = line.strip()
@@ -325,14 +524,14 @@ def normalize_rec(rec: Dict[str, Any]) -> Dict[str, Any]:
         "id": rec.get("id"),
         "description": rec.get("description"),
         "tags": rec.get("tags"),
-        "likes_count": rec.get("likes_count", 0),
-        "views_count": rec.get("views_count", 0),
+        "likes_count": rec.get("likes_count") or 0,
+        "views_count": rec.get("views_count") or 0,
         "shared_url": rec.get("shared_url"),
         "created_at": rec.get("created_at"),
         "updated_at": rec.get("updated_at"),
         "author_id": rec.get("author_id"),
         "category": rec.get("category"),
-        "is_published": rec.get("is_published", False),
+        "is_published": parse_bool(rec.get("is_published")) or False,
         "updated_by": rec.get("updated_by"),
     }
     return out
@@ -342,100 +541,143 @@ def cmd_import(args):
     if key not in ("url", "id"):
         print("on-conflict must be 'url' or 'id'", file=sys.stderr); sys.exit(2)
 
-    dry = bool(args.dry_run)
-    total = 0
-    upserts = 0
-    inserts = 0
+    conn = get_conn()
+    try:
+        res = bulk_import(conn, iter_import_records(args.path), key=key, method=args.method,
+                          batch_size=args.batch_size, dry_run=bool(args.dry_run))
+    finally:
+        conn.close()
+
+    total = res["staged"] + res["skipped"]
+    rate = res["staged"] / max(res["stage_s"] + res["upsert_s"], 1e-9)
+    if args.dry_run:
+        print(f"(dry-run) would insert {res['inserted']} and update {res['updated']} of {total} records"
+              f" (skipped={res['skipped']})")
+    else:
+        print(f"import complete: processed={total}, inserted={res['inserted']}, updated={res['updated']}, "
+              f"skipped={res['skipped']} ({rate:,.0f} rows/s; stage {res['stage_s']:.1f}s, upsert {res['upsert_s']:.1f}s)")
+
+# ---------- BENCHMARK ----------
+
+BENCH_DDL = """
+    CREATE TEMP TABLE posters_bench (
+        id BIGSERIAL PRIMARY KEY,
+        description TEXT, tags TEXT,
+        likes_count INT DEFAULT 0, views_count INT DEFAULT 0,
+        shared_url TEXT UNIQUE,
+        created_at TIMESTAMPTZ, updated_at TIMESTAMPTZ,
+        author_id INT, category TEXT,
+        is_published BOOLEAN DEFAULT FALSE, updated_by TEXT
+    )
+"""
 
-    for rec in iter_import_records(args.path):
-        total += 1
+def write_fixture(path: str, rows: int, seed_offset: int = 0):
+    """NDJSON fixture of `rows` posters with unique shared_urls."""
+    cats = ["fantasy", "sci_fi", "horror", "comedy", "drama", "action"]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(rows):
+            f.write(json.dumps({
+                "description": f"Poster {i} \t with a tab, a \\ backslash and a\nnewline" if i % 1000 == 0
+                               else f"Poster {i} - neon skyline over a rainy city",
+                "tags": "bench,fixture", "likes_count": (i + seed_offset) % 97,
+                "views_count": (i * 7 + seed_offset) % 1009,
+                "shared_url": f"https://example.com/p/{i}",
+                "created_at": "2025-01-01T00:00:00Z", "updated_at": None,
+                "author_id": i % 5000, "category": cats[i % len(cats)],
+                "is_published": i % 3 == 0, "updated_by": None,
+            }) + "\n")
+
+def _legacy_import(connect, records: List[Dict[str, Any]], table: str) -> float:
+    """
+    The old per-row import, as cmd_import ran it before the bulk engine: for each
+    row an upsert (q_exec_returning) and an existence probe (q_select), each on a
+    connection of its own from `connect`.
+    """
+    upsert = f"""
+        INSERT INTO {table}
+        (description, tags, likes_count, views_count, shared_url,
+         created_at, updated_at, author_id, category, is_published, updated_by)
+        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        ON CONFLICT (shared_url) DO UPDATE
+        SET description = EXCLUDED.description,
+            tags = EXCLUDED.tags,
+            likes_count = EXCLUDED.likes_count,
+            views_count = EXCLUDED.views_count,
+            author_id = EXCLUDED.author_id,
+            category = EXCLUDED.category,
+            is_published = EXCLUDED.is_published,
+            updated_by = EXCLUDED.updated_by,
+            updated_at = COALESCE(EXCLUDED.updated_at, NOW())
+        RETURNING id;
+    """
+    probe = f"SELECT 1 FROM {table} WHERE shared_url = %s"
+    t0 = time.perf_counter()
+    for rec in records:
         r = normalize_rec(rec)
-
-        # Convert timestamps if strings
-        for ts_key in ("created_at", "updated_at"):
-            v = r.get(ts_key)
-            if isinstance(v, str):
-                try:
-                    # let postgres handle most formats, but keep as string
-                    pass
-                except Exception:
-                    r[ts_key] = None
-
-        if key == "url":
-            if not r.get("shared_url"):
-                print(f"[skip] row {total}: missing shared_url", file=sys.stderr)
-                continue
-
-            sql = f"""
-                INSERT INTO {TABLE}
-                (description, tags, likes_count, views_count, shared_url,
-                 created_at, updated_at, author_id, category, is_published, updated_by)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                ON CONFLICT (shared_url) DO UPDATE
-                SET description = EXCLUDED.description,
-                    tags = EXCLUDED.tags,
-                    likes_count = EXCLUDED.likes_count,
-                    views_count = EXCLUDED.views_count,
-                    author_id = EXCLUDED.author_id,
-                    category = EXCLUDED.category,
-                    is_published = EXCLUDED.is_published,
-                    updated_by = EXCLUDED.updated_by,
-                    updated_at = COALESCE(EXCLUDED.updated_at, NOW())
-                RETURNING id;
-            """
-            params = (
-                r["description"], r["tags"], r["likes_count"], r["views_count"], r["shared_url"],
-                r["created_at"], r["updated_at"], r["author_id"], r["category"], r["is_published"], r["updated_by"]
-            )
-        else:
-            # conflict on id (requires id present)
-            if not r.get("id"):
-                print(f"[skip] row {total}: missing id for on-conflict=id", file=sys.stderr)
-                continue
-            sql = f"""
-                INSERT INTO {TABLE}
-                (id, description, tags, likes_count, views_count, shared_url,
-                 created_at, updated_at, author_id, category, is_published, updated_by)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                ON CONFLICT (id) DO UPDATE
-                SET description = EXCLUDED.description,
-                    tags = EXCLUDED.tags,
-                    likes_count = EXCLUDED.likes_count,
-                    views_count = EXCLUDED.views_count,
-                    shared_url = EXCLUDED.shared_url,
-                    author_id = EXCLUDED.author_id,
-                    category = EXCLUDED.category,
-                    is_published = EXCLUDED.is_published,
-                    updated_by = EXCLUDED.updated_by,
-                    updated_at = COALESCE(EXCLUDED.updated_at, NOW())
-                RETURNING id;
-            """
-            params = (
-                r["id"], r["description"], r["tags"], r["likes_count"], r["views_count"], r["shared_url"],
-                r["created_at"], r["updated_at"], r["author_id"], r["category"], r["is_published"], r["updated_by"]
-            )
-
-        if dry:
-            upserts += 1
-            continue
-
-        row = q_exec_returning(sql, params)
-        if row:
-            # Can't easily tell insert vs update without additional checks;
-            # treat as upsert and count inserts by probing previous existence quickly
-            if key == "url":
-                existed = q_select(f"SELECT 1 FROM {TABLE} WHERE shared_url = %s", (r["shared_url"],))
-            else:
-                existed = q_select(f"SELECT 1 FROM {TABLE} WHERE id = %s", (r["id"],))
-            if existed:
-                upserts += 1
-            else:
-                inserts += 1
-
-    if dry:
-        print(f"(dry-run) would upsert {upserts} of {total} records")
-    else:
-        print(f"import complete: processed={total}, upserts={upserts}, inserts~={inserts}")
+        params = tuple(r[c] for c in COLUMNS if c != "id")
+        for sql, args in ((upsert, params), (probe, (r["shared_url"],))):
+            conn = connect()
+            try:
+                with conn:
+                    with conn.cursor() as cur:
+                        cur.execute(sql, args)
+                        cur.fetchall()
+            finally:
+                conn.close()
+    return time.perf_counter() - t0
+
+def cmd_bench(args):
+    """Import/export throughput on a temp table (nothing in public.posters is touched)."""
+    workdir = tempfile.mkdtemp(prefix="toolkit-bench-")
+    fixture = os.path.join(workdir, "fixture.ndjson")
+    t0 = time.perf_counter()
+    write_fixture(fixture, args.rows)
+    print(f"fixture: {args.rows:,} rows, {os.path.getsize(fixture) / 1e6:.0f} MB in {time.perf_counter() - t0:.1f}s")
+
+    conn = get_conn()
+    results = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute(BENCH_DDL)
+        conn.commit()
+        table = "posters_bench"
+
+        for method in args.methods:
+            with conn.cursor() as cur:
+                cur.execute(f"TRUNCATE {table} RESTART IDENTITY")
+            conn.commit()
+            for phase in ("insert", "update"):
+                res = bulk_import(conn, iter_import_records(fixture), table=table, method=method,
+                                  batch_size=args.batch_size)
+                secs = res["stage_s"] + res["upsert_s"]
+                results.append((f"import {method} ({phase})", res["staged"], secs,
+                                f"ins={res['inserted']:,} upd={res['updated']:,}"))
+
+        for fmt in ("ndjson", "csv"):
+            out_path = os.path.join(workdir, f"export.{fmt}")
+            t0 = time.perf_counter()
+            with open(out_path, "w", encoding="utf-8", newline="") as f:
+                n = bulk_export(conn, f, fmt, table=table, batch_size=args.batch_size)
+            results.append((f"export {fmt}", n, time.perf_counter() - t0,
+                            f"{os.path.getsize(out_path) / 1e6:.0f} MB"))
+
+        if args.legacy_sample:
+            sample = [r for _, r in zip(range(args.legacy_sample), iter_import_records(fixture))]
+            with conn.cursor() as cur:
+                cur.execute(f"TRUNCATE {table}")
+            conn.commit()
+            secs = _legacy_import(get_conn, sample, table)
+            results.append(("import per-row (legacy)", len(sample), secs, "2 connections/row, as before"))
+    finally:
+        conn.close()
+        if not args.keep_fixture:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{'scenario':<28} {'rows':>10} {'seconds':>9} {'rows/s':>12}  notes")
+    for name, rows, secs, notes in results:
+        print(f"{name:<28} {rows:>10,} {secs:>9.2f} {rows / max(secs, 1e-9):>12,.0f}  {notes}")
+    if args.keep_fixture:
+        print(f"fixture kept in {workdir}")
 
 # ---------- ARGPARSE ----------
 
@@ -483,18 +725,29 @@ def build_parser():
 
     sp = sub.add_parser("export")
     sp.add_argument("path")
-    sp.add_argument("--format", choices=["json", "ndjson"])
+    sp.add_argument("--format", choices=["json", "ndjson", "csv"])
     sp.add_argument("--author", type=int)
     sp.add_argument("--category")
     sp.add_argument("--published")
+    sp.add_argument("--batch-size", type=int, default=BATCH_SIZE)
     sp.set_defaults(func=cmd_export)
 
     sp = sub.add_parser("import")
     sp.add_argument("path")
     sp.add_argument("--on-conflict", choices=["url", "id"], default="url")
+    sp.add_argument("--method", choices=["copy", "values"], default="copy")
+    sp.add_argument("--batch-size", type=int, default=BATCH_SIZE)
     sp.add_argument("--dry-run", action="store_true")
     sp.set_defaults(func=cmd_import)
 
+    sp = sub.add_parser("bench")
+    sp.add_argument("--rows", type=int, default=1_000_000)
+    sp.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    sp.add_argument("--methods", nargs="+", choices=["copy", "values"], default=["copy", "values"])
+    sp.add_argument("--legacy-sample", type=int, default=2000, help="rows to time through the old per-row path (0: skip)")
+    sp.add_argument("--keep-fixture", action="store_true")
+    sp.set_defaults(func=cmd_bench)
+
     return p
 
 def main():
@@ -36,10 +36,13 @@ if [ -d "frontend" ] && [ ! -d "backend/static/assets" ]; then
 fi
 
 # Initialize database and start application
-echo "Initializing database..."
+echo "Migrating database..."
 if [ -d "backend" ]; then
     cd backend
-    python -c "from models import init_db; init_db()" 2>/dev/null || echo "Database initialization skipped"
+    python migrate.py upgrade || echo "Database migration skipped"
+
+    # Fingerprint + precompress static assets
+    python build_assets.py || echo "Static asset build skipped"
 
     # Start the application with gunicorn
     echo "Starting Flask application with gunicorn..."
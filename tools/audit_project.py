@@ -2,13 +2,21 @@
 """
 Audit Mini-Visionary: find unused assets, scripts, styles; spot orphaned HTML/JS; list Flask routes.
 
-- Scans references in .html/.js/.css/.py
-- Compares against files under backend/static and templates
-- Emits JSON + markdown reports in tools/_reports/
+- One walk over backend/; each file is read once and every pattern that
+  applies to it runs in that pass (refs, on* calls, JS defs, routes, asset hash)
+- Files are scanned on a process pool; results are cached in
+  tools/_reports/.audit_cache.json keyed on (mtime, size), so re-runs only
+  rescan what changed
+- Compares references against files under backend/static and templates
+- Emits JSON + markdown reports in tools/_reports/, with wall time per phase
+
+Usage:
+  python tools/audit_project.py [--jobs N] [--no-cache]
 """
 from __future__ import annotations
-import os, re, json, hashlib, pathlib
-from collections import defaultdict
+import os, re, json, time, hashlib, pathlib, argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 STATIC_DIR = ROOT / "backend" / "static"
@@ -16,28 +24,15 @@ TEMPLATES_DIR = ROOT / "backend" / "templates" if (ROOT / "backend" / "templates
 BACKEND_DIR = ROOT / "backend"
 REPORT_DIR = ROOT / "tools" / "_reports"
 REPORT_DIR.mkdir(parents=True, exist_ok=True)
+CACHE_PATH = REPORT_DIR / ".audit_cache.json"
+CACHE_VERSION = 1  # bump when patterns or the per-file result shape change
 
 CODE_EXTS = (".py", ".js", ".ts", ".css", ".html")
+JS_DEF_EXTS = (".js", ".ts", ".html")
 ASSET_EXTS = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico", ".ttf", ".woff", ".woff2", ".mp3", ".wav", ".mp4")
-
-def iter_files(base: pathlib.Path, exts: tuple[str,...]):
-    for p in base.rglob("*"):
-        if p.is_file() and p.suffix.lower() in exts:
-            yield p
-
-def sha1(path: pathlib.Path) -> str:
-    h = hashlib.sha1()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(65536), b""):
-            h.update(chunk)
-    return h.hexdigest()[:12]
-
-def gather_all_assets():
-    assets = []
-    for p in iter_files(STATIC_DIR, ASSET_EXTS):
-        rel = p.relative_to(ROOT).as_posix()
-        assets.append({"path": rel, "size": p.stat().st_size, "hash": sha1(p)})
-    return assets
+SKIP_DIRS = {"__pycache__", "node_modules", "_build", ".git"}  # _build: generated by build_assets.py
+# below this many changed files, pool startup costs more than it saves
+POOL_MIN_FILES = 32
 
 # Very simple reference patterns (cover most cases)
 ASSET_PAT = re.compile(r"""(?:src|href)\s*=\s*["']([^"']+)["']""")
@@ -54,61 +49,142 @@ def normalize_ref(ref: str) -> str:
         ref = ref.lstrip("/")
     return ref
 
-def scan_code_refs():
-    refs = set()
-    js_funcs_called = set()
-    for base in (BACKEND_DIR, STATIC_DIR, TEMPLATES_DIR):
-        for p in iter_files(base, CODE_EXTS):
-            try:
-                txt = p.read_text(encoding="utf-8", errors="ignore")
-            except Exception:
-                continue
-            for m in ASSET_PAT.finditer(txt):
-                refs.add(normalize_ref(m.group(1)))
-            for m in CSS_URL_PAT.finditer(txt):
-                refs.add(normalize_ref(m.group(1)))
-            for m in IMPORT_PAT.finditer(txt):
-                g = m.group(1) or m.group(2)
-                if g: refs.add(normalize_ref(g))
-            for m in LINK_CSS_PAT.finditer(txt):
+def sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+# ---------- phases ----------
+
+TIMINGS: dict[str, float] = {}
+
+@contextmanager
+def phase(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        TIMINGS[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+# ---------- walk ----------
+
+def roles_for(path: pathlib.Path) -> tuple[str, ...]:
+    """Which scans apply to a file; the old per-pass directory/extension rules."""
+    ext = path.suffix.lower()
+    in_static = STATIC_DIR in path.parents
+    roles = []
+    if ext in CODE_EXTS and (BACKEND_DIR in path.parents or TEMPLATES_DIR in path.parents):
+        roles.append("code")
+    if ext in JS_DEF_EXTS and in_static:
+        roles.append("jsdef")
+    if ext == ".py":
+        roles.append("routes")
+    if ext in ASSET_EXTS and in_static:
+        roles.append("asset")
+    return tuple(roles)
+
+def walk() -> dict[str, dict]:
+    """rel path -> {abs, roles, mtime, size} for every file some scan applies to."""
+    files = {}
+    bases = {BACKEND_DIR, STATIC_DIR, TEMPLATES_DIR}
+    # drop bases nested inside another base so each file is visited once
+    for base in sorted(b for b in bases if not any(o in b.parents for o in bases)):
+        for dirpath, dirnames, filenames in os.walk(base):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+            for name in filenames:
+                p = pathlib.Path(dirpath, name)
+                roles = roles_for(p)
+                if not roles:
+                    continue
+                st = p.stat()
+                files[p.relative_to(ROOT).as_posix()] = {
+                    "abs": str(p), "roles": roles, "mtime": st.st_mtime_ns, "size": st.st_size}
+    return files
+
+# ---------- per-file scan (runs in the pool) ----------
+
+def scan_file(job: tuple[str, tuple[str, ...]]) -> dict:
+    path, roles = job
+    out = {"refs": [], "calls": [], "defs": [], "routes": [], "hash": None}
+    if "asset" in roles:
+        out["hash"] = sha1(path)
+    if not {"code", "jsdef", "routes"} & set(roles):
+        return out
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            txt = f.read()
+    except Exception:
+        return out
+
+    if "code" in roles:
+        refs, calls = set(), set()
+        for pat in (ASSET_PAT, CSS_URL_PAT, LINK_CSS_PAT):
+            for m in pat.finditer(txt):
                 refs.add(normalize_ref(m.group(1)))
-            for m in ONCALL_PAT.finditer(txt):
-                js_funcs_called.add(m.group(1))
-    return refs, js_funcs_called
-
-def scan_js_defined_funcs():
-    funcs = set()
-    for p in iter_files(STATIC_DIR, (".js", ".ts", ".html")):
-        try:
-            txt = p.read_text(encoding="utf-8", errors="ignore")
-        except Exception:
-            continue
-        for m in FUNC_DEF_JS.finditer(txt):
-            for g in m.groups():
-                if g:
-                    funcs.add(g)
-    return funcs
-
-def list_flask_routes():
-    routes = set()
-    for p in iter_files(BACKEND_DIR, (".py",)):
-        try:
-            txt = p.read_text(encoding="utf-8", errors="ignore")
-        except Exception:
-            continue
-        for m in FLASK_ROUTE_PAT.finditer(txt):
-            route = m.group(1) or m.group(2)
-            if route:
-                routes.add(route)
-    return sorted(routes)
+        for m in IMPORT_PAT.finditer(txt):
+            g = m.group(1) or m.group(2)
+            if g: refs.add(normalize_ref(g))
+        for m in ONCALL_PAT.finditer(txt):
+            calls.add(m.group(1))
+        out["refs"], out["calls"] = sorted(refs), sorted(calls)
+    if "jsdef" in roles:
+        out["defs"] = sorted({g for m in FUNC_DEF_JS.finditer(txt) for g in m.groups() if g})
+    if "routes" in roles:
+        out["routes"] = sorted({m.group(1) or m.group(2) for m in FLASK_ROUTE_PAT.finditer(txt)} - {None})
+    return out
 
-def main():
-    assets = gather_all_assets()
+# ---------- cache ----------
+
+def load_cache() -> dict:
+    try:
+        data = json.loads(CACHE_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return data.get("files", {}) if data.get("version") == CACHE_VERSION else {}
+
+def save_cache(entries: dict):
+    tmp = CACHE_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"version": CACHE_VERSION, "files": entries}), encoding="utf-8")
+    os.replace(tmp, CACHE_PATH)
+
+def scan_all(files: dict[str, dict], cache: dict, jobs: int) -> tuple[dict[str, dict], int]:
+    """Per-file results for every walked file; only files whose (mtime, size, roles) changed are rescanned."""
+    results, todo = {}, []
+    for rel, f in files.items():
+        hit = cache.get(rel)
+        if hit and hit["mtime"] == f["mtime"] and hit["size"] == f["size"] and tuple(hit["roles"]) == f["roles"]:
+            results[rel] = hit
+        else:
+            todo.append(rel)
+
+    jobs_in = [(files[rel]["abs"], files[rel]["roles"]) for rel in todo]
+    if len(todo) >= POOL_MIN_FILES and jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            scanned = list(pool.map(scan_file, jobs_in, chunksize=max(1, len(todo) // (jobs * 4))))
+    else:
+        scanned = [scan_file(j) for j in jobs_in]
+
+    for rel, res in zip(todo, scanned):
+        f = files[rel]
+        results[rel] = {**res, "mtime": f["mtime"], "size": f["size"], "roles": list(f["roles"])}
+    return results, len(todo)
+
+# ---------- report ----------
+
+def build_report(files: dict[str, dict], results: dict[str, dict]) -> dict:
+    assets = [{"path": rel, "size": results[rel]["size"], "hash": results[rel]["hash"]}
+              for rel in sorted(results) if "asset" in files[rel]["roles"]]
     asset_paths = {a["path"] for a in assets}
 
-    refs, js_calls = scan_code_refs()
-    js_defs = scan_js_defined_funcs()
-    routes = list_flask_routes()
+    refs, js_calls, js_defs, routes = set(), set(), set(), set()
+    for res in results.values():
+        refs.update(res["refs"])
+        js_calls.update(res["calls"])
+        js_defs.update(res["defs"])
+        routes.update(res["routes"])
+    routes = sorted(routes)
 
     # Map referenced paths to on-disk existence
     missing_refs = []
@@ -137,7 +213,7 @@ def main():
     # JS usage gaps
     js_missing_impl = sorted(js_calls - js_defs)
 
-    report = {
+    return {
         "summary": {
             "asset_count": len(assets),
             "referenced_asset_count": len(referenced_assets),
@@ -159,9 +235,7 @@ def main():
         "routes": routes,
     }
 
-    (REPORT_DIR / "audit.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
-
-    # Also emit a human-readable checklist
+def write_markdown(report: dict):
     lines = []
     s = report["summary"]
     lines.append("# Mini-Visionary Audit Report\n")
@@ -191,12 +265,40 @@ def main():
         lines.append(f"- {f}()")
 
     (REPORT_DIR / "audit.md").write_text("\n".join(lines), encoding="utf-8")
+
+def main():
+    ap = argparse.ArgumentParser(description="Audit static assets, JS wiring and Flask routes")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="scanner processes (1: scan inline)")
+    ap.add_argument("--no-cache", action="store_true", help="ignore and rebuild the per-file cache")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    with phase("walk"):
+        files = walk()
+    with phase("cache_load"):
+        cache = {} if args.no_cache else load_cache()
+    with phase("scan"):
+        results, rescanned = scan_all(files, cache, args.jobs)
+    with phase("resolve"):
+        report = build_report(files, results)
+    report["timings_ms"] = dict(TIMINGS)
+    with phase("write"):
+        (REPORT_DIR / "audit.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+        write_markdown(report)
+        save_cache(results)
+    total_ms = round((time.perf_counter() - t0) * 1000, 1)
+
+    s = report["summary"]
     print(f"[OK] Wrote {REPORT_DIR/'audit.json'} and {REPORT_DIR/'audit.md'}")
     print(f"\n[SUMMARY]")
     print(f"   - Orphan assets: {s['orphan_asset_count']}")
     print(f"   - Missing references: {s['missing_reference_count']}")
     print(f"   - JS missing implementations: {s['js_missing_implementations']}")
     print(f"   - Flask routes: {s['flask_routes_count']}")
+    print(f"\n[TIMING] {len(files)} files, {rescanned} rescanned, {len(files) - rescanned} from cache")
+    for name, ms in TIMINGS.items():
+        print(f"   - {name:<10} {ms:8.1f} ms")
+    print(f"   - {'total':<10} {total_ms:8.1f} ms")
 
 if __name__ == "__main__":
     main()
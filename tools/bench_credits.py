@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the credit engine (backend/wallet.py).
+
+Runs N parallel debits against one user and checks for lost updates:
+  final_balance == start - successes * cost  and  ledger rows == successes
+
+Also runs the legacy read-modify-write pattern (user.credits -= n) for comparison.
+
+Usage:
+  python tools/bench_credits.py [--url DATABASE_URL] [--threads 16] [--ops 400] [--cost 1]
+
+Defaults to a throwaway SQLite file; point --url at Postgres for realistic numbers.
+"""
+from __future__ import annotations
+import argparse, os, sys, tempfile, threading, time, pathlib
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+
+def build_engine(url: str):
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+    if url.startswith("sqlite"):
+        # one connection per session so transactions really interleave
+        return create_engine(url, poolclass=NullPool, connect_args={"timeout": 60, "check_same_thread": False})
+    return create_engine(url, pool_size=32, max_overflow=32)
+
+
+def legacy_spend(user_id: int, cost: int) -> bool:
+    from models import get_session, User
+    with get_session() as s:
+        user = s.get(User, user_id)
+        if user.credits < cost:
+            return False
+        current = user.credits
+        time.sleep(0.0005)  # widen the race window like a real request would
+        user.credits = current - cost
+        s.commit()
+        return True
+
+
+def engine_spend(user_id: int, cost: int) -> bool:
+    import wallet
+    return wallet.spend_credits(user_id, cost, notes="bench")
+
+
+def run(label: str, fn, user_id: int, start: int, threads: int, ops: int, cost: int):
+    from models import get_session, User, CreditLedger
+
+    with get_session() as s:
+        s.query(CreditLedger).filter_by(user_id=user_id).delete()
+        s.get(User, user_id).credits = start
+        s.commit()
+
+    successes = 0
+    errors = 0
+    lock = threading.Lock()
+    per_thread = ops // threads
+
+    def worker():
+        nonlocal successes, errors
+        for _ in range(per_thread):
+            try:
+                ok = fn(user_id, cost)
+            except Exception:
+                ok = None
+            with lock:
+                if ok:
+                    successes += 1
+                elif ok is None:
+                    errors += 1
+
+    t0 = time.perf_counter()
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    dt = time.perf_counter() - t0
+
+    with get_session() as s:
+        final = s.get(User, user_id).credits
+        ledger = s.query(CreditLedger).filter_by(user_id=user_id).count()
+
+    expected = start - successes * cost
+    lost = final - expected
+    print(f"[{label}] ops={per_thread * threads} ok={successes} errors={errors} "
+          f"time={dt:.2f}s rate={per_thread * threads / dt:.0f} ops/s")
+    print(f"[{label}] final={final} expected={expected} lost_updates={lost // cost if cost else lost} ledger_rows={ledger}")
+    return lost == 0 and (fn is legacy_spend or ledger == successes)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Credit engine concurrency benchmark")
+    ap.add_argument("--url", default=os.getenv("BENCH_DATABASE_URL"))
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--ops", type=int, default=400)
+    ap.add_argument("--cost", type=int, default=1)
+    args = ap.parse_args()
+
+    url = args.url or f"sqlite:///{tempfile.mkdtemp()}/bench_credits.db"
+    os.environ["DATABASE_URL"] = url
+
+    import models
+    models._engine = build_engine(url)
+    models.Base.metadata.create_all(bind=models._engine)
+
+    with models.get_session() as s:
+        user = models.User(email=f"bench-{time.time_ns()}@example.com", credits=0)
+        s.add(user)
+        s.commit()
+        user_id = user.id
+
+    # start with fewer credits than requested ops so the "insufficient" branch races too
+    start = (args.ops * args.cost) * 3 // 4
+
+    legacy_ok = run("legacy", legacy_spend, user_id, start, args.threads, args.ops, args.cost)
+    engine_ok = run("engine", engine_spend, user_id, start, args.threads, args.ops, args.cost)
+
+    print(f"\nlegacy consistent: {legacy_ok}   engine consistent: {engine_ok}")
+    sys.exit(0 if engine_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
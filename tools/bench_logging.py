@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Logging overhead per request, before and after backend/logconfig.py.
+
+A minimal Flask app runs app.py's request_start / request_end hooks plus the
+five lines auth_required wrote for an authenticated request. Every mode logs
+the same records at the same levels (auth lines at --auth-level, INFO by
+default), so only the pipeline differs:
+
+  none     logging off (baseline for the per-request cost)
+  sync     old setup: StreamHandler + JsonFormatter on the request thread
+  async    logconfig: QueueHandler -> listener thread
+  sampled  async with LOG_SAMPLE=root=0.1,auth=0.1
+
+--auth-level DEBUG shows the effect of demoting the auth lines instead: they
+are dropped by the level check in every mode.
+
+Records go to a temp file. --write-delay-us adds a sleep to every write to
+imitate a slow or backed-up stdout pipe (this is where sync logging stalls
+requests). The overhead is (mode - none) per request, measured on the
+request thread.
+
+Usage:
+  python tools/bench_logging.py [--requests 5000] [--threads 1] [--write-delay-us 0] [--auth-level INFO]
+"""
+from __future__ import annotations
+import argparse, io, logging, os, sys, tempfile, threading, time, pathlib, uuid
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+
+class SlowFile(io.TextIOWrapper):
+    delay = 0.0
+
+    def write(self, s):
+        if self.delay:
+            time.sleep(self.delay)
+        return super().write(s)
+
+
+def build_app(auth_level: int):
+    from flask import Flask, g, request
+    app = Flask("bench")
+    auth_log = logging.getLogger("auth")
+
+    @app.before_request
+    def _before():
+        g.request_id = request.headers.get("X-Request-ID") or str(uuid.uuid4())
+        g._t0 = time.time()
+        logging.info("request_start", extra={"rid": g.request_id, "method": request.method, "path": request.path,
+                                             "ip": request.remote_addr, "ua": request.headers.get("user-agent")})
+
+    @app.after_request
+    def _after(response):
+        logging.info("request_end", extra={"rid": g.request_id, "status": response.status_code,
+                                           "duration_ms": round((time.time() - g._t0) * 1000, 2),
+                                           "length": response.calculate_content_length()})
+        return response
+
+    @app.get("/api/me")
+    def me():
+        hdr = request.headers.get("Authorization", "")
+        token = hdr.split(" ", 1)[1]
+        auth_log.log(auth_level, "[auth_required] Checking auth for %s", request.endpoint)
+        auth_log.log(auth_level, "[auth_required] Auth header: %s", hdr[:20] + "...")
+        auth_log.log(auth_level, "[auth_required] Token extracted: %s", token[:20] + "...")
+        auth_log.log(auth_level, "[auth_required] Token decoded successfully, user_id=%s", "42")
+        auth_log.log(auth_level, "[auth_required] User found: %s", "user@example.com")
+        return {"ok": True, "user_id": 42}
+
+    return app
+
+
+def configure(mode: str, out) -> None:
+    import logconfig
+    root = logging.getLogger()
+    logconfig.stop()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.setLevel(logging.INFO)
+    if mode == "none":
+        root.setLevel(logging.CRITICAL)
+        return
+    sys.stdout, saved = out, sys.stdout
+    try:
+        if mode == "sync":
+            logconfig.LOG_ASYNC = False
+            logconfig.init(logging.INFO)
+        else:
+            logconfig.LOG_ASYNC = True
+            os.environ["LOG_SAMPLE"] = "root=0.1,auth=0.1" if mode == "sampled" else ""  # logging.info() -> "root"
+            logconfig.init(logging.INFO)
+    finally:
+        sys.stdout = saved
+
+
+def run(mode: str, n: int, threads: int, auth_level: int, out) -> dict:
+    import logconfig
+    configure(mode, out)
+    app = build_app(auth_level)
+    headers = {"Authorization": "Bearer " + "x" * 120, "User-Agent": "bench"}
+    per_thread = n // threads
+    times: list[float] = []
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        local = []
+        for _ in range(per_thread):
+            t0 = time.perf_counter()
+            client.get("/api/me", headers=headers)
+            local.append(time.perf_counter() - t0)
+        with lock:
+            times.extend(local)
+
+    client = app.test_client()
+    for _ in range(50):  # warm up
+        client.get("/api/me", headers=headers)
+    t0 = time.perf_counter()
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    wall = time.perf_counter() - t0
+    t1 = time.perf_counter()
+    logconfig.stop()  # drain the queue
+    drain = time.perf_counter() - t1
+    out.flush()
+    times.sort()
+    return {"mode": mode, "requests": len(times), "rps": len(times) / wall,
+            "mean_us": sum(times) / len(times) * 1e6, "p99_us": times[int(len(times) * 0.99)] * 1e6,
+            "drain_ms": drain * 1000}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--threads", type=int, default=1)
+    ap.add_argument("--write-delay-us", type=float, default=0.0)
+    ap.add_argument("--modes", default="none,sync,async,sampled")
+    ap.add_argument("--auth-level", default="INFO", choices=["DEBUG", "INFO"], help="level of the auth_required lines")
+    args = ap.parse_args()
+
+    SlowFile.delay = args.write_delay_us / 1e6
+    with tempfile.TemporaryDirectory() as tmp:
+        rows = []
+        for mode in args.modes.split(","):
+            path = os.path.join(tmp, f"{mode}.log")
+            with SlowFile(open(path, "wb"), encoding="utf-8", line_buffering=False) as out:
+                rows.append(run(mode, args.requests, args.threads, getattr(logging, args.auth_level), out))
+            rows[-1]["lines"] = sum(1 for _ in open(path))
+
+    base = next((r["mean_us"] for r in rows if r["mode"] == "none"), 0.0)
+    print(f"{args.requests} requests, {args.threads} threads, write delay {args.write_delay_us:g}us, "
+          f"auth lines at {args.auth_level}")
+    print(f"{'mode':8} {'rps':>8} {'mean us':>9} {'p99 us':>9} {'log us/req':>11} {'lines':>7} {'drain ms':>9}")
+    for r in rows:
+        print(f"{r['mode']:8} {r['rps']:8.0f} {r['mean_us']:9.1f} {r['p99_us']:9.1f} "
+              f"{r['mean_us'] - base:11.1f} {r['lines']:7d} {r['drain_ms']:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Concurrent logins under a gevent worker, before and after backend/passwords.py.
+
+Each mode runs in its own process (gevent monkey-patching is process-wide),
+serving a minimal Flask app with gevent's WSGI server:
+
+  POST /login   verifies a bcrypt hash
+  GET  /ping    does nothing (stands in for every other request in the worker)
+
+  inline   the old way: Flask-Bcrypt on the request greenlet, blocking the hub
+  pool     passwords.check_password(): native-thread pool, the hub keeps running
+
+--logins greenlets log in back to back while one client pings the worker.
+Ping latency shows how long other requests are starved. In inline mode it
+approaches the bcrypt time times the queue of logins; in pool mode it stays
+at a few milliseconds.
+
+Usage:
+  python tools/bench_passwords.py [--logins 8] [--seconds 5] [--rounds 12] [--threads 2]
+"""
+from __future__ import annotations
+import argparse, json, os, subprocess, sys, pathlib
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+
+def child(mode: str, args) -> dict:
+    from gevent import monkey
+    monkey.patch_all()
+    import time
+    import gevent
+    from gevent.pywsgi import WSGIServer
+    import requests
+    from flask import Flask, request
+    from flask_bcrypt import Bcrypt
+
+    os.environ["PASSWORD_HASH_THREADS"] = str(args.threads)
+    sys.path.insert(0, str(ROOT / "backend"))
+    import passwords
+
+    password = "correct horse battery staple"
+    hashed = passwords._hash(password, args.rounds)
+    flask_bcrypt = Bcrypt()
+    app = Flask("bench")
+
+    @app.post("/login")
+    def login():
+        pw = request.get_json()["password"]
+        ok = flask_bcrypt.check_password_hash(hashed, pw) if mode == "inline" else passwords.check_password(hashed, pw)
+        return {"ok": ok}
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    server = WSGIServer(("127.0.0.1", 0), app, log=None)
+    server.start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    deadline = time.monotonic() + args.seconds
+    logins, pings = [], []
+
+    def login_loop():
+        s = requests.Session()
+        while time.monotonic() < deadline:
+            t0 = time.perf_counter()
+            assert s.post(f"{base}/login", json={"password": password}).json()["ok"]
+            logins.append(time.perf_counter() - t0)
+
+    def ping_loop():
+        s = requests.Session()
+        gevent.sleep(0.05)
+        while time.monotonic() < deadline:
+            t0 = time.perf_counter()
+            s.get(f"{base}/ping")
+            pings.append(time.perf_counter() - t0)
+            gevent.sleep(0.01)
+
+    gevent.joinall([gevent.spawn(login_loop) for _ in range(args.logins)] + [gevent.spawn(ping_loop)])
+    server.stop()
+    pings.sort()
+    logins.sort()
+    return {"mode": mode, "logins": len(logins), "login_rps": len(logins) / args.seconds,
+            "login_p50_ms": logins[len(logins) // 2] * 1000 if logins else 0.0,
+            "pings": len(pings), "ping_p50_ms": pings[len(pings) // 2] * 1000,
+            "ping_p99_ms": pings[int(len(pings) * 0.99)] * 1000, "ping_max_ms": pings[-1] * 1000}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--logins", type=int, default=8, help="concurrent login clients")
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--rounds", type=int, default=12, help="bcrypt cost of the stored hash")
+    ap.add_argument("--threads", type=int, default=2, help="PASSWORD_HASH_THREADS for pool mode")
+    ap.add_argument("--modes", default="inline,pool")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.child, args)))
+        return
+
+    rows = []
+    for mode in args.modes.split(","):
+        out = subprocess.run([sys.executable, __file__, "--child", mode, "--logins", str(args.logins),
+                              "--seconds", str(args.seconds), "--rounds", str(args.rounds),
+                              "--threads", str(args.threads)], capture_output=True, text=True, check=True)
+        rows.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{args.logins} concurrent logins for {args.seconds:g}s, bcrypt cost {args.rounds}, "
+          f"{args.threads} hashing threads, {os.cpu_count()} CPUs")
+    print(f"{'mode':7} {'logins':>7} {'login/s':>8} {'login p50':>10} {'pings':>6} {'ping p50':>9} "
+          f"{'ping p99':>9} {'ping max':>9}")
+    for r in rows:
+        print(f"{r['mode']:7} {r['logins']:7d} {r['login_rps']:8.1f} {r['login_p50_ms']:8.0f}ms {r['pings']:6d} "
+              f"{r['ping_p50_ms']:7.1f}ms {r['ping_p99_ms']:7.1f}ms {r['ping_max_ms']:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
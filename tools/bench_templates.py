@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Render-cost benchmark for email templates and purchase receipts.
+
+  before: the pre-change code, loaded from git at the parent of the commit
+          that introduced the compiled templates: the f-string email
+          functions of app_email_templates.py and the receipt f-strings
+          from the app_payments.py views
+  after:  templates compiled once at import, receipts cached by
+          (receipt id, created_at, user updated_at)
+
+The old email functions returned a set literal (`return {{...}}`), which
+raised TypeError after the strings were built. The benchmark returns the
+dict instead; nothing else in the old code is changed.
+
+Usage:
+  python tools/bench_templates.py [--n 20000] [--receipts 500] [--before-rev REV]
+"""
+from __future__ import annotations
+import argparse, re, subprocess, sys, time, pathlib
+from datetime import datetime
+from types import SimpleNamespace
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+
+def timeit(label: str, fn, n: int) -> float:
+    fn()  # warm up
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    dt = time.perf_counter() - t0
+    print(f"  {label:<34} {dt / n * 1e6:9.2f} us/call")
+    return dt / n
+
+
+def _git(*args: str) -> str:
+    return subprocess.check_output(["git", "-C", str(ROOT), *args], text=True)
+
+
+def default_before_rev() -> str:
+    commit = _git("log", "-1", "--format=%H", "--grep", r"^\[user-031\] Compile email").strip()
+    if not commit:
+        sys.exit("can't find the template commit in git history; pass --before-rev")
+    return f"{commit}^"
+
+
+def legacy_templates(rev: str) -> dict:
+    """Namespace of the old app_email_templates module."""
+    src = _git("show", f"{rev}:backend/app_email_templates.py")
+    src = re.sub(r"return \{\{(.*?)\n    \}\}", r"return {\1\n    }", src, flags=re.S)  # set literal -> dict
+    ns: dict = {}
+    exec(compile(src, f"{rev}:backend/app_email_templates.py", "exec"), ns)
+    return ns
+
+
+def legacy_receipts(rev: str) -> dict:
+    """{variant: render(receipt, user, product_info)} built from the old view f-strings."""
+    src = _git("show", f"{rev}:backend/app_payments.py")
+    bodies = re.findall(r'receipt_html = (f""".*?""")', src, re.S)
+    if len(bodies) != 2:
+        sys.exit(f"expected the page and email receipt f-strings in {rev}:backend/app_payments.py")
+    codes = {v: compile(b, f"{rev}:backend/app_payments.py ({v})", "eval") for v, b in zip(("page", "email"), bodies)}
+
+    def renderer(code):
+        return lambda receipt, user, product_info: eval(code, {}, {
+            "receipt": receipt, "user": user, "product_info": product_info})
+    return {v: renderer(c) for v, c in codes.items()}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Template render benchmark")
+    ap.add_argument("--n", type=int, default=20000)
+    ap.add_argument("--receipts", type=int, default=500)
+    ap.add_argument("--before-rev", help="git revision with the old templates (default: parent of the user-031 commit)")
+    args = ap.parse_args()
+
+    rev = args.before_rev or default_before_rev()
+    old_t = legacy_templates(rev)
+    old_r = legacy_receipts(rev)
+
+    import app_email_templates as t
+    import receipts
+
+    print(f"email templates (before = {rev})")
+    before = timeit("welcome: old f-string", lambda: old_t["get_welcome_email_template"]("Ada"), args.n)
+    after = timeit("welcome: precompiled", lambda: t.get_welcome_email_template("Ada"), args.n)
+    print(f"  speedup x{before / after:.1f}")
+    before = timeit("purchase: old f-string",
+                    lambda: old_t["get_purchase_confirmation_template"]("Ada", "$9.00", "Starter Pack"), args.n)
+    after = timeit("purchase: precompiled",
+                   lambda: t.get_purchase_confirmation_template("Ada", "$9.00", "Starter Pack"), args.n)
+    print(f"  speedup x{before / after:.1f}")
+
+    print("receipts")
+    product = {"name": "Starter Pack", "desc": "60 poster credits (6 posters)", "amount_cents": 900}
+    user = SimpleNamespace(email="ada@example.com", updated_at=datetime(2025, 1, 1))
+    rows = [(SimpleNamespace(id=i, amount=60, reference=f"stripe:cs_{i}", created_at=datetime(2025, 1, 1),
+                             notes="checkout purchase 60 credits", sku="starter"), user)
+            for i in range(args.receipts)]
+    per = max(1, args.n // (args.receipts * 10))
+
+    for variant in ("page", "email"):
+        def receipt_old():
+            for r, u in rows:
+                old_r[variant](r, u, product)
+
+        def receipt_cold():
+            receipts.clear_cache()
+            for r, u in rows:
+                receipts.render_receipt(r, u, product, variant)
+
+        def receipt_cached():
+            for r, u in rows:
+                receipts.render_receipt(r, u, product, variant)
+
+        o = timeit(f"{args.receipts} {variant}: old f-string", receipt_old, per) / args.receipts
+        c = timeit(f"{args.receipts} {variant}: compiled, cold", receipt_cold, per) / args.receipts
+        receipt_cached()
+        h = timeit(f"{args.receipts} {variant}: compiled, cached", receipt_cached, per) / args.receipts
+        print(f"  per receipt: old {o * 1e6:.2f} us, cold {c * 1e6:.2f} us (x{o / c:.1f}), "
+              f"cached {h * 1e6:.2f} us (x{o / h:.1f})")
+
+    receipts.clear_cache()
+    t0 = time.perf_counter()
+    bodies = receipts.render_receipts(rows, lambda r: product, variant="email")
+    print(f"  bulk render_receipts({len(bodies)}, email): {(time.perf_counter() - t0) * 1e3:.1f} ms")
+    print(f"  cache: {receipts.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
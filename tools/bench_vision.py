@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Vision input size and cost, before and after backend/vision_input.py.
+
+Builds a synthetic phone-camera photo (4032x3024 JPEG by default, with
+sensor-like noise so it compresses like a real one) and compares:
+
+  raw       what remix_poster used to send: the upload, base64-encoded
+  prepared  vision_input.data_url(): draft decode, 768 px long side, JPEG
+  cached    the same call again (content-hash cache hit)
+
+For each it reports the base64 payload size, the time to prepare it, the
+upload time at --uplink-mbps, and the image tokens GPT-4o bills at
+detail=high (512 px tiles after fitting in 2048 and scaling the short
+side to 768).
+
+Usage:
+  python tools/bench_vision.py [--width 4032 --height 3024] [--uplink-mbps 20] [--runs 5]
+"""
+from __future__ import annotations
+import argparse, io, math, sys, time, pathlib
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+
+def phone_photo(w: int, h: int) -> bytes:
+    from PIL import Image, ImageFilter
+    base = Image.radial_gradient("L").resize((w, h)).convert("RGB")
+    noise = Image.effect_noise((w // 4, h // 4), 60).resize((w, h)).convert("RGB")
+    img = Image.blend(base, noise, 0.5).filter(ImageFilter.DETAIL)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+
+def vision_tokens(w: int, h: int) -> int:
+    scale = min(1.0, 2048 / max(w, h))
+    w, h = w * scale, h * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--width", type=int, default=4032)
+    ap.add_argument("--height", type=int, default=3024)
+    ap.add_argument("--uplink-mbps", type=float, default=20.0)
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    import base64
+    from PIL import Image
+    import vision_input
+
+    photo = phone_photo(args.width, args.height)
+    rows = []
+
+    t0 = time.perf_counter()
+    for _ in range(args.runs):
+        raw = f"data:image/jpeg;base64,{base64.b64encode(photo).decode('ascii')}"
+    rows.append(("raw", len(raw), (time.perf_counter() - t0) / args.runs, (args.width, args.height)))
+
+    times = []
+    for _ in range(args.runs):
+        vision_input.clear()
+        t0 = time.perf_counter()
+        prepared = vision_input.data_url(photo, mime="image/jpeg")
+        times.append(time.perf_counter() - t0)
+    size = Image.open(io.BytesIO(base64.b64decode(prepared.split(",", 1)[1]))).size
+    rows.append(("prepared", len(prepared), sorted(times)[len(times) // 2], size))
+
+    t0 = time.perf_counter()
+    for _ in range(args.runs):
+        vision_input.data_url(photo, mime="image/jpeg")
+    rows.append(("cached", len(prepared), (time.perf_counter() - t0) / args.runs, size))
+
+    print(f"{args.width}x{args.height} JPEG, {len(photo) / 1e6:.2f} MB upload, uplink {args.uplink_mbps:g} Mbit/s")
+    print(f"{'input':9} {'payload KB':>11} {'prep ms':>8} {'upload ms':>10} {'total ms':>9} {'pixels':>11} {'tokens':>7}")
+    for name, nbytes, prep, (w, h) in rows:
+        upload = nbytes * 8 / (args.uplink_mbps * 1e6)
+        print(f"{name:9} {nbytes / 1024:11.0f} {prep * 1000:8.1f} {upload * 1000:10.0f} "
+              f"{(prep + upload) * 1000:9.0f} {f'{w}x{h}':>11} {vision_tokens(w, h):7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the third-party APIs the backend calls, for load tests.
+
+  OpenAI   POST /v1/images/generations|edits|variations   b64 PNG of --image-px
+           POST /v1/chat/completions                       text (vision requests too)
+           GET  /v1/models
+  Stripe   GET  /v1/checkout/sessions/<id>                 session with line items
+           stripe_signature() signs webhook payloads like Stripe does
+  Resend   POST /emails, /emails/batch, GET /domains
+
+Every route sleeps for its configured latency (+/- jitter) and can fail a
+fraction of calls with 500/429 (--error-rate) to exercise retry and breaker
+paths. GET /__stats returns call counts and bytes sent per route.
+
+Point the backend at it with:
+  OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+  STRIPE_API_BASE=http://127.0.0.1:<port>
+  RESEND_BASE_URL=http://127.0.0.1:<port>
+
+Usage:
+  python tools/fake_upstream.py [--port 8999] [--images-latency 1.0] [--image-px 1024]
+"""
+from __future__ import annotations
+import argparse, base64, hashlib, hmac, io, json, os, random, re, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# route -> default latency in seconds (real image calls take 10-20s; chat ~1s)
+DEFAULT_LATENCY = {"images": 1.0, "chat": 0.3, "models": 0.05, "stripe": 0.15, "resend": 0.1}
+
+
+def make_png(px: int) -> bytes:
+    """Noise PNG: about as large as a real generated image of that size (noise barely compresses)."""
+    from PIL import Image
+    img = Image.frombytes("RGB", (px, px), os.urandom(px * px * 3))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
+
+
+def stripe_signature(payload: bytes, secret: str, timestamp: int | None = None) -> str:
+    """Stripe-Signature header value for payload (what stripe.Webhook.construct_event verifies)."""
+    t = int(timestamp if timestamp is not None else time.time())
+    mac = hmac.new(secret.encode(), f"{t}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={t},v1={mac}"
+
+
+class Upstream:
+    def __init__(self, latency: dict | None = None, jitter: float = 0.2, image_px: int = 1024,
+                 chat_words: int = 120, error_rate: float = 0.0, seed: int | None = None):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.jitter = jitter
+        self.chat_words = chat_words
+        self.error_rate = error_rate
+        self.rand = random.Random(seed)
+        self.image_b64 = base64.b64encode(make_png(image_px)).decode("ascii")
+        self.stats: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.server: ThreadingHTTPServer | None = None
+
+    # ---------- lifecycle ----------
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "Upstream":
+        upstream = self
+
+        class Handler(_Handler):
+            pass
+        Handler.upstream = upstream
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="fake-upstream", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> dict:
+        """Environment that points the backend's clients at this server."""
+        return {"OPENAI_BASE_URL": f"{self.url}/v1", "STRIPE_API_BASE": self.url, "RESEND_BASE_URL": self.url}
+
+    # ---------- behaviour ----------
+
+    def delay(self, kind: str):
+        base = self.latency.get(kind, 0.0)
+        if base > 0:
+            time.sleep(max(0.0, base * (1 + self.rand.uniform(-self.jitter, self.jitter))))
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and self.rand.random() < self.error_rate
+
+    def record(self, route: str, status: int, nbytes: int):
+        with self._lock:
+            st = self.stats.setdefault(route, {"calls": 0, "errors": 0, "bytes": 0})
+            st["calls"] += 1
+            st["bytes"] += nbytes
+            if status >= 400:
+                st["errors"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return json.loads(json.dumps(self.stats))
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+    def images(self, n: int) -> dict:
+        return {"created": int(time.time()),
+                "data": [{"b64_json": self.image_b64, "revised_prompt": "stand-in image"} for _ in range(max(1, n))]}
+
+    def chat(self, body: dict) -> dict:
+        text = " ".join(self.rand.choice(_WORDS) for _ in range(self.chat_words))
+        prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": self.chat_words,
+                      "total_tokens": prompt_tokens + self.chat_words},
+        }
+
+    def checkout_session(self, sid: str) -> dict:
+        return {"id": sid, "object": "checkout.session", "mode": "payment", "payment_status": "paid",
+                "line_items": {"object": "list", "has_more": False,
+                               "data": [{"id": f"li_{sid[-12:]}", "object": "item", "quantity": 1,
+                                         "price": {"id": "price_loadtest", "object": "price"}}]}}
+
+
+_WORDS = ("neon", "skyline", "poster", "cinematic", "dragon", "glow", "bold", "title", "storm", "gold",
+          "portrait", "fantasy", "lighting", "mood", "color", "vivid", "shadow", "hero", "the", "and")
+_N_FIELD = re.compile(rb'name="n"\r\n\r\n(\d+)')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    upstream: Upstream
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+
+    def log_message(self, *args):  # quiet
+        pass
+
+    def _body(self) -> bytes:
+        n = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(n) if n else b""
+
+    def _send(self, route: str, status: int, obj):
+        data = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(data)
+        self.upstream.record(route, status, len(data))
+
+    def _dispatch(self, method: str):
+        up = self.upstream
+        path = self.path.split("?", 1)[0]
+        body = self._body() if method == "POST" else b""
+
+        if path == "/__stats":
+            return self._send("__stats", 200, up.snapshot())
+
+        route, kind = _ROUTES.get((method, path), (None, None))
+        if route is None and method == "GET" and path.startswith("/v1/checkout/sessions/"):
+            route, kind = "stripe.checkout_session", "stripe"
+        if route is None:
+            return self._send("unknown", 404, {"error": {"message": f"no stand-in for {method} {path}"}})
+
+        up.delay(kind)
+        if up.should_fail():
+            status = up.rand.choice((429, 500))
+            return self._send(route, status, {"error": {"message": "injected failure", "type": "server_error"}})
+
+        if kind == "images":
+            if route == "openai.images.generations":
+                n = int((json.loads(body or b"{}") or {}).get("n") or 1)
+            else:
+                m = _N_FIELD.search(body)
+                n = int(m.group(1)) if m else 1
+            return self._send(route, 200, up.images(n))
+        if route == "openai.chat":
+            return self._send(route, 200, up.chat(json.loads(body or b"{}")))
+        if route == "openai.models":
+            return self._send(route, 200, {"object": "list", "data": [
+                {"id": m, "object": "model", "owned_by": "openai"} for m in ("gpt-4o-mini", "gpt-4o", "dall-e-3")]})
+        if route == "stripe.checkout_session":
+            return self._send(route, 200, up.checkout_session(path.rsplit("/", 1)[-1]))
+        if route == "resend.emails":
+            return self._send(route, 200, {"id": str(uuid.uuid4())})
+        if route == "resend.batch":
+            items = json.loads(body or b"[]")
+            return self._send(route, 200, {"data": [{"id": str(uuid.uuid4())} for _ in items]})
+        return self._send(route, 200, {"data": []})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+
+_ROUTES = {
+    ("POST", "/v1/images/generations"): ("openai.images.generations", "images"),
+    ("POST", "/v1/images/edits"): ("openai.images.edits", "images"),
+    ("POST", "/v1/images/variations"): ("openai.images.variations", "images"),
+    ("POST", "/v1/chat/completions"): ("openai.chat", "chat"),
+    ("GET", "/v1/models"): ("openai.models", "models"),
+    ("POST", "/emails"): ("resend.emails", "resend"),
+    ("POST", "/emails/batch"): ("resend.batch", "resend"),
+    ("GET", "/domains"): ("resend.domains", "resend"),
+}
+
+
+def add_latency_args(ap: argparse.ArgumentParser):
+    for kind, default in DEFAULT_LATENCY.items():
+        ap.add_argument(f"--{kind}-latency", type=float, default=default, help=f"seconds (default {default})")
+    ap.add_argument("--jitter", type=float, default=0.2, help="latency +/- fraction")
+    ap.add_argument("--image-px", type=int, default=1024, help="side of the returned PNG")
+    ap.add_argument("--chat-words", type=int, default=120)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered 500/429")
+
+
+def from_args(args) -> Upstream:
+    return Upstream(latency={k: getattr(args, f"{k}_latency") for k in DEFAULT_LATENCY},
+                    jitter=args.jitter, image_px=args.image_px, chat_words=args.chat_words,
+                    error_rate=args.error_rate)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fake OpenAI/Stripe/Resend for load tests")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8999)
+    add_latency_args(ap)
+    args = ap.parse_args()
+
+    up = from_args(args).start(args.host, args.port)
+    print(f"fake upstream on {up.url} (image {len(up.image_b64) * 3 // 4 // 1024} KiB)")
+    for k, v in up.env().items():
+        print(f"  export {k}={v}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        up.stop()
+
+
+if __name__ == "__main__":
+    main()
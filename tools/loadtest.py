@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+Load tests for the production app (serve_spa:app under gunicorn) against a
+local stand-in for OpenAI/Stripe/Resend (tools/fake_upstream.py).
+
+  generate_burst   concurrent POST /api/generate (credit hold + image call + job/library rows)
+  gallery_browse   gallery feed (anonymous and signed-in), my-reaction, react toggles, the page
+  library_paging   /api/library, /api/history, /api/me for users with a full library
+  webhook_storm    signed checkout.session.completed deliveries (10% redelivered),
+                   then waits for the webhook worker to drain the queue
+
+The app runs under gunicorn like the Dockerfile does (2 sync workers by
+default). A small wrapper (instrumented_app) disables the rate limiter and
+stamps each response with the worker pid and its RSS. Query counts come from
+db_metrics' X-DB-Queries header (DB_METRICS_HEADER=1). The report gives
+p50/p95/p99 latency, RPS, errors, queries per request and peak RSS per
+worker, per scenario and per request type.
+
+Results go to tools/_reports/loadtest_last.json. --save-baseline stores them
+as the baseline. Later runs are compared against it, and the exit code is 1
+when p95, RPS, queries per request, error rate or RSS regress past
+--tolerance.
+
+Usage:
+  python tools/loadtest.py [scenario ...] [--duration 20] [--workers 2] [--database-url URL]
+                           [--images-latency 1.0] [--save-baseline] [--tolerance 0.15]
+"""
+from __future__ import annotations
+import argparse, itertools, json, os, pathlib, random, socket, subprocess, sys, tempfile, threading, time, uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable
+
+import requests
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+BACKEND = ROOT / "backend"
+TOOLS = ROOT / "tools"
+REPORT_DIR = ROOT / "tools" / "_reports"
+BASELINE_PATH = REPORT_DIR / "loadtest_baseline.json"
+LAST_PATH = REPORT_DIR / "loadtest_last.json"
+
+PASSWORD = "loadtest-password"
+WEBHOOK_SECRET = "whsec_loadtest"
+
+
+# ---------- in-worker instrumentation (gunicorn loads "loadtest:instrumented_app()") ----------
+
+def _rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource  # peak, not current, but the best portable number
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def instrumented_app():
+    """serve_spa:app with the limiter off and pid/RSS response headers (queries: db_metrics' X-DB-Queries)."""
+    import serve_spa, app_secure
+
+    app = serve_spa.app
+    app_secure.limiter.enabled = False  # the load is the point
+
+    @app.after_request
+    def _stamp(resp):
+        resp.headers["X-Bench-Pid"] = str(os.getpid())
+        resp.headers["X-Bench-Rss-Kb"] = str(_rss_kb())
+        return resp
+
+    return app
+
+
+# ---------- setup ----------
+
+def _backend_imports(database_url: str):
+    os.environ["DATABASE_URL"] = database_url
+    if str(BACKEND) not in sys.path:
+        sys.path.insert(0, str(BACKEND))
+    import migrate, models
+    return migrate, models
+
+
+def seed(database_url: str, users: int, gallery_posts: int, library_items: int, blob_kb: int) -> None:
+    """Bench users (loadtest+N@example.com) with credits, a full library each, and a gallery with reactions."""
+    from werkzeug.security import generate_password_hash
+    migrate, models = _backend_imports(database_url)
+    migrate.upgrade()
+
+    pw = generate_password_hash(PASSWORD)
+    blob = os.urandom(blob_kb * 1024)
+    rand = random.Random(7)
+    with models.get_session() as s:
+        have = {u.email: u for u in s.query(models.User).filter(models.User.email.like("loadtest+%"))}
+        for i in range(users):
+            email = f"loadtest+{i}@example.com"
+            if email not in have:
+                have[email] = models.User(email=email, password_hash=pw)
+                s.add(have[email])
+            have[email].credits = 1_000_000
+        s.commit()
+        bench_users = list(have.values())
+
+        for u in bench_users:
+            n = s.query(models.Library).filter_by(user_id=u.id).count()
+            for j in range(n, library_items):
+                job = models.ImageJob(user_id=u.id, kind="generate", prompt=f"seeded poster {j} for {u.email}",
+                                      image_png=blob, credits_used=10)
+                s.add(job)
+                s.flush()
+                s.add(models.Library(user_id=u.id, image_job_id=job.id, collection_name="mini_library"))
+        s.commit()
+
+        n = s.query(models.GalleryPost).count()
+        kinds = ("love", "magic", "peace", "fire", "gratitude", "star", "applause", "support")
+        for j in range(n, gallery_posts):
+            post = models.GalleryPost(user_id=rand.choice(bench_users).id, image_url=f"/static/seed/{j}.png",
+                                      prompt=f"seeded gallery post {j}", story="seeded", tags=json.dumps(["seed"]),
+                                      is_demo=j < 8)
+            s.add(post)
+            s.flush()
+            for u in rand.sample(bench_users, min(len(bench_users), rand.randint(0, 6))):
+                s.add(models.Reaction(post_id=post.id, user_id=u.id, reaction_type=rand.choice(kinds)))
+        s.commit()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, env: dict, log_path: pathlib.Path) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    cmd = [sys.executable, "-m", "gunicorn", "loadtest:instrumented_app()",
+           "--chdir", str(BACKEND), "--pythonpath", str(TOOLS),
+           "-w", str(args.workers), "-k", args.worker_class, "--threads", str(args.threads),
+           "-b", f"127.0.0.1:{port}", "--timeout", "180", "--log-level", "warning"]
+    log = open(log_path, "w")
+    proc = subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"gunicorn exited ({proc.returncode}); see {log_path}")
+        try:
+            if requests.get(f"{url}/healthz", timeout=1).status_code == 200:
+                return proc, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit(f"server did not come up in 60s; see {log_path}")
+
+
+def login_all(base_url: str, users: int) -> list[tuple[int, str]]:
+    out = []
+    with requests.Session() as http:
+        for i in range(users):
+            r = http.post(f"{base_url}/api/auth/login", json={"email": f"loadtest+{i}@example.com", "password": PASSWORD})
+            r.raise_for_status()
+            token = r.json()["token"]
+            me = http.get(f"{base_url}/api/me", headers={"Authorization": f"Bearer {token}"}).json()
+            out.append(((me.get("user") or me).get("id"), token))
+    return out
+
+
+# ---------- scenarios ----------
+
+@dataclass
+class Ctx:
+    base_url: str
+    users: list                        # [(user_id, token)]
+    post_ids: list
+    sent_events: list = field(default_factory=list)
+
+    def auth(self, rand: random.Random) -> dict:
+        return {"Authorization": f"Bearer {rand.choice(self.users)[1]}"}
+
+
+@dataclass
+class Scenario:
+    name: str
+    concurrency: int
+    pick: Callable[[Ctx, random.Random], tuple]   # -> (label, method, path, requests kwargs)
+    max_requests: int | None = None               # None: run for --duration
+    after: Callable | None = None                 # (ctx, args) -> extra report fields
+
+
+def _generate(ctx: Ctx, rand: random.Random):
+    return ("generate", "POST", "/api/generate",
+            {"json": {"prompt": f"neon poster of a lighthouse #{rand.randrange(10**6)}", "size": "1024x1024"},
+             "headers": ctx.auth(rand)})
+
+
+def _gallery(ctx: Ctx, rand: random.Random):
+    roll = rand.random()
+    if roll < 0.4:
+        return ("feed_anon", "GET", "/api/gallery/posts", {})
+    if roll < 0.7:
+        return ("feed_user", "GET", "/api/gallery/posts", {"headers": ctx.auth(rand)})
+    if roll < 0.8:
+        return ("my_reaction", "GET", f"/api/gallery/{rand.choice(ctx.post_ids)}/my-reaction", {"headers": ctx.auth(rand)})
+    if roll < 0.9:
+        return ("react", "POST", f"/api/gallery/{rand.choice(ctx.post_ids)}/react",
+                {"json": {"reaction_type": rand.choice(("love", "fire", "star"))}, "headers": ctx.auth(rand)})
+    return ("page", "GET", "/gallery", {})
+
+
+def _library(ctx: Ctx, rand: random.Random):
+    roll = rand.random()
+    if roll < 0.6:
+        return ("library", "GET", "/api/library?collection=mini_library", {"headers": ctx.auth(rand)})
+    if roll < 0.9:
+        return ("history", "GET", f"/api/history?page={rand.randint(1, 5)}&per=12", {"headers": ctx.auth(rand)})
+    return ("me", "GET", "/api/me", {"headers": ctx.auth(rand)})
+
+
+def _webhook(ctx: Ctx, rand: random.Random):
+    from fake_upstream import stripe_signature
+    if ctx.sent_events and rand.random() < 0.1:
+        label, payload = "redelivery", rand.choice(ctx.sent_events)  # Stripe retries deliver the same event id
+    else:
+        uid = rand.choice(ctx.users)[0]
+        sid = f"cs_test_{uuid.uuid4().hex}"
+        payload = json.dumps({
+            "id": f"evt_{uuid.uuid4().hex}", "object": "event", "type": "checkout.session.completed",
+            "data": {"object": {"id": sid, "object": "checkout.session", "mode": "payment",
+                                "client_reference_id": str(uid), "amount_total": 499,
+                                "metadata": {"credits": "60", "sku": "starter"}}},
+        }).encode()
+        ctx.sent_events.append(payload)
+        label = "delivery"
+    return (label, "POST", "/api/payments/webhook",
+            {"data": payload, "headers": {"Content-Type": "application/json",
+                                          "Stripe-Signature": stripe_signature(payload, WEBHOOK_SECRET)}})
+
+
+def _drain_webhooks(ctx: Ctx, args) -> dict:
+    """Wait for the webhook worker(s) to apply every stored event."""
+    from sqlalchemy import func
+    _, models = _backend_imports(args.database_url)
+    t0 = time.perf_counter()
+    while True:
+        with models.get_session() as s:
+            counts = dict(s.query(models.WebhookEvent.status, func.count())
+                          .group_by(models.WebhookEvent.status).all())
+        open_ = counts.get("pending", 0) + counts.get("processing", 0)
+        if open_ == 0 or time.perf_counter() - t0 > args.drain_timeout:
+            return {"drain_s": round(time.perf_counter() - t0, 2), "events": counts}
+        time.sleep(0.25)
+
+
+SCENARIOS = {
+    "generate_burst": Scenario("generate_burst", 16, _generate, max_requests=160),
+    "gallery_browse": Scenario("gallery_browse", 16, _gallery),
+    "library_paging": Scenario("library_paging", 8, _library),
+    "webhook_storm": Scenario("webhook_storm", 16, _webhook, max_requests=1000, after=_drain_webhooks),
+}
+
+
+# ---------- runner ----------
+
+def _pct(sorted_vals: list, p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, max(0, round(p / 100 * len(sorted_vals)) - 1))]
+
+
+def _stats(samples: list, wall: float) -> dict:
+    lat = sorted(s[2] * 1000 for s in samples)
+    queries = [s[3] for s in samples if s[3] >= 0]
+    errors = sum(1 for s in samples if not 200 <= s[1] < 400)
+    return {
+        "requests": len(samples), "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "rps": round(len(samples) / wall, 1) if wall else 0.0,
+        "p50_ms": round(_pct(lat, 50), 1), "p95_ms": round(_pct(lat, 95), 1),
+        "p99_ms": round(_pct(lat, 99), 1), "max_ms": round(lat[-1], 1) if lat else 0.0,
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+        "queries_max": max(queries) if queries else None,
+    }
+
+
+def run_scenario(sc: Scenario, ctx: Ctx, args, upstream) -> dict:
+    concurrency = args.concurrency or sc.concurrency
+    max_requests = args.requests or sc.max_requests
+    samples, lock = [], threading.Lock()
+    counter = itertools.count()
+    statuses = defaultdict(int)
+
+    def worker(wid: int, deadline: float, record: bool):
+        rand = random.Random(wid)
+        mine = []
+        with requests.Session() as http:
+            while time.perf_counter() < deadline:
+                if record and max_requests and next(counter) >= max_requests:
+                    break
+                label, method, path, kw = sc.pick(ctx, rand)
+                t0 = time.perf_counter()
+                try:
+                    r = http.request(method, ctx.base_url + path, timeout=180, **kw)
+                    status, h = r.status_code, r.headers
+                except requests.RequestException:
+                    status, h = 0, {}
+                dt = time.perf_counter() - t0
+                if record:
+                    mine.append((label, status, dt, int(h.get("X-DB-Queries", -1)),
+                                 h.get("X-Bench-Pid"), int(h.get("X-Bench-Rss-Kb", 0))))
+                if not record and max_requests:
+                    break  # one warm-up request per worker for count-bound scenarios
+        with lock:
+            samples.extend(mine)
+
+    def run(seconds: float, record: bool) -> float:
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=worker, args=(i, deadline, record)) for i in range(concurrency)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - t0
+
+    if args.warmup > 0:
+        run(args.warmup, record=False)
+    upstream.reset()
+    wall = run(args.duration if not max_requests else 3600, record=True)
+
+    for s in samples:
+        statuses[str(s[1])] += 1
+    rss = {}
+    for s in samples:
+        if s[4]:
+            rss[s[4]] = max(rss.get(s[4], 0), s[5])
+    by_label = defaultdict(list)
+    for s in samples:
+        by_label[s[0]].append(s)
+
+    out = {"concurrency": concurrency, "wall_s": round(wall, 2), **_stats(samples, wall),
+           "statuses": dict(statuses),
+           "rss_mb_per_worker": {pid: round(kb / 1024, 1) for pid, kb in sorted(rss.items())},
+           "rss_mb_max": round(max(rss.values()) / 1024, 1) if rss else None,
+           "by_request": {k: _stats(v, wall) for k, v in sorted(by_label.items())},
+           "upstream": upstream.snapshot()}
+    if sc.after:
+        out.update(sc.after(ctx, args))
+    return out
+
+
+# ---------- reporting ----------
+
+def print_report(results: dict):
+    hdr = f"{'scenario / request':<30} {'reqs':>6} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'q/req':>6}"
+    print("\n" + hdr + "\n" + "-" * len(hdr))
+    for name, r in results["scenarios"].items():
+        rows = [(name, r)] + [(f"  {k}", v) for k, v in r["by_request"].items()]
+        for label, s in rows:
+            q = "-" if s["queries_per_request"] is None else f"{s['queries_per_request']:.1f}"
+            print(f"{label:<30} {s['requests']:>6} {s['errors']:>5} {s['rps']:>8.1f} {s['p50_ms']:>8.1f} "
+                  f"{s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f} {q:>6}")
+        extra = f"  RSS/worker MB: {r['rss_mb_per_worker']}"
+        if "drain_s" in r:
+            extra += f"  drain: {r['drain_s']}s {r['events']}"
+        print(extra)
+
+
+def compare(current: dict, baseline: dict, tol: float) -> list[str]:
+    """Human-readable regressions of current vs baseline (same scenario names only)."""
+    out = []
+    if current["config"] != baseline.get("config"):
+        print("note: baseline was recorded with different settings; comparison is approximate")
+    for name, cur in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if cur["p95_ms"] > base["p95_ms"] * (1 + tol):
+            out.append(f"{name}: p95 {base['p95_ms']} -> {cur['p95_ms']} ms")
+        if cur["rps"] < base["rps"] * (1 - tol):
+            out.append(f"{name}: rps {base['rps']} -> {cur['rps']}")
+        if (cur["queries_per_request"] or 0) > (base["queries_per_request"] or 0) + 0.5:
+            out.append(f"{name}: queries/request {base['queries_per_request']} -> {cur['queries_per_request']}")
+        if cur["error_rate"] > base["error_rate"] + 0.01:
+            out.append(f"{name}: error rate {base['error_rate']} -> {cur['error_rate']}")
+        if base.get("rss_mb_max") and (cur["rss_mb_max"] or 0) > base["rss_mb_max"] * (1 + tol):
+            out.append(f"{name}: worker RSS {base['rss_mb_max']} -> {cur['rss_mb_max']} MB")
+    return out
+
+
+def main():
+    sys.path.insert(0, str(TOOLS))
+    import fake_upstream
+
+    ap = argparse.ArgumentParser(description="Load-test the app against a fake OpenAI/Stripe/Resend")
+    ap.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    ap.add_argument("--duration", type=float, default=20, help="seconds per time-bound scenario")
+    ap.add_argument("--requests", type=int, help="override request count for count-bound scenarios")
+    ap.add_argument("--concurrency", type=int, help="override per-scenario client concurrency")
+    ap.add_argument("--warmup", type=float, default=2)
+    ap.add_argument("--workers", type=int, default=2, help="gunicorn workers (Dockerfile: 2)")
+    ap.add_argument("--worker-class", default="sync")
+    ap.add_argument("--threads", type=int, default=1)
+    ap.add_argument("--database-url", help="default: a fresh SQLite file (smoke runs only: one shared "
+                                           "connection per worker); use Postgres for real numbers")
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--gallery-posts", type=int, default=200)
+    ap.add_argument("--library-items", type=int, default=60, help="per user")
+    ap.add_argument("--blob-kb", type=int, default=256, help="seeded image_png size")
+    ap.add_argument("--drain-timeout", type=float, default=120)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.15)
+    fake_upstream.add_latency_args(ap)
+    args = ap.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        ap.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    args.database_url = args.database_url or f"sqlite:///{workdir}/loadtest.db"
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+
+    print(f"seeding {args.database_url} ...")
+    seed(args.database_url, args.users, args.gallery_posts, args.library_items, args.blob_kb)
+
+    upstream = fake_upstream.from_args(args).start()
+    env = {**os.environ, **upstream.env(),
+           "DATABASE_URL": args.database_url, "OPENAI_API_KEY": "sk-loadtest", "RESEND_API_KEY": "re_loadtest",
+           "STRIPE_SECRET_KEY": "sk_test_loadtest", "STRIPE_WEBHOOK_SECRET": WEBHOOK_SECRET,
+           "JWT_SECRET_KEY": "loadtest-jwt", "SECRET_KEY": "loadtest",
+           # poll fast so the webhook drain time measures processing, not the idle wait
+           "WEBHOOK_POLL_SECONDS": "1", "OUTBOX_POLL_SECONDS": "1", "DB_METRICS_HEADER": "1"}
+    log_path = REPORT_DIR / "loadtest_server.log"
+    proc, base_url = start_server(args, env, log_path)
+    try:
+        from models import get_session, GalleryPost
+        with get_session() as s:
+            post_ids = [p for (p,) in s.query(GalleryPost.id).filter_by(is_deleted=False)]
+        ctx = Ctx(base_url, login_all(base_url, args.users), post_ids)
+
+        results = {"config": {k: v for k, v in vars(args).items()
+                              if k not in ("scenarios", "save_baseline", "tolerance", "database_url")}
+                             | {"database": args.database_url.split(":", 1)[0]},
+                   "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "scenarios": {}}
+        for name in args.scenarios or list(SCENARIOS):
+            print(f"running {name} ...")
+            results["scenarios"][name] = run_scenario(SCENARIOS[name], ctx, args, upstream)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        upstream.stop()
+
+    print_report(results)
+    LAST_PATH.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"\n[OK] Wrote {LAST_PATH}")
+
+    if args.save_baseline:
+        BASELINE_PATH.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"[OK] Saved baseline {BASELINE_PATH}")
+        return 0
+    if BASELINE_PATH.exists():
+        regressions = compare(results, json.loads(BASELINE_PATH.read_text(encoding="utf-8")), args.tolerance)
+        if regressions:
+            print("\n[REGRESSION]")
+            for line in regressions:
+                print(f"   - {line}")
+            return 1
+        print("no regressions vs baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())